@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""Compression ratio and CPU cost per message class, codec and wire format.
+
+Aufruf: python -m benchmarks.compression_bench [Wiederholungen]
+"""
+import os
+import random
+import sys
+import time
+
+from network import compression
+from network import protocol
+
+SAMPLE_TEXTS = [
+    "ok", "bin gleich da", "wer kommt heute mit in die mensa?", "danke!",
+    "hat jemand die lösung zur übung 3? ich komme bei aufgabe 2 nicht weiter",
+    "treffen wir uns morgen um 10 in der bibliothek für das projekt?",
+    "Die Abgabe ist am Freitag, bitte bis Donnerstag abend eure Teile in die Gruppe schicken.",
+]
+
+
+def message_classes(rng):
+    """Returns {klasse: [packet, ...]} with typical traffic."""
+    handles = [f"nutzer{i}" for i in range(20)]
+    groups = ['default', 'bsrn', 'lerngruppe-3']
+    classes = {'ALIVE': [], 'LEAVE': [], 'GMSG kurz': [], 'GMSG lang': [], 'MSG': []}
+    for _ in range(200):
+        handle, group = rng.choice(handles), rng.choice(groups)
+        classes['ALIVE'].append(protocol.Packet(protocol.ALIVE, group, handle, 5000 + rng.randrange(100), None))
+        classes['LEAVE'].append(protocol.Packet(protocol.LEAVE, group, handle, None, None))
+        classes['GMSG kurz'].append(protocol.Packet(protocol.GMSG, group, handle, None, rng.choice(SAMPLE_TEXTS[:4])))
+        long_text = ' '.join(rng.choice(SAMPLE_TEXTS[4:]) for _ in range(rng.randint(1, 3)))
+        classes['GMSG lang'].append(protocol.Packet(protocol.GMSG, group, handle, None, long_text))
+        classes['MSG'].append(protocol.Packet(protocol.MSG, None, handle, None, rng.choice(SAMPLE_TEXTS)))
+    return classes
+
+
+def chunk_classes(rng, chunk_size=1400, count=64):
+    text = ' '.join(rng.choice(SAMPLE_TEXTS) for _ in range(chunk_size * count // 40)).encode('utf-8')
+    return {
+        'Chunk Text': [text[i * chunk_size:(i + 1) * chunk_size] for i in range(count)],
+        'Chunk Zufall': [os.urandom(chunk_size) for _ in range(count)],
+    }
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    rng = random.Random(1)
+    print(f"{'Klasse':<13} {'Format':<6} {'Codec':<5} {'roh B':>7} {'Draht B':>8} {'Quote':>6} "
+          f"{'µs pack':>8} {'µs entp.':>9} {'unkompr.':>9}")
+
+    for name, packets in message_classes(rng).items():
+        for wire, encode in (('text', protocol.encode_text), ('binär', protocol.encode_binary)):
+            datagrams = [encode(packet) for packet in packets]
+            for codec_name, codec in (('zlib', compression.ZLIB), ('dict', compression.DICT)):
+                compressor = compression.Compressor((codec,))
+                start = time.perf_counter()
+                for _ in range(repeat):
+                    packed = [compressor.compress(data, codec, name) for data in datagrams]
+                pack_us = (time.perf_counter() - start) * 1e6 / (repeat * len(datagrams))
+                start = time.perf_counter()
+                for _ in range(repeat):
+                    for data in packed:
+                        if compression.is_compressed(data):
+                            compression.decompress(data)
+                unpack_us = (time.perf_counter() - start) * 1e6 / (repeat * len(datagrams))
+                assert all(compression.decompress(p) == d if compression.is_compressed(p) else p == d
+                           for p, d in zip(packed, datagrams))
+                raw = sum(map(len, datagrams)) / len(datagrams)
+                sent = sum(map(len, packed)) / len(packed)
+                skipped = sum(1 for p in packed if not compression.is_compressed(p)) / len(packed)
+                print(f"{name:<13} {wire:<6} {codec_name:<5} {raw:>7.1f} {sent:>8.1f} {sent / raw:>6.2f} "
+                      f"{pack_us:>8.1f} {unpack_us:>9.1f} {skipped:>9.0%}")
+
+    for name, chunks in chunk_classes(rng).items():
+        for codec_name, codec in (('zlib', compression.ZLIB), ('dict', compression.DICT)):
+            compressor = compression.Compressor((codec,))
+            compress_chunk = compressor.chunk_compressor(codec)
+            start = time.perf_counter()
+            for _ in range(repeat):
+                packed = [compress_chunk(chunk) for chunk in chunks]
+            pack_us = (time.perf_counter() - start) * 1e6 / (repeat * len(chunks))
+            raw = sum(map(len, chunks)) / len(chunks)
+            sent = sum(len(p) if p is not None else len(c) for p, c in zip(packed, chunks)) / len(chunks)
+            skipped = sum(1 for p in packed if p is None) / len(packed)
+            print(f"{name:<13} {'chunk':<6} {codec_name:<5} {raw:>7.1f} {sent:>8.1f} {sent / raw:>6.2f} "
+                  f"{pack_us:>8.1f} {'':>9} {skipped:>9.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""Loopback benchmark for receive-loop latency while slow handlers run.
+
+Aufruf: python -m benchmarks.dispatch_bench [--transfers 8] [--size 2097152] [--disk-ms 200]
+
+Ein Sender schickt mehrere Transfers an einen Empfänger, dessen Platte langsam ist: Das
+Ablegen jeder Datei braucht zusätzlich --disk-ms Millisekunden. Gleichzeitig schickt ein
+zweiter Peer alle 5 ms eine Direktnachricht. Verglichen wird die Verarbeitung auf den
+Dispatch-Workern mit einer Verarbeitung direkt im Empfang (wie vor dem Dispatcher).
+Gemessen werden die Latenz der Nachrichten und die Verspätung eines 10-ms-Timers auf dem
+Event-Loop, also wie lange der Empfang blockiert war.
+"""
+import argparse
+import asyncio
+import shutil
+import tempfile
+import time
+
+from benchmarks.parallel_transfer_bench import BenchPeer, _chat_latency, percentile
+from network import dispatch
+
+PROBE_INTERVAL = 0.01
+
+
+class InlineDispatcher(dispatch.Dispatcher):
+    """Runs every task immediately on the calling thread, i.e. inside the receive loop."""
+
+    def submit(self, key, fn, *args, droppable=True):
+        fn(*args)
+        self.handled += 1
+        return True
+
+
+class SlowDisk(BenchPeer):
+    """BenchPeer whose content store takes disk_ms longer per received file."""
+
+    disk_ms = 0
+
+    def __init__(self, config):
+        self.stored = 0
+        super().__init__(config)
+
+    def _store_received(self, receiver, rate):
+        time.sleep(self.disk_ms / 1000)
+        super()._store_received(receiver, rate)
+        self.stored += 1
+
+
+def _config(handle, port, whoisport, path):
+    return {'user': {
+        'handle': handle, 'port': port, 'whoisport': whoisport, 'broadcastaddress': '127.255.255.255',
+        'history': False, 'peersnapshot': False, 'imagepath': path, 'tcptransfer': False,
+    }}
+
+
+async def _loop_lag(samples, until):
+    """Records how late a PROBE_INTERVAL timer fires on the event loop, in milliseconds."""
+    while not until():
+        due = time.perf_counter() + PROBE_INTERVAL
+        await asyncio.sleep(PROBE_INTERVAL)
+        samples.append((time.perf_counter() - due) * 1000)
+
+
+def run(inline, transfers, size, disk_ms, base_port, timeout):
+    path = tempfile.mkdtemp(prefix='dispatch-bench-')
+    SlowDisk.disk_ms = disk_ms
+    receiver = SlowDisk(_config('empfaenger', base_port + 1, base_port, path))
+    if inline:
+        receiver.dispatcher = InlineDispatcher()
+    sender = BenchPeer(_config('sender', base_port + 2, base_port, path))
+    chatter = BenchPeer(_config('plauderer', base_port + 3, base_port, path))
+    try:
+        deadline = time.monotonic() + 10
+        while not {'sender', 'plauderer'} <= set(receiver.peers.handles()) \
+                or 'empfaenger' not in chatter.peers.handles():
+            if time.monotonic() > deadline:
+                raise RuntimeError("Peers wurden nicht gefunden")
+            time.sleep(0.05)
+
+        stored = lambda: receiver.stored >= transfers
+        start = time.perf_counter()
+        done = lambda: stored() or time.perf_counter() - start > timeout
+        lag = []
+        probe = receiver.loop.submit(_loop_lag(lag, done))
+        for _ in range(transfers):
+            sender.send_image('empfaenger', str(size))
+        latencies = _chat_latency(chatter, receiver, 100000, 0.005, until=done)
+        probe.result(timeout)
+        return latencies, lag, stored()
+    finally:
+        for peer in (receiver, sender, chatter):
+            peer.shutdown()
+        time.sleep(0.2)
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latenz des Empfangs bei langsamer Verarbeitung.")
+    parser.add_argument('--transfers', type=int, default=8)
+    parser.add_argument('--size', type=int, default=2 * 1024 * 1024, help="Bytes pro Transfer")
+    parser.add_argument('--disk-ms', type=float, default=200.0, help="Zusätzliche Zeit pro abgelegter Datei")
+    parser.add_argument('--base-port', type=int, default=28000)
+    parser.add_argument('--timeout', type=float, default=60.0)
+    args = parser.parse_args()
+
+    print(f"{'Verarbeitung':<13} {'fertig':>6} {'Chat p50/p99/max ms':>22} {'Loop-Verspätung p50/p99/max ms':>32}")
+    for inline in (True, False):
+        latencies, lag, ok = run(inline, args.transfers, args.size, args.disk_ms, args.base_port, args.timeout)
+        print(f"{'im Empfang' if inline else 'Worker':<13} {'ja' if ok else 'nein':>6} "
+              f"{percentile(latencies, 50):>8.2f}/{percentile(latencies, 99):.2f}/{max(latencies, default=0):<7.1f} "
+              f"{percentile(lag, 50):>14.2f}/{percentile(lag, 99):.2f}/{max(lag, default=0):.1f}")
+
+
+if __name__ == "__main__":
+    main()
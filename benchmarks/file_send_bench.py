@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""Loopback benchmark for sending files from disk.
+
+Aufruf: python -m benchmarks.file_send_bench [--size 1073741824] [--dir /tmp]
+
+Vergleicht für eine Testdatei:
+  sendto-Schleife  Kopf + mmap-Ausschnitt je Chunk per sendto, ohne Protokoll (Obergrenze)
+  /send (mmap)     TransferSender liest direkt aus der Abbildung der Datei
+  /img (Puffer)    Die alte Variante: Daten zuerst vollständig in den Speicher
+
+Gemessen werden Durchsatz und der höchste Zuwachs an anonymem Speicher (RssAnon, nur Linux);
+Dateiseiten im Page Cache zählen nicht dazu. Der Empfänger schreibt in eine PartialFile, am
+Ende wird der Inhaltshash verglichen.
+"""
+import argparse
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+
+from benchmarks import transfer_bench
+from network import transfer
+from network.storage import MappedFile, PartialFile
+
+
+def anon_rss():
+    """Anonymous resident memory in bytes, or None outside Linux."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('RssAnon:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+class PeakMemory:
+    """Samples anonymous memory in a background thread and keeps the peak above the start."""
+
+    def __init__(self, interval=0.02):
+        self.interval = interval
+        self.start = anon_rss()
+        self.peak = self.start
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            value = anon_rss()
+            if value is not None and value > self.peak:
+                self.peak = value
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    @property
+    def growth(self):
+        return (self.peak - self.start) if self.start is not None else None
+
+
+def create_file(path, size):
+    """Writes size random bytes in 1 MiB blocks."""
+    block = os.urandom(1024 * 1024)
+    with open(path, 'wb') as f:
+        remaining = size
+        while remaining > 0:
+            f.write(block[:remaining])
+            remaining -= len(block)
+
+
+def sendto_loop(source, chunk_size):
+    """Sends every chunk once with plain sendto and returns bytes per second (sender side)."""
+    send_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    recv_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    recv_sock.bind(('127.0.0.1', 0))
+    recv_sock.settimeout(0.2)
+    addr = recv_sock.getsockname()
+    done = []
+
+    def drain():
+        buffer = bytearray(65535)
+        while not done:
+            try:
+                recv_sock.recv_into(buffer)
+            except socket.timeout:
+                pass
+
+    thread = threading.Thread(target=drain, daemon=True)
+    thread.start()
+    data = memoryview(source.data)
+    start = time.perf_counter()
+    for seq in range(transfer.chunk_count(source.size, chunk_size)):
+        offset = seq * chunk_size
+        send_sock.sendto(transfer.CHUNK_HEADER.pack(transfer.CHUNK_MAGIC, 1, seq)
+                         + data[offset:offset + chunk_size], addr)
+    elapsed = time.perf_counter() - start
+    data.release()
+    done.append(True)
+    thread.join()
+    send_sock.close()
+    recv_sock.close()
+    return source.size / elapsed
+
+
+def protocol_transfer(payload, size, directory, expected):
+    """Runs a TransferSender over loopback into a PartialFile; returns (bytes per second, hash ok)."""
+    partial_path = os.path.join(directory, 'receive.part')
+    partial = PartialFile(partial_path, size, transfer.chunk_count(size, transfer.DEFAULT_CHUNK_SIZE))
+    try:
+        sender = transfer_bench.run_transfer(size, 0.0, payload=payload, buffer=partial.data,
+                                             received=partial.received)
+        ok = not sender.failed and transfer.content_hash(partial.data) == expected
+        return sender.throughput, ok
+    finally:
+        partial.discard()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dateien von der Platte über Loopback senden.")
+    parser.add_argument('--size', type=int, default=256 * 1024 * 1024, help="Größe der Testdatei in Bytes")
+    parser.add_argument('--dir', default=None, help="Verzeichnis für Test- und Zieldatei")
+    parser.add_argument('--skip-buffer', action='store_true', help="/img-Variante auslassen (große Dateien)")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='file-send-bench-', dir=args.dir)
+    try:
+        path = os.path.join(directory, 'source.bin')
+        create_file(path, args.size)
+        source = MappedFile(path)
+        expected = transfer.content_hash(source.data)
+
+        print(f"{'Variante':<16} {'MB/s':>8} {'+Speicher MB':>13} {'Hash':>6}")
+        rows = []
+        with PeakMemory() as memory:
+            rate = sendto_loop(source, transfer.DEFAULT_CHUNK_SIZE)
+        rows.append(("sendto-Schleife", rate, memory.growth, None))
+
+        with PeakMemory() as memory:
+            rate, ok = protocol_transfer(source.data, args.size, directory, expected)
+        rows.append(("/send (mmap)", rate, memory.growth, ok))
+
+        if not args.skip_buffer:
+            with PeakMemory() as memory:
+                with open(path, 'rb') as f:
+                    payload = f.read()
+                rate, ok = protocol_transfer(payload, args.size, directory, expected)
+                del payload
+            rows.append(("/img (Puffer)", rate, memory.growth, ok))
+        source.close()
+
+        for name, rate, growth, ok in rows:
+            growth_str = f"{growth / (1024 * 1024):.1f}" if growth is not None else "-"
+            ok_str = "-" if ok is None else ("ok" if ok else "FEHLER")
+            print(f"{name:<16} {rate / (1024 * 1024):>8.1f} {growth_str:>13} {ok_str:>6}")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""Loopback benchmark for floods of JOINs and direct messages.
+
+Aufruf: python -m benchmarks.flood_bench [--rate 100000] [--duration 3] [--kinds join,chat]
+
+Ein eigener Prozess flutet von 127.0.0.2 aus, einmal mit JOINs unter ständig neuen Handles
+an die Broadcast-Adresse (jeder löst ein REPLY aus), einmal mit Direktnachrichten an den
+Unicast-Port. Währenddessen schickt ein zweiter Peer von 127.0.0.1 alle 10 ms eine
+Nachricht. Jeder Lauf wird mit und ohne Ratenbegrenzung wiederholt.
+
+Gemessen werden die CPU-Last des Prozesses mit beiden Peers (100% = ein Kern), die vom
+Kernel und von der Ratenbegrenzung verworfenen Datagramme, die gesendeten REPLYs und die
+Latenz und Verluste der Nachrichten des zweiten Peers.
+"""
+import argparse
+import multiprocessing
+import shutil
+import socket
+import tempfile
+import time
+
+from benchmarks.parallel_transfer_bench import MARKER, percentile
+from network.network_handler import NetworkHandler
+
+FLOOD_SOURCE = '127.0.0.2'
+BROADCAST_ADDRESS = '127.255.255.255'
+
+
+class Victim(NetworkHandler):
+    """NetworkHandler that records the latency of marked direct messages."""
+
+    def __init__(self, config):
+        self.latencies = []  # Millisekunden
+        super().__init__(config)
+
+    def _deliver_message(self, sender, text):
+        if text.startswith(MARKER):
+            self.latencies.append((time.perf_counter() - float(text[len(MARKER):])) * 1000)
+
+
+def _config(handle, port, whoisport, path, ratelimit):
+    return {'user': {
+        'handle': handle, 'port': port, 'whoisport': whoisport, 'broadcastaddress': BROADCAST_ADDRESS,
+        'history': False, 'peersnapshot': False, 'imagepath': path, 'ratelimit': ratelimit,
+    }}
+
+
+def flood(kind, rate, duration, target, whoisport, sent):
+    """Sends rate datagrams per second for duration seconds, paced in 1 ms slices."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+    sock.bind((FLOOD_SOURCE, 0))
+    port = sock.getsockname()[1]
+    if kind == 'join':
+        addr = (BROADCAST_ADDRESS, whoisport)
+        make = lambda i: f"JOIN default flut{i} {port}".encode()
+    else:
+        addr = ('127.0.0.1', target)
+        make = lambda i: f"MSG flut{i % 100} spam spam spam".encode()
+    per_slice = max(1, rate // 1000)
+    count = 0
+    start = time.perf_counter()
+    end = start + duration
+    while True:
+        now = time.perf_counter()
+        if now >= end:
+            break
+        due = int((now - start) * rate) + per_slice
+        while count < due:
+            try:
+                sock.sendto(make(count), addr)
+            except OSError:
+                pass  # Sendepuffer voll, gehört zur Flut
+            count += 1
+        time.sleep(0.001)
+    sent.value = count
+    sock.close()
+
+
+def run(kind, ratelimit, rate, duration, base_port):
+    path = tempfile.mkdtemp(prefix='flood-bench-')
+    victim = Victim(_config('opfer', base_port + 1, base_port, path, ratelimit))
+    peer = NetworkHandler(_config('nutzer', base_port + 2, base_port, path, ratelimit))
+    try:
+        deadline = time.monotonic() + 10
+        while 'opfer' not in peer.peers.handles():
+            if time.monotonic() > deadline:
+                raise RuntimeError("Peer wurde nicht gefunden")
+            time.sleep(0.05)
+        replies_before = victim._packets_out.values.get(('REPLY',), 0)
+
+        sent = multiprocessing.Value('q', 0)
+        flooder = multiprocessing.Process(target=flood, args=(kind, rate, duration, victim.port, base_port, sent))
+        cpu_start, wall_start = time.process_time(), time.perf_counter()
+        flooder.start()
+        chats = 0
+        while flooder.is_alive():
+            peer.send_message('opfer', f"{MARKER}{time.perf_counter()}")
+            chats += 1
+            time.sleep(0.01)
+        flooder.join()
+        cpu = (time.process_time() - cpu_start) / (time.perf_counter() - wall_start) * 100
+        time.sleep(0.5)
+
+        stats = {}
+        for _, endpoint in victim._endpoints():
+            for key in ('kernel_drops', 'shed', 'paused'):
+                stats[key] = stats.get(key, 0) + endpoint.stats[key]
+        return {
+            'sent': sent.value, 'cpu': cpu, 'replies': victim._packets_out.values.get(('REPLY',), 0) - replies_before,
+            'chats': chats, 'latencies': victim.latencies, **stats,
+        }
+    finally:
+        victim.shutdown()
+        peer.shutdown()
+        time.sleep(0.2)
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fluten von JOINs und Nachrichten über Loopback.")
+    parser.add_argument('--rate', type=int, default=100000, help="Datagramme pro Sekunde")
+    parser.add_argument('--duration', type=float, default=3.0, help="Dauer der Flut in Sekunden")
+    parser.add_argument('--kinds', default='join,chat', help="Kommagetrennt: join, chat")
+    parser.add_argument('--base-port', type=int, default=24000)
+    args = parser.parse_args()
+
+    print(f"{'Flut':<5} {'Begrenzung':>10} {'gesendet':>9} {'CPU %':>6} {'Kernel':>8} {'verworfen':>10} "
+          f"{'Pausen':>7} {'REPLYs':>7} {'Chat p50/p99 ms':>16} {'verloren':>9}")
+    for kind in args.kinds.split(','):
+        for ratelimit in (False, True):
+            r = run(kind, ratelimit, args.rate, args.duration, args.base_port)
+            lost = r['chats'] - len(r['latencies'])
+            print(f"{kind:<5} {'an' if ratelimit else 'aus':>10} {r['sent']:>9} {r['cpu']:>6.0f} "
+                  f"{r['kernel_drops']:>8} {r['shed']:>10} {r['paused']:>7} {r['replies']:>7} "
+                  f"{percentile(r['latencies'], 50):>7.2f}/{percentile(r['latencies'], 99):<8.2f} "
+                  f"{lost:>4}/{r['chats']:<4}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""Loopback benchmark comparing peer discovery by broadcast and by gossip.
+
+Aufruf: python -m benchmarks.gossip_bench [--nodes 10,100] [--simulate 10,100,1000] [--loss 0.0]
+
+Für jede Größe in --nodes starten N Peers auf 127.0.0.1, einmal mit discovery = "broadcast"
+(JOIN und ALIVE an alle), einmal mit discovery = "gossip" (SWIM-Proben per Unicast, Einstieg
+über einen Seed). Gemessen werden die Zeit, bis jeder Peer alle anderen kennt (ab dem Start
+des letzten Peers), der Entdeckungsverkehr pro Peer und Sekunde im Ruhezustand, gesendet und
+empfangen, und die Zeit, bis ein abgestürzter Peer bei allen anderen entfernt ist.
+
+Mehrere hundert NetworkHandler teilen sich hier einen Event-Loop und einen Kern, das misst
+dann die Maschine und nicht das Protokoll. Für --simulate laufen deshalb nur die
+gossip.Membership-Instanzen gegeneinander, in simulierter Zeit mit echten Datagrammen,
+1-3 ms Laufzeit und --loss Verlust. 1000 Peers dauern einige Minuten.
+
+Gemessen wird der Ruhezustand, sobald alle Änderungen verbreitet sind, aber spätestens nach
+--timeout Sekunden. Nach dem gleichzeitigen Beitritt von 1000 Peers fahren deren Einträge
+dann noch auf den Proben mit: Die Zahl der Datagramme bleibt gleich, die Bytes sind durch
+gossip.UPDATE_BUDGET pro Datagramm begrenzt.
+"""
+import argparse
+import heapq
+import random
+import shutil
+import tempfile
+import time
+
+from benchmarks.parallel_transfer_bench import BenchPeer
+from network import gossip
+from network.network_handler import GOSSIP_TICK
+
+SETTLE = 2.0  # Sekunden Pause, nachdem alle Änderungen verbreitet sind
+
+
+class CountingPeer(BenchPeer):
+    """BenchPeer that counts the datagrams and bytes it sends and receives."""
+
+    def __init__(self, config):
+        self.traffic = [0, 0, 0, 0]  # gesendet Pakete, Bytes; empfangen Pakete, Bytes
+        super().__init__(config)
+
+    def _count(self, index, data):
+        self.traffic[index] += 1
+        self.traffic[index + 1] += len(data)
+
+    def _send_unicast(self, data, addr):
+        self._count(0, data)
+        super()._send_unicast(data, addr)
+
+    def _send_broadcast(self, data, group=None, coalesce=False):
+        self._count(0, data)
+        super()._send_broadcast(data, group, coalesce)
+
+    def _on_unicast_datagram(self, data, addr):
+        self._count(2, data)
+        return super()._on_unicast_datagram(data, addr)
+
+    def _on_broadcast_datagram(self, data, addr):
+        self._count(2, data)
+        return super()._on_broadcast_datagram(data, addr)
+
+
+def _config(handle, port, base_port, path, mode):
+    return {'user': {
+        'handle': handle, 'port': port, 'whoisport': base_port, 'broadcastaddress': '127.255.255.255',
+        'history': False, 'peersnapshot': False, 'imagepath': path,
+        'discovery': mode, 'seeds': [f"127.0.0.1:{base_port + 1}"] if mode == 'gossip' else [],
+        # Vergleichbare Erkennungszeiten: ein ALIVE bzw. eine Probe pro Sekunde
+        'aliveinterval': 1, 'alivetimeout': 3, 'gossipinterval': 1,
+        # Alle Peers teilen sich 127.0.0.1; die Begrenzung pro Quell-IP träfe sie gemeinsam
+        'ratelimit': False,
+    }}
+
+
+def _wait(condition, timeout):
+    """Polls condition until it holds; returns the seconds it took, or None after timeout."""
+    start = time.perf_counter()
+    while not condition():
+        if time.perf_counter() - start > timeout:
+            return None
+        time.sleep(0.05)
+    return time.perf_counter() - start
+
+
+def _traffic(peers):
+    return [sum(peer.traffic[i] for peer in peers) for i in range(4)]
+
+
+def run(mode, count, base_port, measure, timeout):
+    path = tempfile.mkdtemp(prefix='gossip-bench-')
+    peers = []
+    try:
+        for i in range(count):
+            peers.append(CountingPeer(_config(f"peer-{i}", base_port + 1 + i, base_port, path, mode)))
+        converged = _wait(lambda: all(len(peer.peers.members('default')) == count - 1 for peer in peers), timeout)
+        if converged is None:
+            known = sorted(len(peer.peers.members('default')) for peer in peers)
+            return None, f"keine Konvergenz, bekannt min/median {known[0]}/{known[len(known) // 2]}"
+
+        _wait(lambda: not any(peer.gossip.pending() for peer in peers if peer.gossip is not None), timeout)
+        time.sleep(SETTLE)
+        before, start = _traffic(peers), time.perf_counter()
+        time.sleep(measure)
+        after, elapsed = _traffic(peers), time.perf_counter() - start
+        rates = [(a - b) / count / elapsed for a, b in zip(after, before)]
+
+        # Absturz ohne LEAVE: Sockets schließen, nichts mehr senden
+        victim = peers.pop()
+        victim.running = False
+        victim.loop.call_soon(victim._close)
+        detected = _wait(lambda: all(victim.handle not in peer.peers.members('default') for peer in peers), timeout)
+        return (converged, rates, detected), None
+    finally:
+        for peer in peers:
+            peer.shutdown()
+        time.sleep(0.5)
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def simulate(count, measure, loss, timeout, seed=1):
+    """Runs count Membership instances against each other in simulated time, like run()."""
+    rng = random.Random(seed)
+    addrs = [('127.0.0.1', 40000 + i) for i in range(count)]
+    nodes = {addr: gossip.Membership(f"peer-{i}", addr[1], ['default'], rng.random(),
+                                     seeds=[addrs[0]] if i else [], rng=random.Random(i))
+             for i, addr in enumerate(addrs)}
+    traffic = [0, 0, 0, 0]
+    queue = []  # (ankunft, nr, datagramm, ziel, absender)
+    now = 0.0
+
+    def send(out, source):
+        for data, addr in out:
+            traffic[0] += 1
+            traffic[1] += len(data)
+            if rng.random() >= loss:
+                heapq.heappush(queue, (now + rng.uniform(0.001, 0.003), traffic[0], data, addr, source))
+
+    def advance_until(condition):
+        nonlocal now
+        start = now
+        while not condition():
+            if now - start > timeout:
+                return None
+            now += GOSSIP_TICK
+            while queue and queue[0][0] <= now:
+                _, _, data, addr, source = heapq.heappop(queue)
+                node = nodes.get(addr)
+                if node is not None:
+                    traffic[2] += 1
+                    traffic[3] += len(data)
+                    send(node.receive(gossip.decode(data[len(b"GOSSIP "):].decode('utf-8')), source, now), addr)
+            for addr, node in nodes.items():
+                send(node.tick(now), addr)
+        return now - start
+
+    converged = advance_until(lambda: all(len(node) == count - 1 for node in nodes.values()))
+    if converged is None:
+        known = sorted(len(node) for node in nodes.values())
+        return None, f"keine Konvergenz, bekannt min/median {known[0]}/{known[len(known) // 2]}"
+    advance_until(lambda: not any(node.pending() for node in nodes.values()))
+    settled = now + SETTLE
+    advance_until(lambda: now >= settled)
+    before, start = list(traffic), now
+    advance_until(lambda: now >= start + measure)
+    rates = [(a - b) / count / (now - start) for a, b in zip(traffic, before)]
+
+    # Absturz: der letzte Knoten verschwindet samt seiner Datagramme
+    del nodes[addrs[-1]]
+    detected = advance_until(lambda: all(len(node) == count - 2 for node in nodes.values()))
+    return (converged, rates, detected), None
+
+
+def _print_result(mode, count, result, error):
+    if result is None:
+        print(f"{mode:<14} {count:>5} {error}")
+        return
+    converged, (sent, sent_bytes, received, received_bytes), detected = result
+    detected_str = f"{detected:.2f}" if detected is not None else "nein"
+    print(f"{mode:<14} {count:>5} {converged:>12.2f} {sent:>13.2f} {sent_bytes:>7.0f} "
+          f"{received:>14.2f} {received_bytes:>8.0f} {detected_str:>17}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Peer-Entdeckung per Broadcast und per Gossip.")
+    parser.add_argument('--nodes', default='10,100', help="Anzahl echter Peers, kommagetrennt")
+    parser.add_argument('--simulate', default='10,100,1000', help="Anzahl simulierter Gossip-Peers")
+    parser.add_argument('--loss', type=float, default=0.0, help="Anteil verlorener Datagramme in der Simulation")
+    parser.add_argument('--measure', type=float, default=10.0, help="Sekunden Messung im Ruhezustand")
+    parser.add_argument('--base-port', type=int, default=30000)
+    parser.add_argument('--timeout', type=float, default=120.0)
+    args = parser.parse_args()
+
+    print(f"{'Modus':<14} {'Peers':>5} {'Konvergenz s':>12} {'ges. Pakete/s':>13} {'B/s':>7} "
+          f"{'empf. Pakete/s':>14} {'B/s':>8} {'Ausfall erkannt s':>17}")
+    for count in (int(n) for n in args.nodes.split(',') if n):
+        for mode in ('broadcast', 'gossip'):
+            _print_result(mode, count, *run(mode, count, args.base_port, args.measure, args.timeout))
+    for count in (int(n) for n in args.simulate.split(',') if n):
+        _print_result('gossip (sim.)', count, *simulate(count, args.measure, args.loss, args.timeout))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""Loopback benchmark for lost group messages with and without sequence numbers and fetches.
+
+Aufruf: python -m benchmarks.group_cache_bench [--receivers 5] [--messages 500] [--loss 0.0,0.05,0.2]
+
+Ein Sender schreibt --messages Gruppennachrichten, alle 2 ms eine. Die Empfänger verwerfen
+jedes eingehende Gruppendatagramm mit Wahrscheinlichkeit --loss, bevor es geparst wird.
+Verglichen werden groupcache = 0 (GMSG wie bisher, verloren ist verloren) und der Standard
+(SGMSG, Lücken werden per GFETCH nachgefragt). Gemessen werden der Anteil zugestellter
+Nachrichten, Nachrichten außer der Reihe, doppelt zugestellte, die Nachfragen und die
+nachgesendeten Nachrichten, und wie lange die letzte Zustellung nach der letzten Nachricht
+dauert. Ohne Verlust tritt danach ein weiterer Peer bei; gezählt wird, wie viele der
+letzten Nachrichten er nachgeholt hat.
+"""
+import argparse
+import random
+import shutil
+import tempfile
+import time
+
+from benchmarks.gossip_bench import _wait
+from benchmarks.parallel_transfer_bench import BenchPeer
+from benchmarks.suite import free_ports
+from network import group_cache
+from network import rate_limit
+
+SEND_INTERVAL = 0.002
+SETTLE = 3.0  # Sekunden nach der letzten Nachricht, bis nicht mehr auf Zustellungen gewartet wird
+
+
+class LossyPeer(BenchPeer):
+    """BenchPeer that drops incoming group datagrams at random and records what it delivers."""
+
+    def __init__(self, config, loss):
+        self.loss = loss
+        self.delivered = []  # (zeit, text)
+        super().__init__(config)
+
+    def _on_broadcast_datagram(self, data, addr):
+        if self.loss and rate_limit.classify(data) in ('chat', 'compressed') and random.random() < self.loss:
+            return False
+        return super()._on_broadcast_datagram(data, addr)
+
+    def _deliver_group_message(self, group, sender, text):
+        self.delivered.append((time.perf_counter(), text))
+        super()._deliver_group_message(group, sender, text)
+
+
+def _config(handle, port, whoisport, path, cache):
+    return {'user': {
+        'handle': handle, 'port': port, 'whoisport': whoisport, 'broadcastaddress': '127.255.255.255',
+        'history': False, 'peersnapshot': False, 'imagepath': path, 'ratelimit': False,
+        'groupcache': group_cache.DEFAULT_CAPACITY if cache else 0,
+    }}
+
+
+def run(cache, receivers, count, loss):
+    path = tempfile.mkdtemp(prefix='group-cache-bench-')
+    whoisport, *ports = free_ports(receivers + 2)
+    sender = BenchPeer(_config('sender', ports[0], whoisport, path, cache))
+    peers = [sender]
+    try:
+        group = [LossyPeer(_config(f"empfaenger-{i}", ports[i + 1], whoisport, path, cache), loss)
+                 for i in range(receivers)]
+        peers.extend(group)
+        if _wait(lambda: all(sender.peers.capabilities(peer.handle) is not None for peer in group)
+                 and all(peer.peers.capabilities('sender') is not None for peer in group), 10) is None:
+            raise RuntimeError("Peers wurden nicht gefunden")
+
+        expected = [f"n{i}" for i in range(count)]
+        for text in expected:
+            sender.send_group_message(text)
+            time.sleep(SEND_INTERVAL)
+        last_sent = time.perf_counter()
+        _wait(lambda: all(len(peer.delivered) >= count for peer in group), SETTLE)
+
+        delivered = sum(len(set(text for _, text in peer.delivered)) for peer in group)
+        duplicates = sum(len(peer.delivered) - len(set(text for _, text in peer.delivered)) for peer in group)
+        reordered = sum(sum(1 for (_, a), (_, b) in zip(peer.delivered, peer.delivered[1:])
+                            if int(b[1:]) < int(a[1:])) for peer in group)
+        tail = max((peer.delivered[-1][0] for peer in group if peer.delivered), default=last_sent) - last_sent
+        fetches = sum(peer.group_receiver.fetches for peer in group if peer.group_receiver is not None)
+        served = sum(peer._group_served for peer in peers)
+        result = [delivered / (count * receivers), reordered, duplicates, fetches, served, max(tail, 0.0)]
+
+        late = None
+        if cache and not loss:
+            joiner = LossyPeer(_config('neu', ports[-1], whoisport, path, cache), 0.0)
+            peers.append(joiner)
+            _wait(lambda: len(joiner.delivered) >= group_cache.RECENT, 5)
+            late = len(joiner.delivered)
+        return result, late
+    finally:
+        for peer in peers:
+            peer.shutdown()
+        time.sleep(0.2)
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Verlorene Gruppennachrichten mit und ohne Nachfragen.")
+    parser.add_argument('--receivers', type=int, default=5)
+    parser.add_argument('--messages', type=int, default=500)
+    parser.add_argument('--loss', default='0.0,0.05,0.2', help="Verlustraten, kommagetrennt")
+    args = parser.parse_args()
+
+    print(f"{'Modus':<10} {'Verlust':>7} {'zugestellt':>10} {'Reihenfolge':>11} {'doppelt':>7} "
+          f"{'Nachfragen':>10} {'nachgesendet':>12} {'letzte nach s':>13} {'Neuer holt':>10}")
+    for loss in (float(x) for x in args.loss.split(',') if x):
+        for cache in (False, True):
+            (share, reordered, duplicates, fetches, served, tail), late = run(
+                cache, args.receivers, args.messages, loss)
+            late_str = f"{late}/{group_cache.RECENT}" if late is not None else "-"
+            print(f"{'SGMSG' if cache else 'GMSG':<10} {loss:>7.0%} {share:>10.2%} {reordered:>11} {duplicates:>7} "
+                  f"{fetches:>10} {served:>12} {tail:>13.2f} {late_str:>10}")
+
+
+if __name__ == "__main__":
+    main()
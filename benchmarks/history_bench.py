@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""Benchmark for the message log: append throughput, restart time and query latency.
+
+Aufruf: python -m benchmarks.history_bench [Anzahl Nachrichten ...]
+"""
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from network import protocol
+from network.message_log import MessageLog
+
+COUNTS = [100_000, 1_000_000]
+WORDS = ("hallo welt wer ist heute da gleich treffen mensa bibliothek klausur projekt "
+         "netzwerk gruppe abgabe morgen abend kaffee zug verspätung prüfung übung").split()
+
+
+def fill(log, count, rng, groups, peers):
+    for i in range(count):
+        text = ' '.join(rng.choices(WORDS, k=rng.randint(3, 12)))
+        if rng.random() < 0.7:
+            log.append(protocol.GMSG, rng.choice(groups), rng.choice(peers), text)
+        else:
+            peer = rng.choice(peers)
+            log.append(protocol.MSG, peer, peer, text, outgoing=rng.random() < 0.5)
+
+
+def timed(func, repeat=20):
+    """Returns (result, median milliseconds) of repeated calls."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append((time.perf_counter() - start) * 1000)
+    return result, sorted(times)[len(times) // 2]
+
+
+def run(count):
+    rng = random.Random(count)
+    groups = [f"g{i}" for i in range(20)]
+    peers = [f"nutzer{i}" for i in range(200)]
+    path = tempfile.mkdtemp(prefix='history-bench-')
+    try:
+        log = MessageLog(path, segment_size=16 * 1024 * 1024, max_segments=1000)
+        start = time.perf_counter()
+        fill(log, count, rng, groups, peers)
+        enqueue = time.perf_counter() - start
+        log.close()
+        written = time.perf_counter() - start
+
+        start = time.perf_counter()
+        log = MessageLog(path, segment_size=16 * 1024 * 1024, max_segments=1000)
+        reopen = time.perf_counter() - start
+
+        _, group_ms = timed(lambda: log.history(group='g3', limit=50))
+        _, peer_ms = timed(lambda: log.history(peer='nutzer7', limit=50))
+        hits, common_ms = timed(lambda: log.search('mensa', 20))
+        rare, phrase_ms = timed(lambda: log.search('klausur morgen abend', 20))
+        log.close()
+
+        print(f"{count:>10} {len(log):>10} {count / enqueue / 1000:>10.0f}k "
+              f"{count / written / 1000:>10.0f}k {reopen:>9.2f}s {group_ms:>8.2f} {peer_ms:>8.2f} "
+              f"{common_ms:>8.2f} {phrase_ms:>8.2f}")
+        assert len(hits) == 20 and all('mensa' in entry.text for entry in hits)
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def main():
+    counts = [int(arg) for arg in sys.argv[1:]] or COUNTS
+    print(f"{'Nachr.':>10} {'indexiert':>10} {'append/s':>11} {'fsync/s':>11} {'Neustart':>10} "
+          f"{'Gruppe':>8} {'Peer':>8} {'Suche':>8} {'Phrase':>8}   (Abfragen in ms)")
+    for count in counts:
+        run(count)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""Multi-peer host mode: runs many simulated peers in one process for load testing.
+
+Aufruf: python -m benchmarks.multipeer [config.toml] --peers 10,50,100 --duration 10 \\
+            --rate 200 --mix gmsg=70,msg=20,join=5,img=5 [--transport multicast]
+
+Jeder Peer bekommt ein eigenes Handle, einen eigenen Port und zufällige Gruppen. Gemessen
+werden Latenz-Perzentile pro Nachrichtentyp, verlorene Nachrichten und die Zeit, bis alle
+Peer-Tabellen vollständig sind.
+"""
+import argparse
+import contextlib
+import os
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from network.network_handler import NetworkHandler
+from utils.config_loader import load_config
+
+MARKER = "lt:"
+
+
+class Recorder:
+    """Collects send and receive timestamps of the generated traffic."""
+
+    def __init__(self):
+        self.sent = {}      # {msg_id: (typ, sendezeit, erwartete Empfänger)}
+        self.received = {}  # {msg_id: {empfänger: empfangszeit}}
+        self.next_id = 0
+
+    def new_message(self, kind, expected):
+        self.next_id += 1
+        self.sent[self.next_id] = (kind, time.perf_counter(), set(expected))
+        return self.next_id
+
+    def record(self, msg_id, receiver):
+        self.received.setdefault(msg_id, {}).setdefault(receiver, time.perf_counter())
+
+    def summary(self):
+        """Returns {typ: (latenzen in ms, gesendet, erwartet, verloren)}."""
+        result = {}
+        for msg_id, (kind, sent_at, expected) in self.sent.items():
+            latencies, sent, total, dropped = result.setdefault(kind, ([], 0, 0, 0))
+            got = self.received.get(msg_id, {})
+            latencies.extend((got[r] - sent_at) * 1000 for r in expected if r in got)
+            result[kind] = (latencies, sent + 1, total + len(expected),
+                            dropped + len(expected - got.keys()))
+        return result
+
+
+class SimulatedPeer(NetworkHandler):
+    """NetworkHandler that reports received load-test traffic to a Recorder."""
+
+    def __init__(self, config, recorder):
+        self.recorder = recorder
+        self.pending_images = {}  # {absender: [msg_id, ...]}
+        super().__init__(config)
+
+    def _record(self, text):
+        if text.startswith(MARKER):
+            try:
+                self.recorder.record(int(text[len(MARKER):]), self.handle)
+            except ValueError:
+                pass
+
+    def _deliver_message(self, sender, text):
+        self._record(text)
+        super()._deliver_message(sender, text)
+
+    def _deliver_group_message(self, group, sender, text):
+        # Erst nach der Duplikaterkennung zählen; GMSG und SGMSG landen beide hier
+        self._record(text)
+        super()._deliver_group_message(group, sender, text)
+
+    def _save_image(self, receiver, rate):
+        super()._save_image(receiver, rate)
+        queued = self.pending_images.get(receiver.sender)
+        if queued:
+            self.recorder.record(queued.pop(0), self.handle)
+
+
+def peer_configs(template, count, base_port, whoisport, groups, memberships, image_path,
+                 transport='broadcast'):
+    """Derives one [user] config per simulated peer from the template."""
+    rng = random.Random(count)
+    configs = []
+    for i in range(count):
+        user = dict(template['user'])
+        user.update({
+            'handle': f"{template['user']['handle']}-{i}",
+            'port': base_port + i,
+            'whoisport': whoisport,
+            'broadcastaddress': '127.255.255.255',
+            'imagepath': image_path,
+            'history': False,  # Nur das Netz messen, nicht die Platte
+            'peersnapshot': False,
+            'grouptransport': transport,
+        })
+        joined = rng.sample(groups, min(memberships, len(groups)))
+        configs.append(({'user': user}, joined))
+    return configs
+
+
+def wait_for_convergence(peers, timeout):
+    """Returns the seconds until every peer knows all other members of its groups, or None."""
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        members = {}
+        for peer in peers:
+            for group in peer.groups:
+                members.setdefault(group, set()).add(peer.handle)
+        if all(members[group] - {peer.handle} <= set(peer.peers.members(group))
+               for peer in peers for group in peer.groups):
+            return time.perf_counter() - start
+        time.sleep(0.05)
+    return None
+
+
+def drive_traffic(peers, recorder, duration, rate, mix, img_size, pool):
+    """Sends a random traffic mix at the given rate (messages per second)."""
+    rng = random.Random(len(peers))
+    kinds, weights = zip(*mix.items())
+    interval = 1.0 / rate
+    next_send = time.perf_counter()
+    end = next_send + duration
+    while next_send < end:
+        sender = rng.choice(peers)
+        kind = rng.choices(kinds, weights)[0]
+        group_members = [p for p in peers if p is not sender]
+
+        if kind == 'gmsg':
+            group = rng.choice(sender.groups)
+            expected = [p.handle for p in group_members if group in p.groups]
+            msg_id = recorder.new_message(kind, expected)
+            sender.active_group = group
+            sender.send_group_message(f"{MARKER}{msg_id}")
+        elif kind == 'msg':
+            known = sender.peers.handles()
+            if known:
+                target = rng.choice(known)
+                msg_id = recorder.new_message(kind, [target])
+                sender.send_message(target, f"{MARKER}{msg_id}")
+        elif kind == 'img':
+            known = sender.peers.handles()
+            if known:
+                target = rng.choice(known)
+                msg_id = recorder.new_message(kind, [target])
+                receiver = next(p for p in peers if p.handle == target)
+                receiver.pending_images.setdefault(sender.handle, []).append(msg_id)
+                sender.send_image(target, str(img_size))
+        elif kind == 'join':
+            # Eine Gruppe verlassen und sofort wieder beitreten (JOIN/LEAVE-Churn)
+            group = rng.choice(sender.groups)
+            if group != 'default':
+                pool.submit(_rejoin, sender, group)
+
+        next_send += interval
+        delay = next_send - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+
+def _rejoin(peer, group):
+    peer.leave_group(group)
+    peer.join_group(group)
+
+
+def percentile(values, pct):
+    if not values:
+        return float('nan')
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def run(template, count, args, mix):
+    recorder = Recorder()
+    groups = ['default'] + [f"g{i}" for i in range(args.groups)]
+    configs = peer_configs(template, count, args.base_port, args.whoisport, groups[1:],
+                           args.memberships, args.image_path, args.transport)
+    peers = []
+    with ThreadPoolExecutor(max_workers=32) as pool:
+        for config, joined in configs:
+            peer = SimulatedPeer(config, recorder)
+            peers.append(peer)
+            for group in joined:
+                pool.submit(peer.join_group, group)
+    converged = wait_for_convergence(peers, args.converge_timeout)
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        drive_traffic(peers, recorder, args.duration, args.rate, mix, args.img_size, pool)
+    time.sleep(args.drain)
+    # Von allen Peers empfangene Gruppendatagramme; mit Multicast nur die eigener Gruppen
+    group_datagrams = sum(peer.io_stats()['broadcast']['recv_datagrams'] for peer in peers)
+
+    for peer in peers:
+        peer.shutdown()
+    time.sleep(0.2)
+    return converged, recorder.summary(), group_datagrams
+
+
+def parse_mix(mix_str):
+    mix = {}
+    for part in mix_str.split(','):
+        kind, weight = part.split('=')
+        if kind not in ('gmsg', 'msg', 'join', 'img'):
+            raise ValueError(f"Unbekannter Nachrichtentyp im Mix: {kind}")
+        mix[kind] = float(weight)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simuliert viele Peers in einem Prozess.")
+    parser.add_argument('config', nargs='?', default='config.toml', help="Vorlage mit [user]-Tabelle")
+    parser.add_argument('--peers', default='10,50,100', help="Kommagetrennte Peer-Anzahlen")
+    parser.add_argument('--duration', type=float, default=10.0, help="Dauer der Last in Sekunden")
+    parser.add_argument('--rate', type=float, default=100.0, help="Nachrichten pro Sekunde")
+    parser.add_argument('--mix', default='gmsg=70,msg=20,join=5,img=5')
+    parser.add_argument('--groups', type=int, default=4, help="Anzahl zusätzlicher Gruppen")
+    parser.add_argument('--memberships', type=int, default=2, help="Gruppen pro Peer")
+    parser.add_argument('--img-size', type=int, default=64 * 1024)
+    parser.add_argument('--base-port', type=int, default=20000)
+    parser.add_argument('--whoisport', type=int, default=19999)
+    parser.add_argument('--image-path', default=os.path.join('received_images', 'loadtest'))
+    parser.add_argument('--transport', choices=('broadcast', 'multicast'), default='broadcast',
+                        help="Transport für Gruppenverkehr")
+    parser.add_argument('--drain', type=float, default=3.0, help="Wartezeit auf Nachzügler")
+    parser.add_argument('--converge-timeout', type=float, default=60.0)
+    args = parser.parse_args()
+
+    template = load_config(args.config)
+    if not template:
+        sys.exit(1)
+    mix = parse_mix(args.mix)
+
+    print(f"{'Peers':>6} {'Konvergenz':>11} {'Typ':>5} {'gesendet':>9} {'verloren':>9} "
+          f"{'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for count in (int(n) for n in args.peers.split(',')):
+        # Die Konsolenausgaben der simulierten Peers unterdrücken
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            converged, summary, group_datagrams = run(template, count, args, mix)
+        converged_str = f"{converged:.2f}s" if converged is not None else "nein"
+        for kind, (latencies, sent, expected, dropped) in sorted(summary.items()):
+            print(f"{count:>6} {converged_str:>11} {kind:>5} {sent:>9} {dropped:>9} "
+                  f"{percentile(latencies, 50):>8.1f} {percentile(latencies, 90):>8.1f} "
+                  f"{percentile(latencies, 99):>8.1f} {max(latencies, default=float('nan')):>8.1f}")
+        print(f"{count:>6} Gruppendatagramme empfangen (alle Peers): {group_datagrams}")
+
+
+if __name__ == "__main__":
+    main()
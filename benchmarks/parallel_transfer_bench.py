@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""Loopback benchmark for parallel transfers to several receivers.
+
+Aufruf: python -m benchmarks.parallel_transfer_bench [--streams 1,4,8] [--size 8388608]
+
+Ein Sender verteilt mit send_image_to_group denselben Block an alle Empfänger der Gruppe,
+jeder Empfänger ist ein eigener Transfer mit eigenem Staufenster. Gemessen werden der
+Durchsatz pro Strom, die Fairness nach Jain (1.0 = alle gleich schnell) und die Latenz von
+Direktnachrichten, die während der Übertragung gesendet werden.
+"""
+import argparse
+import shutil
+import tempfile
+import time
+
+from network.network_handler import NetworkHandler
+
+MARKER = "lat:"
+
+
+class BenchPeer(NetworkHandler):
+    """NetworkHandler that records finished transfers and chat latency."""
+
+    def __init__(self, config):
+        self.finished = {}   # {absender: (empfangszeit, mb/s)}
+        self.latencies = []  # Millisekunden
+        self.group_latencies = []
+        super().__init__(config)
+
+    def _deliver_message(self, sender, text):
+        if text.startswith(MARKER):
+            self.latencies.append((time.perf_counter() - float(text[len(MARKER):])) * 1000)
+
+    def _deliver_group_message(self, group, sender, text):
+        if text.startswith(MARKER):
+            self.group_latencies.append((time.perf_counter() - float(text[len(MARKER):])) * 1000)
+
+    def _save_image(self, receiver, rate):
+        super()._save_image(receiver, rate)
+        self.finished[receiver.sender] = (time.perf_counter(), rate / (1024 * 1024))
+
+
+def _config(handle, port, whoisport, path):
+    return {'user': {
+        'handle': handle, 'port': port, 'whoisport': whoisport, 'broadcastaddress': '127.255.255.255',
+        'history': False, 'peersnapshot': False, 'imagepath': path, 'aliveinterval': 1,
+    }}
+
+
+def jain(values):
+    """Jain's fairness index of the given throughputs."""
+    if not values:
+        return float('nan')
+    return sum(values) ** 2 / (len(values) * sum(v * v for v in values))
+
+
+def _chat_latency(sender, receiver, count, interval, until=None):
+    """Sends direct messages and returns the new latency samples of the receiver."""
+    before = len(receiver.latencies)
+    for _ in range(count):
+        if until is not None and until():
+            break
+        sender.send_message(receiver.handle, f"{MARKER}{time.perf_counter()}")
+        time.sleep(interval)
+    time.sleep(0.1)
+    return receiver.latencies[before:]
+
+
+def percentile(values, pct):
+    if not values:
+        return float('nan')
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def run(streams, size, base_port, timeout):
+    path = tempfile.mkdtemp(prefix='parallel-bench-')
+    sender = BenchPeer(_config('sender', base_port + 1, base_port, path))
+    receivers = [BenchPeer(_config(f"empfaenger-{i}", base_port + 2 + i, base_port, path))
+                 for i in range(streams)]
+    try:
+        deadline = time.monotonic() + 10
+        handles = {r.handle for r in receivers}
+        while not handles <= set(sender.peers.members('default')):
+            if time.monotonic() > deadline:
+                raise RuntimeError("Empfänger wurden nicht gefunden")
+            time.sleep(0.05)
+        idle = _chat_latency(sender, receivers[0], 50, 0.005)
+
+        start = time.perf_counter()
+        sender.send_image_to_group(str(size))
+        busy = _chat_latency(sender, receivers[0], 100000, 0.005,
+                             until=lambda: all('sender' in r.finished for r in receivers)
+                             or time.perf_counter() - start > timeout)
+        while (not all('sender' in r.finished for r in receivers)
+               and time.perf_counter() - start < timeout):
+            time.sleep(0.01)
+        finished = [r.finished['sender'] for r in receivers if 'sender' in r.finished]
+        rates = [rate for _, rate in finished]
+        elapsed = max((at for at, _ in finished), default=time.perf_counter()) - start
+        total = len(rates) * size / (1024 * 1024) / elapsed
+        return len(rates), rates, total, idle, busy, sender.transfer_scheduler.deferred
+    finally:
+        for peer in [sender] + receivers:
+            peer.shutdown()
+        time.sleep(0.2)
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parallele Transfers an mehrere Empfänger.")
+    parser.add_argument('--streams', default='1,4,8', help="Kommagetrennte Anzahl Empfänger")
+    parser.add_argument('--size', type=int, default=8 * 1024 * 1024, help="Bytes pro Empfänger")
+    parser.add_argument('--base-port', type=int, default=23000)
+    parser.add_argument('--timeout', type=float, default=120.0)
+    args = parser.parse_args()
+
+    print(f"{'Ströme':>6} {'fertig':>7} {'gesamt MB/s':>12} {'min MB/s':>9} {'max MB/s':>9} "
+          f"{'Jain':>6} {'Chat p50/p99 ms leer':>21} {'während':>15} {'verzögert':>10}")
+    for streams in (int(n) for n in args.streams.split(',')):
+        done, rates, total, idle, busy, deferred = run(streams, args.size, args.base_port, args.timeout)
+        print(f"{streams:>6} {done:>4}/{streams:<2} {total:>12.1f} {min(rates, default=0):>9.1f} "
+              f"{max(rates, default=0):>9.1f} {jain(rates):>6.3f} "
+              f"{percentile(idle, 50):>10.2f}/{percentile(idle, 99):<10.2f} "
+              f"{percentile(busy, 50):>7.2f}/{percentile(busy, 99):<7.2f} {deferred:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""Microbenchmark: text protocol vs. binary frames (parse throughput and bytes on the wire).
+
+Aufruf: python -m benchmarks.protocol_bench [Wiederholungen]
+"""
+import sys
+import time
+
+from network import protocol
+
+GROUPS = {protocol.group_id(g): g for g in ("default", "projekt-gruppe")}
+
+MESSAGES = {
+    "ALIVE": protocol.Packet(protocol.ALIVE, "projekt-gruppe", "Simon", 5001, None),
+    "JOIN": protocol.Packet(protocol.JOIN, "projekt-gruppe", "User Two", 5002, None),
+    "GMSG kurz": protocol.Packet(protocol.GMSG, "default", "Taha", None, "ok"),
+    "GMSG lang": protocol.Packet(protocol.GMSG, "projekt-gruppe", "Taha", None,
+                                 " ".join(["Treffen wir uns morgen um zehn in der Bibliothek?"] * 3)),
+    "MSG": protocol.Packet(protocol.MSG, None, "Simon", None, "Hast du die Folien schon?"),
+    # Nachricht einer nicht beigetretenen Gruppe, die der Empfänger verwerfen muss
+    "GMSG fremd": protocol.Packet(protocol.GMSG, "andere-gruppe", "Taha", None,
+                                  "Das hier interessiert nur die andere Gruppe."),
+}
+
+
+def _rate(func, data, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(data)
+    return repeat / (time.perf_counter() - start)
+
+
+def parse_text(data):
+    packet = protocol.parse_text(data.decode('utf-8').strip())
+    if packet is not None and packet.group is not None and packet.group not in GROUPS.values():
+        return None
+    return packet
+
+
+def parse_binary(data):
+    return protocol.parse_binary(data, GROUPS)
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    print(f"{'Nachricht':<11} {'Text B':>7} {'Binär B':>8} {'Text Msg/s':>12} {'Binär Msg/s':>12}")
+    for name, packet in MESSAGES.items():
+        text = protocol.encode_text(packet)
+        binary = protocol.encode_binary(packet)
+        assert parse_binary(binary) == parse_text(text)
+        print(f"{name:<11} {len(text):>7} {len(binary):>8} "
+              f"{_rate(parse_text, text, repeat):>12,.0f} {_rate(parse_binary, binary, repeat):>12,.0f}")
+
+
+if __name__ == "__main__":
+    main()
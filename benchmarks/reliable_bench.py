@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""Loopback benchmark for reliable direct messages under simulated loss.
+
+Aufruf: python -m benchmarks.reliable_bench [Verlustraten ...] [--messages 500] [--rate 200]
+
+Zwei Instanzen tauschen RMSG/RACK über Loopback aus; nach der Aushandlung verwerfen beide
+zufällig den angegebenen Anteil ihrer Unicast-Datagramme. Geprüft wird, dass jede Nachricht
+genau einmal und in Reihenfolge ankommt; dazu RTT- und Verlustschätzung des Senders.
+Der Exit-Status ist 1, wenn bei einer Verlustrate etwas fehlt oder außer der Reihe kam.
+"""
+import argparse
+import contextlib
+import os
+import random
+import sys
+import tempfile
+import time
+
+from network import protocol
+from network.network_handler import NetworkHandler
+
+LOSS_RATES = [0.0, 0.05, 0.2]
+
+
+class LossyPeer(NetworkHandler):
+    """NetworkHandler that drops outgoing unicast datagrams and records delivered messages."""
+
+    def __init__(self, config, seed):
+        self.rng = random.Random(seed)
+        self.loss = 0.0
+        self.delivered = []
+        super().__init__(config)
+
+    def _send_unicast(self, data, addr):
+        if self.loss and self.rng.random() < self.loss:
+            return
+        super()._send_unicast(data, addr)
+
+    def _deliver_message(self, sender, text):
+        self.delivered.append(text)
+
+
+def _config(handle, port, whoisport, path):
+    return {'user': {
+        'handle': handle, 'port': port, 'whoisport': whoisport, 'broadcastaddress': '127.255.255.255',
+        'reliablemsg': True, 'history': False, 'peersnapshot': False, 'imagepath': path, 'aliveinterval': 1,
+    }}
+
+
+def run(loss, messages, rate, base_port, timeout):
+    path = tempfile.mkdtemp(prefix='reliable-bench-')
+    a = LossyPeer(_config('sender', base_port + 1, base_port, path), 1)
+    b = LossyPeer(_config('empfaenger', base_port + 2, base_port, path), 2)
+    try:
+        deadline = time.monotonic() + 5
+        while not (a.peers.supports('empfaenger', protocol.RELIABLE_CAPABILITY)
+                   and b.peers.supports('sender', protocol.RELIABLE_CAPABILITY)):
+            if time.monotonic() > deadline:
+                raise RuntimeError("Aushandlung fehlgeschlagen")
+            time.sleep(0.05)
+        a.loss = b.loss = loss
+
+        start = time.monotonic()
+        for i in range(messages):
+            a.send_message('empfaenger', str(i))
+            time.sleep(1.0 / rate)
+        while len(b.delivered) < messages and time.monotonic() - start < timeout:
+            time.sleep(0.01)
+        elapsed = time.monotonic() - start
+        quality = a.link_quality('empfaenger')
+        expected = [str(i) for i in range(messages)]
+        return b.delivered == expected, len(b.delivered), elapsed, quality
+    finally:
+        a.shutdown()
+        b.shutdown()
+        time.sleep(0.2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Zuverlässige Direktnachrichten unter Verlust.")
+    parser.add_argument('loss', nargs='*', type=float, default=LOSS_RATES, help="Verlustraten 0..1")
+    parser.add_argument('--messages', type=int, default=500)
+    parser.add_argument('--rate', type=float, default=200.0, help="Nachrichten pro Sekunde")
+    parser.add_argument('--base-port', type=int, default=23000)
+    parser.add_argument('--timeout', type=float, default=60.0)
+    args = parser.parse_args()
+
+    print(f"{'Verlust':>8} {'geordnet':>9} {'zugest.':>8} {'Dauer s':>8} {'RTT ms':>7} "
+          f"{'RTO ms':>7} {'geschätzt':>10} {'wiederh.':>9} {'fehlg.':>7}")
+    failures = 0
+    for loss in args.loss:
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            ordered, count, elapsed, q = run(loss, args.messages, args.rate, args.base_port, args.timeout)
+        rtt = q['srtt'] * 1000 if q['srtt'] is not None else float('nan')
+        print(f"{loss:>8.0%} {'ja' if ordered else 'NEIN':>9} {count:>8} {elapsed:>8.2f} {rtt:>7.2f} "
+              f"{q['rto'] * 1000:>7.0f} {q['loss']:>10.1%} {q['retransmits']:>9} {q['failed']:>7}")
+        if not ordered:
+            failures += 1
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""Loopback benchmark for the time until a restarted node can deliver a message.
+
+Aufruf: python -m benchmarks.restart_bench [--peers 5] [--aliveinterval 15]
+
+Ein Knoten läuft mit mehreren Peers, stürzt ab (ohne LEAVE, die anderen halten ihn daher
+weiter für anwesend und antworten nicht auf sein JOIN) und startet neu. Gemessen wird die
+Zeit vom Neustart, bis die erste Direktnachricht an einen Peer ankommt, und bis alle Peers
+wieder bekannt sind - einmal mit Peer-Snapshot und Nachfrage per Unicast, einmal ohne.
+Zum Vergleich auch ein sauberer Neustart (mit LEAVE) mit Snapshot.
+"""
+import argparse
+import shutil
+import tempfile
+import time
+
+from benchmarks.parallel_transfer_bench import MARKER
+from network.network_handler import NetworkHandler
+
+
+class Receiver(NetworkHandler):
+    """NetworkHandler that records when a marked direct message arrived."""
+
+    def __init__(self, config):
+        self.received = []  # perf_counter-Zeitpunkte
+        super().__init__(config)
+
+    def _deliver_message(self, sender, text):
+        if text.startswith(MARKER):
+            self.received.append(time.perf_counter())
+
+
+def _config(handle, port, whoisport, path, snapshot, alive):
+    return {'user': {
+        'handle': handle, 'port': port, 'whoisport': whoisport, 'broadcastaddress': '127.255.255.255',
+        'history': False, 'imagepath': path, 'statepath': path, 'peersnapshot': snapshot,
+        'snapshotinterval': 0.2, 'aliveinterval': alive, 'alivetimeout': alive * 2 + 5,
+    }}
+
+
+def crash(handler):
+    """Stops a handler without LEAVE, as if the process had been killed."""
+    handler.running = False
+    handler.loop.call_soon(handler._close)
+    time.sleep(0.1)
+
+
+def run(peer_count, snapshot, clean, alive, base_port, timeout):
+    path = tempfile.mkdtemp(prefix='restart-bench-')
+    config = _config('neustart', base_port + 1, base_port, path, snapshot, alive)
+    peers = [Receiver(_config(f"peer-{i}", base_port + 2 + i, base_port, path, False, alive))
+             for i in range(peer_count)]
+    node = NetworkHandler(config)
+    try:
+        deadline = time.monotonic() + 10
+        while len(node.peers) < peer_count and time.monotonic() < deadline:
+            time.sleep(0.02)
+        time.sleep(0.5)  # Mindestens ein Snapshot
+        if clean:
+            node.shutdown()
+            time.sleep(0.2)
+        else:
+            crash(node)
+
+        start = time.perf_counter()
+        node = NetworkHandler(config)
+        first_message = all_known = None
+        target = peers[0]
+        while time.perf_counter() - start < timeout and (first_message is None or all_known is None):
+            if first_message is None:
+                if target.received:
+                    first_message = target.received[0] - start
+                elif node.peers.lookup(target.handle):
+                    node.send_message(target.handle, f"{MARKER}{time.perf_counter()}")
+            if all_known is None and len(node.peers) >= peer_count:
+                all_known = time.perf_counter() - start
+            time.sleep(0.002)
+        return first_message, all_known, dict(node._probes.values)
+    finally:
+        for handler in [node] + peers:
+            handler.shutdown()
+        time.sleep(0.2)
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Zeit bis zur ersten zustellbaren Nachricht nach einem Neustart.")
+    parser.add_argument('--peers', type=int, default=5)
+    parser.add_argument('--aliveinterval', type=float, default=15.0, help="ALIVE-Intervall aller Knoten")
+    parser.add_argument('--base-port', type=int, default=26000)
+    args = parser.parse_args()
+    timeout = args.aliveinterval * 2 + 5
+
+    print(f"{'Neustart':<10} {'Snapshot':>9} {'erste Nachricht':>16} {'alle Peers':>11} {'Proben':>16}")
+    for clean, snapshot in ((False, False), (False, True), (True, True)):
+        first, known, probes = run(args.peers, snapshot, clean, args.aliveinterval, args.base_port, timeout)
+        fmt = lambda value: f"{value * 1000:.0f} ms" if value is not None else f"> {timeout:.0f} s"
+        probe_str = f"{probes.get(('confirmed',), 0)}/{probes.get(('sent',), 0)} bestätigt"
+        print(f"{'sauber' if clean else 'Absturz':<10} {'an' if snapshot else 'aus':>9} {fmt(first):>16} "
+              f"{fmt(known):>11} {probe_str:>16}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""Benchmark for the cold start up to the first JOIN and for config (re)loading.
+
+Aufruf: python -m benchmarks.startup_bench [--runs 5] [--target-ms 500]
+
+Startet wiederholt einen frischen Interpreter, der die Konfiguration lädt und einen
+NetworkHandler erzeugt, und misst die Zeit vom Start des Prozesses bis zum Empfang seines
+JOIN auf dem Broadcast-Port. Der Kindprozess meldet dazu die Dauer der einzelnen Schritte.
+Außerdem: Parsen der Datei mit tomllib bzw. toml, ein Lesen aus dem Cache (unveränderte
+Datei) und ein Neuladen im laufenden Betrieb mit und ohne Portwechsel.
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BROADCAST_ADDRESS = '127.255.255.255'
+CONFIG = """[user]
+handle = "start"
+port = {port}
+whoisport = {whoisport}
+broadcastaddress = "{address}"
+history = false
+peersnapshot = false
+imagepath = "{path}"
+autoreply = "{autoreply}"
+"""
+
+
+def write_config(path, port, whoisport, directory, autoreply="Ich bin gerade nicht da."):
+    with open(path, 'w') as f:
+        f.write(CONFIG.format(port=port, whoisport=whoisport, address=BROADCAST_ADDRESS,
+                              path=directory, autoreply=autoreply))
+
+
+def child(config_file):
+    """Runs in the fresh interpreter: load the config, start a handler, report the phases."""
+    phases = {}
+    start = time.perf_counter()
+    from utils import config_loader
+    phases['import config_loader'] = time.perf_counter() - start
+    mark = time.perf_counter()
+    config = config_loader.load_config(config_file)
+    phases['load_config'] = time.perf_counter() - mark
+    mark = time.perf_counter()
+    from network.network_handler import NetworkHandler
+    phases['import network_handler'] = time.perf_counter() - mark
+    mark = time.perf_counter()
+    handler = NetworkHandler(config)
+    phases['NetworkHandler()'] = time.perf_counter() - mark
+    print(json.dumps(phases), flush=True)
+    sys.stdin.readline()  # Bis der Messprozess fertig ist
+    handler.shutdown()
+    time.sleep(0.1)
+
+
+def cold_start(config_file, whoisport, timeout=10.0):
+    """Starts a child and returns (ms until its JOIN arrived, phases in ms)."""
+    listener = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind(('0.0.0.0', whoisport))
+    listener.settimeout(timeout)
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, '-m', 'benchmarks.startup_bench', '--child', config_file],
+                            stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+    try:
+        while True:
+            data, _ = listener.recvfrom(65535)
+            if data.startswith(b'JOIN '):
+                elapsed = (time.perf_counter() - start) * 1000
+                break
+        phases = {name: value * 1000 for name, value in json.loads(proc.stdout.readline()).items()}
+        proc.stdin.write('\n')
+        proc.stdin.flush()
+        proc.wait(5)
+        return elapsed, phases
+    finally:
+        listener.close()
+        if proc.poll() is None:
+            proc.kill()
+
+
+def parse_times(config_file, repeat=200):
+    """Microseconds per parse with tomllib and toml (None if not installed), and per cached read."""
+    from utils import config_loader
+    results = {}
+    try:
+        import tomllib
+        with open(config_file, 'rb') as f:
+            data = f.read()
+        start = time.perf_counter()
+        for _ in range(repeat):
+            tomllib.loads(data.decode())
+        results['tomllib'] = (time.perf_counter() - start) / repeat * 1e6
+    except ImportError:
+        results['tomllib'] = None
+    try:
+        import toml
+        with open(config_file) as f:
+            text = f.read()
+        start = time.perf_counter()
+        for _ in range(repeat):
+            toml.loads(text)
+        results['toml'] = (time.perf_counter() - start) / repeat * 1e6
+    except ImportError:
+        results['toml'] = None
+    config_loader.read_config(config_file)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        config_loader.read_config(config_file)
+    results['Cache'] = (time.perf_counter() - start) / repeat * 1e6
+    return results
+
+
+def reload_times(config_file, port, whoisport, directory):
+    """Milliseconds for apply_config without and with a port change; checks that peers survive."""
+    from network.network_handler import NetworkHandler
+    from utils import config_loader
+    handler = NetworkHandler(config_loader.read_config(config_file))
+    peer = NetworkHandler({'user': {'handle': 'gegenueber', 'port': port + 1, 'whoisport': whoisport,
+                                    'broadcastaddress': BROADCAST_ADDRESS, 'history': False, 'peersnapshot': False,
+                                    'imagepath': directory}})
+    try:
+        deadline = time.monotonic() + 5
+        while 'gegenueber' not in handler.peers.handles() and time.monotonic() < deadline:
+            time.sleep(0.02)
+        results = {}
+        for name, new_port, autoreply in (("autoreply", port, "Bin gleich zurück."),
+                                          ("port", port + 2, "Bin gleich zurück.")):
+            write_config(config_file, new_port, whoisport, directory, autoreply)
+            config = config_loader.read_config(config_file)
+            start = time.perf_counter()
+            handler.loop.run(handler.apply_config(config))
+            results[name] = (time.perf_counter() - start) * 1000
+        kept = 'gegenueber' in handler.peers.handles()
+        return results, kept
+    finally:
+        handler.shutdown()
+        peer.shutdown()
+        time.sleep(0.2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Kaltstart bis zum ersten JOIN und Neuladen der Konfiguration.")
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--target-ms', type=float, default=500.0, help="Ziel für den Median des Kaltstarts")
+    parser.add_argument('--base-port', type=int, default=25000)
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args.child)
+        return
+
+    directory = tempfile.mkdtemp(prefix='startup-bench-')
+    config_file = os.path.join(directory, 'config.toml')
+    port, whoisport = args.base_port + 1, args.base_port
+    write_config(config_file, port, whoisport, directory)
+
+    totals, phases = [], {}
+    for _ in range(args.runs):
+        elapsed, child_phases = cold_start(config_file, whoisport)
+        totals.append(elapsed)
+        for name, value in child_phases.items():
+            phases.setdefault(name, []).append(value)
+        time.sleep(0.2)
+    print(f"Kaltstart bis JOIN (Median aus {args.runs}): {statistics.median(totals):.1f} ms "
+          f"(min {min(totals):.1f}, max {max(totals):.1f})")
+    for name, values in phases.items():
+        print(f"  {name:<24} {statistics.median(values):>8.2f} ms")
+    rest = statistics.median(totals) - sum(statistics.median(v) for v in phases.values())
+    print(f"  {'Interpreter und Rest':<24} {rest:>8.2f} ms")
+
+    print("Konfiguration lesen:")
+    for name, value in parse_times(config_file).items():
+        print(f"  {name:<24} " + (f"{value:>8.1f} µs" if value is not None else "     nicht installiert"))
+
+    results, kept = reload_times(config_file, port, whoisport, directory)
+    print("Neuladen im Betrieb:")
+    for name, value in results.items():
+        print(f"  {'Änderung ' + name:<24} {value:>8.2f} ms")
+    print(f"  Peers erhalten: {'ja' if kept else 'NEIN'}")
+
+    ok = statistics.median(totals) <= args.target_ms
+    print(f"Ziel {args.target_ms:.0f} ms: {'erreicht' if ok else 'VERFEHLT'}")
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
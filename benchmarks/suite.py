@@ -0,0 +1,383 @@
+#!/usr/bin/env python3
+"""Benchmark and regression suite for the network layer, with NetworkHandlers on loopback.
+
+Aufruf: python -m benchmarks.suite [--only parse,latency,transfer,discovery,memory] [--repeat 3]
+            [--quick] [--output ergebnis.json] [--baseline basis.json] [--tolerance 0.15]
+
+Alle Peers sind echte NetworkHandler auf 127.0.0.1. Jede Messung bekommt frische, vom
+Kernel vergebene Ports, damit sich Läufe nicht gegenseitig stören. Gemessen werden:
+
+  parse      Datagramme pro Sekunde durch Empfang, Parsen, Verarbeitung und Zustellung,
+             direkt in die Empfangsfunktionen gespeist (ohne Sockets), je Befehl und Format
+  latency    p50/p99 der Latenz von MSG und GMSG zwischen zwei Peers
+  transfer   Durchsatz von send_image je Größe
+  discovery  Sekunden, bis sich N Peers gegenseitig kennen, per Broadcast und per Gossip
+  memory     Bytes pro bekanntem Peer in der Peer-Tabelle (samt ausgehandelter Fähigkeiten)
+             und pro Mitglied der Gossip-Mitgliedschaft (samt ausstehender Verbreitung), sowie pro
+             Nachricht im vollen Puffer der Gruppennachrichten
+
+Jede Messung läuft --repeat mal, Ergebnis ist der Median. --output schreibt die Werte als
+JSON, dieselbe Datei dient später als --baseline. Werte, die um mehr als --tolerance
+schlechter sind als in der Basis, gelten als Regression, und das Programm endet mit
+Status 1. Latenzen und Durchsätze hängen stark von der Maschine und ihrer Last ab;
+Vergleiche sind nur auf demselben Rechner aussagekräftig.
+"""
+import argparse
+import asyncio
+import gc
+import json
+import os
+import platform
+import shutil
+import socket
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.gossip_bench import _wait
+from benchmarks.parallel_transfer_bench import MARKER, BenchPeer, _chat_latency, percentile
+from network import gossip
+from network import group_cache
+from network import protocol
+from network import tcp_transfer
+from network import transfer
+
+RESULT_VERSION = 1
+GROUPS = ('parse', 'latency', 'transfer', 'discovery', 'memory')
+HIGHER, LOWER = 'higher', 'lower'
+RECV_BATCH = 64     # Datagramme pro Runde des Event-Loops, wie ein Stapel aus recvmmsg()
+VARIANTS = 100      # Verschiedene Absender bzw. Texte je Befehl
+WAIT_TIMEOUT = 60.0
+
+
+def free_ports(count):
+    """Returns count distinct UDP ports that are free on all interfaces right now."""
+    socks, ports = [], []
+    try:
+        while len(ports) < count:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            socks.append(sock)
+            sock.bind(('0.0.0.0', 0))
+            ports.append(sock.getsockname()[1])
+    finally:
+        for sock in socks:
+            sock.close()
+    return ports
+
+
+class Peers:
+    """Starts BenchPeers on fresh ports with a temporary image directory; shuts them down on exit."""
+
+    def __init__(self, **settings):
+        self.settings = settings
+        self.path = tempfile.mkdtemp(prefix='suite-')
+        self.whoisport = free_ports(1)[0]
+        self.peers = []
+
+    def start(self, count, **settings):
+        started = []
+        for port in free_ports(count):
+            user = {
+                'handle': f"peer-{len(self.peers)}", 'port': port, 'whoisport': self.whoisport,
+                'broadcastaddress': '127.255.255.255', 'history': False, 'peersnapshot': False,
+                'imagepath': self.path,
+                # Alle Peers teilen sich 127.0.0.1; die Begrenzung pro Quell-IP verfälschte die Messung
+                'ratelimit': False,
+            }
+            user.update(self.settings)
+            user.update(settings)
+            peer = BenchPeer({'user': user})
+            self.peers.append(peer)
+            started.append(peer)
+        return started
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        for peer in self.peers:
+            peer.shutdown()
+        time.sleep(0.2)
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+def _require(seconds, what):
+    if seconds is None:
+        raise RuntimeError(f"Zeitüberschreitung: {what}")
+    return seconds
+
+
+def _connect(a, b):
+    """Waits until a and b know each other and negotiated their capabilities."""
+    _require(_wait(lambda: a.peers.capabilities(b.handle) is not None
+                   and b.peers.capabilities(a.handle) is not None, WAIT_TIMEOUT),
+             f"{a.handle} und {b.handle} finden sich nicht")
+
+
+async def _feed(handler, receive, datagrams, addr):
+    """Hands datagrams to a receive function in batches and waits until their delivery ran."""
+    start = time.perf_counter()
+    for offset in range(0, len(datagrams), RECV_BATCH):
+        for data in datagrams[offset:offset + RECV_BATCH]:
+            receive(data, addr)
+        await asyncio.sleep(0)
+    while handler.dispatcher.pending():
+        await asyncio.sleep(0.001)
+    return time.perf_counter() - start
+
+
+def measure_parse(quick):
+    count = 5000 if quick else 30000
+    with Peers() as peers:
+        handler, = peers.start(1)
+        sink = ('127.0.0.1', handler.port)
+        text = "Hast du die Folien zur Vorlesung von heute schon hochgeladen?"
+        cases = {
+            'alive_text': ('broadcast', [protocol.encode_text(protocol.Packet(
+                protocol.ALIVE, 'default', f"nutzer{i}", handler.port, None)) for i in range(VARIANTS)]),
+            'gmsg_text': ('broadcast', [protocol.encode_text(protocol.Packet(
+                protocol.GMSG, 'default', f"nutzer{i}", None, f"{text} {i}")) for i in range(VARIANTS)]),
+            'gmsg_binary': ('broadcast', [protocol.encode_binary(protocol.Packet(
+                protocol.GMSG, 'default', f"nutzer{i}", None, f"{text} {i}")) for i in range(VARIANTS)]),
+            'msg_text': ('unicast', [protocol.encode_text(protocol.Packet(
+                protocol.MSG, None, f"nutzer{i}", None, f"{text} {i}")) for i in range(VARIANTS)]),
+            'msg_binary': ('unicast', [protocol.encode_binary(protocol.Packet(
+                protocol.MSG, None, f"nutzer{i}", None, f"{text} {i}")) for i in range(VARIANTS)]),
+            # Jede mit eigener Sequenznummer, sonst fielen ab der zweiten Runde alle als Duplikate heraus
+            'sgmsg_binary': ('broadcast', [protocol.encode_binary(protocol.Packet(
+                protocol.SGMSG, 'default', f"nutzer{i % VARIANTS}", None, f"{text} {i}", 1, i // VARIANTS + 1))
+                for i in range(count)]),
+        }
+        results = {}
+        for name, (kind, variants) in cases.items():
+            receive = handler._on_unicast_datagram if kind == 'unicast' else handler._on_broadcast_datagram
+            datagrams = (variants * (count // len(variants) + 1))[:count]
+            dropped = handler.dispatcher.dropped
+            elapsed = handler.loop.submit(_feed(handler, receive, datagrams, sink)).result()
+            if handler.dispatcher.dropped != dropped:
+                # Sonst zählte der Durchsatz verworfene Nachrichten mit
+                raise RuntimeError(f"{name}: {handler.dispatcher.dropped - dropped} Nachrichten verworfen")
+            results[f"parse.{name}"] = (count / elapsed, 'msg/s', HIGHER)
+        return results
+
+
+def measure_latency(quick):
+    count = 200 if quick else 1000
+    with Peers() as peers:
+        sender, receiver = peers.start(2)
+        _connect(sender, receiver)
+        direct = _chat_latency(sender, receiver, count, 0.002)
+        for _ in range(count):
+            sender.send_group_message(f"{MARKER}{time.perf_counter()}")
+            time.sleep(0.002)
+        time.sleep(0.1)
+        group = receiver.group_latencies
+        if len(direct) < count // 2 or len(group) < count // 2:
+            raise RuntimeError(f"Zu viele Nachrichten verloren: MSG {len(direct)}, GMSG {len(group)} von {count}")
+        return {
+            'latency.msg_p50_ms': (percentile(direct, 50), 'ms', LOWER),
+            'latency.msg_p99_ms': (percentile(direct, 99), 'ms', LOWER),
+            'latency.gmsg_p50_ms': (percentile(group, 50), 'ms', LOWER),
+            'latency.gmsg_p99_ms': (percentile(group, 99), 'ms', LOWER),
+        }
+
+
+def _size_label(size):
+    for unit, factor in (('MiB', 1024 * 1024), ('KiB', 1024)):
+        if size >= factor and size % factor == 0:
+            return f"{size // factor}{unit}"
+    return f"{size}B"
+
+
+def measure_transfer(quick):
+    sizes = (64 * 1024, 1024 * 1024) if quick else (64 * 1024, 1024 * 1024, 16 * 1024 * 1024)
+    with Peers() as peers:
+        sender, receiver = peers.start(2)
+        _connect(sender, receiver)
+        results = {}
+        for size in sizes:
+            receiver.finished.pop(sender.handle, None)
+            start = time.perf_counter()
+            sender.send_image(receiver.handle, str(size))
+            _require(_wait(lambda: sender.handle in receiver.finished, WAIT_TIMEOUT),
+                     f"Transfer von {_size_label(size)}")
+            elapsed = receiver.finished[sender.handle][0] - start
+            results[f"transfer.{_size_label(size)}_mb_s"] = (size / (1024 * 1024) / elapsed, 'MB/s', HIGHER)
+        return results
+
+
+def measure_discovery(quick):
+    count = 10 if quick else 30
+    results = {}
+    for mode in ('broadcast', 'gossip'):
+        with Peers(discovery=mode) as peers:
+            first, = peers.start(1)
+            if mode == 'gossip':
+                peers.settings['seeds'] = [f"127.0.0.1:{first.port}"]
+            group = [first] + peers.start(count - 1)
+            seconds = _require(_wait(lambda: all(len(peer.peers.members('default')) == count - 1
+                                                 for peer in group), WAIT_TIMEOUT),
+                               f"Entdeckung per {mode}")
+            results[f"discovery.{mode}_{count}_s"] = (seconds, 's', LOWER)
+    return results
+
+
+def _traced(fn):
+    """Runs fn and returns the growth of traced Python memory in bytes."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        fn()
+        gc.collect()
+        return tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+
+
+def measure_memory(quick):
+    count = 2000 if quick else 10000
+    results = {}
+    with Peers() as peers:
+        handler, = peers.start(1)
+        sink = ('127.0.0.1', free_ports(1)[0])
+        datagrams = [protocol.encode_text(protocol.Packet(protocol.ALIVE, 'default', f"nutzer{i}", sink[1], None))
+                     for i in range(count)]
+        caps = ','.join([protocol.CAPABILITY, protocol.RELIABLE_CAPABILITY, *handler.compressor.capabilities(),
+                         transfer.FILE_CAPABILITY, transfer.CHECKSUM_CAPABILITY, tcp_transfer.TCP_CAPABILITY])
+
+        async def negotiate():
+            # Die CAPS an die Absender laufen ins Leere; eingetragen wird die Antwort, die ein
+            # echter Peer mit allen Erweiterungen schicken würde
+            for i in range(count):
+                handler._handle_unicast_message(f"CAPS-REPLY nutzer{i} {caps}", sink)
+
+        def track():
+            handler.loop.submit(_feed(handler, handler._on_broadcast_datagram, datagrams, sink)).result()
+            handler.loop.submit(negotiate()).result()
+            if len(handler.peers.members('default')) != count:
+                raise RuntimeError(f"Nur {len(handler.peers.members('default'))} von {count} Peers eingetragen")
+            # Ausgehende CAPS abfließen lassen, bevor gemessen wird
+            time.sleep(0.5)
+
+        results['memory.peer_bytes'] = (_traced(track) / count, 'B/peer', LOWER)
+
+    membership = gossip.Membership('ich', 5000, ['default'], time.time())
+
+    def join():
+        now = time.time()
+        for i in range(count):
+            message = {'t': 'gossip', 'n': [f"nutzer{i}", 5000, int(now), ['default']]}
+            membership.receive(message, (f"10.{i // 65536}.{i // 256 % 256}.{i % 256}", 5000), now)
+
+    results['memory.gossip_member_bytes'] = (_traced(join) / count, 'B/member', LOWER)
+
+    cache = group_cache.MessageCache()
+    capacity = cache.capacity * cache.max_groups
+
+    def fill():
+        # Doppelt so viele Nachrichten, wie hineinpassen: der Puffer muss auch verdrängen
+        for i in range(2 * capacity):
+            cache.store(f"gruppe{i % cache.max_groups}", f"nutzer{i % 50}", 1, i + 1,
+                        f"Nachricht {i} mit etwas Text, etwa so lang wie im Chat üblich")
+
+    results['memory.group_cache_bytes'] = (_traced(fill) / capacity, 'B/message', LOWER)
+    return results
+
+
+MEASUREMENTS = {
+    'parse': measure_parse, 'latency': measure_latency, 'transfer': measure_transfer,
+    'discovery': measure_discovery, 'memory': measure_memory,
+}
+
+
+def run(groups, repeat, quick):
+    """Runs the selected measurements repeat times; returns {name: {value, unit, better, runs}}."""
+    samples = {}
+    for group in groups:
+        for _ in range(repeat):
+            for name, (value, unit, better) in MEASUREMENTS[group](quick).items():
+                samples.setdefault(name, (unit, better, []))[2].append(value)
+    return {name: {'value': statistics.median(values), 'unit': unit, 'better': better, 'runs': values}
+            for name, (unit, better, values) in samples.items()}
+
+
+def environment(repeat, quick):
+    return {
+        'python': platform.python_version(), 'implementation': platform.python_implementation(),
+        'platform': platform.platform(), 'machine': platform.machine(), 'cpus': os.cpu_count(),
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S%z'), 'repeat': repeat, 'quick': quick,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Compares results with a baseline; returns [(name, old, new, change, regression)].
+
+    change is the relative difference, positive when the value got better.
+    """
+    rows = []
+    for name, entry in sorted(results.items()):
+        old = baseline.get(name)
+        if old is None or not old['value']:
+            continue
+        change = (entry['value'] - old['value']) / old['value']
+        if entry['better'] == LOWER:
+            change = -change
+        rows.append((name, old['value'], entry['value'], change, change < -tolerance))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark- und Regressionssuite der Netzwerkschicht.")
+    parser.add_argument('--only', default=','.join(GROUPS), help="Messungen, kommagetrennt")
+    parser.add_argument('--repeat', type=int, default=3, help="Läufe je Messung, gespeichert wird der Median")
+    parser.add_argument('--quick', action='store_true', help="Kleinere Mengen für einen schnellen Überblick")
+    parser.add_argument('--output', help="Ergebnisse als JSON in diese Datei schreiben")
+    parser.add_argument('--baseline', help="Mit den Ergebnissen in dieser JSON-Datei vergleichen")
+    parser.add_argument('--tolerance', type=float, default=0.15, help="Erlaubte Verschlechterung (0.15 = 15%%)")
+    args = parser.parse_args()
+
+    groups = [group for group in args.only.split(',') if group]
+    unknown = [group for group in groups if group not in MEASUREMENTS]
+    if unknown:
+        parser.error(f"Unbekannte Messung: {', '.join(unknown)} (möglich: {', '.join(GROUPS)})")
+    baseline = None
+    if args.baseline:
+        # Vor den Messungen lesen, damit ein Tippfehler nicht erst nach Minuten auffällt
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get('version') != RESULT_VERSION:
+            parser.error(f"'{args.baseline}' hat ein unbekanntes Format")
+
+    results = run(groups, args.repeat, args.quick)
+    document = {'version': RESULT_VERSION, 'environment': environment(args.repeat, args.quick), 'results': results}
+
+    print(f"{'Messung':<34} {'Wert':>12} {'Einheit':<9} {'min':>10} {'max':>10}")
+    for name, entry in sorted(results.items()):
+        print(f"{name:<34} {entry['value']:>12.2f} {entry['unit']:<9} {min(entry['runs']):>10.2f} "
+              f"{max(entry['runs']):>10.2f}")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(document, f, indent=2, ensure_ascii=False)
+            f.write('\n')
+
+    if baseline is None:
+        return 0
+    old_env, new_env = baseline.get('environment', {}), document['environment']
+    differs = [key for key in ('python', 'implementation', 'machine', 'cpus', 'quick') if old_env.get(key) != new_env[key]]
+    if differs:
+        print(f"\nWarnung: Basis stammt aus einer anderen Umgebung ({', '.join(differs)})")
+    rows = compare(results, baseline.get('results', {}), args.tolerance)
+    print(f"\n{'Messung':<34} {'Basis':>12} {'jetzt':>12} {'Änderung':>9}")
+    for name, old, new, change, regression in rows:
+        verdict = "REGRESSION" if regression else ("besser" if change > args.tolerance else "")
+        print(f"{name:<34} {old:>12.2f} {new:>12.2f} {change * 100:>+8.1f}% {verdict}")
+    regressions = [row for row in rows if row[4]]
+    print(f"\n{len(regressions)} Regression(en) bei {len(rows)} verglichenen Werten, Toleranz {args.tolerance:.0%}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""Loopback benchmark comparing file transfers over UDP chunks and over the TCP side channel.
+
+Aufruf: python -m benchmarks.tcp_transfer_bench [--size 67108864] [--runs 3]
+
+Ein Sender schickt mit send_file dieselbe Datei an einen Empfänger, einmal mit
+tcptransfer = false (Chunks über den UDP-Socket), einmal mit tcptransfer = true (sendfile()
+über eine eigene TCP-Verbindung). Währenddessen gehen alle 5 ms Direktnachrichten an den
+Empfänger. Gemessen werden der Durchsatz, die CPU-Last des Prozesses (100% = ein Kern)
+und die Latenz der Nachrichten im Leerlauf und während der Übertragung.
+"""
+import argparse
+import os
+import shutil
+import statistics
+import tempfile
+import time
+
+from benchmarks.parallel_transfer_bench import BenchPeer, _chat_latency, percentile
+
+
+def _config(handle, port, whoisport, path, tcp):
+    return {'user': {
+        'handle': handle, 'port': port, 'whoisport': whoisport, 'broadcastaddress': '127.255.255.255',
+        'history': False, 'peersnapshot': False, 'imagepath': path, 'tcptransfer': tcp,
+    }}
+
+
+def run(tcp, size, base_port, timeout):
+    path = tempfile.mkdtemp(prefix='tcp-bench-')
+    source = os.path.join(path, 'daten.bin')
+    with open(source, 'wb') as f:
+        f.write(os.urandom(size))
+    sender = BenchPeer(_config('sender', base_port + 1, base_port, path, tcp))
+    receiver = BenchPeer(_config('empfaenger', base_port + 2, base_port, os.path.join(path, 'in'), tcp))
+    try:
+        deadline = time.monotonic() + 10
+        while not receiver.peers.supports('sender', 'file1') or not sender.peers.supports('empfaenger', 'file1'):
+            if time.monotonic() > deadline:
+                raise RuntimeError("Empfänger wurde nicht gefunden")
+            time.sleep(0.05)
+        idle = _chat_latency(sender, receiver, 50, 0.005)
+
+        cpu_start, start = time.process_time(), time.perf_counter()
+        sender.send_file('empfaenger', source)
+        busy = _chat_latency(sender, receiver, 100000, 0.005,
+                             until=lambda: 'sender' in receiver.finished or time.perf_counter() - start > timeout)
+        while 'sender' not in receiver.finished and time.perf_counter() - start < timeout:
+            time.sleep(0.01)
+        if 'sender' not in receiver.finished:
+            return None
+        elapsed = receiver.finished['sender'][0] - start
+        cpu = (time.process_time() - cpu_start) / (time.perf_counter() - start) * 100
+        streamed = receiver._packets_out.values.get(('IMG-TCP',), 0) > 0
+        return size / (1024 * 1024) / elapsed, cpu, idle, busy, streamed
+    finally:
+        sender.shutdown()
+        receiver.shutdown()
+        time.sleep(0.2)
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dateitransfer über UDP und über den TCP-Seitenkanal.")
+    parser.add_argument('--size', type=int, default=64 * 1024 * 1024, help="Bytes pro Transfer")
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--base-port', type=int, default=27000)
+    parser.add_argument('--timeout', type=float, default=120.0)
+    args = parser.parse_args()
+
+    print(f"{'Weg':<4} {'MB/s':>8} {'CPU %':>6} {'Chat p50/p99 ms leer':>21} {'während':>15}")
+    for tcp in (False, True):
+        rates, cpus, idle, busy = [], [], [], []
+        for _ in range(args.runs):
+            result = run(tcp, args.size, args.base_port, args.timeout)
+            if result is None:
+                print(f"{'TCP' if tcp else 'UDP':<4} Zeitüberschreitung")
+                continue
+            rate, cpu, run_idle, run_busy, streamed = result
+            if streamed != tcp:
+                print(f"Warnung: Transfer lief nicht über {'TCP' if tcp else 'UDP'}")
+            rates.append(rate)
+            cpus.append(cpu)
+            idle.extend(run_idle)
+            busy.extend(run_busy)
+        if rates:
+            print(f"{'TCP' if tcp else 'UDP':<4} {statistics.median(rates):>8.1f} {statistics.median(cpus):>6.0f} "
+                  f"{percentile(idle, 50):>10.2f}/{percentile(idle, 99):<10.2f} "
+                  f"{percentile(busy, 50):>7.2f}/{percentile(busy, 99):<7.2f}")
+
+
+if __name__ == "__main__":
+    main()
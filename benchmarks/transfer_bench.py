@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""Loopback benchmark for the chunked transfer engine.
+
+Aufruf: python -m benchmarks.transfer_bench [Größen in Bytes ...]
+"""
+import os
+import random
+import socket
+import sys
+from threading import Thread
+
+from network import transfer
+
+SIZES = [64 * 1024, 1024 * 1024, 16 * 1024 * 1024]
+LOSS_RATES = [0.0, 0.01, 0.05]
+
+
+def _open_socket():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+    sock.bind(('127.0.0.1', 0))
+    sock.settimeout(0.5)
+    return sock
+
+
+def _lossy(sock, loss, rng):
+    """Returns a send function that drops datagrams with the given probability."""
+    def send(data, addr):
+        if rng.random() >= loss:
+            sock.sendto(data, addr)
+    return send
+
+
+def run_transfer(size, loss, chunk_size=transfer.DEFAULT_CHUNK_SIZE, window=transfer.DEFAULT_WINDOW,
+                 payload=None, buffer=None, received=None):
+    """Transfers size random bytes over loopback and returns the finished TransferSender.
+
+    payload replaces the random bytes (e.g. with an mmap); buffer/received are passed to
+    the TransferReceiver, e.g. the mappings of a storage.PartialFile.
+    """
+    rng = random.Random(size ^ int(loss * 1000))
+    send_sock = _open_socket()
+    recv_sock = _open_socket()
+    recv_addr = recv_sock.getsockname()
+    transfer_id = rng.getrandbits(32)
+    if payload is None:
+        payload = os.urandom(size)
+    done = []
+
+    def receive():
+        send_ack = _lossy(recv_sock, loss, rng)
+        receiver = None
+        addr = None
+        while not done:
+            # Verzögerte Bestätigung wie im NetworkHandler: spätestens ACK_DELAY nach dem letzten Chunk
+            pending = receiver is not None and receiver.since_ack > 0
+            recv_sock.settimeout(transfer.ACK_DELAY if pending else 0.5)
+            try:
+                data, addr = recv_sock.recvfrom(65535)
+            except socket.timeout:
+                if pending:
+                    send_ack(receiver.ack_message().encode('utf-8'), addr)
+                continue
+            if transfer.is_chunk(data):
+                if receiver is None:
+                    continue
+                _, seq, chunk = transfer.parse_chunk(data)
+                if receiver.on_chunk(seq, chunk):
+                    send_ack(receiver.ack_message().encode('utf-8'), addr)
+            elif data.startswith(b'IMG '):
+                if receiver is None:
+                    receiver = transfer.TransferReceiver(transfer_id, size, chunk_size, 'bench', addr,
+                                                         buffer=buffer, received=received)
+                send_ack(receiver.ack_message().encode('utf-8'), addr)
+
+    def receive_acks(sender):
+        while not sender.done:
+            try:
+                data, _ = send_sock.recvfrom(65535)
+            except socket.timeout:
+                continue
+            _, args_str = data.decode('utf-8').split(' ', 1)
+            _, cumulative, highest, nacks = transfer.parse_ack(args_str)
+            sender.on_ack(cumulative, highest, nacks)
+
+    header = f"IMG bench {size} {transfer_id} {chunk_size}".encode('utf-8')
+    sender = transfer.TransferSender(_lossy(send_sock, loss, rng), recv_addr, transfer_id, payload,
+                                     header, chunk_size=chunk_size, window=window)
+    threads = [Thread(target=receive), Thread(target=receive_acks, args=(sender,))]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    sender.run()
+    done.append(True)
+    for thread in threads:
+        thread.join()
+    send_sock.close()
+    recv_sock.close()
+    return sender
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or SIZES
+    print(f"{'Größe':>12} {'Verlust':>8} {'MB/s':>8} {'Wiederh.':>9} {'Status':>8}")
+    for size in sizes:
+        for loss in LOSS_RATES:
+            sender = run_transfer(size, loss)
+            status = "FEHLER" if sender.failed else "ok"
+            print(f"{size:>12} {loss:>8.0%} {sender.throughput / (1024 * 1024):>8.1f} "
+                  f"{sender.retransmit_rate:>9.2%} {status:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,6 @@
 #!/usr/bin/env python3
 from user_interface import UserInterface
-from utils.config_loader import load_config
+from utils.config_loader import config_path, load_config
 import sys
 
 def show_welcome_banner():
@@ -9,22 +9,24 @@ def show_welcome_banner():
     print("Standardnachrichten werden an die aktuelle Gruppe gesendet.\n")
 
 def main():
-    show_welcome_banner()
-    
-    # Konfiguration laden
-    # Konfiguration laden, optional via Kommandozeile
-    config_file = sys.argv[1] if len(sys.argv) > 1 else "config.toml"
+    # Konfiguration laden, optional via Kommandozeile; --json schaltet auf JSON-Zeilen für Skripte um
+    args = [arg for arg in sys.argv[1:] if arg != '--json']
+    config_file = args[0] if args else "config.toml"
     config = load_config(config_file)
     if not config:
         print("Fehler: Konfiguration konnte nicht geladen werden")
         sys.exit(1)
+    if '--json' in sys.argv[1:]:
+        config['user']['output'] = 'json'
+
+    if config['user'].get('output', 'console') != 'json':
+        show_welcome_banner()
     
     try:
         # Benutzeroberfläche starten
-        ui = UserInterface(config)
-        # Warten auf das Ende des Input-Threads
-        while ui.running:
-            pass
+        ui = UserInterface(config, config_path(config_file))
+        # Warten, bis der Nutzer das Programm beendet (ohne Busy-Waiting)
+        ui.wait()
     except KeyboardInterrupt:
         print("\nProgramm wird beendet...")
         sys.exit(0)
@@ -0,0 +1,248 @@
+import asyncio
+import socket
+import struct
+import weakref
+from collections import deque
+
+MAX_DATAGRAM = 65535
+DEFAULT_BATCH = 64
+POOL_SIZE = 4 * MAX_DATAGRAM
+
+# Linux liefert mit SO_RXQ_OVFL die Anzahl der im Kernel verworfenen Datagramme als Zusatzdaten
+SO_RXQ_OVFL = getattr(socket, 'SO_RXQ_OVFL', 40)
+_DROP_COUNTER = struct.Struct('I')
+
+# Ein Empfangspuffer pro Event-Loop genügt: Ein Batch wird vollständig verarbeitet,
+# bevor der Loop den nächsten Socket bedient
+_pools = weakref.WeakKeyDictionary()
+
+
+def _buffer_pool(loop):
+    pool = _pools.get(loop)
+    if pool is None:
+        pool = memoryview(bytearray(POOL_SIZE))
+        _pools[loop] = pool
+    return pool
+
+
+def configure_buffers(sock, rcvbuf=None, sndbuf=None):
+    """Applies SO_RCVBUF/SO_SNDBUF sizes in bytes (None keeps the system default)."""
+    if rcvbuf:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, int(rcvbuf))
+    if sndbuf:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, int(sndbuf))
+
+
+def _new_stats():
+    return {
+        'recv_wakeups': 0,    # Aufrufe des Lese-Callbacks
+        'recv_datagrams': 0,
+        'max_batch': 0,       # Größter Batch pro Aufruf
+        'truncated': 0,       # Zu große, abgeschnittene Datagramme
+        'kernel_drops': 0,    # Vom Kernel wegen voller Queue verworfen (nur Linux)
+        'send_flushes': 0,
+        'sent_datagrams': 0,
+        'coalesced': 0,       # Identische Datagramme im selben Tick zusammengefasst
+        'send_blocked': 0,    # Sendepuffer voll, auf Schreibbereitschaft gewartet
+        'send_errors': 0,
+        'shed': 0,            # Vom Empfänger ohne Verarbeitung verworfen (z.B. Ratenbegrenzung)
+        'paused': 0,          # Lesepausen wegen Überlast
+    }
+
+
+class BatchedDatagramEndpoint:
+    """Non-blocking UDP endpoint that drains its socket in batches and flushes sends per tick.
+
+    Each read wakeup pulls up to batch_size datagrams with recvmsg_into into a shared,
+    preallocated buffer before any of them is dispatched, so a burst leaves the kernel
+    queue quickly. Handlers receive memoryviews into that buffer and must copy what they
+    keep. Outgoing datagrams are queued and sent together once per loop iteration.
+
+    on_datagram returns False for datagrams it shed without processing. If almost a
+    whole batch was shed, the socket is not read for overload_pause seconds: during a
+    flood the kernel then drops the excess, which bounds the CPU spent on it.
+    """
+
+    def __init__(self, loop, sock, on_datagram, batch_size=DEFAULT_BATCH, overload_pause=0.0):
+        self.loop = loop
+        self.sock = sock
+        self.on_datagram = on_datagram
+        self.batch_size = batch_size
+        self.overload_pause = overload_pause
+        self._resume_handle = None
+        self.stats = _new_stats()
+        self._pool = _buffer_pool(loop)
+        self._queue = deque()
+        self._queued = set()  # Mit coalesce gesendete Inhalte, die in diesem Tick schon anstehen
+        self._flush_scheduled = False
+        self._writer_registered = False
+        self._closed = False
+
+        sock.setblocking(False)
+        self._ancbufsize = 0
+        if hasattr(sock, 'recvmsg_into'):
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, SO_RXQ_OVFL, 1)
+                self._ancbufsize = socket.CMSG_SPACE(_DROP_COUNTER.size)
+            except OSError:
+                pass
+        loop.add_reader(sock.fileno(), self._on_readable)
+
+    def _receive(self, buffer):
+        if self._ancbufsize:
+            nbytes, ancdata, flags, addr = self.sock.recvmsg_into([buffer], self._ancbufsize)
+            for level, kind, data in ancdata:
+                if level == socket.SOL_SOCKET and kind == SO_RXQ_OVFL and len(data) >= _DROP_COUNTER.size:
+                    self.stats['kernel_drops'] = _DROP_COUNTER.unpack_from(data)[0]
+            if flags & getattr(socket, 'MSG_TRUNC', 0):
+                self.stats['truncated'] += 1
+                return 0, None
+            return nbytes, addr
+        return self.sock.recvfrom_into(buffer)
+
+    def _on_readable(self):
+        pool = self._pool
+        batch = []
+        offset = 0
+        while len(batch) < self.batch_size and offset + MAX_DATAGRAM <= len(pool):
+            try:
+                nbytes, addr = self._receive(pool[offset:offset + MAX_DATAGRAM])
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError:
+                # z.B. ICMP-Fehler eines früheren Sendens (Windows); den Socket weiter leeren
+                continue
+            if addr is None:
+                continue
+            batch.append((pool[offset:offset + nbytes], addr))
+            offset += nbytes
+
+        stats = self.stats
+        stats['recv_wakeups'] += 1
+        stats['recv_datagrams'] += len(batch)
+        if len(batch) > stats['max_batch']:
+            stats['max_batch'] = len(batch)
+        shed = 0
+        for data, addr in batch:
+            if self.on_datagram(data, addr) is False:
+                shed += 1
+        if shed:
+            stats['shed'] += shed
+            # Mindestens drei Viertel eines vollen Batches verworfen: Überlast
+            if self.overload_pause and len(batch) == self.batch_size and shed * 4 >= len(batch) * 3:
+                self._pause()
+
+    def _pause(self):
+        self.stats['paused'] += 1
+        self.loop.remove_reader(self.sock.fileno())
+        self._resume_handle = self.loop.call_later(self.overload_pause, self._resume)
+
+    def _resume(self):
+        self._resume_handle = None
+        if not self._closed:
+            self.loop.add_reader(self.sock.fileno(), self._on_readable)
+
+    def queue_depth(self):
+        return len(self._queue)
+
+    def send(self, data, addr, coalesce=False):
+        """Queues a datagram; the queue is flushed once per loop iteration. Loop thread only.
+
+        With coalesce, a datagram identical to one queued with coalesce in the same tick
+        is dropped; only for idempotent announcements, never for chat messages.
+        """
+        if self._closed:
+            return
+        if coalesce:
+            key = (data, addr)
+            if key in self._queued:
+                self.stats['coalesced'] += 1
+                return
+            self._queued.add(key)
+        self._queue.append((data, addr))
+        if not self._flush_scheduled and not self._writer_registered:
+            self._flush_scheduled = True
+            self.loop.call_soon(self._flush)
+
+    def _flush(self):
+        self._flush_scheduled = False
+        queue = self._queue
+        sent = 0
+        while queue:
+            data, addr = queue[0]
+            try:
+                self.sock.sendto(data, addr)
+            except (BlockingIOError, InterruptedError):
+                if not self._writer_registered:
+                    self._writer_registered = True
+                    self.stats['send_blocked'] += 1
+                    self.loop.add_writer(self.sock.fileno(), self._on_writable)
+                break
+            except OSError:
+                self.stats['send_errors'] += 1
+            queue.popleft()
+            sent += 1
+        if not queue:
+            self._queued.clear()
+        if sent:
+            self.stats['send_flushes'] += 1
+            self.stats['sent_datagrams'] += sent
+
+    def _on_writable(self):
+        self.loop.remove_writer(self.sock.fileno())
+        self._writer_registered = False
+        self._flush()
+
+    def close(self):
+        if self._closed:
+            return
+        # Ausstehende Datagramme (z.B. LEAVE) noch versuchen zu senden
+        self._flush()
+        self._closed = True
+        if self._resume_handle is not None:
+            self._resume_handle.cancel()
+        self.loop.remove_reader(self.sock.fileno())
+        if self._writer_registered:
+            self.loop.remove_writer(self.sock.fileno())
+        self.sock.close()
+
+
+class _CallbackProtocol(asyncio.DatagramProtocol):
+    def __init__(self, on_datagram):
+        self.on_datagram = on_datagram
+
+    def datagram_received(self, data, addr):
+        self.on_datagram(data, addr)
+
+    def error_received(self, exc):
+        # z.B. ICMP "Port unreachable" nach einem Senden an einen beendeten Peer
+        pass
+
+
+class ProtocolEndpoint:
+    """Fallback for event loops without add_reader (e.g. the Windows proactor loop)."""
+
+    def __init__(self, transport):
+        self.transport = transport
+        self.stats = _new_stats()
+
+    def queue_depth(self):
+        return self.transport.get_write_buffer_size()
+
+    def send(self, data, addr, coalesce=False):
+        self.transport.sendto(data, addr)
+        self.stats['sent_datagrams'] += 1
+
+    def close(self):
+        self.transport.close()
+
+
+async def open_endpoint(sock, on_datagram, batch_size=DEFAULT_BATCH, overload_pause=0.0):
+    """Creates the best available endpoint for a bound UDP socket on the running loop."""
+    loop = asyncio.get_running_loop()
+    try:
+        return BatchedDatagramEndpoint(loop, sock, on_datagram, batch_size, overload_pause)
+    except NotImplementedError:
+        transport, _ = await loop.create_datagram_endpoint(
+            lambda: _CallbackProtocol(on_datagram), sock=sock)
+        return ProtocolEndpoint(transport)
@@ -0,0 +1,144 @@
+import time
+import zlib
+
+# Komprimiertes Datagramm: Magic-Byte, Codec, danach der Deflate-Strom des ursprünglichen
+# Datagramms (Textbefehl oder Binärrahmen). 0x00 und 0x01 sind Chunks und Binärrahmen.
+COMPRESSED_MAGIC = 0x02
+
+ZLIB = 1  # Deflate ohne Wörterbuch, für längere Texte und Dateien
+DICT = 2  # Deflate mit gemeinsamem Wörterbuch, für kurze Chatnachrichten
+CAPABILITIES = {ZLIB: "z1", DICT: "zd1"}  # Werden per CAPS ausgehandelt
+CODECS = {'zlib': (ZLIB,), 'dict': (DICT, ZLIB), 'off': ()}
+
+LEVEL = 6
+MIN_SIZE = 32           # Kürzere Datagramme werden gar nicht erst versucht
+MAX_SIZE = 65535        # Obergrenze beim Entpacken (Schutz vor Dekompressionsbomben)
+PROBE_CHUNKS = 8        # So viele Chunks eines Transfers entscheiden, ob sich Kompression lohnt
+MIN_SAVING = 0.1        # Mindestens 10 % kleiner, sonst bleiben Chunks unkomprimiert
+
+# Gemeinsames Wörterbuch (Version 1, daher "zd1"). zlib nutzt bevorzugt Treffer am Ende,
+# deshalb stehen die häufigsten Bestandteile zuletzt. Änderungen brauchen eine neue Version.
+SHARED_DICTIONARY = (
+    "ok danke bitte ja nein vielleicht gleich später morgen heute abend mittag wann wo wer "
+    "warum weil aber auch noch schon jetzt hier da mal kurz treffen essen mensa bibliothek "
+    "vorlesung übung klausur prüfung abgabe projekt gruppe aufgabe frage antwort lösung "
+    "thanks please yes no maybe later tomorrow today tonight when where who why because "
+    "meeting lunch lecture exercise exam deadline project group question answer "
+    "hallo hi hey servus moin tschüss bis dann bis später alles klar passt gut super cool "
+    "ich bin du bist wir sind ihr seid das ist ist das hast du habt ihr kommst du kommt ihr "
+    "der die das und oder nicht mit für von zu im in auf an es ein eine einen "
+    "the and or not with for from to in on at is are it a an you we i "
+    "MSG-AUTOREPLY MSG REPLY LEAVE ALIVE JOIN GMSG default GMSG default "
+).encode('utf-8')
+
+
+def is_compressed(data):
+    return len(data) >= 2 and data[0] == COMPRESSED_MAGIC
+
+
+def _compressobj(codec):
+    if codec == DICT:
+        return zlib.compressobj(LEVEL, zlib.DEFLATED, -15, zdict=SHARED_DICTIONARY)
+    return zlib.compressobj(LEVEL, zlib.DEFLATED, -15)
+
+
+def deflate(data, codec):
+    """Returns codec byte + raw deflate stream of data."""
+    compressor = _compressobj(codec)
+    return bytes((codec,)) + compressor.compress(data) + compressor.flush()
+
+
+def inflate(body, max_length=MAX_SIZE):
+    """Reverses deflate(); returns None for unknown codecs, corrupt or oversized data."""
+    if not body:
+        return None
+    codec = body[0]
+    try:
+        if codec == DICT:
+            decompressor = zlib.decompressobj(-15, zdict=SHARED_DICTIONARY)
+        elif codec == ZLIB:
+            decompressor = zlib.decompressobj(-15)
+        else:
+            return None
+        data = decompressor.decompress(body[1:], max_length)
+        if decompressor.unconsumed_tail or not decompressor.eof:
+            return None
+    except zlib.error:
+        return None
+    return data
+
+
+def decompress(data):
+    """Unpacks a compressed datagram into the original datagram, or None if it is invalid."""
+    return inflate(memoryview(data)[1:])
+
+
+class Compressor:
+    """Chooses a codec per peer, compresses datagrams if that makes them smaller and
+    records ratio and CPU time per message class.
+
+    compress() and the chunk compressors must run on the event loop thread, the only
+    writer of stats; report() may be called from any thread.
+    """
+
+    def __init__(self, codecs=CODECS['dict']):
+        self.codecs = tuple(codecs)  # In der Reihenfolge der Bevorzugung
+        self.stats = {}  # {klasse: [datagramme, roh, übertragen, cpu-sekunden, unkomprimiert]}
+
+    def capabilities(self):
+        return [CAPABILITIES[codec] for codec in self.codecs]
+
+    def choose(self, supports):
+        """Returns the preferred codec for which supports(capability) is true, or None."""
+        for codec in self.codecs:
+            if supports(CAPABILITIES[codec]):
+                return codec
+        return None
+
+    def _record(self, message_class, raw, wire, cpu, skipped):
+        entry = self.stats.get(message_class)
+        if entry is None:
+            entry = self.stats[message_class] = [0, 0, 0, 0.0, 0]
+        entry[0] += 1
+        entry[1] += raw
+        entry[2] += wire
+        entry[3] += cpu
+        entry[4] += skipped
+
+    def compress(self, data, codec, message_class):
+        """Returns a compressed datagram, or data unchanged if it would not get smaller."""
+        if codec is None or len(data) < MIN_SIZE:
+            self._record(message_class, len(data), len(data), 0.0, 1)
+            return data
+        start = time.perf_counter()
+        packed = bytes((COMPRESSED_MAGIC,)) + deflate(data, codec)
+        cpu = time.perf_counter() - start
+        if len(packed) >= len(data):
+            self._record(message_class, len(data), len(data), cpu, 1)
+            return data
+        self._record(message_class, len(data), len(packed), cpu, 0)
+        return packed
+
+    def chunk_compressor(self, codec):
+        """Returns a function for TransferSender that compresses chunk payloads, or None."""
+        if codec is None:
+            return None
+
+        def compress_chunk(payload):
+            start = time.perf_counter()
+            packed = deflate(payload, codec)
+            cpu = time.perf_counter() - start
+            if len(packed) > len(payload) * (1 - MIN_SAVING):
+                self._record('chunk', len(payload), len(payload), cpu, 1)
+                return None
+            self._record('chunk', len(payload), len(packed), cpu, 0)
+            return packed
+        return compress_chunk
+
+    def report(self):
+        """Returns {class: (datagrams, compression ratio, µs CPU per datagram, share sent uncompressed)}."""
+        result = {}
+        for message_class, (count, raw, wire, cpu, skipped) in list(self.stats.items()):
+            result[message_class] = (count, wire / raw if raw else 1.0,
+                                     cpu * 1e6 / count, skipped / count)
+        return result
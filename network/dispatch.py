@@ -0,0 +1,142 @@
+import threading
+import time
+from collections import deque
+
+DEFAULT_WORKERS = 4
+DEFAULT_LIMIT = 1024   # Aufgaben, die höchstens auf einen Worker warten
+POLICIES = ('oldest', 'newest')
+CLOSE_TIMEOUT = 5.0
+
+
+class Dispatcher:
+    """Bounded worker pool for handlers that may block, run in submission order per key.
+
+    The receive loops only decode packets and update protocol state; whatever touches the
+    disk or the output goes through submit(). Tasks with the same key (the peer's handle)
+    never run concurrently and keep their order, tasks of different keys are interleaved
+    round-robin. Worker threads are started on demand up to workers.
+
+    If limit tasks are waiting, policy decides: 'oldest' drops the oldest task of the
+    longest queue, so a flooding peer loses its own backlog first; 'newest' rejects the
+    new task.
+
+    With schedule (e.g. loop.call_soon_threadsafe), workers are woken once per pass of the
+    event loop instead of once per task: a batch of datagrams costs one thread switch.
+    """
+
+    def __init__(self, workers=DEFAULT_WORKERS, limit=DEFAULT_LIMIT, policy='oldest', on_error=None,
+                 schedule=None):
+        self.workers = workers
+        self.limit = limit
+        self.policy = policy
+        self.on_error = on_error
+        self.schedule = schedule
+        self._wake_scheduled = False
+        self.handled = 0
+        self.dropped = 0
+        self.errors = 0
+        self._cond = threading.Condition()
+        self._queues = {}      # {schlüssel: deque((fn, args, droppable))}, solange wartend oder laufend
+        self._ready = deque()  # Schlüssel mit wartenden Aufgaben, die gerade kein Worker bearbeitet
+        self._pending = 0
+        self._idle = 0
+        self._threads = []
+        self._closed = False
+
+    def pending(self):
+        """Number of tasks waiting for a worker."""
+        return self._pending
+
+    def submit(self, key, fn, *args, droppable=True):
+        """Queues fn(*args) behind earlier tasks of key; returns False if the new task was dropped.
+
+        Tasks with droppable=False (e.g. storing a finished transfer) are always queued and
+        never chosen as the oldest task to drop.
+        """
+        with self._cond:
+            if self._closed:
+                return False
+            if self._pending >= self.limit and droppable:
+                self.dropped += 1
+                if self.policy == 'newest' or not self._drop_oldest():
+                    return False
+            queue = self._queues.get(key)
+            if queue is None:
+                queue = self._queues[key] = deque()
+                self._ready.append(key)
+            queue.append((fn, args, droppable))
+            self._pending += 1
+            if self.schedule is None:
+                self._wake_workers()
+            elif not self._wake_scheduled:
+                self._wake_scheduled = True
+                self.schedule(self._wake)
+        return True
+
+    def _wake(self):
+        with self._cond:
+            self._wake_scheduled = False
+            self._wake_workers()
+
+    def _wake_workers(self):
+        # Ein Worker je bereitem Schlüssel, mehr können nicht gleichzeitig arbeiten
+        ready = len(self._ready)
+        self._cond.notify(min(ready, self._idle))
+        while ready > self._idle and len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._work, name=f"dispatch-{len(self._threads)}", daemon=True)
+            self._threads.append(thread)
+            thread.start()
+            ready -= 1
+
+    def _drop_oldest(self):
+        # Die längste Warteschlange zuerst; nur bei Überlast, daher darf es linear sein
+        for queue in sorted(self._queues.values(), key=len, reverse=True):
+            for index, (_, _, droppable) in enumerate(queue):
+                if droppable:
+                    del queue[index]
+                    self._pending -= 1
+                    return True
+        return False
+
+    def _work(self):
+        while True:
+            with self._cond:
+                while not self._ready and not self._closed:
+                    self._idle += 1
+                    self._cond.wait()
+                    self._idle -= 1
+                if not self._ready:
+                    return
+                key = self._ready.popleft()
+                queue = self._queues[key]
+                if not queue:
+                    # Alle Aufgaben dieses Schlüssels wurden verworfen
+                    del self._queues[key]
+                    continue
+                fn, args, _ = queue.popleft()
+                self._pending -= 1
+            try:
+                fn(*args)
+            except Exception as e:
+                self.errors += 1
+                if self.on_error is not None:
+                    self.on_error(e)
+            with self._cond:
+                self.handled += 1
+                if queue:
+                    # Hinten anstellen, damit andere Schlüssel nicht warten müssen
+                    self._ready.append(key)
+                    self._cond.notify()
+                else:
+                    del self._queues[key]
+
+    def close(self, timeout=CLOSE_TIMEOUT):
+        """Runs the queued tasks to completion (at most timeout seconds) and stops the workers."""
+        with self._cond:
+            self._closed = True
+            self._wake_workers()
+            self._cond.notify_all()
+        deadline = time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+
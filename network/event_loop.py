@@ -0,0 +1,94 @@
+import asyncio
+import queue
+import threading
+
+
+class EventLoopThread:
+    """Runs one asyncio event loop in a background thread with a small synchronous facade."""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self._run, name="network-loop")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def in_loop_thread(self):
+        return threading.get_ident() == self.thread.ident
+
+    def run(self, coro, timeout=None):
+        """Runs a coroutine on the loop and blocks until it has finished."""
+        if self.in_loop_thread():
+            raise RuntimeError("run() darf nicht aus dem Event-Loop-Thread aufgerufen werden")
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+    def submit(self, coro):
+        """Schedules a coroutine on the loop and returns a concurrent.futures.Future."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def call_soon(self, callback, *args):
+        """Runs callback on the loop thread; directly if we are already on it."""
+        if self.in_loop_thread():
+            callback(*args)
+        else:
+            self.loop.call_soon_threadsafe(callback, *args)
+
+
+_shared_loop = None
+_shared_loop_lock = threading.Lock()
+
+
+def shared_loop():
+    """Returns the process-wide event loop that hosts all NetworkHandler instances."""
+    global _shared_loop
+    with _shared_loop_lock:
+        if _shared_loop is None:
+            _shared_loop = EventLoopThread()
+        return _shared_loop
+
+
+class AsyncInput:
+    """Async adapter for input(): a daemon thread reads the console, the loop awaits the lines.
+
+    A daemon thread is used instead of the loop's executor so that a pending input() never
+    keeps the interpreter from exiting.
+    """
+
+    def __init__(self, loop):
+        self.loop = loop
+        self._requests = queue.Queue()
+        self.prompt = None  # Angezeigte Eingabeaufforderung, solange input() wartet
+        self._thread = threading.Thread(target=self._reader, name="console-input")
+        self._thread.daemon = True
+        self._thread.start()
+
+    async def readline(self, prompt=""):
+        future = self.loop.create_future()
+        self._requests.put((prompt, future))
+        return await future
+
+    def _reader(self):
+        while True:
+            prompt, future = self._requests.get()
+            self.prompt = prompt
+            try:
+                line = input(prompt)
+            except BaseException as e:
+                self.prompt = None
+                self.loop.call_soon_threadsafe(_set_exception, future, e)
+            else:
+                self.prompt = None
+                self.loop.call_soon_threadsafe(_set_result, future, line)
+
+
+def _set_result(future, result):
+    if not future.done():
+        future.set_result(result)
+
+
+def _set_exception(future, exc):
+    if not future.done():
+        future.set_exception(exc)
@@ -0,0 +1,76 @@
+import threading
+import time
+from collections import deque, namedtuple
+
+DEFAULT_CAPACITY = 10000  # Ältere Ereignisse werden verworfen, wenn die Ausgabe nicht nachkommt
+
+# Ereignisse der Netzwerkschicht; die Ausgabe entscheidet, wie sie dargestellt werden
+Message = namedtuple('Message', 'sender text')
+AutoReply = namedtuple('AutoReply', 'sender text')
+GroupMessage = namedtuple('GroupMessage', 'group sender text')
+PeerJoined = namedtuple('PeerJoined', 'group handle')    # JOIN empfangen
+PeerFound = namedtuple('PeerFound', 'group handle')      # REPLY auf unser JOIN oder per Gossip
+PeerLeft = namedtuple('PeerLeft', 'group handle')
+PeerTimeout = namedtuple('PeerTimeout', 'group handle')
+DeliveryFailed = namedtuple('DeliveryFailed', 'peer text')
+# state: announced, resumed, started, progress, done, known, failed, stalled, error
+# known: Inhalt lag beim Empfänger schon vor, es wurde nichts übertragen
+# done/total zählen Chunks; info ist Dateiname, Fehlertext oder Anzahl Wiederholungen
+Transfer = namedtuple('Transfer', 'direction peer transfer_id state size done total rate info',
+                      defaults=(0, 0, 0.0, None))
+Notice = namedtuple('Notice', 'level text')  # level: info oder error; auch Antworten auf Befehle
+
+KINDS = {
+    Message: 'message', AutoReply: 'autoreply', GroupMessage: 'group_message',
+    PeerJoined: 'peer_joined', PeerFound: 'peer_found', PeerLeft: 'peer_left',
+    PeerTimeout: 'peer_timeout', DeliveryFailed: 'delivery_failed', Transfer: 'transfer',
+    Notice: 'notice',
+}
+
+
+class EventBus:
+    """Bounded, thread-safe queue of events from the network layer to the output.
+
+    publish() never blocks: it appends to a deque and wakes the consumer, so packet
+    handling does not wait for the terminal. If the consumer falls behind by more than
+    capacity events, the oldest ones are dropped and counted.
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self._events = deque(maxlen=capacity)  # (zeitstempel, ereignis)
+        self._ready = threading.Event()
+        self.published = 0
+        self.dropped = 0
+
+    def publish(self, event):
+        if len(self._events) == self._events.maxlen:
+            self.dropped += 1
+        self._events.append((time.time(), event))
+        self.published += 1
+        if not self._ready.is_set():
+            self._ready.set()
+
+    def notice(self, text, level='info'):
+        self.publish(Notice(level, text))
+
+    def wake(self):
+        """Wakes a consumer blocked in wait(), e.g. so that it notices a shutdown."""
+        self._ready.set()
+
+    def wait(self, timeout=None):
+        """Blocks until events are pending or timeout expires; returns True if there are any."""
+        return self._ready.wait(timeout)
+
+    def drain(self, limit=None):
+        """Removes and returns up to limit pending (timestamp, event) pairs, oldest first."""
+        self._ready.clear()
+        batch = []
+        events = self._events
+        while events and (limit is None or len(batch) < limit):
+            batch.append(events.popleft())
+        if events:
+            self._ready.set()
+        return batch
+
+    def __len__(self):
+        return len(self._events)
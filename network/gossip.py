@@ -0,0 +1,403 @@
+import json
+import math
+import random
+
+GOSSIP_CAPABILITY = "swim1"
+PROTOCOL_PERIOD = 1.0   # Sekunden zwischen zwei Proben eines Knotens
+PING_TIMEOUT = 0.3      # Ohne ACK bis dahin: indirekt über andere Mitglieder proben
+INDIRECT_PROBES = 3     # Mitglieder, die ein PING-REQ bekommen
+SUSPICION_MULT = 4      # Ein Verdacht dauert SUSPICION_MULT * log10(n) Perioden
+RETRANSMIT_MULT = 3     # Jede Änderung fährt RETRANSMIT_MULT * log2(n) Nachrichten mit
+FRESH_MULT = 2          # Für die ersten FRESH_MULT * log2(n) davon gilt sie als frisch
+UPDATE_BUDGET = 1200    # Bytes für mitgesendete Einträge, damit ein Datagramm nicht fragmentiert
+SYNC_MEMBERS = 20       # Höchstens so viele Mitglieder enthält ein ACK auf einen PING mit Abgleich
+SYNC_EVERY = 10         # Jede so vielte Probe fragt nach einem Abgleich, auch bei gleicher Größe
+GOSSIP_FANOUT = 3       # Solange frische Änderungen anstehen: so viele zufällige Mitglieder ...
+GOSSIP_RATE = 5         # ... so oft pro Periode zusätzlich informieren
+SEED_RETRY = 5.0        # Sekunden zwischen zwei Versuchen, solange kein Mitglied bekannt ist
+DEAD_RETENTION = 60.0   # Sekunden, die ein toter Eintrag veraltete Gerüchte abwehrt
+
+ALIVE = 'alive'
+SUSPECT = 'suspect'
+DEAD = 'dead'
+LEFT = 'left'
+_GONE = (DEAD, LEFT)
+
+
+def encode(message):
+    return b"GOSSIP " + json.dumps(message, separators=(',', ':')).encode('utf-8')
+
+
+def decode(args_str):
+    """Parses the JSON body of a GOSSIP command; raises ValueError if it is malformed."""
+    message = json.loads(args_str)
+    if not isinstance(message, dict) or message.get('t') not in ('ping', 'ping-req', 'ack', 'gossip'):
+        raise ValueError(args_str)
+    return message
+
+
+def _record_size(record):
+    # Grobe Größe des JSON-Eintrags; genau genug, um unter der MTU zu bleiben
+    return 40 + len(record[0]) + len(record[1] or '') + sum(len(group) + 3 for group in record[5])
+
+
+def parse_seed(text):
+    """Splits a seed 'host:port' from the config into (host, port)."""
+    host, _, port = text.rpartition(':')
+    if not host or not port.isdigit() or not 0 < int(port) < 65536:
+        raise ValueError(f"Ungültiger Seed '{text}', erwartet 'host:port'")
+    return host, int(port)
+
+
+class Member:
+    __slots__ = ('handle', 'ip', 'port', 'incarnation', 'state', 'groups', 'deadline', 'since')
+
+    def __init__(self, handle, ip, port, incarnation, state, groups, now):
+        self.handle = handle
+        self.ip = ip
+        self.port = port
+        self.incarnation = incarnation
+        self.state = state
+        self.groups = groups
+        self.deadline = None  # Ende des Verdachts
+        self.since = now
+
+    @property
+    def endpoint(self):
+        return (self.ip, self.port)
+
+    def record(self):
+        return [self.handle, self.ip, self.port, self.incarnation, self.state, list(self.groups)]
+
+
+def _overrides(state, incarnation, old_state, old_incarnation):
+    """SWIM precedence: does (state, incarnation) replace what is known about a member?"""
+    if old_state in _GONE:
+        # Nur ein Neustart (höhere Inkarnation) holt einen toten Knoten zurück
+        return state == ALIVE and incarnation > old_incarnation
+    if state in _GONE:
+        return incarnation >= old_incarnation
+    if state == SUSPECT:
+        return incarnation > old_incarnation or (incarnation == old_incarnation and old_state == ALIVE)
+    return incarnation > old_incarnation
+
+
+class Membership:
+    """SWIM-style membership of one node: failure detection plus gossip dissemination.
+
+    A pure state machine like reliable.ReliableChannel: callers pass the current time,
+    send the returned (datagram, address) pairs and read the changes list. Every period
+    one member is pinged, round-robin in random order; without an ACK within
+    PING_TIMEOUT, INDIRECT_PROBES other members ping it on our behalf (PING-REQ). A member
+    that stays silent for the whole period becomes suspect, and dead once the suspicion
+    times out, unless it refutes with a higher incarnation. Membership changes ride
+    along on pings and ACKs, each a logarithmic number of times; while a change is
+    fresh (see FRESH_MULT) it is also pushed to GOSSIP_FANOUT random
+    members GOSSIP_RATE times per period. The number of datagrams per node therefore
+    depends on the rate of changes, not on the size of the group.
+
+    Each member carries the list of chat groups it joined. The incarnation starts at the
+    current time, so a restarted node supersedes what others remember about it.
+    """
+
+    def __init__(self, handle, port, groups, now, period=PROTOCOL_PERIOD, seeds=(), rng=None):
+        self.handle = handle
+        self.port = port
+        self.groups = tuple(sorted(groups))
+        self.incarnation = int(now)
+        self.period = period
+        self.seeds = list(seeds)  # (ip, port) bekannter Knoten für den Einstieg
+        self.members = {}   # {handle: Member}, auch verdächtige und kürzlich tote
+        self._suspects = set()  # Handles verdächtiger Mitglieder
+        self._gone = {}     # {handle: seit} tote und abgemeldete, die ältesten zuerst
+        self.changes = []   # (art, Member, vorherige Gruppen); art: join, update, dead, left
+        self._rng = rng or random.Random()
+        self._updates = {}  # {handle: [eintrag, gesendet]} - weiterzutragende Änderungen
+        self._least_sent = None  # Wie oft die frischeste Änderung schon gesendet wurde
+        self._order = []    # Reihenfolge der Proben, neu gemischt nach jeder Runde
+        self._next = 0
+        self._seq = 0
+        self._probe = None  # [seq, handle, gesendet, indirekt gefragt]
+        self._relays = {}   # {eigene seq: (adresse des fragenden, dessen seq, frist)}
+        self._next_probe = now
+        self._next_contact = now
+        self._next_gossip = now
+        self._probes = 0
+
+    # --- Abfragen ---
+
+    def alive(self):
+        return [m for m in self.members.values() if m.state not in _GONE]
+
+    def __len__(self):
+        return len(self.members) - len(self._gone)
+
+    def _random_members(self, count, exclude=None):
+        """Picks up to count random live members without walking the whole table."""
+        if len(self._order) <= 4 * count:
+            members = [m for m in self.alive() if m.handle != exclude]
+            return self._rng.sample(members, min(count, len(members)))
+        picked = {}
+        for _ in range(4 * count):
+            member = self.members.get(self._rng.choice(self._order))
+            if member is not None and member.state not in _GONE and member.handle != exclude:
+                picked[member.handle] = member
+                if len(picked) == count:
+                    break
+        return list(picked.values())
+
+    # --- Eigener Zustand ---
+
+    def set_groups(self, groups):
+        """Announces a changed list of joined groups under a new incarnation."""
+        self.groups = tuple(sorted(groups))
+        self._refresh_self()
+
+    def _refresh_self(self):
+        self.incarnation += 1
+        self._queue([self.handle, None, self.port, self.incarnation, ALIVE, list(self.groups)])
+
+    def contact(self, addr):
+        """Returns a ping to an address whose member is unknown (a seed); it answers with members."""
+        self._seq += 1
+        return [(self._message('ping', s=self._seq, j=1), addr)]
+
+    def _sync_records(self, exclude, budget):
+        records = []
+        for member in self._random_members(SYNC_MEMBERS, exclude):
+            record = member.record()
+            budget -= _record_size(record)
+            if budget < 0:
+                break
+            records.append(record)
+        return records
+
+    def leave(self):
+        """Returns messages that tell a few members that this node leaves for good."""
+        self.incarnation += 1
+        self._queue([self.handle, None, self.port, self.incarnation, LEFT, []])
+        out = []
+        for member in self._random_members(INDIRECT_PROBES):
+            self._seq += 1
+            out.append((self._message('ping', s=self._seq), member.endpoint))
+        return out
+
+    # --- Verbreitung ---
+
+    def _queue(self, record):
+        self._updates[record[0]] = [record, 0]
+        self._least_sent = 0
+
+    def _piggyback(self, budget):
+        """Picks the least often sent changes that fit into budget bytes."""
+        if not self._updates:
+            return []
+        limit = RETRANSMIT_MULT * math.ceil(math.log2(len(self.members) + 2))
+        records = []
+        for entry in sorted(self._updates.values(), key=lambda entry: entry[1]):
+            record = entry[0]
+            size = _record_size(record)
+            if size > budget:
+                break
+            budget -= size
+            entry[1] += 1
+            if entry[1] >= limit:
+                del self._updates[record[0]]
+            records.append(record)
+        self._least_sent = min((entry[1] for entry in self._updates.values()), default=None)
+        return records
+
+    def pending(self):
+        """Number of changes still riding along on outgoing messages."""
+        return len(self._updates)
+
+    def _message(self, kind, budget=UPDATE_BUDGET, **fields):
+        message = {'t': kind, 'n': [self.handle, self.port, self.incarnation, list(self.groups)]}
+        message.update(fields)
+        updates = self._piggyback(budget)
+        if updates:
+            message['u'] = updates
+        return encode(message)
+
+    # --- Empfang ---
+
+    def receive(self, message, addr, now):
+        """Processes a decoded GOSSIP message from addr; returns the datagrams to send."""
+        try:
+            handle, port, incarnation, groups = message['n']
+            self._apply([handle, addr[0], port, incarnation, ALIVE, groups], now)
+            for record in list(message.get('u', ())) + list(message.get('m', ())):
+                if record[1] is None:
+                    # Nur der Knoten selbst lässt seine IP weg; er ist unter addr erreichbar
+                    if record[0] != handle:
+                        continue
+                    record = [record[0], addr[0]] + record[2:]
+                self._apply(record, now)
+            kind, seq = message['t'], message.get('s')
+        except (KeyError, TypeError, ValueError):
+            return []
+
+        if kind == 'gossip':
+            return []
+        if kind == 'ping':
+            fields = {'s': seq}
+            budget = UPDATE_BUDGET
+            # Abgleich auf Wunsch oder wenn dem Fragenden laut seiner Zählung Mitglieder fehlen
+            count = message.get('c')
+            if message.get('j') or (isinstance(count, int) and count < len(self)):
+                # Der Abgleich geht vor; Änderungen füllen nur den Rest des Datagramms
+                fields['m'] = self._sync_records(handle, UPDATE_BUDGET)
+                budget -= sum(_record_size(record) for record in fields['m'])
+            return [(self._message('ack', budget, **fields), addr)]
+        if kind == 'ping-req':
+            target = message.get('a')
+            if not isinstance(target, list) or len(target) != 2:
+                return []
+            self._seq += 1
+            self._relays[self._seq] = (addr, seq, now + self.period)
+            return [(self._message('ping', s=self._seq), tuple(target))]
+        # ACK: für unsere Probe oder für eine, die wir für einen anderen weitergeleitet haben
+        if self._probe is not None and self._probe[0] == seq:
+            self._probe = None
+        relay = self._relays.pop(seq, None)
+        if relay is not None:
+            requester, requester_seq, _ = relay
+            return [(self._message('ack', s=requester_seq), requester)]
+        return []
+
+    def _apply(self, record, now):
+        handle, ip, port, incarnation, state, groups = record
+        if (not isinstance(handle, str) or not isinstance(ip, str) or not isinstance(port, int)
+                or not isinstance(incarnation, int) or state not in (ALIVE, SUSPECT, DEAD, LEFT)):
+            raise ValueError(record)
+        if handle == self.handle:
+            # Verdacht oder Todesmeldung über uns selbst: mit höherer Inkarnation widerlegen
+            if state != ALIVE and incarnation >= self.incarnation:
+                self.incarnation = incarnation
+                self._refresh_self()
+            return
+        groups = tuple(sorted(groups))
+        member = self.members.get(handle)
+        if member is None:
+            if state in _GONE:
+                return
+            member = self.members[handle] = Member(handle, ip, port, incarnation, state, groups, now)
+            # An zufälliger Stelle einreihen, damit neue Mitglieder nicht alle zuletzt geprobt werden
+            self._order.insert(self._rng.randint(self._next, len(self._order)), handle)
+            if state == SUSPECT:
+                member.deadline = now + self._suspicion_timeout()
+                self._suspects.add(handle)
+            self.changes.append(('join', member, ()))
+            self._queue(member.record())
+            return
+        if not _overrides(state, incarnation, member.state, member.incarnation):
+            return
+        old_state, old_groups, old_endpoint = member.state, member.groups, member.endpoint
+        member.ip, member.port, member.incarnation, member.state, member.groups = ip, port, incarnation, state, groups
+        member.since = now
+        self._mark(member, now)
+        if state == SUSPECT:
+            if old_state != SUSPECT:
+                member.deadline = now + self._suspicion_timeout()
+        elif state in _GONE:
+            self.changes.append((state, member, old_groups))
+        elif old_state in _GONE:
+            self.changes.append(('join', member, ()))
+        elif groups != old_groups or member.endpoint != old_endpoint:
+            self.changes.append(('update', member, old_groups))
+        self._queue(member.record())
+
+    def _mark(self, member, now):
+        # Hält die Indizes verdächtiger und toter Mitglieder zum Zustand passend
+        handle = member.handle
+        if member.state == SUSPECT:
+            self._suspects.add(handle)
+        else:
+            self._suspects.discard(handle)
+        self._gone.pop(handle, None)
+        if member.state in _GONE:
+            self._gone[handle] = now
+
+    def _suspicion_timeout(self):
+        return SUSPICION_MULT * max(1.0, math.log10(len(self.members) + 1)) * self.period
+
+    def _suspect(self, member, now):
+        if member.state == ALIVE:
+            member.state = SUSPECT
+            member.deadline = now + self._suspicion_timeout()
+            self._suspects.add(member.handle)
+            self._queue(member.record())
+
+    # --- Fehlererkennung ---
+
+    def tick(self, now):
+        """Advances probes and suspicions; returns the datagrams to send."""
+        out = []
+        for handle in [h for h in self._suspects if now >= self.members[h].deadline]:
+            member = self.members[handle]
+            member.state, member.since = DEAD, now
+            self._mark(member, now)
+            self.changes.append((DEAD, member, member.groups))
+            self._queue(member.record())
+        while self._gone:
+            handle, since = next(iter(self._gone.items()))
+            if now - since <= DEAD_RETENTION:
+                break
+            del self._gone[handle]
+            del self.members[handle]
+            self._updates.pop(handle, None)
+        for seq, (_, _, deadline) in list(self._relays.items()):
+            if now >= deadline:
+                del self._relays[seq]
+
+        probe = self._probe
+        if probe is not None:
+            seq, handle, sent_at, indirect = probe
+            member = self.members.get(handle)
+            if member is None or member.state in _GONE:
+                self._probe = None
+            elif now - sent_at >= self.period:
+                # Die ganze Periode ohne ACK, auch nicht über Dritte
+                self._suspect(member, now)
+                self._probe = None
+            elif not indirect and now - sent_at >= PING_TIMEOUT:
+                probe[3] = True
+                for helper in self._random_members(INDIRECT_PROBES, exclude=handle):
+                    out.append((self._message('ping-req', s=seq, a=list(member.endpoint)), helper.endpoint))
+
+        if self._probe is None and now >= self._next_probe:
+            self._next_probe = now + self.period
+            member = self._next_target()
+            if member is not None:
+                self._seq += 1
+                self._probes += 1
+                self._probe = [self._seq, member.handle, now, False]
+                sync = {'j': 1} if self._probes % SYNC_EVERY == 0 else {'c': len(self)}
+                out.append((self._message('ping', s=self._seq, **sync), member.endpoint))
+            elif not self.members and self.seeds and now >= self._next_contact:
+                # Niemand bekannt (Start, Netztrennung): wieder bei den Seeds anklopfen
+                self._next_contact = now + SEED_RETRY
+                for seed in self.seeds:
+                    out.extend(self.contact(seed))
+
+        fresh = FRESH_MULT * math.ceil(math.log2(len(self.members) + 2))
+        if self._least_sent is not None and self._least_sent < fresh and now >= self._next_gossip:
+            # Frische Änderungen schneller verbreiten, als es die Proben allein täten; danach
+            # fahren sie nur noch auf Proben und ACKs mit
+            self._next_gossip = now + self.period / GOSSIP_RATE
+            for member in self._random_members(GOSSIP_FANOUT):
+                out.append((self._message('gossip'), member.endpoint))
+        return out
+
+    def _next_target(self):
+        for _ in range(2):
+            while self._next < len(self._order):
+                member = self.members.get(self._order[self._next])
+                self._next += 1
+                if member is not None and member.state not in _GONE:
+                    return member
+            # Runde vorbei: Vergessene entfernen und neu mischen
+            self._order = [handle for handle in self._order if handle in self.members]
+            self._rng.shuffle(self._order)
+            self._next = 0
+        return None
@@ -0,0 +1,244 @@
+from collections import OrderedDict, deque
+
+SEQ_CAPABILITY = "gseq1"  # Versteht SGMSG und GFETCH; per CAPS ausgehandelt
+DEFAULT_CAPACITY = 256    # Nachrichten je Gruppe, die für Nachfragen anderer bereitliegen
+DEFAULT_GROUPS = 16       # Gruppen mit Puffer; die am längsten unbenutzte fällt heraus
+WINDOW = 1024             # Breite des Duplikatfensters je Absender, in Sequenznummern
+HOLD_LIMIT = 64           # Hinter einer Lücke zurückgehaltene Nachrichten je Absender
+FETCH_LIMIT = 64          # Höchstens so viele Nachrichten fordert bzw. beantwortet eine Nachfrage
+RECENT = 20               # So viele Nachrichten holt ein Neuer nach dem Beitritt
+REPEAT_DELAY = 0.2        # Nach so vielen Sekunden Ruhe geht die letzte eigene Nachricht noch einmal raus, ...
+LOSS_MEMORY = 60.0        # ... sofern in dieser Zeit jemand in der Gruppe Nachrichten nachfragen musste
+GAP_TIMEOUT = 0.3         # Sekunden bis zur nächsten Nachfrage für eine Lücke
+MAX_FETCHES = 3           # Danach gilt die Lücke als verloren, das Zurückgehaltene wird zugestellt
+MAX_STREAMS = 4096        # Verfolgte (Gruppe, Absender)-Ströme
+
+
+class MessageCache:
+    """Recent group messages by (sender, epoch, seq), for answering fetches of lost ones.
+
+    Each group has a ring of at most capacity messages, the oldest is evicted first.
+    Groups are kept in LRU order and at most max_groups of them are cached, so the cache
+    holds at most capacity * max_groups messages of one datagram each.
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, max_groups=DEFAULT_GROUPS):
+        self.capacity = capacity
+        self.max_groups = max_groups
+        self._groups = OrderedDict()  # {gruppe: (deque((absender, epoche, seq)), {(absender, epoche, seq): text})}
+        self.evicted = 0
+
+    def store(self, group, sender, epoch, seq, text):
+        """Keeps a message; returns False if it is already cached."""
+        entry = self._groups.get(group)
+        if entry is None:
+            entry = self._groups[group] = (deque(), {})
+            while len(self._groups) > self.max_groups:
+                _, (ring, _) = self._groups.popitem(last=False)
+                self.evicted += len(ring)
+        else:
+            self._groups.move_to_end(group)
+        ring, index = entry
+        key = (sender, epoch, seq)
+        if key in index:
+            return False
+        while ring and len(ring) >= self.capacity:
+            del index[ring.popleft()]
+            self.evicted += 1
+        ring.append(key)
+        index[key] = text
+        return True
+
+    def fetch(self, group, sender, epoch, first, last):
+        """Returns the cached (seq, text) of sender's messages first..last, at most FETCH_LIMIT."""
+        entry = self._groups.get(group)
+        if entry is None:
+            return []
+        self._groups.move_to_end(group)
+        index = entry[1]
+        found = []
+        for seq in range(max(first, 1), min(last, first + FETCH_LIMIT - 1) + 1):
+            text = index.get((sender, epoch, seq))
+            if text is not None:
+                found.append((seq, text))
+        return found
+
+    def recent(self, group, count):
+        """Returns the newest count messages of a group as (sender, epoch, seq, text), oldest first."""
+        entry = self._groups.get(group)
+        if entry is None or count <= 0:
+            return []
+        ring, index = entry
+        keys = list(ring)[-count:]
+        return [(sender, epoch, seq, index[(sender, epoch, seq)]) for sender, epoch, seq in keys]
+
+    def drop(self, group):
+        self._groups.pop(group, None)
+
+    def group_count(self):
+        return len(self._groups)
+
+    def __len__(self):
+        return sum(len(ring) for ring, _ in list(self._groups.values()))
+
+
+class ReplayWindow:
+    """Bitmap of the last WINDOW sequence numbers seen in one stream (as in RFC 4303).
+
+    Bit i of mask stands for top - i. Sequence numbers older than the window count as
+    seen, since whatever they carried was delivered or given up long ago.
+    """
+
+    __slots__ = ('top', 'mask')
+
+    def __init__(self):
+        self.top = 0
+        self.mask = 0
+
+    def add(self, seq):
+        """Marks seq as seen; returns False if it was seen before or is older than the window."""
+        if seq > self.top:
+            shift = seq - self.top
+            # Große Sprünge nicht schieben: eine gefälschte Seq von 2**32 kostete sonst 512 MB
+            self.mask = ((self.mask << shift) | 1) & _FULL if shift < WINDOW else 1
+            self.top = seq
+            return True
+        bit = 1 << (self.top - seq) if self.top - seq < WINDOW else 0
+        if not bit or self.mask & bit:
+            return False
+        self.mask |= bit
+        return True
+
+
+_FULL = (1 << WINDOW) - 1
+
+
+class _Stream:
+    __slots__ = ('key', 'epoch', 'seen', 'next', 'held', 'fetches', 'due')
+
+    def __init__(self, key, epoch, seq):
+        self.key = key
+        self.epoch = epoch
+        self.seen = ReplayWindow()
+        self.next = seq     # Nächste Seq für die Zustellung in Reihenfolge
+        self.held = {}      # {seq: text} - hinter einer Lücke angekommen
+        self.fetches = 0    # Nachfragen für die aktuelle Lücke
+        self.due = None     # Zeitpunkt der nächsten Nachfrage bzw. des Aufgebens
+
+
+class GroupReceiver:
+    """Deduplication and in-order delivery of sequenced group messages, per group and sender.
+
+    A pure state machine like reliable.ReliableChannel: callers pass the current time,
+    send the fetches and deliver the returned texts. Each sender numbers its messages per
+    group within a random epoch; a new epoch (a restarted sender) starts a new stream at
+    whatever arrives first. Duplicates are dropped by a sliding bitmap. Messages behind a
+    gap are held back while the gap is fetched, up to MAX_FETCHES times GAP_TIMEOUT,
+    then delivered anyway. Messages older than the stream's start (e.g. fetched after
+    joining) are delivered as they come.
+    """
+
+    def __init__(self, max_streams=MAX_STREAMS):
+        self.max_streams = max_streams
+        self._streams = OrderedDict()  # {(gruppe, absender): _Stream}, in LRU-Reihenfolge
+        self._waiting = {}             # {(gruppe, absender): _Stream} mit offener Lücke
+        self.received = 0
+        self.duplicates = 0
+        self.recovered = 0
+        self.lost = 0
+        self.fetches = 0
+
+    def receive(self, group, sender, epoch, seq, text, now):
+        """Accepts a message. Returns (texts to deliver in order, fetch or None).
+
+        fetch is (epoch, first, last, attempt): the messages to ask a member for now.
+        """
+        key = (group, sender)
+        stream = self._streams.get(key)
+        texts = []
+        if stream is None or stream.epoch != epoch:
+            if stream is not None:
+                # Neustart des Absenders: das Zurückgehaltene des alten Stroms nicht verlieren
+                texts = self._skip(stream, max(stream.held) + 1 if stream.held else stream.next)
+            stream = self._streams[key] = _Stream(key, epoch, seq)
+            self._streams.move_to_end(key)
+            while len(self._streams) > self.max_streams:
+                old_key, _ = self._streams.popitem(last=False)
+                self._waiting.pop(old_key, None)
+        else:
+            self._streams.move_to_end(key)
+        self.received += 1
+
+        if not stream.seen.add(seq):
+            self.duplicates += 1
+            return texts, None
+        if seq < stream.next:
+            # Älter als alles Zugestellte, z.B. die letzten Nachrichten nach dem Beitritt
+            self.recovered += 1
+            texts.append(text)
+            return texts, None
+        if stream.held and seq < max(stream.held):
+            self.recovered += 1
+        if seq > stream.next:
+            stream.held[seq] = text
+            if len(stream.held) > HOLD_LIMIT:
+                # Die Lücke ist zu groß zum Nachholen
+                texts.extend(self._skip(stream, min(stream.held)))
+            if stream.held and stream.due is None:
+                return texts, self._fetch(stream, now)
+            return texts, None
+
+        stream.next += 1
+        texts.append(text)
+        texts.extend(self._advance(stream))
+        return texts, None
+
+    def _advance(self, stream):
+        texts = []
+        held = stream.held
+        while stream.next in held:
+            texts.append(held.pop(stream.next))
+            stream.next += 1
+        if not held:
+            stream.fetches = 0
+            stream.due = None
+            self._waiting.pop(stream.key, None)
+        return texts
+
+    def _skip(self, stream, upto):
+        """Gives up on the missing messages below upto; returns what can be delivered now."""
+        texts = [stream.held.pop(seq) for seq in sorted(seq for seq in stream.held if seq < upto)]
+        self.lost += upto - stream.next - len(texts)
+        stream.next = upto
+        stream.fetches = 0
+        stream.due = None
+        self._waiting.pop(stream.key, None)
+        return texts + self._advance(stream)
+
+    def _fetch(self, stream, now):
+        stream.fetches += 1
+        stream.due = now + GAP_TIMEOUT
+        self._waiting[stream.key] = stream
+        self.fetches += 1
+        last = min(max(stream.held) - 1, stream.next + FETCH_LIMIT - 1)
+        return stream.epoch, stream.next, last, stream.fetches
+
+    def next_due(self):
+        """Time of the earliest pending fetch or give-up, or None if no gap is open."""
+        return min((stream.due for stream in self._waiting.values()), default=None)
+
+    def expire(self, now):
+        """Handles due gaps. Returns [(group, sender, texts to deliver, fetch or None)]."""
+        results = []
+        for stream in [s for s in self._waiting.values() if s.due <= now]:
+            texts = []
+            if stream.fetches >= MAX_FETCHES:
+                texts = self._skip(stream, min(stream.held))
+            fetch = self._fetch(stream, now) if stream.held else None
+            results.append((stream.key[0], stream.key[1], texts, fetch))
+        return results
+
+    def drop(self, group):
+        for key in [key for key in self._streams if key[0] == group]:
+            del self._streams[key]
+            self._waiting.pop(key, None)
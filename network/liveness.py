@@ -0,0 +1,64 @@
+import time
+
+
+class TimerWheel:
+    """Hashed timer wheel for peer liveness deadlines.
+
+    refresh() only updates a dict entry, so an ALIVE costs O(1). Each key sits in the
+    bucket of the first tick after its deadline; when a bucket comes due, refreshed keys
+    are moved on lazily and the rest expire. Expirations therefore fire at most one tick
+    late, and a tick only touches the keys that are actually due.
+    """
+
+    def __init__(self, tick=0.5, slots=256, start=None):
+        self.tick = tick
+        self.slots = [set() for _ in range(slots)]
+        self.deadlines = {}  # {schlüssel: frist}
+        # Zuletzt abgearbeiteter Tick
+        self.current = int((time.time() if start is None else start) / tick)
+
+    def __len__(self):
+        return len(self.deadlines)
+
+    def __contains__(self, key):
+        return key in self.deadlines
+
+    def _bucket(self, deadline):
+        return self.slots[(int(deadline / self.tick) + 1) % len(self.slots)]
+
+    def refresh(self, key, deadline):
+        """Sets or moves the deadline of a key."""
+        old = self.deadlines.get(key)
+        self.deadlines[key] = deadline
+        # Verlängerte Fristen bleiben im alten Bucket und werden dort weitergereicht;
+        # nur eine vorgezogene Frist braucht einen zusätzlichen Eintrag
+        if old is None or deadline < old:
+            self._bucket(deadline).add(key)
+
+    def remove(self, key):
+        self.deadlines.pop(key, None)
+
+    def advance(self, now):
+        """Processes all ticks up to now and returns the keys whose deadline has passed."""
+        target = int(now / self.tick)
+        # Nach langer Pause höchstens eine volle Umdrehung abarbeiten
+        self.current = max(self.current, target - len(self.slots))
+
+        expired = []
+        while self.current < target:
+            self.current += 1
+            bucket = self.slots[self.current % len(self.slots)]
+            if not bucket:
+                continue
+            keys = list(bucket)
+            bucket.clear()
+            for key in keys:
+                deadline = self.deadlines.get(key)
+                if deadline is None:
+                    continue
+                if deadline <= now:
+                    del self.deadlines[key]
+                    expired.append(key)
+                else:
+                    self._bucket(deadline).add(key)
+        return expired
@@ -0,0 +1,487 @@
+import os
+import queue
+import re
+import struct
+import threading
+import time
+import zlib
+from array import array
+from bisect import bisect_left
+from collections import namedtuple
+
+from network import protocol
+
+# Datensatz: CRC32 über den Rest, Zeitstempel, Befehl, Flags, Längen von Unterhaltung,
+# Absender und Text; danach die drei Felder als UTF-8
+_RECORD = struct.Struct('!IdBBHHI')
+_INDEX_TERM = struct.Struct('!HI')
+OUTGOING = 0x01
+
+SEGMENT_SIZE = 64 * 1024 * 1024
+MAX_SEGMENTS = 32
+FSYNC_INTERVAL = 1.0
+MAX_WORD = 64  # Längere Wörter werden gekürzt indexiert; die Suche prüft ohnehin den Volltext
+
+_WORD = re.compile(r'\w+')
+_STOP = object()
+
+Entry = namedtuple('Entry', 'timestamp command outgoing conversation sender text')
+
+
+def _conversation_term(command, conversation):
+    prefix = 'g:' if command == protocol.GMSG else 'u:'
+    return prefix + conversation
+
+
+def _terms(command, conversation, text):
+    terms = {'w:' + word[:MAX_WORD] for word in _WORD.findall(text.lower())}
+    terms.add(_conversation_term(command, conversation))
+    return terms
+
+
+def _segment_name(number):
+    return f"segment-{number:08d}.log"
+
+
+class MessageLog:
+    """Segmented append-only chat history with in-memory term indexes.
+
+    append() only enqueues; a writer thread encodes records in batches, rotates segments
+    at segment_size bytes and fsyncs at most every fsync_interval seconds. Each record is
+    indexed under its conversation ('g:<gruppe>' or 'u:<handle>') and every word of its
+    text. Positions are (segment << 32 | offset), so posting lists stay sorted and
+    queries only read the records they return. Sealed segments get a .idx sidecar so a
+    restart does not rescan them; beyond max_segments the oldest segment is dropped.
+    With max_age (seconds), sealed segments are compacted at startup and after each
+    rotation: rewritten without records older than that, or deleted once empty.
+    """
+
+    def __init__(self, path, segment_size=SEGMENT_SIZE, max_segments=MAX_SEGMENTS,
+                 fsync_interval=FSYNC_INTERVAL, on_error=None, max_age=None):
+        self.path = path
+        self.on_error = on_error  # Funktion (text) für Schreibfehler; sonst Ausgabe auf der Konsole
+        self.segment_size = segment_size
+        self.max_segments = max(1, max_segments)
+        self.fsync_interval = fsync_interval
+        self.max_age = max_age
+        self._compact_due = True  # Beim Start und nach jeder Rotation; nur im Writer-Thread
+        self._lock = threading.Lock()
+        self._index = {}         # {begriff: array('Q') positionen}
+        self._active_terms = {}  # {begriff: array('I') offsets} des aktiven Segments
+        self._segments = []      # Segmentnummern, aufsteigend
+        self._readers = {}       # {segment: datei}
+        self._count = 0
+
+        os.makedirs(path, exist_ok=True)
+        self._load()
+        self._queue = queue.SimpleQueue()
+        self._writer_thread = threading.Thread(target=self._writer, daemon=True)
+        self._writer_thread.start()
+
+    def __len__(self):
+        return self._count
+
+    def pending(self):
+        """Number of messages still waiting for the writer thread."""
+        return self._queue.qsize()
+
+    # --- Laden ---
+
+    def _segment_path(self, number, suffix='.log'):
+        return os.path.join(self.path, _segment_name(number)[:-4] + suffix)
+
+    def _load(self):
+        numbers = []
+        for name in os.listdir(self.path):
+            if name.startswith('segment-') and name.endswith('.log'):
+                try:
+                    numbers.append(int(name[8:-4]))
+                except ValueError:
+                    pass
+        numbers.sort()
+
+        for number in numbers[:-1]:
+            self._segments.append(number)
+            if not self._load_index(number):
+                terms = self._scan(number)
+                self._write_index(number, terms)
+                self._merge(number, terms)
+
+        self._active = numbers[-1] if numbers else 1
+        self._segments.append(self._active)
+        self._active_terms = self._scan(self._active, repair=True)
+        self._merge(self._active, self._active_terms)
+        self._file = open(self._segment_path(self._active), 'ab')
+        self._active_size = self._file.tell()
+
+    def _scan(self, number, repair=False):
+        """Reads a segment and returns its {term: offsets}; cuts off a torn tail if repair is set."""
+        terms = {}
+        path = self._segment_path(number)
+        if not os.path.exists(path):
+            open(path, 'wb').close()
+        with open(path, 'rb') as f:
+            data = f.read()
+        offset = 0
+        while offset + _RECORD.size <= len(data):
+            entry, end = self._decode(data, offset)
+            if entry is None:
+                break
+            for term in _terms(entry.command, entry.conversation, entry.text):
+                terms.setdefault(term, array('I')).append(offset)
+            offset = end
+        if repair and offset < len(data):
+            with open(path, 'r+b') as f:
+                f.truncate(offset)
+        return terms
+
+    def _load_index(self, number):
+        try:
+            with open(self._segment_path(number, '.idx'), 'rb') as f:
+                data = f.read()
+            terms = {}
+            pos = 0
+            while pos < len(data):
+                term_len, count = _INDEX_TERM.unpack_from(data, pos)
+                pos += _INDEX_TERM.size
+                term = data[pos:pos + term_len].decode('utf-8')
+                pos += term_len
+                offsets = array('I')
+                offsets.frombytes(data[pos:pos + count * offsets.itemsize])
+                pos += count * offsets.itemsize
+                if len(offsets) != count:
+                    return False
+                terms[term] = offsets
+        except (OSError, struct.error, UnicodeDecodeError, ValueError):
+            return False
+        self._merge(number, terms)
+        return True
+
+    def _write_index(self, number, terms):
+        parts = []
+        for term, offsets in terms.items():
+            encoded = term.encode('utf-8')
+            parts.append(_INDEX_TERM.pack(len(encoded), len(offsets)))
+            parts.append(encoded)
+            parts.append(offsets.tobytes())
+        tmp_path = self._segment_path(number, '.idx.tmp')
+        with open(tmp_path, 'wb') as f:
+            f.write(b''.join(parts))
+        os.replace(tmp_path, self._segment_path(number, '.idx'))
+
+    def _merge(self, number, terms):
+        base = number << 32
+        for term, offsets in terms.items():
+            positions = self._index.get(term)
+            if positions is None:
+                positions = self._index[term] = array('Q')
+            positions.extend([base | offset for offset in offsets])
+            if term[0] == 'g' or term[0] == 'u':
+                self._count += len(offsets)
+
+    # --- Schreiben ---
+
+    def append(self, command, conversation, sender, text, outgoing=False, timestamp=None):
+        """Queues a message for the log; never blocks on disk I/O."""
+        self._queue.put((time.time() if timestamp is None else timestamp,
+                         command, outgoing, conversation, sender, text))
+
+    def _encode(self, timestamp, command, outgoing, conversation, sender, text):
+        conversation_b = conversation.encode('utf-8')[:0xFFFF]
+        sender_b = sender.encode('utf-8')[:0xFFFF]
+        text_b = text.encode('utf-8')
+        body = _RECORD.pack(0, timestamp, command, OUTGOING if outgoing else 0,
+                            len(conversation_b), len(sender_b), len(text_b))[4:]
+        body = b''.join((body, conversation_b, sender_b, text_b))
+        return struct.pack('!I', zlib.crc32(body)) + body
+
+    def _decode(self, data, offset):
+        try:
+            crc, timestamp, command, flags, conv_len, sender_len, text_len = \
+                _RECORD.unpack_from(data, offset)
+        except struct.error:
+            return None, offset
+        end = offset + _RECORD.size + conv_len + sender_len + text_len
+        if end > len(data) or zlib.crc32(data[offset + 4:end]) != crc:
+            return None, offset
+        pos = offset + _RECORD.size
+        try:
+            conversation = bytes(data[pos:pos + conv_len]).decode('utf-8')
+            pos += conv_len
+            sender = bytes(data[pos:pos + sender_len]).decode('utf-8')
+            text = bytes(data[pos + sender_len:end]).decode('utf-8')
+        except UnicodeDecodeError:
+            return None, offset
+        return Entry(timestamp, command, bool(flags & OUTGOING), conversation, sender, text), end
+
+    def _report(self, error):
+        if self.on_error is not None:
+            self.on_error(f"Fehler beim Schreiben des Verlaufs: {error}")
+        else:
+            print(f"\nFehler beim Schreiben des Verlaufs: {error}")
+
+    def _writer(self):
+        last_sync = time.monotonic()
+        dirty = False
+        while True:
+            if self._compact_due:
+                self._compact_due = False
+                try:
+                    self._compact()
+                except Exception as e:
+                    self._report(e)
+            try:
+                item = self._queue.get(timeout=self.fsync_interval if dirty else None)
+            except queue.Empty:
+                item = None
+            batch = []
+            stop = False
+            while item is not None:
+                if item is _STOP:
+                    stop = True
+                else:
+                    batch.append(item)
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    item = None
+
+            try:
+                if batch:
+                    self._write_batch(batch)
+                    dirty = True
+                now = time.monotonic()
+                if dirty and (stop or not batch or now - last_sync >= self.fsync_interval):
+                    os.fsync(self._file.fileno())
+                    last_sync = now
+                    dirty = False
+            except Exception as e:
+                self._report(e)
+            if stop:
+                return
+
+    def _write_batch(self, batch):
+        records = []
+        for item in batch:
+            record = self._encode(*item)
+            if self._active_size + len(record) > self.segment_size and self._active_size:
+                self._flush_records(records)
+                records = []
+                self._rotate()
+            records.append((self._active_size, record, item))
+            self._active_size += len(record)
+        self._flush_records(records)
+
+    def _flush_records(self, records):
+        if not records:
+            return
+        self._file.write(b''.join(record for _, record, _ in records))
+        # Ohne fsync, aber für die Lesezugriffe sichtbar
+        self._file.flush()
+        base = self._active << 32
+        with self._lock:
+            for offset, _, (_, command, _, conversation, _, text) in records:
+                for term in _terms(command, conversation, text):
+                    offsets = self._active_terms.get(term)
+                    if offsets is None:
+                        offsets = self._active_terms[term] = array('I')
+                    offsets.append(offset)
+                    positions = self._index.get(term)
+                    if positions is None:
+                        positions = self._index[term] = array('Q')
+                    positions.append(base | offset)
+                self._count += 1
+
+    def _rotate(self):
+        """Seals the active segment and starts a new one; drops the oldest beyond max_segments."""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        self._write_index(self._active, self._active_terms)
+        with self._lock:
+            self._active += 1
+            self._segments.append(self._active)
+            self._active_terms = {}
+            self._file = open(self._segment_path(self._active), 'ab')
+            self._active_size = 0
+            while len(self._segments) > self.max_segments:
+                self._drop_oldest()
+        self._compact_due = True
+
+    def _drop_oldest(self):
+        number = self._segments.pop(0)
+        limit = self._segments[0] << 32
+        for term in list(self._index):
+            positions = self._index[term]
+            cut = bisect_left(positions, limit)
+            if cut:
+                if term[0] == 'g' or term[0] == 'u':
+                    self._count -= cut
+                del positions[:cut]
+                if not positions:
+                    del self._index[term]
+        reader = self._readers.pop(number, None)
+        if reader is not None:
+            reader.close()
+        for suffix in ('.log', '.idx'):
+            try:
+                os.remove(self._segment_path(number, suffix))
+            except FileNotFoundError:
+                pass
+
+    def _compact(self):
+        """Removes records older than max_age from the sealed segments (writer thread).
+
+        Timestamps grow with the segment number, so this stops at the first sealed
+        segment without expired records.
+        """
+        if self.max_age is None:
+            return
+        cutoff = time.time() - self.max_age
+        for number in self._segments[:-1]:
+            if not self._compact_segment(number, cutoff):
+                break
+
+    def _compact_segment(self, number, cutoff):
+        """Rewrites a sealed segment without expired records; returns False if it had none."""
+        path = self._segment_path(number)
+        with open(path, 'rb') as f:
+            data = f.read()
+        parts = []
+        terms = {}
+        size = 0
+        expired = False
+        offset = 0
+        while offset + _RECORD.size <= len(data):
+            entry, end = self._decode(data, offset)
+            if entry is None:
+                break
+            if entry.timestamp < cutoff:
+                expired = True
+            else:
+                for term in _terms(entry.command, entry.conversation, entry.text):
+                    terms.setdefault(term, array('I')).append(size)
+                parts.append(data[offset:end])
+                size += end - offset
+            offset = end
+        if not expired:
+            return False
+
+        tmp_path = self._segment_path(number, '.log.tmp')
+        if parts:
+            with open(tmp_path, 'wb') as f:
+                f.write(b''.join(parts))
+                f.flush()
+                os.fsync(f.fileno())
+        with self._lock:
+            reader = self._readers.pop(number, None)
+            if reader is not None:
+                reader.close()
+            # Erst den alten Index löschen: Ein Absturz danach führt nur zu einem neuen Scan
+            try:
+                os.remove(self._segment_path(number, '.idx'))
+            except FileNotFoundError:
+                pass
+            if parts:
+                os.replace(tmp_path, path)
+            else:
+                os.remove(path)
+                self._segments.remove(number)
+            self._reindex(number, terms)
+        if parts:
+            self._write_index(number, terms)
+        return True
+
+    def _reindex(self, number, terms):
+        """Replaces the positions of one segment in all posting lists by terms (lock held)."""
+        low, high = number << 32, (number + 1) << 32
+        for term in list(self._index):
+            positions = self._index[term]
+            start = bisect_left(positions, low)
+            end = bisect_left(positions, high, start)
+            if start == end:
+                continue
+            if term[0] == 'g' or term[0] == 'u':
+                self._count -= end - start
+            del positions[start:end]
+            if not positions:
+                del self._index[term]
+        for term, offsets in terms.items():
+            positions = self._index.get(term)
+            if positions is None:
+                positions = self._index[term] = array('Q')
+            start = bisect_left(positions, low)
+            positions[start:start] = array('Q', [low | offset for offset in offsets])
+            if term[0] == 'g' or term[0] == 'u':
+                self._count += len(offsets)
+
+    def close(self):
+        """Writes and syncs all queued messages and closes the files."""
+        self._queue.put(_STOP)
+        self._writer_thread.join(timeout=10)
+        with self._lock:
+            self._file.close()
+            for reader in self._readers.values():
+                reader.close()
+            self._readers.clear()
+
+    # --- Abfragen ---
+
+    def _read(self, position):
+        number = position >> 32
+        reader = self._readers.get(number)
+        if reader is None:
+            reader = self._readers[number] = open(self._segment_path(number), 'rb')
+        reader.seek(position & 0xFFFFFFFF)
+        header = reader.read(_RECORD.size)
+        if len(header) < _RECORD.size:
+            return None
+        lengths = _RECORD.unpack(header)[4:]
+        data = header + reader.read(sum(lengths))
+        return self._decode(data, 0)[0]
+
+    def has_conversation(self, group=None, peer=None):
+        term = _conversation_term(protocol.GMSG, group) if group is not None else \
+            _conversation_term(protocol.MSG, peer)
+        return term in self._index
+
+    def history(self, group=None, peer=None, limit=20):
+        """Returns the last limit messages of a group or of the direct chat with a peer, oldest first."""
+        term = _conversation_term(protocol.GMSG, group) if group is not None else \
+            _conversation_term(protocol.MSG, peer)
+        with self._lock:
+            positions = self._index.get(term, ())
+            selected = positions[-limit:] if limit > 0 else ()
+            entries = [self._read(position) for position in selected]
+        return [entry for entry in entries if entry is not None]
+
+    def search(self, text, limit=20):
+        """Returns the newest limit messages containing text (case-insensitive), oldest first.
+
+        Candidates come from intersecting the word posting lists, starting with the
+        rarest word; only those records are read and checked for the exact phrase.
+        """
+        needle = text.lower()
+        words = {word[:MAX_WORD] for word in _WORD.findall(needle)}
+        if not words or limit <= 0:
+            return []
+        results = []
+        with self._lock:
+            postings = sorted((self._index.get('w:' + word, array('Q')) for word in words), key=len)
+            rarest, others = postings[0], postings[1:]
+            for i in range(len(rarest) - 1, -1, -1):
+                position = rarest[i]
+                if not all(_contains(posting, position) for posting in others):
+                    continue
+                entry = self._read(position)
+                if entry is not None and needle in entry.text.lower():
+                    results.append(entry)
+                    if len(results) >= limit:
+                        break
+        results.reverse()
+        return results
+
+
+def _contains(positions, position):
+    i = bisect_left(positions, position)
+    return i < len(positions) and positions[i] == position
@@ -0,0 +1,171 @@
+import json
+from bisect import bisect_left
+
+# Obergrenzen der Histogramm-Buckets
+LATENCY_BUCKETS = (1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 1e-2, 1e-1)
+THROUGHPUT_BUCKETS = tuple(2 ** i * 1024 for i in range(4, 19))  # 16 KiB/s bis 256 MiB/s
+
+
+class Counter:
+    """Monotonic counter per label tuple. inc() is a single dict update."""
+
+    kind = 'counter'
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.values = {}  # {label-tupel: wert}
+
+    def inc(self, key=(), amount=1):
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        return list(self.values.items())
+
+    def total(self):
+        return sum(self.values.values())
+
+
+class Gauge:
+    """Values read from a callback at export time, so they cost nothing on the hot path.
+
+    kind='counter' exports values that are counted elsewhere (e.g. socket statistics).
+    """
+
+    def __init__(self, name, help_text, labels, collect, kind='gauge'):
+        self.kind = kind
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.collect = collect  # () -> {label-tupel: wert}
+
+    def samples(self):
+        try:
+            return list(self.collect().items())
+        except Exception:
+            return []
+
+
+class Histogram:
+    """Fixed-bucket histogram per label tuple."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self.values = {}  # {label-tupel: [zähler je bucket (+inf am ende), summe]}
+
+    def observe(self, value, key=()):
+        entry = self.values.get(key)
+        if entry is None:
+            entry = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+        entry[0][bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+
+    def samples(self):
+        return [(key, (list(counts), total)) for key, (counts, total) in list(self.values.items())]
+
+    def count(self, key=()):
+        entry = self.values.get(key)
+        return sum(entry[0]) if entry else 0
+
+    def quantile(self, q, key=()):
+        """Upper bound of the bucket that contains the q-quantile, or None without samples."""
+        entry = self.values.get(key)
+        if not entry:
+            return None
+        counts = entry[0]
+        target = q * sum(counts)
+        seen = 0
+        for i, count in enumerate(counts):
+            seen += count
+            if seen >= target and count:
+                return self.buckets[i] if i < len(self.buckets) else float('inf')
+        return None
+
+
+def _label_str(names, key, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, key)]
+    pairs.extend(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_bound(bound):
+    return '+Inf' if bound == float('inf') else repr(float(bound))
+
+
+class Metrics:
+    """Registry of counters, gauges and histograms with Prometheus text and JSON export.
+
+    Updates are plain dict operations without locking, so they must all happen on the
+    event loop thread; other threads hand them over with call_soon. Readers on other
+    threads (/stats) iterate over list() copies, which new keys cannot invalidate.
+    """
+
+    def __init__(self, prefix='chat'):
+        self.prefix = prefix
+        self.instruments = []
+
+    def _register(self, instrument):
+        instrument.name = f"{self.prefix}_{instrument.name}"
+        self.instruments.append(instrument)
+        return instrument
+
+    def counter(self, name, help_text, labels=()):
+        return self._register(Counter(name, help_text, labels))
+
+    def gauge(self, name, help_text, labels, collect, kind='gauge'):
+        return self._register(Gauge(name, help_text, labels, collect, kind))
+
+    def histogram(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, help_text, labels, buckets))
+
+    def prometheus(self):
+        """Renders all instruments in the Prometheus text exposition format."""
+        lines = []
+        for instrument in self.instruments:
+            lines.append(f"# HELP {instrument.name} {instrument.help}")
+            lines.append(f"# TYPE {instrument.name} {instrument.kind}")
+            for key, value in instrument.samples():
+                if instrument.kind != 'histogram':
+                    lines.append(f"{instrument.name}{_label_str(instrument.labels, key)} {value}")
+                    continue
+                counts, total = value
+                cumulative = 0
+                for bound, count in zip(instrument.buckets + (float('inf'),), counts):
+                    cumulative += count
+                    le = f'le="{_format_bound(bound)}"'
+                    lines.append(f"{instrument.name}_bucket{_label_str(instrument.labels, key, (le,))} {cumulative}")
+                lines.append(f"{instrument.name}_sum{_label_str(instrument.labels, key)} {total}")
+                lines.append(f"{instrument.name}_count{_label_str(instrument.labels, key)} {cumulative}")
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self):
+        """Returns all instruments as a JSON-serialisable dict."""
+        result = {}
+        for instrument in self.instruments:
+            samples = []
+            for key, value in instrument.samples():
+                sample = {'labels': dict(zip(instrument.labels, key))}
+                if instrument.kind == 'histogram':
+                    counts, total = value
+                    sample.update(buckets=dict(zip(map(_format_bound, instrument.buckets + (float('inf'),)), counts)),
+                                  sum=total, count=sum(counts))
+                else:
+                    sample['value'] = value
+                samples.append(sample)
+            result[instrument.name] = {'type': instrument.kind, 'help': instrument.help, 'samples': samples}
+        return result
+
+    def render(self, fmt):
+        if fmt == 'json':
+            return json.dumps(self.snapshot(), indent=1)
+        return self.prometheus()
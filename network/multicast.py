@@ -0,0 +1,40 @@
+import socket
+import struct
+import sys
+
+from network import protocol
+
+# Organisationslokaler Bereich 239.192.0.0/14 (RFC 2365); jede Gruppe bekommt eine Adresse daraus
+_BASE = 0xEFC00000
+_MASK = 0x3FFFF
+
+# Linux stellt sonst jedem an 0.0.0.0 gebundenen Socket alle auf dem Host abonnierten Gruppen zu
+IP_MULTICAST_ALL = getattr(socket, 'IP_MULTICAST_ALL', 49)
+
+
+def group_address(group):
+    """Maps a chat group to its IPv4 multicast address."""
+    return socket.inet_ntoa(struct.pack('!I', _BASE | (protocol.group_id(group) & _MASK)))
+
+
+def _membership(address, interface):
+    return struct.pack('4s4s', socket.inet_aton(address), socket.inet_aton(interface))
+
+
+def configure(sock, ttl=1, interface='0.0.0.0'):
+    """Prepares a bound UDP socket for sending to and receiving only its own multicast groups."""
+    sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, ttl)
+    # Andere Instanzen auf demselben Host sollen mitlesen können
+    sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+    if interface != '0.0.0.0':
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF, socket.inet_aton(interface))
+    if sys.platform.startswith('linux'):
+        sock.setsockopt(socket.IPPROTO_IP, IP_MULTICAST_ALL, 0)
+
+
+def join(sock, address, interface='0.0.0.0'):
+    sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, _membership(address, interface))
+
+
+def leave(sock, address, interface='0.0.0.0'):
+    sock.setsockopt(socket.IPPROTO_IP, socket.IP_DROP_MEMBERSHIP, _membership(address, interface))
@@ -1,369 +1,1852 @@
+import asyncio
+import json
 import socket
 import time
 import os
-from threading import Thread
+import random
+import threading
+from collections import OrderedDict
+
+from network import batch_io
+from network import compression
+from network import dispatch
+from network import events
+from network import gossip
+from network import group_cache
+from network import metrics
+from network import multicast
+from network import protocol
+from network import rate_limit
+from network import reliable
+from network import tcp_transfer
+from network import transfer
+from network.event_loop import shared_loop
+from network.message_log import MAX_SEGMENTS, SEGMENT_SIZE, MessageLog
+from network.peer_directory import PeerDirectory
+from network.storage import ContentStore, MappedFile, PartialFile, partial_usage, remove_stale_partials, write_atomic
+
+
+PROGRESS_INTERVAL = 0.5  # Sekunden zwischen zwei Fortschrittsmeldungen eines Transfers
+REPLY_JITTER = 0.05      # Höchste zufällige Verzögerung der REPLYs auf JOINs
+MAX_PENDING_REPLIES = 1024
+OVERLOAD_PAUSE = 0.02    # Sekunden ohne Lesen, wenn ein voller Stapel fast nur verworfen wurde
+DISCOVER_DELAY = 0.5     # Sekunden nach einem JOIN, bis die bekannten Nutzer angezeigt werden
+SNAPSHOT_VERSION = 1
+SNAPSHOT_INTERVAL = 10   # Sekunden zwischen zwei Sicherungen der Peer-Tabelle
+SNAPSHOT_MAX_AGE = 600   # Ältere Einträge werden beim Start nicht wiederhergestellt
+PROBE_INTERVAL = 0.5     # Sekunden zwischen zwei Nachfragen bei wiederhergestellten Peers
+PROBE_ATTEMPTS = 3
+PROBE_TIMEOUT = PROBE_INTERVAL * PROBE_ATTEMPTS + 1.5  # Danach gilt ein stummer Peer als verloren
+GOSSIP_TICK = 0.1        # Sekunden zwischen zwei Schritten der Gossip-Mitgliedschaft
+GOSSIP_REFRESH = 60      # Sekunden zwischen zwei Auffrischungen der per Gossip bekannten Peers
+GOSSIP_PEER_TIMEOUT = 3 * GOSSIP_REFRESH  # Nur Rückfallebene; Ausfälle meldet die Mitgliedschaft
+
+# Einstellungen, die beim Neuladen der Konfiguration erst nach einem Neustart wirken
+RESTART_KEYS = frozenset(("handle", "history", "historypath", "historysegmentsize", "historysegments",
+                          "compression", "grouptransport", "multicastinterface", "multicastttl",
+                          "metricsfile", "metricsformat", "metricsinterval",
+                          "peersnapshot", "statepath", "snapshotinterval", "discovery", "groupcache"))
+
+# Gleiche Broadcasts dieser Befehle innerhalb eines Ticks (z.B. ALIVE mehrerer Timer) nur
+# einmal senden; Chatnachrichten nie, zwei gleiche Nachrichten sind zwei Nachrichten
+COALESCED_COMMANDS = frozenset((protocol.ALIVE, protocol.JOIN, protocol.LEAVE, protocol.REPLY))
+
+# Befehle, die es nur im Textformat gibt (Aushandlung, Bildübertragung, Gossip, Nachfragen)
+TEXT_COMMANDS = frozenset(("CAPS", "CAPS-REPLY", "IMG", "FILE", "IMG-ACK", "IMG-TCP", "GOSSIP", "GFETCH"))
+
 
 class NetworkHandler:
     def __init__(self, config):
         self.config = config
         self.running = True
-        self.image_transfer_info = {} # {(ip, port): (groesse, handle)}
+        # Alle Ausgaben laufen als Ereignisse über den Bus; die Oberfläche zeigt sie an
+        self.events = events.EventBus()
+        self.incoming_transfers = {} # {((ip, port), transfer_id): TransferReceiver}
+        self.outgoing_transfers = {} # {transfer_id: TransferSender}
+        self.completed_transfers = OrderedDict() # {((ip, port), transfer_id): Anzahl Chunks}
+        self.rejected_transfers = OrderedDict()  # {((ip, port), transfer_id): None} - abgelehnte Ankündigungen
         self.handle = self.config['user']['handle']
         self.port = self.config['user']['port']
         self.broadcast_port = self.config['user']['whoisport']
-        self.broadcast_address = '255.255.255.255'
+        self.broadcast_address = self.config['user'].get('broadcastaddress', '255.255.255.255')
+        self.chunk_size = self.config['user'].get('chunksize', transfer.DEFAULT_CHUNK_SIZE)
+        self.transfer_window = self.config['user'].get('transferwindow', transfer.DEFAULT_WINDOW)
+        # Obergrenze für eingehende Transfers; die Zieldatei wird vorab in voller Größe angelegt
+        self.max_transfer_size = self.config['user'].get('maxtransfersize', transfer.MAX_TRANSFER_SIZE)
+        # ... und für alle zusammen: gleichzeitige Empfänge und der Platz aller Teildateien
+        self.max_incoming = self.config['user'].get('maxincomingtransfers', transfer.MAX_INCOMING)
+        self.max_partial_bytes = self.config['user'].get('maxpartialbytes', transfer.MAX_PARTIAL_BYTES)
+        self.image_path = self.config['user'].get('imagepath', 'received_images/')
+        # Teildateien abgebrochener Empfänge eines früheren Laufs nicht ewig aufheben
+        self._remove_stale_partials()
+        # Große Transfers per TCP neben dem UDP-Socket, wenn beide Seiten es beherrschen
+        self.tcp_transfers = self.config['user'].get('tcptransfer', True)
+        # Empfangene Inhalte liegen einmal pro Hash im Speicher; sichtbare Dateien sind Links darauf
+        self.content_store = ContentStore(os.path.join(self.image_path, '.objects'))
         
         self.groups = ['default']  # Alle beigetretenen Gruppen
         self.active_group = 'default'  # Gruppe zum Senden von Nachrichten
-        self.users_by_group = {'default': {}}  # {gruppe: {handle: (ip, port)}}
+        self.peers = PeerDirectory()  # Bekannte Nutzer je Gruppe mit ihren Endpunkten
+        self.peers.add_group('default')
+        self._group_ids = {protocol.group_id('default'): 'default'}  # Interne Gruppen-IDs des Binärformats
+        self.binary_protocol = self.config['user'].get('binaryprotocol', True)
+
+        # Kompression wird pro Peer ausgehandelt: "dict" (Wörterbuch und zlib), "zlib" oder "off"
+        self.compressor = compression.Compressor(
+            compression.CODECS.get(self.config['user'].get('compression', 'dict'), compression.CODECS['dict']))
+
+        # Optionale Zustellbestätigung für Direktnachrichten (per CAPS ausgehandelt)
+        self.reliable_messages = self.config['user'].get('reliablemsg', False)
+        self._epoch = reliable.new_epoch()
+        self._channels = {}           # {handle: ReliableChannel}
+        self._retransmit_timers = {}  # {handle: asyncio.TimerHandle}
+        self._ack_timers = {}         # {handle: asyncio.TimerHandle}
+        self._chunk_ack_timers = {}   # {((ip, port), transfer_id): asyncio.TimerHandle} verzögerte IMG-ACKs
+        self._discover_timers = {}    # {gruppe: asyncio.TimerHandle} Anzeige der Nutzer nach /join
+
+        # Gruppennachrichten mit Epoche und Sequenznummer des Absenders (per CAPS ausgehandelt):
+        # Duplikate fallen heraus, Lücken werden per Unicast bei einem Mitglied nachgefragt,
+        # und wer neu in einer Gruppe ist, holt deren letzte Nachrichten nach
+        self.group_cache = None
+        self.group_receiver = None
+        if self.config['user'].get('groupcache', group_cache.DEFAULT_CAPACITY):
+            self.group_cache = group_cache.MessageCache(
+                self.config['user'].get('groupcache', group_cache.DEFAULT_CAPACITY),
+                self.config['user'].get('groupcachegroups', group_cache.DEFAULT_GROUPS))
+            self.group_receiver = group_cache.GroupReceiver()
+        self._group_epoch = reliable.new_epoch()
+        self._group_seq = {}          # {gruppe: letzte eigene Sequenznummer}
+        self._group_sync = set(self.groups) if self.group_cache is not None else set()
+        self._group_served = 0        # Auf Nachfragen anderer gesendete Nachrichten
+        self._gap_timer = None
+        self._repeat_timers = {}      # {gruppe: asyncio.TimerHandle} Wiederholung der letzten Nachricht
+        self._group_losses = {}       # {gruppe: monotonic} - letzte Nachfrage anderer nach unseren Nachrichten
 
-        # Socket für Unicast-Nachrichten (Senden und Empfangen)
-        self.unicast_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.unicast_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.unicast_socket.bind(('0.0.0.0', self.port))
+        # Nachrichtenverlauf auf der Platte; ein Verzeichnis pro Handle
+        self.history = None
+        if self.config['user'].get('history', True):
+            history_path = os.path.join(self.config['user'].get('historypath', 'history/'), self.handle)
+            self.history = MessageLog(
+                history_path,
+                segment_size=self.config['user'].get('historysegmentsize', SEGMENT_SIZE),
+                max_segments=self.config['user'].get('historysegments', MAX_SEGMENTS),
+                max_age=self.config['user'].get('historymaxage'),
+                on_error=lambda text: self._notify(text, 'error'))
 
-        # Socket für Broadcast-Nachrichten (Senden und Empfangen)
-        self.broadcast_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.broadcast_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.broadcast_socket.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
-        self.broadcast_socket.bind(('0.0.0.0', self.broadcast_port))
+        # Sockets für Unicast-Nachrichten und für Broadcasts (jeweils Senden und Empfangen)
+        self.unicast_socket = self._bind_unicast(self.port)
+        self.broadcast_socket = self._bind_broadcast(self.broadcast_port)
 
-        # Listener-Threads starten
-        self.unicast_listener = Thread(target=self._listen_unicast)
-        self.unicast_listener.daemon = True
-        self.unicast_listener.start()
+        # Gruppenverkehr per Multicast: Jede Gruppe hat eine eigene Adresse, der Kernel
+        # filtert fremde Gruppen. Broadcasts alter Clients kommen weiterhin an.
+        self.group_transport = self.config['user'].get('grouptransport', 'broadcast')
+        self.multicast_interface = self.config['user'].get('multicastinterface', '0.0.0.0')
+        self._multicast_groups = {}  # {gruppe: multicast-adresse} - nur erfolgreich abonnierte
+        self._setup_multicast()
 
-        self.broadcast_listener = Thread(target=self._listen_broadcast)
-        self.broadcast_listener.daemon = True
-        self.broadcast_listener.start()
+        # Alle Instanzen teilen sich einen Event-Loop; Empfang und Timer laufen dort
+        self.loop = shared_loop()
+        # Ausgabe, Verlauf, Auto-Antworten und Speichern laufen auf Workern, nicht im Empfang;
+        # je Peer in der Reihenfolge des Eingangs
+        self.dispatcher = dispatch.Dispatcher(
+            self.config['user'].get('dispatchworkers', dispatch.DEFAULT_WORKERS),
+            self.config['user'].get('dispatchqueue', dispatch.DEFAULT_LIMIT),
+            self.config['user'].get('dispatchpolicy', 'oldest'),
+            on_error=lambda e: self._notify(f"Fehler bei der Verarbeitung: {e}", 'error'),
+            schedule=self.loop.loop.call_soon_threadsafe)
+        # Verteilt die Sendekapazität reihum auf alle laufenden Transfers
+        self.transfer_scheduler = transfer.TransferScheduler(self.loop.loop.call_soon)
+        self._unicast_endpoint = None
+        self._broadcast_endpoint = None
+        self._tasks = []
+        self._alive_timers = {}  # {gruppe: asyncio.TimerHandle}
 
-        # Periodische Ankündigungen und Bereinigung der Benutzerliste starten
-        self.periodic_thread = Thread(target=self._periodic_tasks)
-        self.periodic_thread.daemon = True
-        self.periodic_thread.start()
+        # Schutz vor Fluten: Token-Buckets je Quell-IP und Verkehrsklasse, vor dem Dekodieren
+        self.rate_limiter = self._make_rate_limiter()
+        # REPLYs auf JOINs werden gesammelt und mit zufälliger Verzögerung gesendet
+        self.reply_jitter = self.config['user'].get('replyjitter', REPLY_JITTER)
+        self._pending_replies = {}  # {(ip, port): [handle, {gruppen}]}
+        self._reply_timer = None
+        self._replies_dropped = 0
+
+        # Peer-Tabelle des letzten Laufs laden, damit Nachrichten sofort zugestellt werden können
+        self.snapshot_file = None
+        if self.config['user'].get('peersnapshot', True):
+            self.snapshot_file = os.path.join(self.config['user'].get('statepath', 'state/'), f"{self.handle}.peers.json")
+        # Periodische Sicherungen laufen im Thread-Pool, die letzte beim Beenden im UI-Thread
+        self._snapshot_lock = threading.Lock()
+        self._snapshot_job = None
+        self._snapshot_final = False
+        self._probing = {}  # {handle: [gruppen]} - wiederhergestellt, aber noch nicht bestätigt
+        self._probe_timer = None
+        self._init_metrics()
+        restored = self._restore_peers() if self.snapshot_file else 0
+
+        # Entdeckung per Broadcast (JOIN/ALIVE) oder per Gossip nach SWIM: Proben und
+        # Änderungen gehen per Unicast, Einstieg über Seeds, daher auch über Subnetze hinweg
+        self.gossip = None
+        self.seeds = self.config['user'].get('seeds', [])
+        self._caps_asked = {}  # {handle: zeit} - CAPS an per Gossip bekannte Peers
+        if self.config['user'].get('discovery', 'broadcast') == 'gossip':
+            self.gossip = gossip.Membership(self.handle, self.port, self.groups, time.time(),
+                                            self.config['user'].get('gossipinterval', gossip.PROTOCOL_PERIOD))
+        self.loop.run(self._start())
 
         # Anwesenheit beim Start ankündigen
         self.announce_presence()
+        if restored:
+            self._notify(f"{restored} bekannte Peers aus dem letzten Lauf übernommen, prüfe Erreichbarkeit...")
+            self.loop.call_soon(self._send_probes, 1)
 
-    def _listen_unicast(self):
-        """Listens for direct messages."""
-        while self.running:
+    def _bind_unicast(self, port):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind(('0.0.0.0', port))
+        # Größere Socket-Puffer fangen Lastspitzen ab, bevor der Kernel Datagramme verwirft
+        batch_io.configure_buffers(sock, self.config['user'].get('rcvbuf'), self.config['user'].get('sndbuf'))
+        return sock
+
+    def _bind_broadcast(self, port):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        sock.bind(('0.0.0.0', port))
+        batch_io.configure_buffers(sock, self.config['user'].get('rcvbuf'), self.config['user'].get('sndbuf'))
+        return sock
+
+    def _setup_multicast(self):
+        """Configures the broadcast socket for multicast and subscribes to all joined groups."""
+        if self.group_transport == 'multicast':
             try:
-                # Einen größeren Puffer für potenzielle Bilddaten verwenden
-                data, addr = self.unicast_socket.recvfrom(65535) 
-                
-                # Prüfen, ob wir ein Bild von dieser Adresse erwarten
-                if addr in self.image_transfer_info:
-                    size, handle = self.image_transfer_info.pop(addr)
-                    if len(data) == size:
-                        self._save_image(data, handle)
-                    else:
-                        print(f"\nBildempfang von {handle} fehlgeschlagen: Größen stimmen nicht überein (erwartet: {size}, erhalten: {len(data)}).")
-                        print("> ", end="", flush=True)
-                else:
-                    # Es ist ein normaler Textbefehl
-                    message = data.decode('utf-8').strip()
-                    self._handle_unicast_message(message, addr)
-            except OSError:
-                if self.running:
-                    break
-            except Exception as e:
-                if self.running:
-                    print(f"\nUnicast-Fehler: {e}")
+                multicast.configure(self.broadcast_socket, self.config['user'].get('multicastttl', 1),
+                                    self.multicast_interface)
+            except OSError as e:
+                self._notify(f"Multicast nicht verfügbar ({e}), nutze Broadcast.", 'error')
+                self.group_transport = 'broadcast'
+        self._multicast_groups.clear()
+        for group in self.groups:
+            self._join_multicast(group)
 
-    def _listen_broadcast(self):
-        """Listens for discovery and group messages."""
-        while self.running:
+    def _make_rate_limiter(self):
+        """Returns the configured RateLimiter, or None if rate limiting is off.
+
+        Limits per class can be overridden, e.g. [user.ratelimits] join = [20, 100].
+        """
+        if not self.config['user'].get('ratelimit', True):
+            return None
+        limits = {cls: (float(rate), int(burst))
+                  for cls, (rate, burst) in self.config['user'].get('ratelimits', {}).items()}
+        return rate_limit.RateLimiter(limits)
+
+    def _overload_pause(self):
+        # Wird auf dem Broadcast-Port fast nur noch verworfen, kurz gar nicht lesen: der Kernel
+        # verwirft dann die Flut. Der Unicast-Port wird immer gelesen, sonst gingen während
+        # einer Pause auch Nachrichten und Chunks der übrigen Peers verloren.
+        if self.rate_limiter is None:
+            return 0.0
+        return self.config['user'].get('overloadpause', OVERLOAD_PAUSE)
+
+    async def _open_unicast_endpoint(self):
+        return await batch_io.open_endpoint(
+            self.unicast_socket, self._on_unicast_datagram,
+            self.config['user'].get('recvbatch', batch_io.DEFAULT_BATCH))
+
+    async def _open_broadcast_endpoint(self):
+        return await batch_io.open_endpoint(
+            self.broadcast_socket, self._on_broadcast_datagram,
+            self.config['user'].get('recvbatch', batch_io.DEFAULT_BATCH),
+            overload_pause=self._overload_pause())
+
+    async def _start(self):
+        """Creates the datagram endpoints and schedules the periodic tasks."""
+        self._unicast_endpoint = await self._open_unicast_endpoint()
+        self._broadcast_endpoint = await self._open_broadcast_endpoint()
+        self._tasks = [asyncio.ensure_future(self._liveness_task())]
+        # Metriken optional regelmäßig für einen externen Sammler (z.B. node_exporter) ablegen
+        metrics_file = self.config['user'].get('metricsfile')
+        if metrics_file:
+            self._tasks.append(asyncio.ensure_future(self._metrics_task(
+                metrics_file, self.config['user'].get('metricsformat', 'prometheus'),
+                self.config['user'].get('metricsinterval', 10))))
+        if self.snapshot_file:
+            self._snapshot_job = asyncio.ensure_future(self._snapshot_task(
+                self.config['user'].get('snapshotinterval', SNAPSHOT_INTERVAL)))
+            self._tasks.append(self._snapshot_job)
+        if self.gossip is not None:
+            self._tasks.append(asyncio.ensure_future(self._gossip_task()))
+        for group in self.groups:
+            self._schedule_alive(group)
+
+    def _init_metrics(self):
+        """Registers the instruments behind /stats and the metrics file.
+
+        Hot-path counters are plain dict updates; queue depths, peer counts and socket
+        statistics are only read when the metrics are shown or exported.
+        """
+        m = self.metrics = metrics.Metrics()
+        self._packets_in = m.counter(
+            'packets_in_total', "Received datagrams by socket and command", ('socket', 'command'))
+        self._packets_out = m.counter('packets_out_total', "Sent datagrams by command", ('command',))
+        self._parse_seconds = m.histogram(
+            'parse_seconds', "Time to decode a datagram into a command", ('format',))
+        self._handler_seconds = m.histogram(
+            'handler_seconds', "Time spent handling a decoded command", ('command',))
+        self._errors = m.counter('errors_total', "Datagrams whose handling raised an error", ('socket',))
+        self._peer_timeouts = m.counter(
+            'peer_timeouts_total', "Peers removed after missing their liveness deadline", ('group',))
+        self._transfers = m.counter(
+            'transfers_total', "Finished transfers by direction and result", ('direction', 'result'))
+        self._probes = m.counter(
+            'peer_probes_total', "Unicast probes to peers restored from the snapshot, and their answers",
+            ('result',))
+        self._chunks_rejected = m.counter(
+            'chunks_rejected_total', "Transfer chunks dropped for a bad checksum or undecodable payload")
+        self._transfer_bytes = m.counter(
+            'transfer_bytes_total', "Payload bytes of successful transfers", ('direction',))
+        self._transfer_throughput = m.histogram(
+            'transfer_throughput_bytes_per_second', "Throughput of successful transfers",
+            ('direction',), metrics.THROUGHPUT_BUCKETS)
+
+        m.gauge('peers', "Known peers per joined group", ('group',),
+                lambda: {(group,): len(self.peers.members(group)) for group in self.groups})
+        m.gauge('transfers_active', "Transfers in progress", ('direction',),
+                lambda: {('in',): len(self.incoming_transfers), ('out',): len(self.outgoing_transfers)})
+        m.gauge('send_queue_depth', "Datagrams waiting for the next send flush", ('socket',),
+                lambda: {(name,): endpoint.queue_depth() for name, endpoint in self._endpoints()})
+        m.gauge('history_queue_depth', "Messages waiting for the history writer", (),
+                lambda: {(): self.history.pending()} if self.history is not None else {})
+        m.gauge('dispatch_queue_depth', "Handler tasks waiting for a dispatch worker", (),
+                lambda: {(): self.dispatcher.pending()})
+        m.gauge('dispatch_tasks_total', "Handler tasks run, dropped because the queue was full, or failed",
+                ('result',), lambda: {('handled',): self.dispatcher.handled, ('dropped',): self.dispatcher.dropped,
+                                      ('error',): self.dispatcher.errors}, kind='counter')
+        m.gauge('reliable_pending', "Direct messages awaiting acknowledgement", (),
+                lambda: {(): sum(c.link_quality()['pending'] for c in list(self._channels.values()))})
+        m.gauge('recv_max_batch', "Largest receive batch so far", ('socket',),
+                lambda: {(name,): endpoint.stats['max_batch'] for name, endpoint in self._endpoints()})
+        m.gauge('socket_events_total', "Batching, drop and error counters of the datagram endpoints",
+                ('socket', 'event'), self._socket_events, kind='counter')
+        m.gauge('shed_total', "Datagrams dropped by the rate limiter, by traffic class and exhausted bucket",
+                ('class', 'scope'), lambda: dict(self.rate_limiter.dropped) if self.rate_limiter is not None else {},
+                kind='counter')
+        m.gauge('replies_dropped_total', "REPLYs not sent because too many were pending", (),
+                lambda: {(): self._replies_dropped}, kind='counter')
+        m.gauge('events_total', "Events published for the output and events dropped because it lagged",
+                ('result',), lambda: {('published',): self.events.published, ('dropped',): self.events.dropped},
+                kind='counter')
+        m.gauge('gossip_members', "Members known to the gossip discovery, by state", ('state',),
+                self._gossip_states)
+        m.gauge('group_messages_total', "Sequenced group messages received, duplicates, recovered, lost "
+                "and served to others", ('result',), self._group_message_counts, kind='counter')
+        m.gauge('group_cache_messages', "Group messages kept for fetches by other members", (),
+                lambda: {(): len(self.group_cache)} if self.group_cache is not None else {})
+        m.gauge('compression_bytes_total', "Datagram bytes before and after compression",
+                ('class', 'stage'), self._compression_bytes, kind='counter')
+
+    def _gossip_states(self):
+        if self.gossip is None:
+            return {}
+        states = {(state,): 0 for state in (gossip.ALIVE, gossip.SUSPECT, gossip.DEAD, gossip.LEFT)}
+        for member in list(self.gossip.members.values()):
+            states[(member.state,)] += 1
+        return states
+
+    def _group_message_counts(self):
+        receiver = self.group_receiver
+        if receiver is None:
+            return {}
+        return {('received',): receiver.received, ('duplicate',): receiver.duplicates,
+                ('recovered',): receiver.recovered, ('lost',): receiver.lost,
+                ('fetched',): receiver.fetches, ('served',): self._group_served}
+
+    def _notify(self, text, level='info'):
+        """Publishes a line of output (a command response, notice or error) for the UI."""
+        self.events.notice(text, level)
+
+    def _endpoints(self):
+        return [(name, endpoint) for name, endpoint in
+                (('unicast', self._unicast_endpoint), ('broadcast', self._broadcast_endpoint))
+                if endpoint is not None]
+
+    def _socket_events(self):
+        return {(name, event): value for name, endpoint in self._endpoints()
+                for event, value in endpoint.stats.items() if event != 'max_batch'}
+
+    def _compression_bytes(self):
+        result = {}
+        for message_class, (_, raw, wire, _, _) in self.compressor.snapshot().items():
+            result[(message_class, 'raw')] = raw
+            result[(message_class, 'wire')] = wire
+        return result
+
+    def _send_unicast(self, data, addr):
+        """Sends a datagram over the unicast endpoint; safe to call from any thread."""
+        self.loop.call_soon(self._unicast_endpoint.send, data, addr)
+
+    def _send_broadcast(self, data, group=None, coalesce=False):
+        """Sends a datagram to a group's multicast address or broadcasts it on the whois port.
+
+        coalesce drops it if the same datagram is already queued in this tick; only for
+        idempotent announcements (see COALESCED_COMMANDS). Safe to call from any thread.
+        """
+        address = self._multicast_groups.get(group, self.broadcast_address)
+        self.loop.call_soon(self._broadcast_endpoint.send, data, (address, self.broadcast_port), coalesce)
+
+    def _join_multicast(self, group):
+        """Subscribes to a group's multicast address; the group keeps using broadcast if that fails."""
+        if self.group_transport != 'multicast':
+            return
+        address = multicast.group_address(group)
+        try:
+            multicast.join(self.broadcast_socket, address, self.multicast_interface)
+        except OSError as e:
+            self._notify(f"Multicast für Gruppe '{group}' nicht möglich ({e}), nutze Broadcast.", 'error')
+            return
+        self._multicast_groups[group] = address
+
+    def _leave_multicast(self, group):
+        address = self._multicast_groups.pop(group, None)
+        if address is not None:
             try:
-                data, addr = self.broadcast_socket.recvfrom(1024)
-                message = data.decode('utf-8').strip()
-                self._handle_broadcast_message(message, addr)
+                multicast.leave(self.broadcast_socket, address, self.multicast_interface)
             except OSError:
-                if self.running:
-                    break
-            except Exception as e:
-                if self.running:
-                    print(f"\nBroadcast-Fehler: {e}")
+                pass
+
+    def io_stats(self):
+        """Returns the batching and drop counters of both endpoints."""
+        return {'unicast': dict(self._unicast_endpoint.stats),
+                'broadcast': dict(self._broadcast_endpoint.stats)}
+
+    def _on_unicast_datagram(self, data, addr):
+        """Handles a datagram received on the unicast endpoint.
+
+        data may be a memoryview into the shared receive buffer; chunks are copied straight
+        into the mapped target file, everything else is copied to bytes first. Returns False
+        if the rate limiter shed the datagram before it was looked at further.
+        """
+        if not self.running:
+            return
+        start = time.perf_counter()
+        limiter = self.rate_limiter
+        if limiter is not None and not limiter.allow(addr[0], rate_limit.classify(data), start):
+            return False
+        try:
+            command = self._receive_unicast(data, addr, start)
+        except Exception as e:
+            command = 'error'
+            self._errors.inc(('unicast',))
+            self._notify(f"Unicast-Fehler: {e}", 'error')
+        self._packets_in.inc(('unicast', command))
+
+    def _receive_unicast(self, data, addr, start):
+        """Decodes and dispatches a unicast datagram; returns its command name for the metrics."""
+        # Binäre Datenpakete eines laufenden Transfers erkennen
+        if transfer.is_chunk(data):
+            self._handle_chunk(data, addr)
+            self._handler_seconds.observe(time.perf_counter() - start, ('CHUNK',))
+            return 'CHUNK'
+        data = bytes(data)
+        if compression.is_compressed(data):
+            data = compression.decompress(data)
+            if data is None:
+                return 'invalid'
+            if not self._allow_inflated(data, addr, start):
+                return 'limited'
+        if protocol.is_frame(data):
+            wire_format = 'binary'
+            packet = protocol.parse_binary(data, self._group_ids)
+        else:
+            # Es ist ein normaler Textbefehl
+            wire_format = 'text'
+            message = data.decode('utf-8').strip()
+            packet = protocol.parse_text(message)
+        parsed = time.perf_counter()
+        self._parse_seconds.observe(parsed - start, (wire_format,))
+
+        if packet is not None:
+            if packet.command not in protocol.UNICAST_COMMANDS:
+                return 'invalid'
+            command = protocol.COMMAND_NAMES[packet.command]
+            self._dispatch_unicast(packet, addr)
+        else:
+            command = message.split(' ', 1)[0] if wire_format == 'text' else None
+            if command not in TEXT_COMMANDS:
+                return 'invalid'
+            self._handle_unicast_message(message, addr)
+        self._handler_seconds.observe(time.perf_counter() - parsed, (command,))
+        return command
+
+    def _allow_inflated(self, data, addr, now):
+        """Charges a decompressed datagram to the traffic class of its content as well.
+
+        Before decoding, compressed datagrams only count as 'compressed'; without this a
+        compressed JOIN or ALIVE flood would get past the limits of those classes.
+        """
+        limiter = self.rate_limiter
+        return limiter is None or limiter.allow(addr[0], rate_limit.classify(data), now)
+
+    def _on_broadcast_datagram(self, data, addr):
+        """Handles a datagram received on the whois endpoint."""
+        if not self.running:
+            return
+        start = time.perf_counter()
+        limiter = self.rate_limiter
+        if limiter is not None and not limiter.allow(addr[0], rate_limit.classify(data), start):
+            return False
+        try:
+            command = self._receive_broadcast(data, addr, start)
+        except Exception as e:
+            command = 'error'
+            self._errors.inc(('broadcast',))
+            self._notify(f"Broadcast-Fehler: {e}", 'error')
+        self._packets_in.inc(('broadcast', command))
+
+    def _receive_broadcast(self, data, addr, start):
+        """Decodes and dispatches a discovery datagram; returns its command name for the metrics."""
+        data = bytes(data)
+        if compression.is_compressed(data):
+            data = compression.decompress(data)
+            if data is None:
+                return 'invalid'
+            if not self._allow_inflated(data, addr, start):
+                return 'limited'
+        if protocol.is_frame(data):
+            # Rahmen fremder Gruppen werden schon anhand der Gruppen-ID verworfen
+            wire_format = 'binary'
+            packet = protocol.parse_binary(data, self._group_ids)
+        else:
+            wire_format = 'text'
+            packet = protocol.parse_text(data.decode('utf-8').strip())
+        parsed = time.perf_counter()
+        self._parse_seconds.observe(parsed - start, (wire_format,))
+        if packet is None or packet.command not in protocol.BROADCAST_COMMANDS:
+            return 'invalid'
+        command = protocol.COMMAND_NAMES[packet.command]
+        self._dispatch_broadcast(packet, addr)
+        self._handler_seconds.observe(time.perf_counter() - parsed, (command,))
+        return command
 
     def _handle_unicast_message(self, message, addr):
-        """Handles direct messages like MSG and REPLY."""
+        """Handles the text-only commands CAPS, CAPS-REPLY, IMG, FILE, IMG-ACK, IMG-TCP, GOSSIP and GFETCH."""
         parts = message.split(' ', 1)
         command = parts[0]
         args_str = parts[1] if len(parts) > 1 else ""
 
-        if command == "MSG":
-            # MSG <Absender> <Text>
+        if command in ("CAPS", "CAPS-REPLY"):
+            # CAPS <Handle> <Fähigkeit,...> - Aushandlung von Protokollerweiterungen
             try:
-                sender, text = args_str.split(' ', 1)
-                print(f"\n[{sender} -> mir]: {text}\n> ", end="", flush=True)
-
-                # Auto-Antwort-Logik
-                autoreply_msg = self.config['user'].get('autoreply')
-                if autoreply_msg:
-                    sender_info = None
-                    for group in self.users_by_group.values():
-                        if sender in group:
-                            sender_info = group[sender]
-                            break
-                    
-                    if sender_info:
-                        ip, port, _ = sender_info
-                        # Einen spezifischen Auto-Antwort-Befehl senden, um Schleifen zu vermeiden
-                        reply_text = f"MSG-AUTOREPLY {self.handle} {autoreply_msg}"
-                        self.unicast_socket.sendto(reply_text.encode('utf-8'), (ip, port))
-            except (ValueError, IndexError):
-                pass # Ignoriere fehlerhafte MSG
-        
-        elif command == "MSG-AUTOREPLY":
-            # MSG-AUTOREPLY <Absender> <Text>
+                handle, caps_str = args_str.rsplit(' ', 1)
+            except ValueError:
+                return
+            if self.peers.lookup(handle) is None:
+                return
+            self.peers.set_capabilities(handle, caps_str.split(','))
+            if command == "CAPS":
+                self._send_capabilities("CAPS-REPLY", addr)
+            if handle in self._probing:
+                self._confirm_probe(handle, addr)
+            if (self.gossip is not None and handle not in self.gossip.members
+                    and self.peers.supports(handle, gossip.GOSSIP_CAPABILITY)):
+                # Per Broadcast oder Snapshot gefunden: in die Gossip-Mitgliedschaft holen
+                self._send_gossip(self.gossip.contact(addr))
+            self._request_recent(handle, addr)
+
+        elif command == "GFETCH":
+            # GFETCH <Gruppe> <Anzahl> - die letzten Nachrichten einer Gruppe, nach dem Beitritt
+            # GFETCH <Gruppe> <Epoche> <Von> <Bis> <Absender> - verlorene Nachrichten eines Absenders
+            self._serve_fetch(args_str.split(' ', 4), addr)
+
+        elif command == "GOSSIP":
+            # GOSSIP <JSON> - Proben und Mitgliedsänderungen der Gossip-Entdeckung
+            if self.gossip is None:
+                return
             try:
-                sender, text = args_str.split(' ', 1)
-                print(f"\n[Auto-Reply von {sender}]: {text}\n> ", end="", flush=True)
-            except (ValueError, IndexError):
-                pass # Ignoriere fehlerhafte Auto-Antwort
+                gossip_msg = gossip.decode(args_str)
+            except ValueError:
+                return
+            now = time.time()
+            self._send_gossip(self.gossip.receive(gossip_msg, addr, now))
+            self._apply_gossip_changes(now)
+            # Fähigkeiten erst beim ersten direkten Kontakt aushandeln, nicht mit allen auf einmal
+            handle = self.peers.handle_for(addr)
+            if (handle is not None and self.peers.capabilities(handle) is None
+                    and now - self._caps_asked.get(handle, 0.0) > GOSSIP_REFRESH):
+                self._caps_asked[handle] = now
+                self._send_capabilities("CAPS", addr)
 
-        elif command == "IMG":
-            # IMG <Absender_Handle> <Größe>
+        elif command == "IMG" or command == "FILE":
+            # IMG <Absender_Handle> <Größe> <Transfer-ID> <Chunkgröße>
+            # FILE <Hash> <Dateiname> <Absender_Handle> <Größe> <Transfer-ID> <Chunkgröße>
             try:
-                sender, size_str = args_str.rsplit(' ', 1)
-                size = int(size_str)
-                self.image_transfer_info[addr] = (size, sender)
-                print(f"\nEingehendes Bild von {sender} ({size} bytes). Warte auf Daten...")
-                print("> ", end="", flush=True)
+                sender, size, transfer_id, chunk_size, name, digest = transfer.parse_announce(
+                    command, args_str, self.max_transfer_size)
+            except transfer.TransferRejected as e:
+                self._reject_transfer(addr, e)
+                return
             except (ValueError, IndexError):
-                print(f"\nUngültige IMG-Nachricht empfangen: {args_str}")
-                print("> ", end="", flush=True)
+                self._notify(f"Ungültige {command}-Nachricht empfangen: {args_str}", 'error')
+                return
+
+            key = (addr, transfer_id)
+            if key in self.completed_transfers:
+                # Die abschließende Bestätigung ging verloren
+                total = self.completed_transfers[key]
+                ack = transfer.format_ack(transfer_id, total, total - 1, [])
+                self._send_unicast(ack.encode('utf-8'), addr)
+                self._packets_out.inc(('IMG-ACK',))
+                return
+            receiver = self.incoming_transfers.get(key)
+            if receiver is None:
+                if digest is not None and self.content_store.has(digest):
+                    self._accept_known_file(key, sender, size, chunk_size, name, digest)
+                    return
+                receiver = self._start_incoming_transfer(transfer_id, size, chunk_size, sender, addr,
+                                                         name, digest)
+                if receiver is None:
+                    return
+            if not receiver.udp_only and self._use_stream(sender, size) and self._offer_stream(key, receiver):
+                return
+            # Ankündigung bestätigen, damit der Sender sie nicht wiederholt
+            self._send_unicast(receiver.ack_message().encode('utf-8'), addr)
+            self._packets_out.inc(('IMG-ACK',))
+
+        elif command == "IMG-TCP":
+            # IMG-TCP <Transfer-ID> <Port> <Offset> - der Empfänger wartet per TCP auf die Daten
+            try:
+                transfer_id, port, offset = tcp_transfer.parse_offer(args_str)
+            except ValueError:
+                return
+            sender = self.outgoing_transfers.get(transfer_id)
+            if isinstance(sender, tcp_transfer.StreamSender) and sender.addr == addr:
+                sender.on_offer(port, offset)
 
-        elif command == "REPLY":
-            # ANTWORT <Gruppe> <Handle> <Port>
+        elif command == "IMG-ACK":
+            # IMG-ACK <Transfer-ID> <Kumulativ> <Höchster> <Fehlend,...>
             try:
-                # Sicher parsen: Gruppe ist das erste Wort, Port ist das letzte, Handle ist in der Mitte
-                parts = args_str.split(' ', 1)
-                group = parts[0]
-                handle_and_port = parts[1]
-                
-                handle, port_str = handle_and_port.rsplit(' ', 1)
-                port = int(port_str)
-
-                if not (handle == self.handle and port == self.port):
-                    if group in self.users_by_group and handle not in self.users_by_group[group]:
-                        self.users_by_group[group][handle] = (addr[0], port, time.time())
-                        print(f"\nNutzer '{handle}' in Gruppe '{group}' gefunden.")
-                        print("> ", end="", flush=True)
+                transfer_id, cumulative, highest, nacks = transfer.parse_ack(args_str)
             except (ValueError, IndexError):
-                pass # Ignoriere fehlerhafte REPLY
+                return
+            sender = self.outgoing_transfers.get(transfer_id)
+            if sender and sender.addr == addr:
+                sender.on_ack(cumulative, highest, nacks)
 
-    def _handle_broadcast_message(self, message, addr):
-        """Handles discovery messages like ALIVE, JOIN, LEAVE and GMSG."""
-        parts = message.split(' ', 1)
-        command = parts[0]
-        args_str = parts[1] if len(parts) > 1 else ""
-        ip = addr[0]
+    def _start_incoming_transfer(self, transfer_id, size, chunk_size, sender, addr, name=None, digest=None):
+        """Preallocates and maps the target file for an announced transfer.
+
+        name and digest come from a FILE announcement; the file is then checked against
+        the hash and saved under its name.
+        """
+        total = transfer.chunk_count(size, chunk_size)
+        partial_dir = self._partial_dir()
+        path = os.path.join(partial_dir, f"from_{sender}_{transfer_id}.part")
+        # Jede Ankündigung legt sofort eine Datei in voller Größe an: Anzahl und Platz begrenzen.
+        # Gezählt wird alles in .partial, auch abgebrochene Empfänge bis zu ihrem Verfall
+        reason = None
+        if len(self.incoming_transfers) >= self.max_incoming:
+            reason = f"schon {len(self.incoming_transfers)} Empfänge gleichzeitig"
+        elif partial_usage(partial_dir, (path, path + '.bitmap')) + size + total > self.max_partial_bytes:
+            reason = f"Platz für Teildateien ({self.max_partial_bytes} Bytes) erschöpft"
+        if reason is not None:
+            self._reject_transfer(addr, transfer.TransferRejected(sender, size, transfer_id, reason))
+            return None
+        try:
+            os.makedirs(partial_dir, exist_ok=True)
+            partial = PartialFile(path, size, total)
+        except (OSError, ValueError) as e:
+            self.events.publish(events.Transfer('in', sender, transfer_id, 'failed', size, info=str(e)))
+            return None
 
-        if command not in ["ALIVE", "JOIN", "LEAVE", "GMSG"]:
+        receiver = transfer.TransferReceiver(transfer_id, size, chunk_size, sender, addr,
+                                             buffer=partial.data, received=partial.received)
+        receiver.partial = partial
+        receiver.name = name
+        receiver.digest = digest
+        receiver.stream = None  # tcp_transfer.StreamReceiver, solange per TCP empfangen wird
+        receiver.udp_only = False  # Der Sender ist von TCP auf UDP umgestiegen
+        receiver.reported_at = receiver.started_at
+        self.incoming_transfers[(addr, transfer_id)] = receiver
+        state = 'resumed' if partial.resumed else 'announced'
+        self.events.publish(events.Transfer('in', sender, transfer_id, state, size, receiver.count, total))
+        return receiver
+
+    def _handle_chunk(self, data, addr):
+        """Stores a transfer chunk and acknowledges progress."""
+        transfer_id, seq, payload = transfer.parse_chunk(data, compression.inflate)
+        if payload is None:
+            # Verfälscht oder nicht entpackbar; der Sender wiederholt den Chunk
+            self._chunks_rejected.inc()
+            return
+        key = (addr, transfer_id)
+        receiver = self.incoming_transfers.get(key)
+        if receiver is None:
+            if key in self.completed_transfers:
+                total = self.completed_transfers[key]
+                ack = transfer.format_ack(transfer_id, total, total - 1, [])
+                self._send_unicast(ack.encode('utf-8'), addr)
+                self._packets_out.inc(('IMG-ACK',))
+            # Chunks ohne vorherige IMG-Ankündigung werden verworfen; der Sender wiederholt sie
             return
+        if receiver.stream is not None:
+            # Der Sender kam per TCP nicht durch und schickt den Rest über UDP
+            stream, receiver.stream = receiver.stream, None
+            receiver.udp_only = True
+            stream.close()
 
-        # Gruppe extrahieren, die bei diesen Befehlen immer das erste Argument ist
-        group_parts = args_str.split(' ', 1)
-        group = group_parts[0]
-        
-        if not group or group not in self.groups:
+        if receiver.on_chunk(seq, payload):
+            self._send_chunk_ack(key)
+            now = time.time()
+            if now - receiver.reported_at >= PROGRESS_INTERVAL and not receiver.complete:
+                receiver.reported_at = now
+                self.events.publish(events.Transfer(
+                    'in', receiver.sender, transfer_id, 'progress', receiver.size, receiver.count,
+                    receiver.total, self._session_bytes(receiver) / (now - receiver.started_at)))
+        elif receiver.since_ack and key not in self._chunk_ack_timers:
+            # Verzögerte Bestätigung: kleine Staufenster warten sonst bis zum Timeout des Senders
+            self._chunk_ack_timers[key] = self.loop.loop.call_later(
+                transfer.ACK_DELAY, self._send_chunk_ack, key)
+
+        if receiver.complete:
+            self._complete_incoming(key, receiver)
+
+    def _complete_incoming(self, key, receiver):
+        self._cancel_timer(self._chunk_ack_timers, key)
+        del self.incoming_transfers[key]
+        self._remember_completed(key, receiver.total)
+        received = self._session_bytes(receiver)
+        elapsed = time.time() - receiver.started_at
+        rate = received / elapsed if elapsed > 0 else 0.0
+        self._record_transfer('in', True, received, rate)
+        self._save_image(receiver, rate)
+
+    def _use_stream(self, handle, size):
+        """Both sides decide the same way: TCP if both support it and the payload is large enough."""
+        return (self.tcp_transfers and size >= tcp_transfer.MIN_STREAM_SIZE
+                and self.peers.supports(handle, tcp_transfer.TCP_CAPABILITY))
+
+    def _offer_stream(self, key, receiver):
+        """Answers an announcement with a TCP listener for the data; False if none can be opened."""
+        if receiver.stream is None:
+            try:
+                receiver.stream = tcp_transfer.StreamReceiver(receiver)
+            except OSError as e:
+                self._notify(f"TCP-Empfang nicht möglich ({e}), nutze UDP.", 'error')
+                return False
+            tcp_transfer.spawn(self._receive_stream, key, receiver)
+        # Auch auf wiederholte Ankündigungen, falls das Angebot verloren ging
+        offer = tcp_transfer.format_offer(receiver.transfer_id, receiver.stream.port, receiver.stream.offset)
+        self._send_unicast(offer.encode('utf-8'), key[0])
+        self._packets_out.inc(('IMG-TCP',))
+        return True
+
+    def _receive_stream(self, key, receiver):
+        """Receives a TCP transfer on a worker thread; the chat socket is not involved."""
+        def progress():
+            now = time.time()
+            if now - receiver.reported_at >= PROGRESS_INTERVAL and not receiver.complete:
+                receiver.reported_at = now
+                self.events.publish(events.Transfer(
+                    'in', receiver.sender, receiver.transfer_id, 'progress', receiver.size, receiver.count,
+                    receiver.total, self._session_bytes(receiver) / (now - receiver.started_at)))
+
+        stream = receiver.stream
+        try:
+            stream.run(progress)
+        except (OSError, ValueError) as e:
+            if receiver.stream is not stream:
+                return  # Aufgegeben, weil der Sender auf UDP umgestiegen ist; der Empfang läuft weiter
+            # Die Teildatei bleibt für einen neuen Versuch erhalten
+            receiver.partial.close()
+            self.loop.call_soon(self._stream_failed, key, receiver, str(e))
+            return
+        self.loop.call_soon(self._complete_incoming, key, receiver)
+
+    def _stream_failed(self, key, receiver, reason):
+        if self.incoming_transfers.get(key) is receiver:
+            del self.incoming_transfers[key]
+        self._transfers.inc(('in', 'stalled'))
+        self._remove_stale_partials()
+        if self.running:
+            self.events.publish(events.Transfer('in', receiver.sender, receiver.transfer_id, 'stalled',
+                                                receiver.size, receiver.count, receiver.total, info=reason))
+
+    def _partial_dir(self):
+        return os.path.join(self.image_path, '.partial')
+
+    def _remove_stale_partials(self):
+        in_use = {receiver.partial.path for receiver in self.incoming_transfers.values()}
+        remove_stale_partials(self._partial_dir(), transfer.PARTIAL_MAX_AGE, in_use)
+
+    def _reject_transfer(self, addr, rejected):
+        """Reports a refused announcement once; the sender repeats it until it gives up."""
+        key = (addr, rejected.transfer_id)
+        if key in self.rejected_transfers:
+            return
+        self.rejected_transfers[key] = None
+        while len(self.rejected_transfers) > 64:
+            self.rejected_transfers.popitem(last=False)
+        self._transfers.inc(('in', 'failed'))
+        self.events.publish(events.Transfer('in', rejected.sender, rejected.transfer_id, 'failed', rejected.size,
+                                            info=f"abgelehnt: {rejected}"))
+
+    def _remember_completed(self, key, total):
+        self.completed_transfers[key] = total
+        while len(self.completed_transfers) > 64:
+            self.completed_transfers.popitem(last=False)
+
+    def _accept_known_file(self, key, sender, size, chunk_size, name, digest):
+        """Answers a FILE announcement whose content is already stored, without any transfer.
+
+        Acknowledging every chunk at once tells the sender that we hold the content, so
+        it stops after its first window.
+        """
+        addr, transfer_id = key
+        total = transfer.chunk_count(size, chunk_size)
+        self._remember_completed(key, total)
+        ack = transfer.format_ack(transfer_id, total, total - 1, [])
+        self._send_unicast(ack.encode('utf-8'), addr)
+        self._packets_out.inc(('IMG-ACK',))
+        self._transfers.inc(('in', 'known'))
+        try:
+            filename = self.content_store.export(digest, self.image_path, name)
+        except OSError as e:
+            self.events.publish(events.Transfer('in', sender, transfer_id, 'error', size, info=str(e)))
+            return
+        self.events.publish(events.Transfer('in', sender, transfer_id, 'known', size, total, total,
+                                            info=filename))
+
+    def _send_chunk_ack(self, key):
+        self._cancel_timer(self._chunk_ack_timers, key)
+        receiver = self.incoming_transfers.get(key)
+        if receiver is not None:
+            self._send_unicast(receiver.ack_message().encode('utf-8'), key[0])
+            self._packets_out.inc(('IMG-ACK',))
+
+    def _session_bytes(self, receiver):
+        # Beim Fortsetzen zählt nur, was in dieser Sitzung ankam
+        return receiver.size * (receiver.count - receiver.initial_count) // receiver.total
+
+    def _dispatch_unicast(self, packet, addr):
+        """Handles a parsed MSG, MSG-AUTOREPLY or REPLY, whichever wire format it came in."""
+        command = packet.command
+
+        if command == protocol.MSG:
+            self.dispatcher.submit(packet.handle, self._deliver_message, packet.handle, packet.text)
+
+        elif command == protocol.RMSG:
+            self._on_reliable_message(packet, addr)
+
+        elif command == protocol.RACK:
+            self._on_reliable_ack(packet.handle, packet.ack_epoch, packet.ack, packet.sack)
+
+        elif command == protocol.SGMSG:
+            # Nachgefragte Gruppennachricht eines Mitglieds
+            if packet.group in self.groups:
+                self._on_sequenced_message(packet)
+
+        elif command == protocol.MSG_AUTOREPLY:
+            self.dispatcher.submit(packet.handle, self._deliver_autoreply, packet.handle, packet.text)
+
+        elif command == protocol.REPLY:
+            # REPLY <Gruppe> <Handle> <Port>
+            group, handle, port = packet.group, packet.handle, packet.port
+            if not (handle == self.handle and port == self.port):
+                timeout = self._liveness_for(group)[1]
+                if self.peers.add(group, handle, addr[0], port, time.time(), timeout):
+                    self._on_peer_discovered(handle, (addr[0], port))
+                    self.events.publish(events.PeerFound(group, handle))
+
+    def _deliver_message(self, sender, text):
+        """Shows a received direct message and sends the auto-reply if one is configured.
+
+        Runs on a dispatch worker, like the other _deliver_* methods.
+        """
+        self.events.publish(events.Message(sender, text))
+        self._log_message(protocol.MSG, sender, sender, text)
+
+        # Auto-Antwort-Logik
+        autoreply_msg = self.config['user'].get('autoreply')
+        if autoreply_msg:
+            sender_info = self.peers.lookup(sender)
+            if sender_info:
+                # Einen spezifischen Auto-Antwort-Befehl senden, um Schleifen zu vermeiden
+                reply = protocol.Packet(protocol.MSG_AUTOREPLY, None, self.handle, None, autoreply_msg)
+                self._send_packet(reply, sender_info, sender)
+
+    def _deliver_autoreply(self, sender, text):
+        self.events.publish(events.AutoReply(sender, text))
+        self._log_message(protocol.MSG_AUTOREPLY, sender, sender, text)
+
+    def _deliver_group_message(self, group, sender, text):
+        self.events.publish(events.GroupMessage(group, sender, text))
+        self._log_message(protocol.GMSG, group, sender, text)
+
+    # --- Zuverlässige Direktnachrichten (laufen auf dem Event-Loop) ---
+
+    def _channel(self, handle):
+        channel = self._channels.get(handle)
+        if channel is None:
+            channel = self._channels[handle] = reliable.ReliableChannel(self._epoch)
+        return channel
+
+    def _send_reliable(self, handle, text):
+        channel = self._channel(handle)
+        for seq, pending_text in channel.send(text, time.monotonic()):
+            self._transmit_reliable(handle, channel, seq, pending_text)
+        self._arm_retransmit(handle)
+
+    def _transmit_reliable(self, handle, channel, seq, text):
+        endpoint = self.peers.lookup(handle)
+        if endpoint is None:
+            # Peer nicht mehr bekannt; die Wiederholungen geben die Nachricht irgendwann auf
+            return
+        ack_epoch, ack = channel.ack_state()
+        packet = protocol.Packet(protocol.RMSG, None, self.handle, None, text,
+                                 channel.epoch, seq, ack_epoch, ack)
+        # Die ausstehende Bestätigung fährt mit dieser Nachricht mit
+        self._cancel_timer(self._ack_timers, handle)
+        self._send_packet(packet, endpoint, handle)
+
+    def _arm_retransmit(self, handle):
+        self._cancel_timer(self._retransmit_timers, handle)
+        channel = self._channels.get(handle)
+        delay = channel.next_timeout(time.monotonic()) if channel else None
+        if delay is not None and self.running:
+            self._retransmit_timers[handle] = self.loop.loop.call_later(
+                delay, self._on_retransmit_timer, handle)
+
+    def _on_retransmit_timer(self, handle):
+        self._retransmit_timers.pop(handle, None)
+        channel = self._channels.get(handle)
+        if channel is None or not self.running:
+            return
+        resend, failed = channel.due(time.monotonic())
+        for seq, text in resend:
+            self._transmit_reliable(handle, channel, seq, text)
+        for text in failed:
+            self.events.publish(events.DeliveryFailed(handle, text))
+        self._arm_retransmit(handle)
+
+    def _on_reliable_message(self, packet, addr):
+        handle = packet.handle
+        channel = self._channel(handle)
+        # Huckepack-Bestätigung für unsere eigenen Nachrichten an diesen Peer
+        self._on_reliable_ack(handle, packet.ack_epoch, packet.ack)
+        delivered, immediate = channel.receive(packet.epoch, packet.seq, packet.text)
+        for text in delivered:
+            self.dispatcher.submit(handle, self._deliver_message, handle, text)
+        if immediate:
+            self._send_reliable_ack(handle, addr)
+        elif handle not in self._ack_timers:
+            self._ack_timers[handle] = self.loop.loop.call_later(
+                reliable.ACK_DELAY, self._send_reliable_ack, handle, addr)
+
+    def _send_reliable_ack(self, handle, addr):
+        self._cancel_timer(self._ack_timers, handle)
+        channel = self._channels.get(handle)
+        if channel is None or not self.running:
+            return
+        ack_epoch, ack = channel.ack_state()
+        packet = protocol.Packet(protocol.RACK, None, self.handle, None, None, None, None,
+                                 ack_epoch, ack, tuple(channel.sack_list()))
+        self._send_packet(packet, addr, handle)
+
+    def _on_reliable_ack(self, handle, ack_epoch, ack, sack=()):
+        channel = self._channels.get(handle)
+        if channel is None or not ack_epoch:
             return
+        acked, ready = channel.on_ack(ack_epoch, ack, time.monotonic(), sack)
+        for seq, text in ready:
+            self._transmit_reliable(handle, channel, seq, text)
+        if acked or ready:
+            self._arm_retransmit(handle)
+
+    # --- Nummerierte Gruppennachrichten (laufen auf dem Event-Loop) ---
+
+    def _send_sequenced(self, group, text):
+        """Numbers a message in our stream of the group, keeps it for fetches and broadcasts it."""
+        if group not in self.groups:
+            return
+        seq = self._group_seq[group] = self._group_seq.get(group, 0) + 1
+        self.group_cache.store(group, self.handle, self._group_epoch, seq, text)
+        self._broadcast_packet(protocol.Packet(protocol.SGMSG, group, self.handle, None, text,
+                                               self._group_epoch, seq))
+        # Geht die letzte Nachricht verloren, zeigt keine spätere die Lücke an. Die Wiederholung
+        # verdoppelte bei seltenen Nachrichten den Verkehr, daher nur, wo zuletzt etwas fehlte
+        self._cancel_timer(self._repeat_timers, group)
+        if time.monotonic() - self._group_losses.get(group, float('-inf')) < group_cache.LOSS_MEMORY:
+            self._repeat_timers[group] = self.loop.loop.call_later(
+                group_cache.REPEAT_DELAY, self._repeat_last, group, seq)
+
+    def _repeat_last(self, group, seq):
+        """Broadcasts our last message of a burst again; whoever has it drops the duplicate."""
+        del self._repeat_timers[group]
+        found = self.group_cache.fetch(group, self.handle, self._group_epoch, seq, seq)
+        if found and group in self.groups and self.running:
+            self._broadcast_packet(protocol.Packet(protocol.SGMSG, group, self.handle, None, found[0][1],
+                                                   self._group_epoch, seq))
 
-        remaining_args_str = group_parts[1] if len(group_parts) > 1 else ""
+    def _on_sequenced_message(self, packet):
+        group, sender, text = packet.group, packet.handle, packet.text
+        if sender == self.handle or packet.seq < 1:
+            return
+        if self.group_receiver is None:
+            # Nicht ausgehandelt und trotzdem erhalten: wie eine GMSG zustellen
+            self.dispatcher.submit(sender, self._deliver_group_message, group, sender, text)
+            return
+        self.group_cache.store(group, sender, packet.epoch, packet.seq, text)
+        texts, fetch = self.group_receiver.receive(group, sender, packet.epoch, packet.seq, text,
+                                                   time.monotonic())
+        for text in texts:
+            self.dispatcher.submit(sender, self._deliver_group_message, group, sender, text)
+        if fetch is not None:
+            self._send_fetch(group, sender, fetch)
+            self._arm_gap_timer()
+
+    def _send_fetch(self, group, sender, fetch):
+        """Asks one member for missing messages: first the sender itself, then other members."""
+        epoch, first, last, attempt = fetch
+        endpoint = self.peers.lookup(sender) if attempt == 1 else None
+        if endpoint is None:
+            others = [handle for handle in self.peers.members(group)
+                      if handle != sender and self.peers.supports(handle, group_cache.SEQ_CAPABILITY)]
+            endpoint = self.peers.lookup(random.choice(others) if others else sender)
+        if endpoint is None:
+            return
+        self._send_unicast(f"GFETCH {group} {epoch} {first} {last} {sender}".encode('utf-8'), endpoint)
+        self._packets_out.inc(('GFETCH',))
+
+    def _arm_gap_timer(self):
+        if self._gap_timer is not None:
+            self._gap_timer.cancel()
+            self._gap_timer = None
+        due = self.group_receiver.next_due()
+        if due is not None and self.running:
+            self._gap_timer = self.loop.loop.call_later(max(0.0, due - time.monotonic()), self._on_gap_timer)
+
+    def _on_gap_timer(self):
+        self._gap_timer = None
+        if not self.running:
+            return
+        for group, sender, texts, fetch in self.group_receiver.expire(time.monotonic()):
+            for text in texts:
+                self.dispatcher.submit(sender, self._deliver_group_message, group, sender, text)
+            if fetch is not None:
+                self._send_fetch(group, sender, fetch)
+        self._arm_gap_timer()
+
+    def _request_recent(self, handle, endpoint):
+        """Asks a member once per group for the latest messages of groups we just joined."""
+        if not self._group_sync or not self.peers.supports(handle, group_cache.SEQ_CAPABILITY):
+            return
+        for group in list(self._group_sync):
+            if self.peers.is_member(group, handle):
+                self._group_sync.discard(group)
+                self._send_unicast(f"GFETCH {group} {group_cache.RECENT}".encode('utf-8'), endpoint)
+                self._packets_out.inc(('GFETCH',))
 
-        if command == "ALIVE":
-            # LEBENSZEICHEN <Gruppe> <Handle> <Port> -> verbleibend: <Handle> <Port>
-            args = remaining_args_str.rsplit(' ', 1)
-            if len(args) != 2:
+    def _serve_fetch(self, args, addr):
+        """Answers a GFETCH from the cache with SGMSGs to the asking member only."""
+        requester = self.peers.handle_for(addr)
+        group = args[0]
+        # Nur bekannten Mitgliedern antworten, eine gefälschte Absenderadresse soll keine
+        # Nachrichten an Dritte auslösen
+        if self.group_cache is None or requester is None or not self.peers.is_member(group, requester):
+            return
+        try:
+            if len(args) == 2:
+                entries = self.group_cache.recent(group, min(int(args[1]), group_cache.FETCH_LIMIT))
+            elif len(args) == 5:
+                epoch, first, last, sender = int(args[1]), int(args[2]), int(args[3]), args[4]
+                entries = [(sender, epoch, seq, text)
+                           for seq, text in self.group_cache.fetch(group, sender, epoch, first, last)]
+                if sender == self.handle:
+                    self._group_losses[group] = time.monotonic()
+            else:
                 return
-            handle, port_str = args
+        except ValueError:
+            return
+        for sender, epoch, seq, text in entries:
+            if sender != requester:
+                packet = protocol.Packet(protocol.SGMSG, group, sender, None, text, epoch, seq)
+                self._send_packet(packet, addr, requester)
+                self._group_served += 1
+
+    def _drop_group_messages(self, group):
+        self._cancel_timer(self._repeat_timers, group)
+        self._group_losses.pop(group, None)
+        if self.group_cache is not None:
+            self.group_cache.drop(group)
+            self.group_receiver.drop(group)
+
+    def _cancel_timer(self, timers, handle):
+        timer = timers.pop(handle, None)
+        if timer is not None:
+            timer.cancel()
+
+    def link_quality(self, handle):
+        """Returns RTT, loss and delivery counters of the reliable channel to a peer, or None."""
+        channel = self._channels.get(handle)
+        return channel.link_quality() if channel else None
+
+    def show_link_quality(self, handle=None):
+        """Shows the measured link quality to one or all peers with reliable messages."""
+        lines = []
+        handles = [handle] if handle else sorted(self._channels)
+        rows = [(h, self.link_quality(h)) for h in handles if self.link_quality(h)]
+        if not rows:
+            lines.append("Keine Verbindungsdaten vorhanden (reliablemsg aktivieren und Nachrichten senden).")
+        else:
+            lines.append(f"{'Nutzer':<16} {'RTT ms':>7} {'RTO ms':>7} {'Verlust':>8} {'zugest.':>8} "
+                         f"{'wiederh.':>8} {'offen':>6} {'fehlg.':>6}")
+            for h, q in rows:
+                rtt = f"{q['srtt'] * 1000:.1f}" if q['srtt'] is not None else "-"
+                lines.append(f"{h:<16} {rtt:>7} {q['rto'] * 1000:>7.0f} {q['loss'] * 100:>7.1f}% "
+                             f"{q['delivered']:>8} {q['retransmits']:>8} {q['pending']:>6} {q['failed']:>6}")
+        self._notify('\n'.join(lines))
+
+    def show_stats(self):
+        """Shows packet counts, latencies, queue depths, transfers and peer counts."""
+        lines = []
+        packets_in = {}
+        for (_, command), count in self._packets_in.samples():
+            packets_in[command] = packets_in.get(command, 0) + count
+        packets_out = {command: count for (command,), count in self._packets_out.samples()}
+
+        def micros(histogram, key):
+            value = histogram.quantile(0.5, key), histogram.quantile(0.99, key)
+            return tuple(f"{v * 1e6:.0f}" if v not in (None, float('inf')) else "-" for v in value)
+
+        lines.append(f"{'Befehl':<14} {'empf.':>8} {'ges.':>8} {'p50 µs':>7} {'p99 µs':>7}")
+        for command in sorted(set(packets_in) | set(packets_out)):
+            p50, p99 = micros(self._handler_seconds, (command,))
+            lines.append(f"{command:<14} {packets_in.get(command, 0):>8} {packets_out.get(command, 0):>8} "
+                         f"{p50:>7} {p99:>7}")
+        for wire_format in ('binary', 'text'):
+            if self._parse_seconds.count((wire_format,)):
+                p50, p99 = micros(self._parse_seconds, (wire_format,))
+                lines.append(f"Parsen {wire_format}: p50 {p50} µs, p99 {p99} µs")
+
+        queues = ', '.join(f"{name} {endpoint.queue_depth()}" for name, endpoint in self._endpoints())
+        history = self.history.pending() if self.history is not None else 0
+        lines.append(f"Warteschlangen: {queues}, Verlauf {history}")
+        drops = sum(endpoint.stats['kernel_drops'] for _, endpoint in self._endpoints())
+        lines.append(f"Verworfen vom Kernel: {drops}, Fehler: {self._errors.total()}")
+        if self.rate_limiter is not None:
+            shed = {}
+            for (cls, _), count in self.rate_limiter.dropped.items():
+                shed[cls] = shed.get(cls, 0) + count
+            pauses = sum(endpoint.stats['paused'] for _, endpoint in self._endpoints())
+            shed_str = ', '.join(f"{cls} {count}" for cls, count in sorted(shed.items())) or "nichts"
+            lines.append(f"Ratenbegrenzung verworfen: {shed_str}; Lesepausen: {pauses}, "
+                         f"REPLYs ausgelassen: {self._replies_dropped}")
+        dispatcher = self.dispatcher
+        lines.append(f"Verarbeitung: {dispatcher.handled} erledigt, {dispatcher.pending()} wartend, "
+                     f"{dispatcher.dropped} verworfen, {dispatcher.errors} Fehler")
+        if self.group_receiver is not None:
+            receiver = self.group_receiver
+            lines.append(f"Gruppennachrichten: {receiver.received} nummeriert empfangen, {receiver.duplicates} doppelt, "
+                         f"{receiver.recovered} nachgeholt, {receiver.lost} verloren; {len(self.group_cache)} "
+                         f"gepuffert in {self.group_cache.group_count()} Gruppen, {self._group_served} an andere gesendet")
+        if self.gossip is not None:
+            states = self._gossip_states()
+            lines.append(f"Gossip: {states[(gossip.ALIVE,)]} Mitglieder, {states[(gossip.SUSPECT,)]} verdächtig, "
+                         f"{states[(gossip.DEAD,)] + states[(gossip.LEFT,)]} ausgeschieden, "
+                         f"Inkarnation {self.gossip.incarnation}")
+
+        transfers = dict(self._transfers.samples())
+        for direction, label in (('in', 'empfangen'), ('out', 'gesendet')):
+            ok = transfers.get((direction, 'ok'), 0)
+            if ok or transfers.get((direction, 'failed')) or transfers.get((direction, 'stalled')):
+                rate = self._transfer_throughput.quantile(0.5, (direction,))
+                rate_str = f", Median bis {rate / (1024 * 1024):.1f} MB/s" if rate not in (None, float('inf')) else ""
+                lines.append(f"Transfers {label}: {ok} ok, {transfers.get((direction, 'failed'), 0)} "
+                             f"fehlgeschlagen, {transfers.get((direction, 'stalled'), 0)} unterbrochen{rate_str}")
+        lines.append(f"Laufende Transfers: {len(self.incoming_transfers)} eingehend, "
+                     f"{len(self.outgoing_transfers)} ausgehend")
+        lines.append(f"Ausgabe: {self.events.published} Meldungen, {self.events.dropped} ausgelassen")
+
+        timeouts = dict(self._peer_timeouts.samples())
+        for group in self.groups:
+            lines.append(f"Gruppe '{group}': {len(self.peers.members(group))} Nutzer, "
+                         f"{timeouts.get((group,), 0)} Timeouts")
+        self._notify('\n'.join(lines))
+
+    async def _metrics_task(self, path, fmt, interval):
+        """Periodically writes all metrics to path (Prometheus text format or JSON)."""
+        while self.running:
+            await asyncio.sleep(interval)
+            text = self.metrics.render(fmt)
             try:
-                port = int(port_str)
-                if not (handle == self.handle and port == self.port):
-                    if group in self.users_by_group:
-                        self.users_by_group[group][handle] = (ip, port, time.time())
-            except ValueError:
-                pass
+                # Schreiben im Thread-Pool, damit der Empfang nicht auf die Platte wartet
+                await self.loop.loop.run_in_executor(None, write_atomic, path, text)
+            except OSError as e:
+                self._notify(f"Metriken konnten nicht geschrieben werden: {e}", 'error')
 
-        elif command == "JOIN":
-            # BEITRETEN <Gruppe> <Handle> <Port> -> verbleibend: <Handle> <Port>
-            args = remaining_args_str.rsplit(' ', 1)
-            if len(args) != 2:
-                return
-            handle, port_str = args
+    def _snapshot_text(self):
+        """Serializes our groups and the peer directory with the last-seen times."""
+        return json.dumps({
+            'version': SNAPSHOT_VERSION, 'saved': time.time(), 'groups': self.groups,
+            'active': self.active_group, 'peers': self.peers.snapshot(),
+        }, ensure_ascii=False, separators=(',', ':'))
+
+    async def _snapshot_task(self, interval):
+        """Periodically saves the peer directory, so that a crashed node can restart warm."""
+        while self.running:
+            await asyncio.sleep(interval)
+            text = self._snapshot_text()
             try:
-                port = int(port_str)
-                if not (handle == self.handle and port == self.port):
-                    if group in self.users_by_group and handle not in self.users_by_group[group]:
-                        self.users_by_group[group][handle] = (ip, port, time.time())
-                        print(f"\n{handle} ist Gruppe '{group}' beigetreten.")
-                        reply_msg = f"REPLY {group} {self.handle} {self.port}"
-                        self.unicast_socket.sendto(reply_msg.encode('utf-8'), (ip, port))
-                        print("> ", end="", flush=True)
-            except ValueError:
-                pass
+                await self.loop.loop.run_in_executor(None, self._write_snapshot, text)
+            except OSError as e:
+                self._notify(f"Peer-Tabelle konnte nicht gesichert werden: {e}", 'error')
 
-        elif command == "LEAVE":
-            # VERLASSEN <Gruppe> <Handle> -> verbleibend: <Handle>
-            handle = remaining_args_str
-            if not handle: return
-            if group in self.users_by_group and handle in self.users_by_group[group]:
-                del self.users_by_group[group][handle]
-                print(f"\n{handle} hat Gruppe '{group}' verlassen.\n> ", end="", flush=True)
-        
-        elif command == "GMSG":
-            # GMSG <Gruppe> <Handle> <Text> -> verbleibend: <Handle> <Text>
-            args = remaining_args_str.split(' ', 1)
-            if len(args) < 2: return
-            sender, text = args
+    def _write_snapshot(self, text, final=False):
+        """Saves a snapshot; once the final one at shutdown is written, older ones are dropped."""
+        with self._snapshot_lock:
+            if self._snapshot_final:
+                return
+            write_atomic(self.snapshot_file, text)
+            self._snapshot_final = final
+
+    def _restore_peers(self):
+        """Loads groups and peers from the snapshot of the last run; returns the number of peers.
+
+        Entries keep their last-seen time but only get PROBE_TIMEOUT seconds to confirm
+        that they are still there (see _send_probes); silent peers expire as usual.
+        """
+        try:
+            with open(self.snapshot_file, encoding='utf-8') as f:
+                snapshot = json.load(f)
+        except FileNotFoundError:
+            return 0
+        except (OSError, ValueError) as e:
+            self._notify(f"Peer-Tabelle konnte nicht geladen werden: {e}", 'error')
+            return 0
+        if snapshot.get('version') != SNAPSHOT_VERSION:
+            return 0
+        for group in snapshot.get('groups', ()):
+            if group not in self.groups:
+                self._add_group(group)
+        if snapshot.get('active') in self.groups:
+            self.active_group = snapshot['active']
+
+        now = time.time()
+        for handle, ip, port, seen in snapshot.get('peers', ()):
+            if handle == self.handle:
+                continue
+            groups = [group for group, last in seen.items()
+                      if group in self.groups and now - last < SNAPSHOT_MAX_AGE]
+            for group in groups:
+                last = seen[group]
+                self.peers.add(group, handle, ip, port, last, now - last + PROBE_TIMEOUT)
+            if groups:
+                self._probing[handle] = groups
+        return len(self._probing)
+
+    def _send_probes(self, attempt):
+        """Asks the restored, unconfirmed peers directly whether they are still there.
+
+        A REPLY per group re-introduces us to peers that forgot us (e.g. after our LEAVE),
+        the CAPS that follows is answered with CAPS-REPLY, which confirms the peer.
+        """
+        self._probe_timer = None
+        for handle, groups in list(self._probing.items()):
+            endpoint = self.peers.lookup(handle)
+            if endpoint is None:
+                # Inzwischen abgelaufen oder abgemeldet
+                del self._probing[handle]
+                continue
+            for group in groups:
+                reply = protocol.Packet(protocol.REPLY, group, self.handle, self.port, None)
+                self._send_unicast(protocol.encode_text(reply), endpoint)
+                self._packets_out.inc(('REPLY',))
+            self._send_capabilities("CAPS", endpoint)
+            self._probes.inc(('sent',))
+        if self._probing and attempt < PROBE_ATTEMPTS and self.running:
+            self._probe_timer = self.loop.loop.call_later(PROBE_INTERVAL, self._send_probes, attempt + 1)
+
+    def _confirm_probe(self, handle, addr):
+        """A restored peer answered: give it the normal liveness timeout in its groups."""
+        now = time.time()
+        for group in self._probing.pop(handle):
+            if self.peers.is_member(group, handle):
+                self.peers.add(group, handle, addr[0], addr[1], now, self._liveness_for(group)[1])
+        self._probes.inc(('confirmed',))
+
+    def _dispatch_broadcast(self, packet, addr):
+        """Handles a parsed ALIVE, JOIN, LEAVE, GMSG or SGMSG, whichever wire format it came in."""
+        command = packet.command
+        group = packet.group
+        ip = addr[0]
+
+        if command not in protocol.BROADCAST_COMMANDS or group not in self.groups:
+            return
+
+        if command == protocol.ALIVE:
+            handle, port = packet.handle, packet.port
+            if not (handle == self.handle and port == self.port):
+                if self.peers.add(group, handle, ip, port, time.time(), self._liveness_for(group)[1]):
+                    self._on_peer_discovered(handle, (ip, port))
+
+        elif command == protocol.JOIN:
+            handle, port = packet.handle, packet.port
+            if not (handle == self.handle and port == self.port):
+                if self.peers.add(group, handle, ip, port, time.time(), self._liveness_for(group)[1]):
+                    self.events.publish(events.PeerJoined(group, handle))
+                    self._queue_reply(handle, group, (ip, port))
+
+        elif command == protocol.LEAVE:
+            handle = packet.handle
+            if self.peers.remove(group, handle):
+                self.events.publish(events.PeerLeft(group, handle))
+
+        elif command == protocol.GMSG:
+            sender, text = packet.handle, packet.text
             if sender != self.handle:
-                print(f"\n[{group}] {sender}: {text}\n> ", end="", flush=True)
+                self.dispatcher.submit(sender, self._deliver_group_message, group, sender, text)
+
+        elif command == protocol.SGMSG:
+            self._on_sequenced_message(packet)
+
+    def _queue_reply(self, handle, group, endpoint):
+        """Schedules the REPLY (and capability negotiation) for a JOIN.
+
+        All REPLYs due within a random delay of up to reply_jitter seconds go out together,
+        and repeated JOINs from the same endpoint collapse into one REPLY per group. That
+        spreads the answers of many peers to one JOIN, and a JOIN burst costs at most
+        MAX_PENDING_REPLIES answers per flush.
+        """
+        pending = self._pending_replies.get(endpoint)
+        if pending is None:
+            if len(self._pending_replies) >= MAX_PENDING_REPLIES:
+                self._replies_dropped += 1
+                return
+            pending = self._pending_replies[endpoint] = [handle, set()]
+        pending[0] = handle
+        pending[1].add(group)
+        if self._reply_timer is None:
+            self._reply_timer = self.loop.loop.call_later(
+                random.uniform(0.0, self.reply_jitter), self._flush_replies)
+
+    def _flush_replies(self):
+        self._reply_timer = None
+        pending, self._pending_replies = self._pending_replies, {}
+        for endpoint, (handle, groups) in pending.items():
+            for group in groups:
+                if group not in self.groups:
+                    continue
+                reply = protocol.Packet(protocol.REPLY, group, self.handle, self.port, None)
+                # Der Neue hat noch keine Fähigkeiten ausgehandelt, daher im Textformat
+                self._send_unicast(protocol.encode_text(reply), endpoint)
+                self._packets_out.inc(('REPLY',))
+            self._on_peer_discovered(handle, endpoint)
+
+    def _on_peer_discovered(self, handle, endpoint):
+        """Starts capability negotiation with a newly discovered peer."""
+        if self.peers.capabilities(handle) is None:
+            self._send_capabilities("CAPS", endpoint)
+        else:
+            # Schon ausgehandelt, z.B. als Mitglied einer anderen Gruppe
+            self._request_recent(handle, endpoint)
+
+    def _send_capabilities(self, command, endpoint):
+        caps = []
+        if self.binary_protocol:
+            caps.append(protocol.CAPABILITY)
+        if self.reliable_messages:
+            caps.append(protocol.RELIABLE_CAPABILITY)
+        caps.extend(self.compressor.capabilities())
+        caps.extend((transfer.FILE_CAPABILITY, transfer.CHECKSUM_CAPABILITY))
+        if self.tcp_transfers:
+            caps.append(tcp_transfer.TCP_CAPABILITY)
+        if self.gossip is not None:
+            caps.append(gossip.GOSSIP_CAPABILITY)
+        if self.group_cache is not None:
+            caps.append(group_cache.SEQ_CAPABILITY)
+        self._send_unicast(f"{command} {self.handle} {','.join(caps or ['text'])}".encode('utf-8'), endpoint)
+        self._packets_out.inc((command,))
+
+    def _send_packet(self, packet, endpoint, handle):
+        """Sends a packet to one peer, in binary and compressed as far as the peer negotiated it.
+
+        Safe to call from any thread. The format is chosen here; encoding, compression and
+        the counters run on the loop, so their statistics only ever have one writer.
+        """
+        binary = self.binary_protocol and self.peers.supports(handle, protocol.CAPABILITY)
+        codec = self.compressor.choose(lambda capability: self.peers.supports(handle, capability))
+        self.loop.call_soon(self._emit_unicast, packet, binary, codec, endpoint)
+
+    def _emit_unicast(self, packet, binary, codec, endpoint):
+        data = protocol.encode(packet, binary)
+        command = protocol.COMMAND_NAMES[packet.command]
+        self._send_unicast(self.compressor.compress(data, codec, command), endpoint)
+        self._packets_out.inc((command,))
+
+    def _broadcast_packet(self, packet):
+        """Broadcasts a packet to its group, in binary and compressed if every known member negotiated it.
+
+        Safe to call from any thread, like _send_packet.
+        """
+        group = packet.group
+        binary = self.binary_protocol and self.peers.group_supports(group, protocol.CAPABILITY)
+        codec = self.compressor.choose(lambda capability: self.peers.group_supports(group, capability))
+        self.loop.call_soon(self._emit_broadcast, packet, binary, codec)
+
+    def _emit_broadcast(self, packet, binary, codec):
+        data = protocol.encode(packet, binary)
+        command = protocol.COMMAND_NAMES[packet.command]
+        self._send_broadcast(self.compressor.compress(data, codec, command), packet.group,
+                             packet.command in COALESCED_COMMANDS)
+        self._packets_out.inc((command,))
+
+    def _log_message(self, command, conversation, sender, text, outgoing=False):
+        """Hands a chat message to the history writer thread."""
+        if self.history is not None:
+            self.history.append(command, conversation, sender, text, outgoing)
 
+    def _format_entries(self, entries):
+        lines = []
+        for entry in entries:
+            stamp = time.strftime('%d.%m. %H:%M', time.localtime(entry.timestamp))
+            if entry.command == protocol.GMSG:
+                lines.append(f"{stamp} [{entry.conversation}] {entry.sender}: {entry.text}")
+            elif entry.outgoing:
+                lines.append(f"{stamp} [mir -> {entry.conversation}]: {entry.text}")
+            elif entry.command == protocol.MSG_AUTOREPLY:
+                lines.append(f"{stamp} [Auto-Reply von {entry.sender}]: {entry.text}")
+            else:
+                lines.append(f"{stamp} [{entry.sender} -> mir]: {entry.text}")
+        return lines
+
+    def show_history(self, name, limit=20):
+        """Shows the last messages of a group or of the direct chat with a user."""
+        lines = []
+        if self.history is None:
+            lines.append("Der Nachrichtenverlauf ist deaktiviert.")
+        elif name in self.groups or self.history.has_conversation(group=name):
+            entries = self.history.history(group=name, limit=limit)
+            lines.append(f"Verlauf von Gruppe '{name}' ({len(entries)} Nachrichten):")
+            lines.extend(self._format_entries(entries))
+        elif self.history.has_conversation(peer=name):
+            entries = self.history.history(peer=name, limit=limit)
+            lines.append(f"Verlauf mit '{name}' ({len(entries)} Nachrichten):")
+            lines.extend(self._format_entries(entries))
+        else:
+            lines.append(f"Kein Verlauf für '{name}' gefunden.")
+        self._notify('\n'.join(lines))
+
+    def search_history(self, text, limit=20):
+        """Shows the newest stored messages that contain text."""
+        lines = []
+        if self.history is None:
+            lines.append("Der Nachrichtenverlauf ist deaktiviert.")
+        else:
+            entries = self.history.search(text, limit)
+            if entries:
+                lines.append(f"Treffer für '{text}':")
+                lines.extend(self._format_entries(entries))
+            else:
+                lines.append(f"Keine Nachrichten mit '{text}' gefunden.")
+        self._notify('\n'.join(lines))
 
     def discover_users(self, group_name=None):
-        """Prints the list of known users in a group."""
+        """Shows the list of known users in a group."""
         group_to_scan = group_name if group_name is not None else self.active_group
         if not group_to_scan:
-            print("\nKeine aktive Gruppe zum Anzeigen.")
-            print("> ", end="", flush=True)
+            self._notify("Keine aktive Gruppe zum Anzeigen.")
             return
 
-        print(f"\nBekannte Nutzer in Gruppe '{group_to_scan}':")
+        lines = [f"Bekannte Nutzer in Gruppe '{group_to_scan}':"]
         
-        known_users = self.users_by_group.get(group_to_scan, {})
+        known_users = self.peers.members(group_to_scan)
         
         if not known_users:
-            print(f"Keine anderen Nutzer in '{group_to_scan}' gefunden.")
+            lines.append(f"Keine anderen Nutzer in '{group_to_scan}' gefunden.")
         else:
-            print(f"Aktive Nutzer in '{group_to_scan}':")
+            lines.append(f"Aktive Nutzer in '{group_to_scan}':")
             for handle in known_users:
-                print(f"- {handle}")
-        print("> ", end="", flush=True)
-
+                lines.append(f"- {handle}")
+        self._notify('\n'.join(lines))
 
     def announce_presence(self, group_name=None):
         """Broadcasts a JOIN message to one or all currently joined groups."""
+        if not self._broadcast_discovery():
+            return
         groups_to_announce = [group_name] if group_name else self.groups
         for group in groups_to_announce:
-            join_msg = f"JOIN {group} {self.handle} {self.port}"
-            self.broadcast_socket.sendto(join_msg.encode('utf-8'), (self.broadcast_address, self.broadcast_port))
+            # JOIN bleibt im Textformat, damit auch alte Clients den Neuen entdecken
+            join_msg = protocol.Packet(protocol.JOIN, group, self.handle, self.port, None)
+            self._send_broadcast(protocol.encode_text(join_msg), group, coalesce=True)
+            # Zähler werden nur auf dem Event-Loop geschrieben
+            self.loop.call_soon(self._packets_out.inc, ('JOIN',))
 
     def send_message(self, handle, text):
         """Sends a message to a specific user, searching across all groups."""
-        user_info = None
-        for group in self.users_by_group:
-            if handle in self.users_by_group[group]:
-                user_info = self.users_by_group[group][handle]
-                break
+        user_info = self.peers.lookup(handle)
         
         if user_info:
-            ip, port, _ = user_info
-            msg = f"MSG {self.handle} {text}"
-            self.unicast_socket.sendto(msg.encode('utf-8'), (ip, port))
+            if self.reliable_messages and self.peers.supports(handle, protocol.RELIABLE_CAPABILITY):
+                # Nummerieren, wiederholen und bestätigen lassen
+                self.loop.call_soon(self._send_reliable, handle, text)
+            else:
+                msg = protocol.Packet(protocol.MSG, None, self.handle, None, text)
+                self._send_packet(msg, user_info, handle)
+            self._log_message(protocol.MSG, handle, self.handle, text, outgoing=True)
         else:
-            print(f"\nNutzer '{handle}' nicht gefunden. 'who' in der jeweiligen Gruppe ausführen.")
-        print("> ", end="", flush=True)
+            self._notify(f"Nutzer '{handle}' nicht gefunden. 'who' in der jeweiligen Gruppe ausführen.")
 
     def send_group_message(self, text):
         """Broadcasts a message to the active group."""
         if not self.active_group:
-            print("\nKeine aktive Gruppe ausgewählt. Mit /switch <gruppe> wechseln.")
-            print("> ", end="", flush=True)
+            self._notify("Keine aktive Gruppe ausgewählt. Mit /switch <gruppe> wechseln.")
             return
-        msg = f"GMSG {self.active_group} {self.handle} {text}"
-        self.broadcast_socket.sendto(msg.encode('utf-8'), (self.broadcast_address, self.broadcast_port))
-        print("> ", end="", flush=True)
+        group = self.active_group
+        if self.group_cache is not None and self.peers.group_supports(group, group_cache.SEQ_CAPABILITY):
+            # Nummerieren und puffern auf dem Event-Loop, dort werden auch Nachfragen beantwortet
+            self.loop.call_soon(self._send_sequenced, group, text)
+        else:
+            msg = protocol.Packet(protocol.GMSG, group, self.handle, None, text)
+            self._broadcast_packet(msg)
+        self._log_message(protocol.GMSG, group, self.handle, text, outgoing=True)
 
     def _send_leave_broadcast(self, group_name):
-        leave_msg = f"LEAVE {group_name} {self.handle}"
+        if not self._broadcast_discovery():
+            return
+        leave_msg = protocol.Packet(protocol.LEAVE, group_name, self.handle, None, None)
         try:
-            self.broadcast_socket.sendto(leave_msg.encode('utf-8'), (self.broadcast_address, self.broadcast_port))
+            self._broadcast_packet(leave_msg)
         except Exception as e:
-            print(f"Error sending leave broadcast for group {group_name}: {e}")
+            self._notify(f"LEAVE für Gruppe {group_name} konnte nicht gesendet werden: {e}", 'error')
 
     def leave_group(self, group_name):
         """Leaves a specific group."""
         if group_name not in self.groups:
-            print(f"\nDu bist nicht in Gruppe '{group_name}'.")
-            print("> ", end="", flush=True)
+            self._notify(f"Du bist nicht in Gruppe '{group_name}'.")
             return
 
-        print(f"\nVerlasse Gruppe '{group_name}'...")
+        self._notify(f"Verlasse Gruppe '{group_name}'...")
         self._send_leave_broadcast(group_name)
 
         self.groups.remove(group_name)
-        if group_name in self.users_by_group:
-            del self.users_by_group[group_name]
+        # Erst nach dem LEAVE, das noch auf dem Event-Loop wartet und an die Gruppenadresse geht
+        self.loop.call_soon(self._leave_multicast, group_name)
+        self._group_ids.pop(protocol.group_id(group_name), None)
+        self.loop.call_soon(self._cancel_alive, group_name)
+        self._group_sync.discard(group_name)
+        self.loop.call_soon(self._drop_group_messages, group_name)
+        self.peers.remove_group(group_name)
+        if self.gossip is not None:
+            self.loop.call_soon(self._gossip_groups_changed)
         
-        print(f"Gruppe '{group_name}' verlassen.")
+        self._notify(f"Gruppe '{group_name}' verlassen.")
 
         if self.active_group == group_name:
             if self.groups:
                 self.active_group = self.groups[0]
-                print(f"Aktive Gruppe ist jetzt '{self.active_group}'.")
+                self._notify(f"Aktive Gruppe ist jetzt '{self.active_group}'.")
             else:
                 self.active_group = None
-                print("Du bist in keiner Gruppe mehr. Trete einer mit /join bei.")
-        print("> ", end="", flush=True)
+                self._notify("Du bist in keiner Gruppe mehr. Trete einer mit /join bei.")
 
     def join_group(self, group_name):
         """Joins a new group and sets it as active."""
         if group_name in self.groups:
             self.active_group = group_name
-            print(f"\nDu bist bereits in Gruppe '{group_name}'. Sie ist jetzt aktiv.")
-            print("> ", end="", flush=True)
+            self._notify(f"Du bist bereits in Gruppe '{group_name}'. Sie ist jetzt aktiv.")
             return
 
-        print(f"\nTrete Gruppe '{group_name}' bei...")
-        self.groups.append(group_name)
-        self.users_by_group[group_name] = {}
+        self._notify(f"Trete Gruppe '{group_name}' bei...")
+        self._add_group(group_name)
         self.active_group = group_name
+        self.loop.call_soon(self._schedule_alive, group_name)
+        if self.gossip is not None:
+            self.loop.call_soon(self._gossip_groups_changed)
         
         self.announce_presence(group_name)
-        time.sleep(0.5)
+        # Die REPLYs abwarten, ohne den aufrufenden Thread zu blockieren
+        self.loop.call_soon(self._schedule_discover, group_name)
+
+    def _schedule_discover(self, group_name):
+        self._cancel_timer(self._discover_timers, group_name)
+        self._discover_timers[group_name] = self.loop.loop.call_later(
+            DISCOVER_DELAY, self._discover_after_join, group_name)
+
+    def _discover_after_join(self, group_name):
+        del self._discover_timers[group_name]
         self.discover_users(group_name)
 
+    def _add_group(self, group_name):
+        self.groups.append(group_name)
+        self._join_multicast(group_name)
+        self.peers.add_group(group_name)
+        self._group_ids[protocol.group_id(group_name)] = group_name
+        if self.group_cache is not None:
+            self._group_sync.add(group_name)
+
+    async def apply_config(self, config):
+        """Applies the changed [user] settings of a reloaded config to the running handler.
+
+        Peers, groups, transfers and the history are kept. A socket is only rebound if its
+        port changed; the peers learn a new unicast port from the JOIN sent afterwards.
+        Settings in RESTART_KEYS keep their old value. Runs on the event loop and returns
+        the names of the applied settings.
+        """
+        old, user = self.config['user'], dict(config['user'])
+        changed = sorted(key for key in old.keys() | user.keys() if old.get(key) != user.get(key))
+        restart = [key for key in changed if key in RESTART_KEYS]
+        for key in restart:
+            if key in old:
+                user[key] = old[key]
+            else:
+                user.pop(key)
+        if 'port' in changed and not await self._rebind('unicast', user['port']):
+            user['port'] = old['port']
+        if 'whoisport' in changed and not await self._rebind('broadcast', user['whoisport']):
+            user['whoisport'] = old['whoisport']
+        self.config = dict(config, user=user)
+
+        self.broadcast_address = user.get('broadcastaddress', '255.255.255.255')
+        self.chunk_size = user.get('chunksize', transfer.DEFAULT_CHUNK_SIZE)
+        self.transfer_window = user.get('transferwindow', transfer.DEFAULT_WINDOW)
+        self.max_transfer_size = user.get('maxtransfersize', transfer.MAX_TRANSFER_SIZE)
+        self.max_incoming = user.get('maxincomingtransfers', transfer.MAX_INCOMING)
+        self.max_partial_bytes = user.get('maxpartialbytes', transfer.MAX_PARTIAL_BYTES)
+        self.binary_protocol = user.get('binaryprotocol', True)
+        self.reliable_messages = user.get('reliablemsg', False)
+        self.reply_jitter = user.get('replyjitter', REPLY_JITTER)
+        self.tcp_transfers = user.get('tcptransfer', True)
+        self.dispatcher.workers = user.get('dispatchworkers', dispatch.DEFAULT_WORKERS)
+        self.dispatcher.limit = user.get('dispatchqueue', dispatch.DEFAULT_LIMIT)
+        self.dispatcher.policy = user.get('dispatchpolicy', 'oldest')
+        if 'imagepath' in changed:
+            self.image_path = user.get('imagepath', 'received_images/')
+            self.content_store = ContentStore(os.path.join(self.image_path, '.objects'))
+        if 'ratelimit' in changed or 'ratelimits' in changed:
+            self.rate_limiter = self._make_rate_limiter()
+        self._broadcast_endpoint.overload_pause = self._overload_pause()
+        for _, endpoint in self._endpoints():
+            endpoint.batch_size = user.get('recvbatch', batch_io.DEFAULT_BATCH)
+        if 'rcvbuf' in changed or 'sndbuf' in changed:
+            for sock in (self.unicast_socket, self.broadcast_socket):
+                batch_io.configure_buffers(sock, user.get('rcvbuf'), user.get('sndbuf'))
+        if {'aliveinterval', 'alivetimeout', 'liveness'} & set(changed):
+            for group in self.groups:
+                self._schedule_alive(group)
+        if self.group_cache is not None:
+            self.group_cache.max_groups = user.get('groupcachegroups', group_cache.DEFAULT_GROUPS)
+        if self.gossip is not None:
+            self.seeds = user.get('seeds', [])
+            self.gossip.period = user.get('gossipinterval', gossip.PROTOCOL_PERIOD)
+            if 'seeds' in changed:
+                self.gossip.seeds = await self._resolve_seeds(self.seeds)
+            if 'port' in changed:
+                # Neuer Port unter neuer Inkarnation; die Mitglieder übernehmen ihn per Gossip
+                self.gossip.port = self.port
+                self.gossip.set_groups(self.groups)
+        if 'port' in changed or 'whoisport' in changed:
+            self.announce_presence()
+
+        applied = [key for key in changed if key not in restart]
+        if applied:
+            self._notify(f"Konfiguration neu geladen: {', '.join(applied)} übernommen.")
+        if restart:
+            self._notify(f"Erst nach einem Neustart wirksam: {', '.join(restart)}.")
+        return applied
+
+    async def _rebind(self, kind, port):
+        """Moves the unicast or broadcast endpoint to a new port; returns False if binding fails."""
+        try:
+            sock = self._bind_unicast(port) if kind == 'unicast' else self._bind_broadcast(port)
+        except OSError as e:
+            self._notify(f"Port {port} nicht verfügbar ({e}), behalte den bisherigen.", 'error')
+            return False
+        if kind == 'unicast':
+            old, self.unicast_socket = self._unicast_endpoint, sock
+            self._unicast_endpoint = await self._open_unicast_endpoint()
+            self.port = port
+        else:
+            old, self.broadcast_socket = self._broadcast_endpoint, sock
+            self._setup_multicast()
+            self._broadcast_endpoint = await self._open_broadcast_endpoint()
+            self.broadcast_port = port
+        # Schließt auch den alten Socket, nachdem dessen Warteschlange gesendet wurde
+        old.close()
+        return True
+
     def shutdown(self):
         """Announces departure from all groups and closes sockets."""
         self.running = False
+        if self.snapshot_file:
+            # Die periodische Sicherung stoppen; ein schon laufender Schreibvorgang endet vor
+            # diesem, und einer mit älterem Stand, der danach noch käme, wird verworfen
+            if self._snapshot_job is not None:
+                self.loop.call_soon(self._snapshot_job.cancel)
+            try:
+                self._write_snapshot(self._snapshot_text(), final=True)
+            except OSError:
+                pass
         for group in self.groups[:]:
              self._send_leave_broadcast(group)
-        
+        if self.gossip is not None:
+            self.loop.call_soon(self._gossip_leave)
+
+        # Erst die wartenden Nachrichten in den Verlauf schreiben, dann den Verlauf schließen
+        self.dispatcher.close()
+        if self.history is not None:
+            self.history.close()
+
+        # Erst nach den LEAVE-Nachrichten schließen; die Endpunkte senden ihre Warteschlange noch aus
+        self.loop.call_soon(self._close)
+
+    def _close(self):
+        for task in self._tasks:
+            task.cancel()
+        for group in list(self._alive_timers):
+            self._cancel_alive(group)
+        for timer in (self._reply_timer, self._probe_timer, self._gap_timer):
+            if timer is not None:
+                timer.cancel()
+        for timers in (self._retransmit_timers, self._ack_timers, self._chunk_ack_timers, self._discover_timers,
+                       self._repeat_timers):
+            for handle in list(timers):
+                self._cancel_timer(timers, handle)
+        for endpoint in (self._unicast_endpoint, self._broadcast_endpoint):
+            if endpoint is not None:
+                endpoint.close()
+
+        # Unvollständige Empfänge sichern, damit sie später fortgesetzt werden können
+        for receiver in list(self.incoming_transfers.values()):
+            if receiver.stream is not None:
+                # Der Worker bricht ab und schließt die Teildatei selbst
+                receiver.stream.close()
+            else:
+                receiver.partial.close()
+        self.incoming_transfers.clear()
+        for sender in list(self.outgoing_transfers.values()):
+            if isinstance(sender, tcp_transfer.StreamSender):
+                sender.cancel()
+
+    def _liveness_for(self, group):
+        """Returns (announce interval, timeout) in seconds for a group.
+
+        Defaults come from aliveinterval/alivetimeout in [user]; a [user.liveness]
+        table can override them per group, e.g. default = { interval = 2, timeout = 5 }.
+        """
+        user_config = self.config['user']
+        group_config = user_config.get('liveness', {}).get(group, {})
+        interval = group_config.get('interval', user_config.get('aliveinterval', 15))
+        timeout = group_config.get('timeout', user_config.get('alivetimeout', 35))
+        return interval, timeout
+
+    def _schedule_alive(self, group):
+        """Schedules the next ALIVE announcement for a group on the event loop."""
+        if not self.running or group not in self.groups or not self._broadcast_discovery():
+            return
+        self._cancel_alive(group)
+        interval = self._liveness_for(group)[0]
+        self._alive_timers[group] = self.loop.loop.call_later(interval, self._send_alive, group)
+
+    def _cancel_alive(self, group):
+        timer = self._alive_timers.pop(group, None)
+        if timer is not None:
+            timer.cancel()
+
+    def _send_alive(self, group):
+        """Announces presence in one group and schedules the next announcement."""
+        self._alive_timers.pop(group, None)
+        if not self.running or group not in self.groups:
+            return
+        alive_msg = protocol.Packet(protocol.ALIVE, group, self.handle, self.port, None)
         try:
-            self.unicast_socket.close()
-            self.broadcast_socket.close()
+            self._broadcast_packet(alive_msg)
         except Exception:
-            pass
+            # Socket könnte während des Herunterfahrens geschlossen werden
+            if self.running:
+                self._notify(f"Konnte keine ALIVE-Nachricht für Gruppe {group} senden", 'error')
+        self._schedule_alive(group)
 
-    def _periodic_tasks(self):
-        """Periodically sends presence announcements and purges stale users."""
+    async def _liveness_task(self):
+        """Expires peers close to their deadline and closes stalled incoming transfers."""
         while self.running:
-            time.sleep(15) # Alle 15 Sekunden ankündigen/prüfen
-            
-            # Anwesenheit in allen beigetretenen Gruppen ankündigen
-            for group in self.groups:
-                alive_msg = f"ALIVE {group} {self.handle} {self.port}"
-                try:
-                    self.broadcast_socket.sendto(alive_msg.encode('utf-8'), (self.broadcast_address, self.broadcast_port))
-                except Exception:
-                    # Socket könnte während des Herunterfahrens geschlossen werden
-                    if self.running:
-                        print(f"Konnte keine ALIVE-Nachricht für Gruppe {group} senden")
+            await asyncio.sleep(self.peers.tick)
+            now = time.time()
+            for group, handle in self.peers.expire(now):
+                self._peer_timeouts.inc((group,))
+                self.events.publish(events.PeerTimeout(group, handle))
+            self._expire_incoming_transfers(now)
+
+    def _broadcast_discovery(self):
+        """True if JOIN, ALIVE and LEAVE go out as broadcasts.
+
+        In gossip mode only without seeds: then the JOIN finds the first members on the
+        LAN, and peers that still discover by broadcast keep seeing us.
+        """
+        return self.gossip is None or not self.seeds
 
-            # Benutzer entfernen, die eine Weile nicht gesehen wurden (z.B. 35 Sekunden)
+    async def _gossip_task(self):
+        """Drives the gossip membership and keeps the peer directory in line with it."""
+        self.gossip.seeds = await self._resolve_seeds(self.seeds)
+        refreshed = time.time()
+        while self.running:
             now = time.time()
-            # Eine Kopie der Elemente verwenden, um Änderungen während der Iteration zu ermöglichen
-            for group, users in list(self.users_by_group.items()):
-                for handle, user_info in list(users.items()):
-                    # user_info kann (ip, port) aus altem Code oder (ip, port, zeitstempel) sein
-                    if len(user_info) == 3:
-                        last_seen = user_info[2]
-                        # Zeitüberschreitung etwas mehr als 2x das Ankündigungsintervall
-                        if now - last_seen > 35:
-                            print(f"\nVerbindung zu '{handle}' in Gruppe '{group}' verloren (Timeout).")
-                            print("> ", end="", flush=True)
-                            del self.users_by_group[group][handle]
+            self._send_gossip(self.gossip.tick(now))
+            if now - refreshed >= GOSSIP_REFRESH:
+                # Lebende Mitglieder vor dem Timeout der Peer-Tabelle bewahren
+                refreshed = now
+                self.gossip.changes.extend(('join', member, ()) for member in self.gossip.alive())
+            self._apply_gossip_changes(now)
+            await asyncio.sleep(GOSSIP_TICK)
+
+    async def _resolve_seeds(self, seeds):
+        """Resolves the 'host:port' seeds from the config; unusable ones are reported and skipped."""
+        addrs = []
+        for seed in seeds:
+            try:
+                host, port = gossip.parse_seed(seed)
+                infos = await self.loop.loop.getaddrinfo(host, port, family=socket.AF_INET, type=socket.SOCK_DGRAM)
+            except (ValueError, OSError) as e:
+                self._notify(f"Seed '{seed}' wird übersprungen: {e}", 'error')
+                continue
+            addrs.append(infos[0][4][:2])
+        return addrs
+
+    def _send_gossip(self, out):
+        for data, addr in out:
+            self._send_unicast(data, addr)
+        if out:
+            self._packets_out.inc(('GOSSIP',), len(out))
+
+    def _apply_gossip_changes(self, now):
+        """Carries joins, group changes, failures and departures from the gossip into the peer directory."""
+        changes, self.gossip.changes = self.gossip.changes, []
+        for kind, member, old_groups in changes:
+            handle = member.handle
+            if kind in ('join', 'update'):
+                for group in old_groups:
+                    if group not in member.groups and self.peers.remove(group, handle):
+                        self.events.publish(events.PeerLeft(group, handle))
+                for group in member.groups:
+                    if self.peers.add(group, handle, member.ip, member.port, now, GOSSIP_PEER_TIMEOUT):
+                        self.events.publish(events.PeerFound(group, handle))
+                        self._request_recent(handle, (member.ip, member.port))
+                continue
+            self._caps_asked.pop(handle, None)
+            for group in old_groups:
+                if not self.peers.remove(group, handle):
+                    continue
+                if kind == gossip.DEAD:
+                    self._peer_timeouts.inc((group,))
+                    self.events.publish(events.PeerTimeout(group, handle))
+                else:
+                    self.events.publish(events.PeerLeft(group, handle))
+
+    def _gossip_groups_changed(self):
+        # Neue Gruppenliste verbreiten und die schon bekannten Mitglieder neuer Gruppen eintragen
+        self.gossip.set_groups(self.groups)
+        self.gossip.changes.extend(('join', member, ()) for member in self.gossip.alive())
+        self._apply_gossip_changes(time.time())
+
+    def _gossip_leave(self):
+        self._send_gossip(self.gossip.leave())
 
     def get_local_ip(self):
         s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
@@ -379,83 +1862,272 @@ class NetworkHandler:
     def switch_active_group(self, group_name):
         if group_name in self.groups:
             self.active_group = group_name
-            print(f"\nAktive Gruppe ist jetzt '{self.active_group}'.")
+            self._notify(f"Aktive Gruppe ist jetzt '{self.active_group}'.")
         else:
-            print(f"\nDu bist nicht in Gruppe '{group_name}'.")
-        print("> ", end="", flush=True)
+            self._notify(f"Du bist nicht in Gruppe '{group_name}'.")
 
     def list_groups(self):
-        print("\nBeigetretene Gruppen:")
+        lines = []
+        lines.append("Beigetretene Gruppen:")
         if not self.groups:
-            print("- Keine")
+            lines.append("- Keine")
         else:
             for group in self.groups:
                 active_marker = " (aktiv)" if group == self.active_group else ""
-                print(f"- {group}{active_marker}")
-        print("> ", end="", flush=True)
+                lines.append(f"- {group}{active_marker}")
+        self._notify('\n'.join(lines))
 
     def send_image(self, handle, size_str):
         """Sends a block of random binary data to a specific user."""
-        user_info = None
-        for group in self.users_by_group:
-            if handle in self.users_by_group[group]:
-                user_info = self.users_by_group[group][handle]
-                break
+        user_info = self.peers.lookup(handle)
         
         if not user_info:
-            print(f"\nNutzer '{handle}' nicht gefunden. 'who' in der jeweiligen Gruppe ausführen.")
-            print("> ", end="", flush=True)
+            self._notify(f"Nutzer '{handle}' nicht gefunden. 'who' in der jeweiligen Gruppe ausführen.")
+            return
+
+        size = self._parse_image_size(size_str)
+        if size is None:
+            return
+
+        # Zufällige Binärdaten generieren
+        self._start_outgoing_transfer(handle, user_info, os.urandom(size))
+
+    def send_image_to_group(self, size_str):
+        """Sends the same block of random binary data to every known user of the active group.
+
+        Each recipient gets its own transfer with its own congestion window; the transfer
+        scheduler interleaves them, so one slow peer does not hold back the others.
+        """
+        if not self.active_group:
+            self._notify("Keine aktive Gruppe ausgewählt. Mit /switch <gruppe> wechseln.")
+            return
+        members = [(handle, self.peers.lookup(handle)) for handle in self.peers.members(self.active_group)]
+        members = [(handle, endpoint) for handle, endpoint in members if endpoint]
+        if not members:
+            self._notify(f"Keine anderen Nutzer in '{self.active_group}' gefunden.")
             return
 
+        size = self._parse_image_size(size_str)
+        if size is None:
+            return
+
+        # Ein Puffer für alle Empfänger; die Sender lesen nur daraus
+        binary_data = os.urandom(size)
+        for handle, endpoint in members:
+            self._start_outgoing_transfer(handle, endpoint, binary_data)
+
+    def _parse_image_size(self, size_str):
         try:
             size = int(size_str)
-            if size <= 0:
-                print("\nGröße muss positiv sein.")
-                print("> ", end="", flush=True)
-                return
         except ValueError:
-            print(f"\nUngültige Größe: {size_str}")
-            print("> ", end="", flush=True)
-            return
+            self._notify(f"Ungültige Größe: {size_str}")
+            return None
+        if size <= 0:
+            self._notify("Größe muss positiv sein.")
+            return None
+        return size
 
+    def send_file(self, handle, path):
+        """Sends a file from disk to a specific user, with its name and content hash.
+
+        The file is memory-mapped and sent in slices of the mapping, so memory use stays
+        constant regardless of the file size.
+        """
+        user_info = self.peers.lookup(handle)
+        if not user_info:
+            self._notify(f"Nutzer '{handle}' nicht gefunden. 'who' in der jeweiligen Gruppe ausführen.")
+            return
         try:
-            # Zufällige Binärdaten generieren
-            binary_data = os.urandom(size)
-            
-            ip, port, _ = user_info
+            source = MappedFile(os.path.expanduser(path))
+        except (OSError, ValueError) as e:
+            self._notify(f"Datei kann nicht gesendet werden: {e}")
+            return
+
+        file_info = None
+        if self.peers.supports(handle, transfer.FILE_CAPABILITY):
+            file_info = (source.name, transfer.content_hash(source.data))
+        else:
+            self._notify(f"{handle} kennt keine Dateiübertragung; die Datei wird als Binärdaten gesendet.")
+        self._start_outgoing_transfer(handle, user_info, source.data, file_info, source)
+
+    def _start_outgoing_transfer(self, handle, endpoint, binary_data, file_info=None, source=None):
+        size = len(binary_data)
+        transfer_id = random.getrandbits(32)
+        while transfer_id in self.outgoing_transfers:
+            transfer_id = random.getrandbits(32)
+        name, digest = file_info or (None, None)
+        header = transfer.format_announce(self.handle, size, transfer_id, self.chunk_size, name, digest).encode('utf-8')
+        if self._use_stream(handle, size):
+            # Dateien gehen per sendfile() direkt aus dem Page Cache auf die Verbindung
+            sender = tcp_transfer.StreamSender(tuple(endpoint), transfer_id, binary_data, header, self.chunk_size,
+                                               path=source.path if source is not None else None)
+            run = self._run_stream_transfer
+        else:
+            sender = self._udp_sender(handle, tuple(endpoint), transfer_id, binary_data, header)
+            run = self._run_transfer
+        sender.source = source  # Wird nach dem Transfer geschlossen
+        self.outgoing_transfers[transfer_id] = sender
+
+        self.events.publish(events.Transfer('out', handle, transfer_id, 'started', size, 0, sender.total, info=name))
+        self.loop.submit(run(sender, handle))
 
-            # 1. Befehl senden
-            img_command = f"IMG {self.handle} {size}"
-            self.unicast_socket.sendto(img_command.encode('utf-8'), (ip, port))
-            
-            # 2. Binärdaten senden
-            time.sleep(0.1) # Kleine Verzögerung, um zu verhindern, dass Pakete in falscher Reihenfolge ankommen
-            self.unicast_socket.sendto(binary_data, (ip, port))
+    def _udp_sender(self, handle, endpoint, transfer_id, binary_data, header):
+        codec = self.compressor.choose(lambda capability: self.peers.supports(handle, capability))
+        return transfer.TransferSender(
+            self._send_unicast, endpoint, transfer_id, binary_data,
+            header, chunk_size=self.chunk_size, window=self.transfer_window,
+            compress=self.compressor.chunk_compressor(codec), wake=self.transfer_scheduler.wake,
+            checksum=self.peers.supports(handle, transfer.CHECKSUM_CAPABILITY))
 
-            print(f"\nBinärdaten an {handle} gesendet ({size} bytes).")
+    def _continue_over_udp(self, sender, handle):
+        """Replaces a StreamSender by a TransferSender; the receiver acknowledges what it already has."""
+        udp = self._udp_sender(handle, sender.addr, sender.transfer_id, sender.data, sender.header)
+        udp.source, sender.source = sender.source, None
+        self.outgoing_transfers[sender.transfer_id] = udp
+        self.loop.submit(self._run_transfer(udp, handle))
 
+    async def _run_stream_transfer(self, sender, handle):
+        """Drives an outgoing TCP transfer: announce, wait for the offer, stream on a worker thread.
+
+        A broken connection is negotiated anew after a growing pause, so a restarted receiver
+        continues from its partial file; if it stays silent for transfer.STALL_TIMEOUT the
+        transfer fails. A refused connection or more than tcp_transfer.MAX_RECONNECTS breaks
+        hand the rest over to UDP.
+        """
+        ok = False
+        try:
+            while not ok and self.running:
+                if not await sender.wait_for_answer(self._send_unicast, transfer.INITIAL_RTO):
+                    sender.failed = True
+                    break
+                if sender.declined:
+                    # Der Empfänger will keinen Datenstrom (oder hat den Inhalt schon): weiter über UDP
+                    self._continue_over_udp(sender, handle)
+                    return
+                work = asyncio.wrap_future(tcp_transfer.spawn(sender.run))
+                while not work.done():
+                    await asyncio.wait({work}, timeout=PROGRESS_INTERVAL)
+                    if not work.done():
+                        self.events.publish(events.Transfer('out', handle, sender.transfer_id, 'progress',
+                                                            sender.size, sender.base, sender.total,
+                                                            sender.throughput))
+                try:
+                    work.result()
+                    ok = True
+                except OSError as e:
+                    if not self.running:
+                        break
+                    if not sender.connected or sender.reconnects >= tcp_transfer.MAX_RECONNECTS:
+                        # Port gesperrt (z.B. Firewall) oder die Verbindung reißt immer wieder ab
+                        self._notify(f"TCP zu {handle} nicht möglich ({e}), sende über UDP weiter.", 'error')
+                        sender.declined = True
+                        self._continue_over_udp(sender, handle)
+                        return
+                    self._notify(f"Verbindung zu {handle} unterbrochen ({e}), setze fort...", 'error')
+                    sender.reset()
+                    await asyncio.sleep(sender.reconnect_delay)
         except Exception as e:
-            print(f"\nFehler beim Senden der Binärdaten: {e}")
-        
-        print("> ", end="", flush=True)
+            if self.running:
+                self.events.publish(events.Transfer('out', handle, sender.transfer_id, 'error', sender.size,
+                                                    info=str(e)))
+        finally:
+            if self.outgoing_transfers.get(sender.transfer_id) is sender:
+                del self.outgoing_transfers[sender.transfer_id]
+            if sender.source is not None:
+                sender.source.close()
+            if not sender.declined:
+                self._record_transfer('out', ok, sender.sent, sender.throughput)
+
+        if ok:
+            self.events.publish(events.Transfer('out', handle, sender.transfer_id, 'done', sender.size,
+                                                sender.total, sender.total, sender.throughput, sender.reconnects))
+        elif self.running and sender.failed:
+            self.events.publish(events.Transfer('out', handle, sender.transfer_id, 'failed', sender.size,
+                                                sender.base, sender.total))
 
-    def _save_image(self, data, sender):
-        """Saves received image data to a file."""
+    async def _run_transfer(self, sender, handle):
+        """Drives an outgoing transfer on the event loop and reports the result."""
+        ok = False
         try:
-            # Ein Verzeichnis für empfangene Bilder erstellen, falls es nicht existiert
-            if not os.path.exists('received_images'):
-                os.makedirs('received_images')
-
-            # Einen eindeutigen Dateinamen erstellen
-            timestamp = int(time.time())
-            # Einen eindeutigen Dateinamen für die Binärdaten erstellen
-            filename = f"received_images/from_{sender}_{timestamp}.bin"
-            
-            with open(filename, 'wb') as f:
-                f.write(data)
-            
-            print(f"\nBinärdaten von {sender} empfangen und als '{filename}' gespeichert.")
-            print("> ", end="", flush=True)
+            sender.start()
+            reported = time.time()
+            while not sender.done:
+                await asyncio.sleep(sender.rto / 2)
+                sender.tick()
+                if time.time() - reported >= PROGRESS_INTERVAL and not sender.done:
+                    reported = time.time()
+                    self.events.publish(events.Transfer('out', handle, sender.transfer_id, 'progress', sender.size,
+                                                        sender.base, sender.total, sender.throughput))
+            ok = not sender.failed
         except Exception as e:
-            print(f"\nFehler beim Speichern des Bildes: {e}")
-            print("> ", end="", flush=True)
\ No newline at end of file
+            self.events.publish(events.Transfer('out', handle, sender.transfer_id, 'error', sender.size,
+                                                info=str(e)))
+        finally:
+            self.outgoing_transfers.pop(sender.transfer_id, None)
+            if sender.source is not None:
+                sender.source.close()
+            self._packets_out.inc(('CHUNK',), sender.chunks_sent)
+            self._record_transfer('out', ok, sender.size, sender.throughput)
+
+        if ok:
+            self.events.publish(events.Transfer('out', handle, sender.transfer_id, 'done', sender.size,
+                                                sender.total, sender.total, sender.throughput, sender.retransmits))
+        elif self.running and sender.failed:
+            self.events.publish(events.Transfer('out', handle, sender.transfer_id, 'failed', sender.size,
+                                                sender.base, sender.total))
+
+    def _record_transfer(self, direction, ok, size, throughput):
+        if not ok:
+            self._transfers.inc((direction, 'failed'))
+            return
+        self._transfers.inc((direction, 'ok'))
+        self._transfer_bytes.inc((direction,), size)
+        self._transfer_throughput.observe(throughput, (direction,))
+
+    def _save_image(self, receiver, rate):
+        """Verifies a completely received transfer and files it in the content store.
+
+        Runs on a dispatch worker: the rest of the hash can be large for resumed transfers.
+        Never dropped, even if the queue is full; the data would otherwise be lost.
+        """
+        self.dispatcher.submit(receiver.sender, self._store_received, receiver, rate, droppable=False)
+
+    def _store_received(self, receiver, rate):
+        sender = receiver.sender
+        try:
+            digest = receiver.finish_hash()
+            if receiver.digest is not None and digest != receiver.digest:
+                receiver.partial.discard()
+                self.loop.call_soon(self._transfers.inc, ('in', 'corrupt'))
+                self.events.publish(events.Transfer('in', sender, receiver.transfer_id, 'failed', receiver.size,
+                                                    info=f"Prüfsumme von '{receiver.name}' stimmt nicht, verworfen"))
+                return
+            # Gleicher Inhalt schon vorhanden: die neue Kopie wird verworfen, nur verlinkt
+            self.content_store.add(receiver.partial, digest)
+            # Ohne Dateinamen: Zeitstempel, bei Kollision mit Zähler (kein Überschreiben mehr)
+            name = receiver.name or f"from_{sender}_{int(time.time())}.bin"
+            filename = self.content_store.export(digest, self.image_path, name)
+            self.events.publish(events.Transfer('in', sender, receiver.transfer_id, 'done', receiver.size,
+                                                receiver.total, receiver.total, rate, filename))
+        except Exception as e:
+            self.events.publish(events.Transfer('in', sender, receiver.transfer_id, 'error', receiver.size,
+                                                info=str(e)))
+
+    def _expire_incoming_transfers(self, now):
+        """Closes stalled incoming transfers; their partial files stay on disk for resuming.
+
+        Partial files nobody resumed within transfer.PARTIAL_MAX_AGE are deleted.
+        """
+        expired = False
+        for key, receiver in list(self.incoming_transfers.items()):
+            # TCP-Empfänger überwachen sich mit ihren Socket-Timeouts selbst
+            if receiver.stream is None and now - receiver.last_activity > transfer.STALL_TIMEOUT * 3:
+                self._cancel_timer(self._chunk_ack_timers, key)
+                del self.incoming_transfers[key]
+                receiver.partial.close()
+                expired = True
+                self._transfers.inc(('in', 'stalled'))
+                self.events.publish(events.Transfer('in', receiver.sender, receiver.transfer_id, 'stalled',
+                                                    receiver.size, receiver.count, receiver.total))
+        if expired:
+            self._remove_stale_partials()
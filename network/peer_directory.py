@@ -0,0 +1,224 @@
+import threading
+
+from network.liveness import TimerWheel
+
+DEFAULT_TIMEOUT = 35  # Sekunden ohne Lebenszeichen, bis ein Peer als verloren gilt
+
+
+class _TrieNode:
+    __slots__ = ('children', 'terminal')
+
+    def __init__(self):
+        self.children = {}
+        self.terminal = False
+
+
+class PeerDirectory:
+    """Thread-safe index of known peers.
+
+    Keeps handle -> endpoint and endpoint -> handle lookups in O(1), per-group
+    membership sets and a prefix trie over all handles, so that multi-word handles
+    at the start of a command line can be resolved without sorting. Liveness deadlines
+    per (group, handle) are tracked in a timer wheel.
+    """
+
+    def __init__(self, tick=0.5):
+        self._lock = threading.RLock()
+        self._members = {}      # {gruppe: {handle, ...}}
+        self._endpoints = {}    # {handle: (ip, port)}
+        self._by_endpoint = {}  # {(ip, port): handle}
+        self._last_seen = {}    # {(gruppe, handle): zeitstempel}
+        self._memberships = {}  # {handle: anzahl gruppen}
+        self._capabilities = {}  # {handle: frozenset} - per CAPS ausgehandelt
+        self._group_caps = {}    # {(gruppe, fähigkeit): (version, ergebnis)}
+        self._version = 0        # Zählt Änderungen an Mitgliedschaften und Fähigkeiten
+        self._trie = _TrieNode()
+        self.tick = tick
+        self._liveness = TimerWheel(tick)
+
+    # --- Gruppen ---
+
+    def add_group(self, group):
+        with self._lock:
+            self._members.setdefault(group, set())
+
+    def remove_group(self, group):
+        """Forgets a group and every peer that is not a member of another group."""
+        with self._lock:
+            for handle in self._members.pop(group, set()):
+                self._drop_membership(group, handle)
+
+    def has_group(self, group):
+        return group in self._members
+
+    def members(self, group):
+        with self._lock:
+            return list(self._members.get(group, ()))
+
+    def is_member(self, group, handle):
+        return handle in self._members.get(group, ())
+
+    # --- Peers ---
+
+    def add(self, group, handle, ip, port, now, timeout=DEFAULT_TIMEOUT):
+        """Adds or refreshes a peer in a known group. Returns True if it is new in that group.
+
+        The peer expires from the group if it is not refreshed within timeout seconds.
+        """
+        with self._lock:
+            members = self._members.get(group)
+            if members is None:
+                return False
+
+            endpoint = (ip, port)
+            old_endpoint = self._endpoints.get(handle)
+            if old_endpoint != endpoint:
+                if old_endpoint is not None and self._by_endpoint.get(old_endpoint) == handle:
+                    del self._by_endpoint[old_endpoint]
+                self._endpoints[handle] = endpoint
+                self._by_endpoint[endpoint] = handle
+
+            self._last_seen[(group, handle)] = now
+            self._liveness.refresh((group, handle), now + timeout)
+            if handle in members:
+                return False
+            members.add(handle)
+            self._version += 1
+            count = self._memberships.get(handle, 0)
+            self._memberships[handle] = count + 1
+            if count == 0:
+                self._trie_insert(handle)
+            return True
+
+    def remove(self, group, handle):
+        """Removes a peer from a group. Returns True if it was a member."""
+        with self._lock:
+            members = self._members.get(group)
+            if members is None or handle not in members:
+                return False
+            members.discard(handle)
+            self._drop_membership(group, handle)
+            return True
+
+    def _drop_membership(self, group, handle):
+        self._version += 1
+        self._last_seen.pop((group, handle), None)
+        self._liveness.remove((group, handle))
+        count = self._memberships.get(handle, 0) - 1
+        if count > 0:
+            self._memberships[handle] = count
+            return
+        # Letzte Gruppe verlassen: Peer komplett vergessen
+        self._memberships.pop(handle, None)
+        self._capabilities.pop(handle, None)
+        endpoint = self._endpoints.pop(handle, None)
+        if endpoint is not None and self._by_endpoint.get(endpoint) == handle:
+            del self._by_endpoint[endpoint]
+        self._trie_remove(handle)
+
+    def lookup(self, handle):
+        """Returns the (ip, port) endpoint of a handle or None."""
+        return self._endpoints.get(handle)
+
+    def handle_for(self, endpoint):
+        """Returns the handle that uses the (ip, port) endpoint or None."""
+        return self._by_endpoint.get(endpoint)
+
+    def last_seen(self, group, handle):
+        return self._last_seen.get((group, handle))
+
+    def handles(self):
+        with self._lock:
+            return list(self._endpoints)
+
+    def set_capabilities(self, handle, capabilities):
+        with self._lock:
+            if handle in self._endpoints:
+                self._capabilities[handle] = frozenset(capabilities)
+                self._version += 1
+
+    def capabilities(self, handle):
+        """Returns the negotiated capabilities of a peer or None if none were exchanged yet."""
+        return self._capabilities.get(handle)
+
+    def supports(self, handle, capability):
+        return capability in self._capabilities.get(handle, ())
+
+    def group_supports(self, group, capability):
+        """Returns True if the group has known members and all of them support capability."""
+        with self._lock:
+            cached = self._group_caps.get((group, capability))
+            if cached is not None and cached[0] == self._version:
+                return cached[1]
+            members = self._members.get(group)
+            result = bool(members) and all(
+                capability in self._capabilities.get(handle, ()) for handle in members)
+            self._group_caps[(group, capability)] = (self._version, result)
+            return result
+
+    def __len__(self):
+        return len(self._endpoints)
+
+    def snapshot(self):
+        """Returns every known peer as [handle, ip, port, {group: last seen}] for saving to disk."""
+        with self._lock:
+            peers = []
+            for handle, (ip, port) in self._endpoints.items():
+                seen = {group: self._last_seen[(group, handle)] for group, members in self._members.items()
+                        if handle in members and (group, handle) in self._last_seen}
+                peers.append([handle, ip, port, seen])
+            return peers
+
+    def expire(self, now):
+        """Removes and returns the (group, handle) pairs whose liveness deadline has passed."""
+        with self._lock:
+            expired = self._liveness.advance(now)
+            for group, handle in expired:
+                members = self._members.get(group)
+                if members is not None and handle in members:
+                    members.discard(handle)
+                    self._drop_membership(group, handle)
+            return expired
+
+    # --- Präfixsuche ---
+
+    def _trie_insert(self, handle):
+        node = self._trie
+        for char in handle:
+            node = node.children.setdefault(char, _TrieNode())
+        node.terminal = True
+
+    def _trie_remove(self, handle):
+        path = []
+        node = self._trie
+        for char in handle:
+            child = node.children.get(char)
+            if child is None:
+                return
+            path.append((node, char))
+            node = child
+        node.terminal = False
+        # Leere Zweige von unten nach oben entfernen
+        for parent, char in reversed(path):
+            child = parent.children[char]
+            if child.terminal or child.children:
+                break
+            del parent.children[char]
+
+    def match_prefix(self, text):
+        """Splits 'Handle Rest' into (handle, rest) using the longest known handle followed by a space.
+
+        Returns (None, text) if no known handle matches.
+        """
+        with self._lock:
+            node = self._trie
+            best = None
+            for i, char in enumerate(text):
+                if char == ' ' and node.terminal:
+                    best = i
+                node = node.children.get(char)
+                if node is None:
+                    break
+        if best is None:
+            return None, text
+        return text[:best], text[best + 1:]
@@ -0,0 +1,230 @@
+import struct
+import zlib
+from collections import namedtuple
+
+# Befehle, die es im Text- und im Binärformat gibt
+ALIVE = 1
+JOIN = 2
+LEAVE = 3
+GMSG = 4
+REPLY = 5
+MSG = 6
+MSG_AUTOREPLY = 7
+RMSG = 8  # Direktnachricht mit Sequenznummer und huckepack getragener Bestätigung
+RACK = 9  # Eigenständige Bestätigung, wenn keine RMSG zurückgeht
+SGMSG = 10  # Gruppennachricht mit Epoche und Sequenznummer des Absenders
+
+COMMAND_NAMES = {
+    ALIVE: "ALIVE", JOIN: "JOIN", LEAVE: "LEAVE", GMSG: "GMSG",
+    REPLY: "REPLY", MSG: "MSG", MSG_AUTOREPLY: "MSG-AUTOREPLY", RMSG: "RMSG", RACK: "RACK",
+    SGMSG: "SGMSG",
+}
+COMMANDS = {name: command for command, name in COMMAND_NAMES.items()}
+
+BROADCAST_COMMANDS = frozenset((ALIVE, JOIN, LEAVE, GMSG, SGMSG))
+# SGMSG auch per Unicast: Antworten auf nachgefragte Gruppennachrichten
+UNICAST_COMMANDS = frozenset((REPLY, MSG, MSG_AUTOREPLY, RMSG, RACK, SGMSG))
+_WITH_PORT = frozenset((ALIVE, JOIN, REPLY))
+_WITHOUT_GROUP = frozenset((MSG, MSG_AUTOREPLY))
+
+# Binärrahmen: Alle Felder fester Länge stehen vorne und werden mit einem einzigen
+# struct-Aufruf gelesen, danach folgen Handle und ggf. Text als UTF-8.
+#   ALIVE/JOIN/REPLY: Magic, Befehl, Gruppen-ID (u32), Port (u16), Handle-Länge (u8)
+#   LEAVE:            Magic, Befehl, Gruppen-ID (u32), Handle-Länge (u8)
+#   GMSG:             Magic, Befehl, Gruppen-ID (u32), Handle-Länge (u8), Text-Länge (u16)
+#   SGMSG:            Magic, Befehl, Gruppen-ID, Epoche, Seq (je u32), Handle-Länge (u8),
+#                     Text-Länge (u16)
+#   MSG/AUTOREPLY:    Magic, Befehl, Handle-Länge (u8), Text-Länge (u16)
+#   RMSG:             Magic, Befehl, Epoche, Seq, Bestätigte Epoche, Bestätigt (je u32),
+#                     Handle-Länge (u8), Text-Länge (u16)
+#   RACK:             Magic, Befehl, Bestätigte Epoche, Bestätigt (je u32), Handle-Länge (u8),
+#                     SACK-Anzahl (u8), danach je SACK eine Sequenznummer (u32)
+# Das Magic-Byte enthält die Version und kollidiert weder mit Textbefehlen noch mit
+# Transfer-Chunks (0x00).
+FRAME_MAGIC = 0x01
+CAPABILITY = "bin1"  # Wird per CAPS ausgehandelt
+RELIABLE_CAPABILITY = "rel1"
+_PEER_FRAME = struct.Struct('!BBIHB')
+_LEAVE_FRAME = struct.Struct('!BBIB')
+_GROUP_TEXT_FRAME = struct.Struct('!BBIBH')
+_SEQ_GROUP_FRAME = struct.Struct('!BBIIIBH')
+_DIRECT_FRAME = struct.Struct('!BBBH')
+_RELIABLE_FRAME = struct.Struct('!BBIIIIBH')
+_ACK_FRAME = struct.Struct('!BBIIBB')
+_SACK_ENTRY = struct.Struct('!I')
+_FRAMES = {
+    ALIVE: _PEER_FRAME, JOIN: _PEER_FRAME, REPLY: _PEER_FRAME, LEAVE: _LEAVE_FRAME,
+    GMSG: _GROUP_TEXT_FRAME, MSG: _DIRECT_FRAME, MSG_AUTOREPLY: _DIRECT_FRAME,
+    RMSG: _RELIABLE_FRAME, RACK: _ACK_FRAME, SGMSG: _SEQ_GROUP_FRAME,
+}
+
+# epoch/seq kennzeichnen eine RMSG, ack_epoch/ack/sack die Bestätigung des Gegenstroms
+Packet = namedtuple('Packet', 'command group handle port text epoch seq ack_epoch ack sack',
+                    defaults=(None, None, None, None, ()))
+
+
+def group_id(group):
+    """Interned 32-bit ID of a group name; receivers map it back via their joined groups."""
+    return zlib.crc32(group.encode('utf-8'))
+
+
+def is_frame(data):
+    return len(data) >= 2 and data[0] == FRAME_MAGIC
+
+
+def encode_binary(packet):
+    """Encodes a Packet as a binary frame."""
+    command = packet.command
+    frame = _FRAMES[command]
+    handle = packet.handle.encode('utf-8')
+    if frame is _PEER_FRAME:
+        header = frame.pack(FRAME_MAGIC, command, group_id(packet.group), packet.port, len(handle))
+        return header + handle
+    if frame is _LEAVE_FRAME:
+        return frame.pack(FRAME_MAGIC, command, group_id(packet.group), len(handle)) + handle
+    if frame is _ACK_FRAME:
+        sack = packet.sack
+        header = frame.pack(FRAME_MAGIC, command, packet.ack_epoch, packet.ack, len(handle), len(sack))
+        return b''.join([header, handle] + [_SACK_ENTRY.pack(seq) for seq in sack])
+    text = packet.text.encode('utf-8')
+    if frame is _RELIABLE_FRAME:
+        header = frame.pack(FRAME_MAGIC, command, packet.epoch, packet.seq, packet.ack_epoch,
+                            packet.ack, len(handle), len(text))
+    elif frame is _GROUP_TEXT_FRAME:
+        header = frame.pack(FRAME_MAGIC, command, group_id(packet.group), len(handle), len(text))
+    elif frame is _SEQ_GROUP_FRAME:
+        header = frame.pack(FRAME_MAGIC, command, group_id(packet.group), packet.epoch, packet.seq,
+                            len(handle), len(text))
+    else:
+        header = frame.pack(FRAME_MAGIC, command, len(handle), len(text))
+    return b''.join((header, handle, text))
+
+
+def encode(packet, binary):
+    """Encodes a Packet as a binary frame if binary is set and its fields fit, else as text."""
+    if binary:
+        try:
+            return encode_binary(packet)
+        except struct.error:
+            # Handle (u8) oder Text (u16) zu lang für die Längenfelder; Text kennt keine Grenze
+            pass
+    return encode_text(packet)
+
+
+def parse_binary(data, groups_by_id):
+    """Decodes a binary frame (bytes) into a Packet.
+
+    The fixed-size fields are unpacked in place with one struct call; only the handle
+    and text are materialised as str. groups_by_id maps interned IDs to the names of the
+    joined groups. Frames for other groups and malformed frames return None; for foreign
+    groups this happens before any string is decoded.
+    """
+    try:
+        command = data[1]
+        frame = _FRAMES.get(command)
+        if frame is None:
+            return None
+        group = port = text = epoch = seq = ack_epoch = ack = None
+        sack = ()
+        text_len = 0
+        if frame is _DIRECT_FRAME:
+            _, _, handle_len, text_len = frame.unpack_from(data)
+        elif frame is _RELIABLE_FRAME:
+            _, _, epoch, seq, ack_epoch, ack, handle_len, text_len = frame.unpack_from(data)
+        elif frame is _ACK_FRAME:
+            _, _, ack_epoch, ack, handle_len, sack_count = frame.unpack_from(data)
+            text_len = sack_count * _SACK_ENTRY.size
+        else:
+            if frame is _PEER_FRAME:
+                _, _, gid, port, handle_len = frame.unpack_from(data)
+            elif frame is _LEAVE_FRAME:
+                _, _, gid, handle_len = frame.unpack_from(data)
+            elif frame is _SEQ_GROUP_FRAME:
+                _, _, gid, epoch, seq, handle_len, text_len = frame.unpack_from(data)
+            else:
+                _, _, gid, handle_len, text_len = frame.unpack_from(data)
+            group = groups_by_id.get(gid)
+            if group is None:
+                return None
+
+        start = frame.size
+        end = start + handle_len
+        if end + text_len != len(data):
+            return None
+        handle = data[start:end].decode('utf-8')
+        if frame is _ACK_FRAME:
+            sack = tuple(seq for seq, in _SACK_ENTRY.iter_unpack(data[end:]))
+        elif frame in (_DIRECT_FRAME, _GROUP_TEXT_FRAME, _RELIABLE_FRAME, _SEQ_GROUP_FRAME):
+            text = data[end:].decode('utf-8')
+    except (struct.error, UnicodeDecodeError):
+        return None
+    return Packet(command, group, handle, port, text, epoch, seq, ack_epoch, ack, sack)
+
+
+def encode_text(packet):
+    """Encodes a Packet in the original text format."""
+    name = COMMAND_NAMES[packet.command]
+    command = packet.command
+    if command in (ALIVE, JOIN, REPLY):
+        message = f"{name} {packet.group} {packet.handle} {packet.port}"
+    elif command == LEAVE:
+        message = f"{name} {packet.group} {packet.handle}"
+    elif command == GMSG:
+        message = f"{name} {packet.group} {packet.handle} {packet.text}"
+    elif command == SGMSG:
+        message = f"{name} {packet.group} {packet.epoch} {packet.seq} {packet.handle} {packet.text}"
+    elif command == RMSG:
+        message = (f"{name} {packet.epoch} {packet.seq} {packet.ack_epoch} {packet.ack} "
+                   f"{packet.handle} {packet.text}")
+    elif command == RACK:
+        sack = ','.join(map(str, packet.sack)) or '-'
+        message = f"{name} {packet.ack_epoch} {packet.ack} {sack} {packet.handle}"
+    else:
+        message = f"{name} {packet.handle} {packet.text}"
+    return message.encode('utf-8')
+
+
+def parse_text(message):
+    """Parses a text command into a Packet; returns None for other or malformed commands.
+
+    Handles may contain spaces where the format allows it: the group is always the first
+    word, and for ALIVE/JOIN/REPLY the port is the last one.
+    """
+    name, _, args_str = message.partition(' ')
+    command = COMMANDS.get(name)
+    if command is None:
+        return None
+    try:
+        if command in _WITHOUT_GROUP:
+            # MSG <Absender> <Text>
+            sender, text = args_str.split(' ', 1)
+            return Packet(command, None, sender, None, text)
+        if command == RMSG:
+            # RMSG <Epoche> <Seq> <Bestätigte Epoche> <Bestätigt> <Absender> <Text>
+            epoch, seq, ack_epoch, ack, sender, text = args_str.split(' ', 5)
+            return Packet(command, None, sender, None, text, int(epoch), int(seq), int(ack_epoch), int(ack))
+        if command == RACK:
+            # RACK <Bestätigte Epoche> <Bestätigt> <SACK,...|-> <Handle>
+            ack_epoch, ack, sack_str, handle = args_str.split(' ', 3)
+            sack = () if sack_str == '-' else tuple(int(seq) for seq in sack_str.split(','))
+            return Packet(command, None, handle, None, None, None, None, int(ack_epoch), int(ack), sack)
+
+        group, _, rest = args_str.partition(' ')
+        if not group or not rest:
+            return None
+        if command in _WITH_PORT:
+            # <Befehl> <Gruppe> <Handle> <Port>
+            handle, port_str = rest.rsplit(' ', 1)
+            return Packet(command, group, handle, int(port_str), None)
+        if command == LEAVE:
+            # LEAVE <Gruppe> <Handle>
+            return Packet(command, group, rest, None, None)
+        if command == SGMSG:
+            # SGMSG <Gruppe> <Epoche> <Seq> <Handle> <Text>
+            epoch, seq, sender, text = rest.split(' ', 3)
+            return Packet(command, group, sender, None, text, int(epoch), int(seq))
+        # GMSG <Gruppe> <Handle> <Text>
+        sender, text = rest.split(' ', 1)
+        return Packet(command, group, sender, None, text)
+    except ValueError:
+        return None
@@ -0,0 +1,111 @@
+from network import compression, protocol, transfer
+
+# Verkehrsklassen mit Rate (Pakete/s) und Burst je Quell-IP. Die Standardwerte lassen auch
+# viele Peers auf einem Rechner (Lasttests) durch, begrenzen aber Fluten eines einzelnen Hosts.
+DEFAULT_LIMITS = {
+    'join': (100.0, 500),        # JOIN, LEAVE: jedes neue Handle löst ein REPLY aus
+    'alive': (500.0, 2000),      # ALIVE, GOSSIP
+    'reply': (200.0, 1000),      # REPLY
+    'chat': (500.0, 2000),       # MSG, GMSG, SGMSG, RMSG, RACK, MSG-AUTOREPLY
+    'compressed': (500.0, 2000), # Komprimierte Datagramme; entpackt zählen sie zusätzlich in ihrer Klasse
+    'control': (100.0, 500),     # CAPS, CAPS-REPLY, IMG, FILE, GFETCH
+    'ack': (20000.0, 20000),     # IMG-ACK
+    'chunk': (100000.0, 50000),  # Transfer-Chunks
+    'other': (50.0, 100),        # Unbekanntes, wird ohnehin verworfen
+}
+GLOBAL_FACTOR = 10     # Alle Quellen zusammen dürfen das Zehnfache einer einzelnen senden
+MAX_BUCKETS = 4096     # Obergrenze der Tabelle; gespoofte Absender können sie sonst aufblähen
+
+_TEXT_CLASSES = {
+    b'JOIN': 'join', b'LEAVE': 'join', b'ALIVE': 'alive', b'GOSSIP': 'alive', b'REPLY': 'reply',
+    b'MSG': 'chat', b'GMSG': 'chat', b'SGMSG': 'chat', b'RMSG': 'chat', b'RACK': 'chat',
+    b'MSG-AUTOREPLY': 'chat',
+    b'CAPS': 'control', b'CAPS-REPLY': 'control', b'IMG': 'control', b'FILE': 'control',
+    b'IMG-TCP': 'control', b'GFETCH': 'control',
+    b'IMG-ACK': 'ack',
+}
+_FRAME_CLASSES = {
+    protocol.JOIN: 'join', protocol.LEAVE: 'join', protocol.ALIVE: 'alive', protocol.REPLY: 'reply',
+    protocol.MSG: 'chat', protocol.GMSG: 'chat', protocol.MSG_AUTOREPLY: 'chat',
+    protocol.RMSG: 'chat', protocol.RACK: 'chat', protocol.SGMSG: 'chat',
+}
+_CHUNK_MAGICS = frozenset((transfer.CHUNK_MAGIC, transfer.COMPRESSED_CHUNK_MAGIC,
+                           transfer.CHECKED_CHUNK_MAGIC, transfer.CHECKED_COMPRESSED_CHUNK_MAGIC))
+
+
+def classify(data):
+    """Returns the traffic class of a raw datagram from its first bytes, without decoding it."""
+    if not data:
+        return 'other'
+    magic = data[0]
+    if magic in _CHUNK_MAGICS:
+        return 'chunk'
+    if magic == protocol.FRAME_MAGIC:
+        return _FRAME_CLASSES.get(data[1], 'other') if len(data) > 1 else 'other'
+    if magic == compression.COMPRESSED_MAGIC:
+        # Der Inhalt ist erst nach dem Entpacken bekannt, siehe NetworkHandler._allow_inflated()
+        return 'compressed'
+    return _TEXT_CLASSES.get(bytes(data[:14]).split(b' ', 1)[0], 'other')
+
+
+class RateLimiter:
+    """Token buckets per (source IP, traffic class), plus one bucket per class for all sources.
+
+    allow() is a few dict and float operations, so it can run for every datagram before
+    anything is copied or decoded. Buckets are plain [tokens, last update] lists. When
+    the table exceeds max_buckets, the full (idle) buckets are dropped first, then all;
+    a dropped bucket simply starts full again.
+    """
+
+    def __init__(self, limits=None, global_factor=GLOBAL_FACTOR, max_buckets=MAX_BUCKETS):
+        self.limits = dict(DEFAULT_LIMITS)
+        self.limits.update(limits or {})
+        self.global_factor = global_factor
+        self.max_buckets = max_buckets
+        self._buckets = {}  # {(ip, klasse): [tokens, zeitpunkt]}
+        self._global = {cls: [burst * global_factor, 0.0] for cls, (_, burst) in self.limits.items()}
+        self.dropped = {}   # {(klasse, 'source' | 'global'): anzahl}
+
+    def allow(self, ip, cls, now):
+        rate, burst = self.limits.get(cls) or self.limits['other']
+        key = (ip, cls)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self.max_buckets:
+                self._prune(now)
+            bucket = self._buckets[key] = [float(burst), now]
+        else:
+            tokens = bucket[0] + (now - bucket[1]) * rate
+            bucket[0] = tokens if tokens < burst else float(burst)
+            bucket[1] = now
+        if bucket[0] < 1.0:
+            self._drop(cls, 'source')
+            return False
+
+        shared = self._global.get(cls) or self._global['other']
+        factor = self.global_factor
+        tokens = shared[0] + (now - shared[1]) * rate * factor
+        shared[0] = tokens if tokens < burst * factor else float(burst * factor)
+        shared[1] = now
+        if shared[0] < 1.0:
+            self._drop(cls, 'global')
+            return False
+        bucket[0] -= 1.0
+        shared[0] -= 1.0
+        return True
+
+    def _drop(self, cls, scope):
+        key = (cls, scope)
+        self.dropped[key] = self.dropped.get(key, 0) + 1
+
+    def _prune(self, now):
+        limits = self.limits
+        for key, (tokens, last) in list(self._buckets.items()):
+            rate, burst = limits.get(key[1]) or limits['other']
+            if tokens + (now - last) * rate >= burst:
+                del self._buckets[key]
+        if len(self._buckets) >= self.max_buckets:
+            self._buckets.clear()
+
+    def __len__(self):
+        return len(self._buckets)
@@ -0,0 +1,236 @@
+import random
+from collections import OrderedDict, deque
+
+DEFAULT_WINDOW = 64   # Unbestätigte Nachrichten unterwegs bzw. vorgezogene beim Empfänger
+INITIAL_RTO = 0.5     # Sekunden bis zur ersten Wiederholung, solange keine RTT gemessen ist
+MIN_RTO = 0.05
+MAX_RTO = 5.0
+MAX_SENDS = 8         # Danach gilt eine Nachricht als nicht zustellbar
+ACK_DELAY = 0.01      # So lange wartet eine Bestätigung darauf, mit einer Antwort mitzufahren
+MAX_SACK = 16         # Höchstens so viele vorgezogene Nachrichten pro RACK melden
+LOSS_WEIGHT = 0.05    # Glättung der Verlustschätzung pro Übertragung
+OLD_EPOCHS = 4        # So viele abgelöste Epochen des Peers werden wiedererkannt
+
+
+def new_epoch():
+    """Random non-zero stream ID; a restarted client thereby starts a fresh sequence."""
+    return random.getrandbits(32) or 1
+
+
+class ReliableChannel:
+    """Sequencing, retransmission and in-order delivery of direct messages with one peer.
+
+    A pure state machine: callers pass the current time and do the sending. Outgoing
+    messages are numbered within this side's epoch and kept until a cumulative ACK covers
+    them. Selective ACKs for messages received beyond a gap avoid go-back-N and let the
+    sender repair the gap before the RTO expires. The RTO follows the measured RTT
+    (RFC 6298, Karn's rule) and backs off on timeouts. Incoming messages are delivered in
+    order; duplicates and anything beyond the reorder window are dropped. If a message
+    exhausts its retries the stream restarts in a new epoch so the receiver is not
+    blocked on the gap forever; late datagrams of a superseded epoch are dropped.
+    """
+
+    def __init__(self, epoch, window=DEFAULT_WINDOW):
+        self.epoch = epoch
+        self.window = window
+
+        # Senden
+        self.next_seq = 1
+        self.unacked = OrderedDict()  # {seq: [text, erstes senden, letztes senden, anzahl, sack]}
+        self.backlog = deque()        # Texte, die nicht mehr ins Fenster passen
+        self.rto = INITIAL_RTO
+        self.srtt = None
+        self.rttvar = 0.0
+        self.loss = 0.0
+        self.sent = 0
+        self.retransmits = 0
+        self.delivered = 0
+        self.failed = 0
+
+        # Empfangen
+        self.peer_epoch = None
+        self.old_epochs = deque(maxlen=OLD_EPOCHS)
+        self.recv_next = 1
+        self.reorder = {}  # {seq: text} - hinter einer Lücke angekommen
+        self.duplicates = 0
+        self.reordered = 0
+
+    # --- Senden ---
+
+    def send(self, text, now):
+        """Queues a message and returns the (seq, text) pairs to transmit now."""
+        self.backlog.append(text)
+        return self._fill_window(now)
+
+    def _fill_window(self, now):
+        ready = []
+        while self.backlog and len(self.unacked) < self.window:
+            seq = self.next_seq
+            self.next_seq += 1
+            text = self.backlog.popleft()
+            self.unacked[seq] = [text, now, now, 1, False]
+            self.sent += 1
+            ready.append((seq, text))
+        return ready
+
+    def _update_rtt(self, sample):
+        if self.srtt is None:
+            self.srtt = sample
+            self.rttvar = sample / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - sample)
+            self.srtt = 0.875 * self.srtt + 0.125 * sample
+        self.rto = min(MAX_RTO, max(MIN_RTO, self.srtt + 4 * self.rttvar))
+
+    def _sample_loss(self, sends):
+        """Counts all but the last of sends transmissions as lost (smoothed per transmission)."""
+        for _ in range(sends - 1):
+            self.loss += LOSS_WEIGHT * (1.0 - self.loss)
+        self.loss -= LOSS_WEIGHT * self.loss
+
+    def on_ack(self, ack_epoch, ack, now, sack=()):
+        """Applies a cumulative ACK and optional selective ACKs.
+
+        Returns (acked texts, (seq, text) pairs to transmit now: repaired gaps and
+        messages that fit into the window again).
+        """
+        if ack_epoch != self.epoch:
+            return [], []
+        # Nur die Nachricht, die die Bestätigung ausgelöst hat, liefert eine unverfälschte
+        # RTT; ältere hingen womöglich hinter einer Lücke
+        entry = self.unacked.get(ack)
+        if entry is not None and entry[3] == 1 and not entry[4]:
+            self._update_rtt(now - entry[1])
+        acked = []
+        while self.unacked:
+            seq = next(iter(self.unacked))
+            if seq > ack:
+                break
+            text, _, _, sends, _ = self.unacked.pop(seq)
+            self._sample_loss(sends)
+            self.delivered += 1
+            acked.append(text)
+
+        ready = []
+        if sack:
+            for seq in sack:
+                entry = self.unacked.get(seq)
+                if entry is not None and not entry[4]:
+                    entry[4] = True
+                    if entry[3] == 1:
+                        self._update_rtt(now - entry[1])
+            # Lücken vor dem höchsten gemeldeten Eingang gelten als verloren; wiederholen,
+            # sofern die letzte Sendung älter als eine RTT ist
+            highest = max(sack)
+            min_gap = self.srtt if self.srtt is not None else self.rto / 2
+            for seq, entry in self.unacked.items():
+                if seq > highest:
+                    break
+                if not entry[4] and now - entry[2] > min_gap and entry[3] < MAX_SENDS:
+                    entry[2] = now
+                    entry[3] += 1
+                    self.retransmits += 1
+                    ready.append((seq, entry[0]))
+        if acked:
+            ready.extend(self._fill_window(now))
+        return acked, ready
+
+    def next_timeout(self, now):
+        """Seconds until the oldest unacknowledged message is due, or None if nothing is pending."""
+        if not self.unacked:
+            return None
+        pending = [entry[2] for entry in self.unacked.values() if not entry[4]]
+        if not pending:
+            # Alles selektiv bestätigt; wartet nur noch auf die kumulative Bestätigung
+            pending = [entry[2] for entry in self.unacked.values()]
+        return max(0.0, min(pending) + self.rto - now)
+
+    def due(self, now):
+        """Returns (messages to retransmit as (seq, text), texts given up on)."""
+        resend = []
+        failed = []
+        for seq, entry in self.unacked.items():
+            if entry[4] or now - entry[2] < self.rto:
+                continue
+            if entry[3] >= MAX_SENDS:
+                failed.append(seq)
+                continue
+            entry[2] = now
+            entry[3] += 1
+            self.retransmits += 1
+            resend.append((seq, entry[0]))
+        if not resend and not failed and self.unacked and \
+                all(entry[4] for entry in self.unacked.values()):
+            # Die kumulative Bestätigung ging verloren: die älteste Nachricht erneut senden
+            seq, entry = next(iter(self.unacked.items()))
+            if now - entry[2] >= self.rto:
+                entry[2] = now
+                self.retransmits += 1
+                resend.append((seq, entry[0]))
+        if resend or failed:
+            self.rto = min(MAX_RTO, self.rto * 2)
+
+        if not failed:
+            return resend, []
+        # Die Lücke würde den Empfänger blockieren: Strom in neuer Epoche neu nummerieren
+        given_up = [self.unacked.pop(seq)[0] for seq in failed]
+        self.failed += len(given_up)
+        for _ in given_up:
+            self._sample_loss(MAX_SENDS + 1)
+        remaining = [entry[0] for entry in self.unacked.values()]
+        self.unacked.clear()
+        self.backlog.extendleft(reversed(remaining))
+        self.epoch = new_epoch()
+        self.next_seq = 1
+        return self._fill_window(now), given_up
+
+    # --- Empfangen ---
+
+    def receive(self, epoch, seq, text):
+        """Accepts an incoming message. Returns (texts to deliver in order, ack immediately)."""
+        if epoch != self.peer_epoch:
+            if epoch in self.old_epochs:
+                # Verspätet aus einem abgelösten Strom; dessen Rest kam im neuen erneut
+                self.duplicates += 1
+                return [], False
+            # Neuer Strom (Neustart des Peers oder aufgegebene Nachricht)
+            if self.peer_epoch is not None:
+                self.old_epochs.append(self.peer_epoch)
+            self.peer_epoch = epoch
+            self.recv_next = 1
+            self.reorder.clear()
+
+        if seq < self.recv_next or seq in self.reorder:
+            # Unsere Bestätigung ging verloren: sofort wiederholen
+            self.duplicates += 1
+            return [], True
+        if seq >= self.recv_next + self.window:
+            return [], True
+        if seq != self.recv_next:
+            self.reorder[seq] = text
+            self.reordered += 1
+            return [], True
+
+        delivered = [text]
+        self.recv_next += 1
+        while self.recv_next in self.reorder:
+            delivered.append(self.reorder.pop(self.recv_next))
+            self.recv_next += 1
+        # Schloss das eine Lücke, erfährt der Sender sofort davon
+        return delivered, len(delivered) > 1
+
+    def ack_state(self):
+        """Returns (epoch, highest in-order seq) of the incoming stream for piggybacking."""
+        return self.peer_epoch or 0, self.recv_next - 1
+
+    def sack_list(self):
+        """Returns up to MAX_SACK sequence numbers received beyond the first gap."""
+        return sorted(self.reorder)[:MAX_SACK]
+
+    def link_quality(self):
+        return {
+            'srtt': self.srtt, 'rto': self.rto, 'loss': self.loss, 'sent': self.sent,
+            'retransmits': self.retransmits, 'delivered': self.delivered, 'failed': self.failed,
+            'pending': len(self.unacked) + len(self.backlog), 'duplicates': self.duplicates,
+            'reordered': self.reordered,
+        }
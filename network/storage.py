@@ -0,0 +1,197 @@
+import mmap
+import os
+import shutil
+import tempfile
+import time
+
+
+def write_atomic(path, text):
+    """Replaces path with text so that readers never see a half-written file.
+
+    Each call writes its own temporary file next to path, so concurrent writers never
+    mix their contents; the last os.replace wins.
+    """
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def partial_usage(directory, exclude=()):
+    """Returns the bytes taken by the files in directory, except those named in exclude."""
+    total = 0
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_file() and entry.path not in exclude:
+                    total += entry.stat().st_size
+    except OSError:
+        pass
+    return total
+
+
+def remove_stale_partials(directory, max_age, keep=(), now=None):
+    """Deletes partial files (and their bitmaps) not modified for max_age seconds.
+
+    keep holds the paths of partial files still in use. Returns the number of files removed.
+    """
+    cutoff = (time.time() if now is None else now) - max_age
+    removed = 0
+    try:
+        with os.scandir(directory) as entries:
+            stale = [entry.path for entry in entries
+                     if entry.is_file() and entry.stat().st_mtime < cutoff
+                     and entry.path.removesuffix('.bitmap') not in keep]
+    except OSError:
+        return 0
+    for path in stale:
+        try:
+            os.remove(path)
+            removed += 1
+        except OSError:
+            pass
+    return removed
+
+
+class PartialFile:
+    """Preallocated, memory-mapped target file with a persistent chunk bitmap for resuming.
+
+    Chunks are written straight into their file offset through the mapping, so memory use
+    stays flat regardless of the file size. The bitmap lives next to the file (one byte per
+    chunk) and survives interruptions, so a later transfer with the same ID can resume.
+    """
+
+    def __init__(self, path, size, total_chunks):
+        self.path = path
+        self.bitmap_path = path + '.bitmap'
+        self.size = size
+
+        resume = (os.path.exists(path) and os.path.getsize(path) == size
+                  and os.path.exists(self.bitmap_path)
+                  and os.path.getsize(self.bitmap_path) == total_chunks)
+        self.resumed = resume
+
+        self._file = self._open(path, size, resume)
+        self._bitmap_file = self._open(self.bitmap_path, total_chunks, resume)
+        self.data = mmap.mmap(self._file.fileno(), size)
+        self.received = mmap.mmap(self._bitmap_file.fileno(), total_chunks)
+
+    @staticmethod
+    def _open(path, size, resume):
+        f = open(path, 'r+b' if resume else 'w+b')
+        if not resume:
+            # Speicher auf der Platte reservieren, damit der Transfer nicht mittendrin an Platzmangel scheitert
+            if hasattr(os, 'posix_fallocate'):
+                os.posix_fallocate(f.fileno(), 0, size)
+            else:
+                f.truncate(size)
+        return f
+
+    def close(self):
+        """Flushes and closes the mapping but keeps the files for a later resume."""
+        for mapping in (self.data, self.received):
+            if not mapping.closed:
+                mapping.flush()
+                mapping.close()
+        self._file.close()
+        self._bitmap_file.close()
+
+    def finish(self, final_path):
+        """Closes the completed file, moves it to final_path and removes the bitmap."""
+        self.close()
+        os.replace(self.path, final_path)
+        os.remove(self.bitmap_path)
+
+    def discard(self):
+        self.close()
+        for path in (self.path, self.bitmap_path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+class MappedFile:
+    """Read-only mapping of a file to send; transfer chunks are slices of it, not copies.
+
+    Only the pages currently being sent are resident, so files larger than memory can be
+    sent with constant memory use.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.name = os.path.basename(path)
+        with open(path, 'rb') as f:
+            self.size = os.fstat(f.fileno()).st_size
+            if not self.size:
+                raise ValueError(f"Datei '{path}' ist leer")
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if hasattr(self.data, 'madvise') and hasattr(mmap, 'MADV_SEQUENTIAL'):
+            self.data.madvise(mmap.MADV_SEQUENTIAL)
+
+    def close(self):
+        try:
+            self.data.close()
+        except BufferError:
+            # Noch gesendete Chunks verweisen auf die Abbildung; sie wird mit ihnen freigegeben
+            pass
+
+
+class ContentStore:
+    """Content-addressed store for received files: <root>/<2 hex digits>/<hash>.
+
+    Every distinct content is stored once. The files users see are hard links to the
+    stored object (copies where the file system has no hard links), so receiving the
+    same data again costs no extra space and known hashes can be answered without a
+    transfer.
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def path_for(self, digest):
+        return os.path.join(self.root, digest[:2], digest)
+
+    def has(self, digest):
+        return os.path.exists(self.path_for(digest))
+
+    def add(self, partial, digest):
+        """Moves a completed PartialFile into the store; returns False if the content was already there."""
+        path = self.path_for(digest)
+        if os.path.exists(path):
+            partial.discard()
+            return False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        partial.finish(path)
+        return True
+
+    def export(self, digest, directory, name):
+        """Makes the object visible as directory/name (with a numeric suffix if taken); returns the path."""
+        source = self.path_for(digest)
+        os.makedirs(directory, exist_ok=True)
+        stem, ext = os.path.splitext(name)
+        counter = 0
+        while True:
+            target = os.path.join(directory, f"{stem}_{counter}{ext}" if counter else name)
+            try:
+                os.link(source, target)
+                return target
+            except FileExistsError:
+                counter += 1
+            except OSError:
+                # Kein Hardlink möglich (z.B. FAT oder anderes Dateisystem): exklusiv kopieren
+                try:
+                    with open(source, 'rb') as src, open(target, 'xb') as dst:
+                        shutil.copyfileobj(src, dst)
+                    return target
+                except FileExistsError:
+                    counter += 1
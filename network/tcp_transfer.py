@@ -0,0 +1,262 @@
+import asyncio
+import socket
+import struct
+import threading
+import time
+from concurrent.futures import Future
+
+from network import transfer
+
+# Ablauf: Der Sender kündigt wie bisher mit IMG/FILE an. Beherrschen beide Seiten TCP_CAPABILITY
+# und ist die Nutzlast mindestens MIN_STREAM_SIZE groß, antwortet der Empfänger statt mit
+# IMG-ACK mit IMG-TCP <Transfer-ID> <Port> <Offset>: Er wartet auf diesem Port auf genau eine
+# Verbindung vom Absender. Der Sender verbindet sich, schickt STREAM_HEADER und danach die
+# Daten ab Offset am Stück; der Empfänger bestätigt das Ende mit einem Byte.
+TCP_CAPABILITY = "tcp1"
+MIN_STREAM_SIZE = 64 * 1024      # Kleinere Nutzlasten lohnen den Verbindungsaufbau nicht
+STREAM_HEADER = struct.Struct('!IQ')  # Transfer-ID, Offset
+SOCKET_BUFFER = 4 * 1024 * 1024  # Große Puffer, damit das Fenster bei hoher RTT nicht bremst
+STREAM_BLOCK = 4 * 1024 * 1024   # Bytes pro sendfile()-/sendall()-Aufruf
+RECV_BLOCK = 1024 * 1024         # Höchstens so viel pro recv_into(); danach Fortschritt verbuchen
+ACCEPT_TIMEOUT = transfer.STALL_TIMEOUT
+IO_TIMEOUT = 30.0                # Abbruch, wenn so lange nichts gelesen oder geschrieben werden kann
+MAX_RECONNECTS = 4               # Danach geht der Rest über UDP
+RECONNECT_DELAY = 0.5            # Wartezeit vor der ersten neuen Verbindung, verdoppelt sich jedes Mal
+DONE = b'\x01'
+
+
+def spawn(fn, *args):
+    """Runs fn on its own daemon thread and returns a concurrent.futures.Future for its result.
+
+    Not a pool: every stream blocks for its whole duration, and a peer that sends and
+    receives at the same time must never wait for a free worker.
+    """
+    future = Future()
+
+    def run():
+        if future.set_running_or_notify_cancel():
+            try:
+                future.set_result(fn(*args))
+            except BaseException as e:
+                future.set_exception(e)
+
+    threading.Thread(target=run, name="tcp-transfer", daemon=True).start()
+    return future
+
+
+def format_offer(transfer_id, port, offset):
+    return f"IMG-TCP {transfer_id} {port} {offset}"
+
+
+def parse_offer(args_str):
+    """Parses IMG-TCP arguments into (transfer_id, port, offset); raises ValueError if malformed."""
+    transfer_id, port, offset = (int(value) for value in args_str.split(' '))
+    if not 0 < port < 65536 or offset < 0:
+        raise ValueError(args_str)
+    return transfer_id, port, offset
+
+
+def _read_exact(conn, size):
+    data = b''
+    while len(data) < size:
+        part = conn.recv(size - len(data))
+        if not part:
+            raise ConnectionError("Verbindung vorzeitig geschlossen")
+        data += part
+    return data
+
+
+class StreamReceiver:
+    """Ephemeral TCP listener that writes one transfer straight into its receiver's buffer.
+
+    The stream starts at the gap-free prefix of the receiver, so an interrupted transfer
+    resumes from its partial file just like over UDP. run() blocks and belongs on a
+    worker thread.
+    """
+
+    def __init__(self, receiver):
+        self.receiver = receiver
+        self.offset = min(receiver.cumulative * receiver.chunk_size, receiver.size)
+        self._conn = None
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            # Vor listen() setzen, damit die Fenstergröße schon beim Verbindungsaufbau gilt
+            self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_BUFFER)
+            self.listener.bind(('0.0.0.0', 0))
+            self.listener.listen(1)
+        except OSError:
+            self.listener.close()
+            raise
+        self.listener.settimeout(ACCEPT_TIMEOUT)
+        self.port = self.listener.getsockname()[1]
+
+    def run(self, progress=None):
+        """Accepts the sender's connection and receives until the transfer is complete."""
+        receiver = self.receiver
+        try:
+            while True:
+                conn, addr = self.listener.accept()
+                if addr[0] == receiver.addr[0]:
+                    break
+                conn.close()  # Nur der angekündigte Absender darf liefern
+            self._conn = conn
+            conn.settimeout(IO_TIMEOUT)
+            transfer_id, offset = STREAM_HEADER.unpack(_read_exact(conn, STREAM_HEADER.size))
+            if transfer_id != receiver.transfer_id or offset != self.offset:
+                raise ValueError(f"Unerwarteter Datenstrom (Transfer {transfer_id}, Offset {offset})")
+            position, size = offset, receiver.size
+            with memoryview(receiver.buffer) as view:
+                while position < size:
+                    received = conn.recv_into(view[position:min(size, position + RECV_BLOCK)])
+                    if not received:
+                        raise ConnectionError("Verbindung vorzeitig geschlossen")
+                    position += received
+                    receiver.on_stream(position)
+                    if progress is not None:
+                        progress()
+            conn.sendall(DONE)
+        finally:
+            self.close()
+
+    def close(self):
+        """Closes listener and connection; a blocked run() then fails with OSError."""
+        for sock in (self.listener, self._conn):
+            if sock is not None:
+                try:
+                    # close() allein weckt ein blockiertes accept()/recv() unter Linux nicht
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+                sock.close()
+
+
+class StreamSender:
+    """Outgoing transfer that streams its payload over TCP once the receiver offered a port.
+
+    Until the IMG-TCP offer arrives, the announcement is repeated like over UDP. If the
+    receiver answers with IMG-ACK instead, it does not want a stream and declined is set;
+    the caller then continues with a transfer.TransferSender. Files are sent with
+    socket.sendfile() from path, other payloads with sendall() from memory. After a broken
+    connection, reset() allows a new offer that continues at the receiver's prefix;
+    connected tells a refused connection apart from one that broke off.
+    """
+
+    def __init__(self, addr, transfer_id, data, header, chunk_size, path=None):
+        self.addr = addr
+        self.transfer_id = transfer_id
+        self.data = data
+        self.size = len(data)
+        self.header = header
+        self.chunk_size = chunk_size
+        self.total = transfer.chunk_count(self.size, chunk_size)
+        self.path = path
+        self.source = None
+        self.answered = None  # asyncio.Future, erfüllt durch IMG-TCP oder IMG-ACK
+        self.offer = None     # (port, offset)
+        self.declined = False
+        self.sent = 0         # Bytes, die der Kernel übernommen hat, über alle Verbindungen
+        self.offset = 0
+        self.position = 0     # Nächstes Byte der laufenden Verbindung
+        self.reconnects = 0
+        self.connected = False  # Ob die letzte Verbindung zustande kam
+        self.retransmits = 0  # Wie bei TransferSender; TCP wiederholt selbst
+        self.started_at = time.time()
+        self.finished_at = 0.0
+        self.done = False
+        self.failed = False
+        self._sock = None
+
+    def _answer(self):
+        if self.answered is not None and not self.answered.done():
+            self.answered.set_result(None)
+
+    def on_offer(self, port, offset):
+        if self.offer is None and offset <= self.size:
+            self.offer = (port, offset)
+            self._answer()
+
+    def on_ack(self, cumulative, highest, nacks):
+        self.declined = True
+        self._answer()
+
+    async def wait_for_answer(self, send_header, interval):
+        """Repeats the announcement every interval seconds until the receiver answered.
+
+        Returns False if it stays silent for transfer.STALL_TIMEOUT.
+        """
+        self.answered = asyncio.get_running_loop().create_future()
+        deadline = time.time() + transfer.STALL_TIMEOUT
+        while time.time() < deadline:
+            send_header(self.header, self.addr)
+            try:
+                await asyncio.wait_for(asyncio.shield(self.answered), interval)
+                return True
+            except asyncio.TimeoutError:
+                pass
+        return False
+
+    def reset(self):
+        """Forgets the last offer so that wait_for_answer() negotiates a new connection."""
+        self.offer = None
+        self.failed = False
+        self.reconnects += 1
+
+    @property
+    def reconnect_delay(self):
+        """Back-off before the next offer is requested, doubling with every reconnect."""
+        return RECONNECT_DELAY * 2 ** max(0, self.reconnects - 1)
+
+    @property
+    def base(self):
+        """Chunks delivered so far, for progress reports in the same unit as over UDP."""
+        return min(self.total, self.position // self.chunk_size)
+
+    @property
+    def throughput(self):
+        end = self.finished_at or time.time()
+        elapsed = end - self.started_at
+        return self.sent / elapsed if elapsed > 0 else 0.0
+
+    def run(self):
+        """Connects, streams the payload and waits for the receiver's confirmation (worker thread)."""
+        port, self.offset = self.offer
+        self.position = self.offset
+        if not self.reconnects:
+            self.started_at = time.time()
+        self.connected = False
+        sock = self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCKET_BUFFER)
+            sock.settimeout(IO_TIMEOUT)
+            sock.connect((self.addr[0], port))
+            self.connected = True
+            sock.sendall(STREAM_HEADER.pack(self.transfer_id, self.offset))
+            if self.path is not None:
+                with open(self.path, 'rb') as f:
+                    while self.position < self.size:
+                        count = min(STREAM_BLOCK, self.size - self.position)
+                        written = sock.sendfile(f, self.position, count)
+                        if not written:
+                            raise OSError(f"Datei '{self.path}' ist kürzer als angekündigt")
+                        self.position += written
+                        self.sent += written
+            else:
+                with memoryview(self.data) as view:
+                    while self.position < self.size:
+                        block = view[self.position:self.position + STREAM_BLOCK]
+                        sock.sendall(block)
+                        self.position += len(block)
+                        self.sent += len(block)
+            if _read_exact(sock, len(DONE)) != DONE:
+                raise ConnectionError("Unerwartete Bestätigung")
+            self.done = True
+        except Exception:
+            self.failed = True
+            raise
+        finally:
+            self.finished_at = time.time()
+            sock.close()
+
+    def cancel(self):
+        if self._sock is not None:
+            self._sock.close()
@@ -0,0 +1,622 @@
+import hashlib
+import os
+import struct
+import threading
+import time
+import zlib
+from collections import deque
+from urllib.parse import quote, unquote
+
+# Datenpaket: Magic-Byte, Transfer-ID, Sequenznummer, danach die Nutzdaten.
+# Textbefehle beginnen nie mit einem Nullbyte, daher sind beide Formate eindeutig unterscheidbar.
+CHUNK_MAGIC = 0x00
+COMPRESSED_CHUNK_MAGIC = 0x03  # Gleicher Kopf, Nutzdaten komprimiert
+CHUNK_HEADER = struct.Struct('!BII')
+# Mit Prüfsumme: zusätzlich CRC32 der Nutzdaten, wie sie übertragen werden (ggf. komprimiert)
+CHECKED_CHUNK_MAGIC = 0x04
+CHECKED_COMPRESSED_CHUNK_MAGIC = 0x05
+CHECKED_CHUNK_HEADER = struct.Struct('!BIII')
+_CHUNK_MAGICS = frozenset((CHUNK_MAGIC, COMPRESSED_CHUNK_MAGIC, CHECKED_CHUNK_MAGIC, CHECKED_COMPRESSED_CHUNK_MAGIC))
+
+DEFAULT_CHUNK_SIZE = 1400  # Passt mit IP/UDP-Header in eine Ethernet-MTU
+DEFAULT_WINDOW = 64        # Höchstens so viele unbestätigte Chunks gleichzeitig unterwegs
+INITIAL_CWND = 16          # Staufenster zu Beginn (AIMD), wächst bis DEFAULT_WINDOW
+MIN_CWND = 4               # Untergrenze nach Verlusten
+DECREASE = 0.7             # Faktor, um den das Staufenster bei Verlust schrumpft
+MAX_SPREAD = 4             # Neue Chunks höchstens window * MAX_SPREAD hinter dem ältesten offenen
+ACK_EVERY = 4              # Empfänger bestätigt spätestens nach so vielen Chunks
+ACK_DELAY = 0.005          # ... oder so viele Sekunden nach dem letzten unbestätigten Chunk
+SCHEDULER_QUANTUM = 16     # Chunks pro Transfer und Runde des Schedulers
+SCHEDULER_BUDGET = 256     # Chunks aller Transfers pro Durchlauf des Event-Loops
+MAX_NACKS = 32             # Maximale Anzahl fehlender Chunks pro IMG-ACK
+INITIAL_RTO = 0.2          # Sekunden bis zur Neuübertragung eines unbestätigten Chunks
+MIN_RTO = 0.01
+MAX_RTO = 2.0
+STALL_TIMEOUT = 10.0       # Abbruch, wenn so lange kein Fortschritt erzielt wird
+PROBE_CHUNKS = 8           # Nach so vielen Chunks ohne Ersparnis wird nicht mehr komprimiert
+MAX_CHUNK_SIZE = 65507     # Größte UDP-Nutzlast über IPv4
+MAX_TRANSFER_SIZE = 4 * 1024 ** 3  # Größte angenommene Ankündigung, sofern maxtransfersize nichts anderes sagt
+MAX_CHUNKS = 1 << 24       # Höchstens so viele Chunks je Transfer; die Bitmap belegt ein Byte pro Chunk
+MAX_INCOMING = 8           # Gleichzeitige Empfänge, sofern maxincomingtransfers nichts anderes sagt
+MAX_PARTIAL_BYTES = 8 * 1024 ** 3  # Platz aller Teildateien zusammen (maxpartialbytes)
+PARTIAL_MAX_AGE = 6 * 3600  # Sekunden, nach denen eine unberührte Teildatei gelöscht wird
+HASH_SIZE = 16             # Bytes des BLAKE2b-Inhaltshashs in FILE-Ankündigungen
+FILE_CAPABILITY = "file1"  # Versteht FILE (Dateiname und Inhaltshash); per CAPS ausgehandelt
+CHECKSUM_CAPABILITY = "crc1"  # Versteht Chunks mit CRC32
+HASH_STEP = 256 * 1024     # Der Empfänger hasht lückenlos empfangene Daten in Schritten dieser Größe
+
+
+def is_chunk(data):
+    """Returns True if a datagram is a binary transfer chunk."""
+    return len(data) >= CHUNK_HEADER.size and data[0] in _CHUNK_MAGICS
+
+
+def parse_chunk(data, decompress=None):
+    """Splits a chunk datagram into (transfer_id, seq, payload).
+
+    Compressed payloads are unpacked with decompress(payload, max_length). The payload is
+    None if its checksum does not match, or if it cannot be unpacked (or no decompress
+    is given).
+    """
+    magic = data[0]
+    if magic == CHECKED_CHUNK_MAGIC or magic == CHECKED_COMPRESSED_CHUNK_MAGIC:
+        if len(data) < CHECKED_CHUNK_HEADER.size:
+            return None, None, None
+        _, transfer_id, seq, checksum = CHECKED_CHUNK_HEADER.unpack_from(data)
+        payload = memoryview(data)[CHECKED_CHUNK_HEADER.size:]
+        if zlib.crc32(payload) != checksum:
+            return transfer_id, seq, None
+        compressed = magic == CHECKED_COMPRESSED_CHUNK_MAGIC
+    else:
+        _, transfer_id, seq = CHUNK_HEADER.unpack_from(data)
+        payload = memoryview(data)[CHUNK_HEADER.size:]
+        compressed = magic == COMPRESSED_CHUNK_MAGIC
+    if compressed:
+        payload = decompress(payload, MAX_CHUNK_SIZE) if decompress is not None else None
+    return transfer_id, seq, payload
+
+
+def chunk_count(size, chunk_size):
+    return (size + chunk_size - 1) // chunk_size
+
+
+def content_hash(data):
+    """Returns the hex BLAKE2b digest of a buffer (e.g. a whole mmap) as sent in FILE."""
+    return hashlib.blake2b(data, digest_size=HASH_SIZE).hexdigest()
+
+
+def format_announce(handle, size, transfer_id, chunk_size, name=None, digest=None):
+    """Builds the command that announces a transfer.
+
+    IMG <Handle> <Größe> <Transfer-ID> <Chunkgröße> for anonymous data, or with a file
+    FILE <Hash> <Name> <Handle> <Größe> <Transfer-ID> <Chunkgröße>; the name is
+    percent-encoded, so the handle remains the only field that may contain spaces.
+    """
+    if name is None:
+        return f"IMG {handle} {size} {transfer_id} {chunk_size}"
+    return f"FILE {digest} {quote(name, safe='')} {handle} {size} {transfer_id} {chunk_size}"
+
+
+class TransferRejected(ValueError):
+    """A well-formed announcement that is not accepted, e.g. because it is too large."""
+
+    def __init__(self, sender, size, transfer_id, reason):
+        super().__init__(reason)
+        self.sender = sender
+        self.size = size
+        self.transfer_id = transfer_id
+
+
+def parse_announce(command, args_str, max_size=MAX_TRANSFER_SIZE):
+    """Parses IMG or FILE arguments into (sender, size, transfer_id, chunk_size, name, digest).
+
+    name and digest are None for IMG. The name is reduced to its last path component.
+    Raises ValueError (or IndexError) for malformed announcements and TransferRejected
+    for announcements larger than max_size or with an unusable chunk size: the receiver
+    preallocates the whole file and a bitmap of one byte per chunk.
+    """
+    name = digest = None
+    if command == "FILE":
+        digest, quoted_name, args_str = args_str.split(' ', 2)
+        if len(bytes.fromhex(digest)) != HASH_SIZE:
+            raise ValueError(digest)
+        name = os.path.basename(unquote(quoted_name).replace('\\', '/'))
+        if name in ('', '.', '..'):
+            raise ValueError(quoted_name)
+    sender, size_str, transfer_id_str, chunk_size_str = args_str.rsplit(' ', 3)
+    size = int(size_str)
+    chunk_size = int(chunk_size_str)
+    transfer_id = int(transfer_id_str)
+    if size <= 0 or chunk_size <= 0:
+        raise ValueError(args_str)
+    if size > max_size:
+        raise TransferRejected(sender, size, transfer_id, f"größer als {max_size} Bytes")
+    if chunk_size > MAX_CHUNK_SIZE or chunk_count(size, chunk_size) > MAX_CHUNKS:
+        raise TransferRejected(sender, size, transfer_id, f"ungültige Chunkgröße {chunk_size}")
+    return sender, size, transfer_id, chunk_size, name, digest
+
+
+def format_ack(transfer_id, cumulative, highest, nacks):
+    """Builds an IMG-ACK command: IMG-ACK <ID> <Kumulativ> <Höchster> <Fehlend,...>"""
+    nack_str = ','.join(str(seq) for seq in nacks) if nacks else '-'
+    return f"IMG-ACK {transfer_id} {cumulative} {highest} {nack_str}"
+
+
+def parse_ack(args_str):
+    """Parses the arguments of an IMG-ACK command into (transfer_id, cumulative, highest, nacks)."""
+    transfer_id_str, cumulative_str, highest_str, nack_str = args_str.split(' ', 3)
+    nacks = [] if nack_str == '-' else [int(seq) for seq in nack_str.split(',')]
+    return int(transfer_id_str), int(cumulative_str), int(highest_str), nacks
+
+
+class TransferSender:
+    """Sends a payload as numbered chunks with a sliding window and selective retransmission.
+
+    The chunks in flight are limited by an AIMD congestion window capped at window: it
+    grows by one chunk per round trip (slow start up to ssthresh), shrinks by DECREASE
+    when the receiver reports gaps and drops to MIN_CWND on a timeout, at most once per
+    round trip. Without wake, chunks are sent directly from start(), on_ack() and tick();
+    with wake (usually TransferScheduler.wake) the sender only reports that it has work
+    and the scheduler calls pump() with a chunk budget.
+
+    data may be any buffer, e.g. an mmap of the file to send. Per-chunk state and the
+    datagrams themselves live in ring buffers of window * MAX_SPREAD slots, so memory use
+    does not grow with the size of the data and sending allocates nothing per chunk: each
+    chunk is assembled in its slot's preallocated frame and passed to send as a memoryview.
+    """
+
+    def __init__(self, send, addr, transfer_id, data, header,
+                 chunk_size=DEFAULT_CHUNK_SIZE, window=DEFAULT_WINDOW, compress=None, wake=None, checksum=False):
+        self.send = send  # Funktion (bytes, addr) zum Versenden eines Datagramms
+        self.wake = wake  # Optionale Funktion (sender), die das Senden einem Scheduler überlässt
+        self.queued = False  # Steht in der Warteschlange des Schedulers
+        # Optionale Funktion (payload) -> komprimierte Nutzdaten oder None, wenn es sich nicht lohnt
+        self.compress = compress
+        self.compress_tries = 0
+        self.compress_misses = 0
+        self.checksum = checksum  # Chunks mit CRC32 senden (CHECKSUM_CAPABILITY)
+        self.addr = addr
+        self.transfer_id = transfer_id
+        self.data = memoryview(data)
+        self.size = len(data)
+        self.header = header  # IMG-Befehl, der den Transfer ankündigt
+        self.chunk_size = chunk_size
+        self.window = window
+        self.total = chunk_count(self.size, chunk_size)
+
+        # Ringpuffer für die Chunks ab base; alles davor ist bestätigt
+        self.slots = window * MAX_SPREAD
+        self.acked = bytearray(self.slots)  # 1 = vom Empfänger bestätigt
+        self.sent_at = [0.0] * self.slots
+        self.send_count = bytearray(self.slots)  # Für RTT-Messungen nur einmal gesendete Chunks verwenden
+        # Ein Sendepuffer je Ringplatz: Kopf und Nutzdaten werden hinein kopiert statt neu angelegt
+        self.header_size = CHECKED_CHUNK_HEADER.size if checksum else CHUNK_HEADER.size
+        self.frame_size = self.header_size + chunk_size
+        self.frames = memoryview(bytearray(self.slots * self.frame_size))
+        self.base = 0       # Erster noch unbestätigter Chunk
+        self.next_seq = 0   # Nächster noch nie gesendeter Chunk
+        self.retransmit_queue = []
+        self.rto = INITIAL_RTO
+        self.srtt = None
+        self.rttvar = 0.0
+        self.cwnd = float(min(INITIAL_CWND, window))
+        self.ssthresh = float(window)
+        self.recovery_until = 0.0  # Bis dahin keine weitere Verkleinerung des Fensters
+        self.losses = 0
+        self.in_flight = 0  # Gesendet, aber (noch) nicht bestätigt
+
+        self.chunks_sent = 0
+        self.retransmits = 0
+        self.header_acked = False
+        self.header_sent_at = 0.0
+        self.last_progress = 0.0
+        self.started_at = 0.0
+        self.finished_at = 0.0
+        self.done = False
+        self.failed = False
+        self.cond = threading.Condition()
+
+    def _send_chunk(self, seq, now):
+        start = seq * self.chunk_size
+        chunk = self.data[start:start + self.chunk_size]
+        packed = None
+        if self.compress is not None:
+            packed = self.compress(chunk)
+            self.compress_tries += 1
+            if packed is None:
+                self.compress_misses += 1
+                # Überwiegend unkomprimierbar (z.B. Zufallsdaten, JPEG): für den Rest aufgeben
+                if self.compress_tries >= PROBE_CHUNKS and self.compress_misses * 2 > self.compress_tries:
+                    self.compress = None
+        if packed is not None:
+            chunk = packed
+        slot = seq % self.slots
+        offset = slot * self.frame_size
+        end = offset + self.header_size + len(chunk)
+        if self.checksum:
+            magic = CHECKED_COMPRESSED_CHUNK_MAGIC if packed is not None else CHECKED_CHUNK_MAGIC
+            CHECKED_CHUNK_HEADER.pack_into(self.frames, offset, magic, self.transfer_id, seq, zlib.crc32(chunk))
+        else:
+            magic = COMPRESSED_CHUNK_MAGIC if packed is not None else CHUNK_MAGIC
+            CHUNK_HEADER.pack_into(self.frames, offset, magic, self.transfer_id, seq)
+        self.frames[offset + self.header_size:end] = chunk
+        self.send(self.frames[offset:end], self.addr)
+        self.sent_at[slot] = now
+        if self.send_count[slot] < 255:
+            self.send_count[slot] += 1
+        self.chunks_sent += 1
+
+    def _is_acked(self, seq):
+        return seq < self.base or self.acked[seq % self.slots]
+
+    def _advance(self, base):
+        """Moves base forward and frees the ring slots of the chunks left behind."""
+        for seq in range(self.base, min(base, self.base + self.slots)):
+            slot = seq % self.slots
+            self.acked[slot] = 0
+            self.send_count[slot] = 0
+        self.base = base
+
+    def _update_rtt(self, sample):
+        """Updates the smoothed round-trip time and the retransmission timeout (RFC 6298)."""
+        if self.srtt is None:
+            self.srtt = sample
+            self.rttvar = sample / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - sample)
+            self.srtt = 0.875 * self.srtt + 0.125 * sample
+        self.rto = min(MAX_RTO, max(MIN_RTO, self.srtt + 4 * self.rttvar))
+
+    def _on_loss(self, now, timeout=False):
+        """Multiplicative decrease, at most once per round trip."""
+        if now < self.recovery_until:
+            return
+        self.ssthresh = max(MIN_CWND, self.cwnd * DECREASE)
+        self.cwnd = MIN_CWND if timeout else self.ssthresh
+        self.recovery_until = now + (self.srtt if self.srtt is not None else self.rto)
+        self.losses += 1
+
+    def _on_acked(self, count):
+        """Additive increase: slow start below ssthresh, then about one chunk per round trip."""
+        if self.cwnd < self.ssthresh:
+            self.cwnd += count
+        else:
+            self.cwnd += count / self.cwnd
+        self.cwnd = min(self.cwnd, float(self.window))
+
+    def _send_header(self, now):
+        self.send(self.header, self.addr)
+        self.header_sent_at = now
+
+    def _schedule(self, now):
+        if self.wake is not None:
+            self.wake(self)
+        else:
+            self._pump(now)
+
+    def start(self):
+        now = time.time()
+        with self.cond:
+            self.started_at = now
+            self.last_progress = now
+            self._send_header(now)
+            self._schedule(now)
+
+    def pump(self, limit):
+        """Sends up to limit chunks; returns how many were sent. Used by TransferScheduler."""
+        with self.cond:
+            if self.done:
+                return 0
+            return self._pump(time.time(), limit)
+
+    def _pump(self, now, limit=None):
+        """Sends requested retransmissions, fills the window and retransmits timed-out chunks."""
+        if limit is None:
+            limit = self.total + len(self.retransmit_queue) + 1
+        sent = 0
+        # 1. Vom Empfänger als fehlend gemeldete Chunks
+        while self.retransmit_queue and sent < limit:
+            seq = self.retransmit_queue.pop()
+            if not self._is_acked(seq):
+                self._send_chunk(seq, now)
+                self.retransmits += 1
+                sent += 1
+
+        # 2. Staufenster mit neuen Chunks auffüllen
+        # Gezählt werden offene Chunks, nicht der Abstand zur ältesten Lücke: eine Lücke in
+        # Reparatur hält den Strom also nicht an
+        while (sent < limit and self.next_seq < self.total and self.in_flight < self.cwnd
+               and self.next_seq - self.base < self.slots):
+            if self.acked[self.next_seq % self.slots]:
+                # Beim Fortsetzen hat der Empfänger den Chunk schon
+                self.next_seq += 1
+                continue
+            self._send_chunk(self.next_seq, now)
+            self.next_seq += 1
+            self.in_flight += 1
+            sent += 1
+
+        # 3. Zeitüberschreitungen: Ankündigung und unbestätigte Chunks erneut senden
+        if not self.header_acked and now - self.header_sent_at > self.rto:
+            self._send_header(now)
+        timed_out = False
+        for seq in range(self.base, self.next_seq):
+            if sent >= limit:
+                break
+            slot = seq % self.slots
+            if not self.acked[slot] and now - self.sent_at[slot] > self.rto:
+                self._send_chunk(seq, now)
+                self.retransmits += 1
+                sent += 1
+                timed_out = True
+        if timed_out:
+            self._on_loss(now, timeout=True)
+
+        if now - self.last_progress > STALL_TIMEOUT:
+            self.failed = True
+            self.done = True
+        return sent
+
+    def on_ack(self, cumulative, highest, nacks):
+        """Processes an IMG-ACK from the receiver."""
+        now = time.time()
+        with self.cond:
+            if self.done:
+                return
+            self.header_acked = True
+            cumulative = min(cumulative, self.total)
+            highest = min(highest, self.total - 1)
+
+            progressed = False
+            newest = -1
+            sample = None
+            newly_acked = 0  # Nur tatsächlich gesendete Chunks zählen für das Staufenster
+            slots = self.slots
+            if cumulative > self.base:
+                for seq in range(self.base, min(cumulative, self.next_seq)):
+                    slot = seq % slots
+                    if not self.acked[slot]:
+                        newly_acked += 1
+                        newest = seq
+                        sample = now - self.sent_at[slot] if self.send_count[slot] == 1 else None
+                self._advance(cumulative)
+                progressed = True
+
+            # Alles zwischen kumulativer Bestätigung und höchstem Chunk, das nicht fehlt, ist angekommen
+            missing = set(nacks)
+            for seq in range(self.base, min(highest + 1, self.base + slots)):
+                slot = seq % slots
+                if seq not in missing and not self.acked[slot]:
+                    self.acked[slot] = 1
+                    progressed = True
+                    if seq < self.next_seq:
+                        newly_acked += 1
+                        if seq > newest:
+                            newest = seq
+                            sample = now - self.sent_at[slot] if self.send_count[slot] == 1 else None
+            base = self.base
+            while base < self.total and self.acked[base % slots]:
+                base += 1
+            self._advance(base)
+            self.next_seq = max(self.next_seq, self.base)
+            if sample is not None:
+                self._update_rtt(sample)
+
+            # Fehlende Chunks nur erneut senden, wenn die letzte Sendung länger als eine RTT zurückliegt;
+            # sonst kann der Empfänger sie noch gar nicht gesehen haben
+            min_gap = self.srtt if self.srtt is not None else self.rto / 2
+            lost = False
+            for seq in missing:
+                if (seq < self.next_seq and not self._is_acked(seq)
+                        and now - self.sent_at[seq % slots] > min_gap):
+                    self.retransmit_queue.append(seq)
+                    lost = True
+            self.in_flight -= newly_acked
+            if lost:
+                self._on_loss(now)
+            elif newly_acked:
+                self._on_acked(newly_acked)
+
+            if progressed:
+                self.last_progress = now
+            if self.base >= self.total:
+                self.done = True
+                self.finished_at = now
+            else:
+                self._schedule(now)
+            self.cond.notify_all()
+
+    def tick(self):
+        """Handles timeouts; call periodically (about every rto / 2) while the transfer runs."""
+        with self.cond:
+            if not self.done:
+                self._schedule(time.time())
+
+    def run(self):
+        """Drives the transfer until it completes or stalls. Blocks the calling thread."""
+        self.start()
+        with self.cond:
+            while not self.done:
+                self.cond.wait(self.rto / 2)
+                if not self.done:
+                    self._pump(time.time())
+        return not self.failed
+
+    @property
+    def retransmit_rate(self):
+        return self.retransmits / self.chunks_sent if self.chunks_sent else 0.0
+
+    @property
+    def throughput(self):
+        """Throughput of the finished transfer in bytes per second."""
+        elapsed = (self.finished_at or time.time()) - self.started_at
+        return self.size / elapsed if elapsed > 0 else 0.0
+
+
+class TransferScheduler:
+    """Shares the send capacity fairly between concurrent outgoing transfers.
+
+    Senders with work are served round-robin, SCHEDULER_QUANTUM chunks at a time, and at
+    most SCHEDULER_BUDGET chunks per event loop iteration; the rest waits for the next
+    iteration so that chat datagrams queued in between are not stuck behind bulk data.
+    call_soon must defer to the next loop iteration; wake() is only called on the loop thread.
+    """
+
+    def __init__(self, call_soon, quantum=SCHEDULER_QUANTUM, budget=SCHEDULER_BUDGET):
+        self.call_soon = call_soon
+        self.quantum = quantum
+        self.budget = budget
+        self._ready = deque()
+        self._scheduled = False
+        self.rounds = 0
+        self.deferred = 0  # Durchläufe, nach denen noch Transfers warten mussten
+
+    def wake(self, sender):
+        if not sender.queued:
+            sender.queued = True
+            self._ready.append(sender)
+        if not self._scheduled:
+            self._scheduled = True
+            self.call_soon(self._run)
+
+    def _run(self):
+        self._scheduled = False
+        self.rounds += 1
+        budget = self.budget
+        ready = self._ready
+        while ready and budget > 0:
+            sender = ready.popleft()
+            limit = min(self.quantum, budget)
+            sent = sender.pump(limit)
+            budget -= sent
+            if sent >= limit:
+                # Hat vermutlich noch mehr zu senden: hinten anstellen
+                ready.append(sender)
+            else:
+                sender.queued = False
+        if ready:
+            self.deferred += 1
+            self._scheduled = True
+            self.call_soon(self._run)
+
+
+class TransferReceiver:
+    """Reassembles chunks of an announced transfer and decides when to acknowledge.
+
+    By default chunks are collected in memory; pass buffer/received (e.g. the mappings of a
+    storage.PartialFile) to write them straight into a file and resume from its chunk bitmap.
+
+    The BLAKE2b content hash is computed while chunks arrive: whenever the gap-free prefix
+    has grown by HASH_STEP bytes, that part is hashed, so finish_hash() only has to cover
+    the tail once the transfer is complete.
+    """
+
+    def __init__(self, transfer_id, size, chunk_size, sender, addr, buffer=None, received=None):
+        self.transfer_id = transfer_id
+        self.size = size
+        self.chunk_size = chunk_size
+        self.sender = sender
+        self.addr = addr
+        self.total = chunk_count(size, chunk_size)
+        self.buffer = buffer if buffer is not None else bytearray(size)
+        self.received = received if received is not None else bytearray(self.total)
+
+        # Bei fortgesetzten Transfers den Stand aus der Bitmap übernehmen
+        self.count = bytes(self.received).count(1) if received is not None else 0
+        first_missing = self.received.find(b'\x00')
+        self.cumulative = self.total if first_missing < 0 else first_missing  # Lückenlos empfangen ab 0
+        self.highest = self.received.rfind(b'\x01')
+        self.since_ack = 0
+        self.last_activity = time.time()
+        self.started_at = self.last_activity
+        self.initial_count = self.count  # Beim Fortsetzen bereits vorhandene Chunks
+        self.hasher = hashlib.blake2b(digest_size=HASH_SIZE)
+        self.hashed = 0  # Bytes ab Anfang, die schon in den Hash eingeflossen sind
+
+    @property
+    def complete(self):
+        return self.count == self.total
+
+    def on_chunk(self, seq, payload):
+        """Stores a chunk. Returns True if an IMG-ACK should be sent now."""
+        if seq >= self.total:
+            return False
+        self.last_activity = time.time()
+        if self.received[seq]:
+            # Duplikat: Der Sender hat unsere Bestätigung offenbar nicht erhalten
+            return True
+
+        start = seq * self.chunk_size
+        expected = min(self.chunk_size, self.size - start)
+        if len(payload) != expected:
+            return False
+        self.buffer[start:start + expected] = payload
+        self.received[seq] = 1
+        self.count += 1
+        self.since_ack += 1
+
+        out_of_order = seq != self.highest + 1
+        if seq > self.highest:
+            self.highest = seq
+        while self.cumulative < self.total and self.received[self.cumulative]:
+            self.cumulative += 1
+        if self.cumulative * self.chunk_size - self.hashed >= HASH_STEP:
+            self._update_hash(self.hashed + HASH_STEP)
+
+        return self.complete or out_of_order or self.since_ack >= ACK_EVERY
+
+    def on_stream(self, end):
+        """Records that a TCP stream has written the buffer up to byte end.
+
+        The stream starts at the gap-free prefix, so every chunk completely below end is
+        now received. Called from the stream's worker thread.
+        """
+        self.last_activity = time.time()
+        last = self.total if end >= self.size else end // self.chunk_size
+        if last <= self.cumulative:
+            return
+        # Beim Fortsetzen können dahinter schon einzelne Chunks per UDP vorhanden sein
+        self.count += last - self.cumulative - bytes(self.received[self.cumulative:last]).count(1)
+        self.received[self.cumulative:last] = b'\x01' * (last - self.cumulative)
+        self.highest = max(self.highest, last - 1)
+        self.cumulative = last
+        while self.cumulative < self.total and self.received[self.cumulative]:
+            self.cumulative += 1
+        while min(self.cumulative * self.chunk_size, self.size) - self.hashed >= HASH_STEP:
+            self._update_hash(self.hashed + HASH_STEP)
+
+    def _update_hash(self, end):
+        # Über eine Sicht hashen statt über eine Kopie; die Sicht wird sofort wieder freigegeben,
+        # damit sich die Abbildung einer PartialFile danach schließen lässt
+        end = min(end, self.size)
+        with memoryview(self.buffer) as view:
+            self.hasher.update(view[self.hashed:end])
+        self.hashed = end
+
+    def finish_hash(self):
+        """Hashes the rest of a complete transfer and returns the hex digest.
+
+        The rest can be large for a resumed transfer, so call this off the event loop.
+        """
+        if self.hashed < self.size:
+            self._update_hash(self.size)
+        return self.hasher.hexdigest()
+
+    def missing(self):
+        """Returns (nacks, highest) with up to MAX_NACKS missing chunks below the highest received one.
+
+        If the list is truncated, highest is lowered to the last reported gap so that the
+        sender never treats an unreported gap as received.
+        """
+        nacks = []
+        for seq in range(self.cumulative, self.highest):
+            if not self.received[seq]:
+                nacks.append(seq)
+                if len(nacks) >= MAX_NACKS:
+                    return nacks, seq
+        return nacks, self.highest
+
+    def ack_message(self):
+        self.since_ack = 0
+        nacks, highest = self.missing()
+        return format_ack(self.transfer_id, self.cumulative, highest, nacks)
@@ -0,0 +1,186 @@
+import json
+import sys
+import threading
+import time
+
+from network import events
+
+try:
+    import readline  # Liefert die angefangene Eingabe, um sie nach einer Ausgabe neu zu zeichnen
+except ImportError:
+    readline = None
+
+REFRESH_INTERVAL = 0.05   # Höchstens 20 Ausgaben pro Sekunde
+MAX_BATCH = 1000          # Ereignisse pro Ausgabe
+PROGRESS_INTERVAL = 1.0   # Fortschritt eines Transfers höchstens so oft anzeigen
+FINAL_STATES = frozenset(('done', 'known', 'failed', 'stalled', 'error'))
+
+
+def format_event(event):
+    """Returns the console text of an event, or None if it is not shown."""
+    kind = type(event)
+    if kind is events.Message:
+        return f"[{event.sender} -> mir]: {event.text}"
+    if kind is events.GroupMessage:
+        return f"[{event.group}] {event.sender}: {event.text}"
+    if kind is events.AutoReply:
+        return f"[Auto-Reply von {event.sender}]: {event.text}"
+    if kind is events.PeerJoined:
+        return f"{event.handle} ist Gruppe '{event.group}' beigetreten."
+    if kind is events.PeerFound:
+        return f"Nutzer '{event.handle}' in Gruppe '{event.group}' gefunden."
+    if kind is events.PeerLeft:
+        return f"{event.handle} hat Gruppe '{event.group}' verlassen."
+    if kind is events.PeerTimeout:
+        return f"Verbindung zu '{event.handle}' in Gruppe '{event.group}' verloren (Timeout)."
+    if kind is events.DeliveryFailed:
+        return f"Nachricht an {event.peer} konnte nicht zugestellt werden: {event.text}"
+    if kind is events.Transfer:
+        return _format_transfer(event)
+    return event.text
+
+
+def _format_transfer(event):
+    state, peer = event.state, event.peer
+    rate = event.rate / (1024 * 1024)
+    if event.direction == 'out':
+        if state == 'started':
+            if event.info:
+                return f"Sende '{event.info}' ({event.size} bytes) an {peer} in {event.total} Chunks..."
+            return f"Sende {event.size} bytes an {peer} in {event.total} Chunks..."
+        if state == 'progress':
+            return f"Sende an {peer}: {event.done * 100 // event.total}% ({rate:.1f} MB/s)"
+        if state == 'done':
+            return (f"Binärdaten an {peer} gesendet ({event.size} bytes, {rate:.1f} MB/s, "
+                    f"{event.info} Wiederholungen).")
+        if state == 'error':
+            return f"Fehler beim Senden der Binärdaten: {event.info}"
+        return f"Übertragung an {peer} abgebrochen: keine Bestätigung erhalten."
+    if state == 'announced':
+        return f"Eingehendes Bild von {peer} ({event.size} bytes). Warte auf Daten..."
+    if state == 'resumed':
+        return f"Setze Bildempfang von {peer} fort ({event.done}/{event.total} Chunks vorhanden)."
+    if state == 'progress':
+        return f"Empfange von {peer}: {event.done * 100 // event.total}% ({rate:.1f} MB/s)"
+    if state == 'known':
+        return f"Inhalt von {peer} ({event.size} bytes) war schon vorhanden und wurde als '{event.info}' abgelegt."
+    if state == 'done':
+        return f"Binärdaten von {peer} empfangen ({rate:.1f} MB/s) und als '{event.info}' gespeichert."
+    if state == 'stalled':
+        return f"Bildempfang von {peer} unterbrochen ({event.done}/{event.total} Chunks, fortsetzbar)."
+    if state == 'failed':
+        return f"Bildempfang von {peer} nicht möglich: {event.info}"
+    return f"Fehler beim Speichern des Bildes: {event.info}"
+
+
+def json_line(timestamp, event):
+    """Returns an event as one JSON object per line for automation."""
+    record = {'event': events.KINDS[type(event)], 'time': round(timestamp, 3)}
+    record.update(event._asdict())
+    return json.dumps(record, ensure_ascii=False)
+
+
+class Renderer:
+    """Drains the event bus on its own thread and writes the events in batches.
+
+    Network handlers only publish events, so a slow terminal can no longer stall packet
+    reception. In console mode the pending input prompt (and what has been typed so far)
+    is redrawn below each batch; in json mode every event becomes one JSON line.
+    """
+
+    def __init__(self, bus, mode='console', prompt=None, stream=None):
+        self.bus = bus
+        self.mode = mode
+        self.prompt = prompt  # Funktion, die die aktuell angezeigte Eingabeaufforderung liefert
+        self.stream = stream or sys.stdout
+        self.interactive = mode == 'console' and self.stream.isatty()
+        self._last_progress = {}  # {(richtung, transfer-id): zeitpunkt der letzten Anzeige}
+        self._reported_drops = 0
+        self._busy = False
+        self._rendered = threading.Condition()
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="console-output")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        while self._running or len(self.bus):
+            self.bus.wait(0.5)
+            self._busy = True
+            batch = self.bus.drain(MAX_BATCH)
+            if batch:
+                try:
+                    self._write(batch)
+                except Exception:
+                    pass  # z.B. geschlossenes Terminal; die Netzwerkschicht läuft weiter
+            with self._rendered:
+                self._busy = False
+                self._rendered.notify_all()
+            if batch:
+                # Begrenzte Bildwiederholrate: weitere Ereignisse sammeln sich derweil an
+                time.sleep(REFRESH_INTERVAL)
+
+    def _write(self, batch):
+        if self.mode == 'json':
+            lines = [json_line(timestamp, event) for timestamp, event in self._coalesce(batch)]
+        else:
+            lines = [text for text in map(format_event, (event for _, event in self._coalesce(batch)))
+                     if text is not None]
+        dropped = self.bus.dropped - self._reported_drops
+        if dropped:
+            self._reported_drops += dropped
+            if self.mode == 'json':
+                lines.append(json.dumps({'event': 'dropped', 'time': round(time.time(), 3), 'count': dropped}))
+            else:
+                lines.append(f"({dropped} Meldungen ausgelassen, die Ausgabe kam nicht nach)")
+        if not lines:
+            return
+
+        if self.interactive:
+            prompt = self.prompt() if self.prompt else None
+            # Eingabezeile löschen, Ereignisse ausgeben, Eingabeaufforderung neu zeichnen
+            text = '\r\033[K' + '\n'.join(lines) + '\n'
+            if prompt is not None:
+                text += prompt + (readline.get_line_buffer() if readline else '')
+        else:
+            text = '\n'.join(lines) + '\n'
+        self.stream.write(text)
+        self.stream.flush()
+
+    def _coalesce(self, batch):
+        """Keeps only the newest progress event per transfer; on the console at most one per second."""
+        latest = {}
+        for index, (_, event) in enumerate(batch):
+            if type(event) is events.Transfer and event.state == 'progress':
+                latest[(event.direction, event.transfer_id)] = index
+        now = time.monotonic()
+        for index, (timestamp, event) in enumerate(batch):
+            if type(event) is events.Transfer:
+                key = (event.direction, event.transfer_id)
+                if event.state in FINAL_STATES:
+                    self._last_progress.pop(key, None)
+                elif event.state != 'progress':
+                    # Kurze Transfers sind fertig, bevor es etwas zu melden gibt
+                    self._last_progress[key] = now
+                elif latest[key] != index or (self.mode != 'json' and
+                                              now - self._last_progress.get(key, 0.0) < PROGRESS_INTERVAL):
+                    continue
+                else:
+                    self._last_progress[key] = now
+            yield timestamp, event
+
+    def flush(self, timeout=1.0):
+        """Waits until everything published so far has been written."""
+        deadline = time.monotonic() + timeout
+        with self._rendered:
+            while (len(self.bus) or self._busy) and self._thread.is_alive():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._rendered.wait(remaining):
+                    return False
+        return True
+
+    def close(self, timeout=2.0):
+        """Writes the remaining events and stops the output thread."""
+        self._running = False
+        self.bus.wake()
+        self._thread.join(timeout)
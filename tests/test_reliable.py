@@ -0,0 +1,176 @@
+import heapq
+import random
+import time
+
+import pytest
+
+from benchmarks.suite import free_ports
+from network import protocol
+from network import reliable
+from network.network_handler import NetworkHandler
+
+LATENCY = 0.005  # Simulierte Laufzeit eines Datagramms in Sekunden
+
+
+class _Link:
+    """Two ReliableChannels in simulated time; every datagram is dropped with probability loss."""
+
+    def __init__(self, loss, seed):
+        self.rng = random.Random(seed)
+        self.loss = loss
+        self.sender = reliable.ReliableChannel(reliable.new_epoch())
+        self.receiver = reliable.ReliableChannel(reliable.new_epoch())
+        self.now = 0.0
+        self.wire = []  # (ankunft, nr, art, nutzdaten)
+        self.count = 0
+        self.delivered = []
+        self.given_up = []
+
+    def _transmit(self, kind, payload):
+        self.count += 1
+        if self.rng.random() >= self.loss:
+            heapq.heappush(self.wire, (self.now + LATENCY, self.count, kind, payload))
+
+    def _send_data(self, ready):
+        for seq, text in ready:
+            self._transmit('data', (self.sender.epoch, seq, text))
+
+    def send(self, text):
+        self._send_data(self.sender.send(text, self.now))
+
+    def run(self, limit=600.0):
+        """Delivers datagrams and timeouts until nothing is pending or limit seconds passed."""
+        while self.now < limit:
+            timeout = self.sender.next_timeout(self.now)
+            if not self.wire and timeout is None:
+                return
+            due = self.now + timeout if timeout is not None else None
+            if self.wire and (due is None or self.wire[0][0] <= due):
+                self.now, _, kind, payload = heapq.heappop(self.wire)
+                if kind == 'data':
+                    texts, _ = self.receiver.receive(*payload)
+                    self.delivered.extend(texts)
+                    epoch, ack = self.receiver.ack_state()
+                    self._transmit('ack', (epoch, ack, self.receiver.sack_list()))
+                else:
+                    epoch, ack, sack = payload
+                    _, ready = self.sender.on_ack(epoch, ack, self.now, sack)
+                    self._send_data(ready)
+            else:
+                # Knapp hinter den Zeitpunkt, sonst lässt Rundung now - gesendet knapp unter dem RTO
+                self.now = due + 1e-6
+                ready, given_up = self.sender.due(self.now)
+                self.given_up.extend(given_up)
+                self._send_data(ready)
+
+
+@pytest.mark.parametrize('loss', [0.0, 0.2, 0.4])
+@pytest.mark.parametrize('seed', [1, 2, 3])
+def test_exactly_once_in_order_under_loss(loss, seed):
+    link = _Link(loss, seed)
+    sent = [str(i) for i in range(300)]
+    for text in sent:
+        link.send(text)
+    link.run()
+
+    assert not link.sender.unacked and not link.sender.backlog
+    # Aufgegebene Nachrichten meldet der Sender; alles andere kommt genau einmal und geordnet an
+    assert link.delivered == [text for text in sent if text not in link.given_up]
+    assert link.sender.failed == len(link.given_up)
+    if loss == 0.0:
+        assert link.sender.retransmits == 0 and not link.given_up
+
+
+def test_epoch_restarts_after_max_sends():
+    link = _Link(0.0, 1)
+    old_epoch = link.sender.epoch
+    # Die erste Nachricht geht jedes Mal verloren, die beiden folgenden kommen an
+    link.rng.random = lambda: 1.0
+    original = link._transmit
+
+    def transmit(kind, payload):
+        if kind == 'data' and payload[0] == old_epoch and payload[2] == 'a':
+            link.count += 1
+            return
+        original(kind, payload)
+    link._transmit = transmit
+
+    for text in ('a', 'b', 'c'):
+        link.send(text)
+    link.run()
+
+    assert link.given_up == ['a']
+    assert link.sender.failed == 1
+    assert link.sender.epoch != old_epoch
+    # b und c warteten beim Empfänger hinter der Lücke und kommen im neuen Strom an
+    assert link.delivered == ['b', 'c']
+    assert link.receiver.peer_epoch == link.sender.epoch
+    assert link.sender.retransmits == reliable.MAX_SENDS - 1
+
+
+def test_late_datagram_of_old_epoch_is_dropped():
+    channel = reliable.ReliableChannel(reliable.new_epoch())
+    assert channel.receive(1, 1, 'a') == (['a'], False)
+    # Der Sender gab 'b' auf und schickt 'c' im neuen Strom; danach kommt 'b' doch noch an
+    assert channel.receive(2, 1, 'c') == (['c'], False)
+    assert channel.receive(1, 2, 'b') == ([], False)
+    assert channel.receive(2, 2, 'd') == (['d'], False)
+    assert channel.peer_epoch == 2
+    assert channel.ack_state() == (2, 2)
+    assert channel.duplicates == 1
+
+
+class _LossyPeer(NetworkHandler):
+    """NetworkHandler that drops outgoing unicast datagrams and records delivered messages."""
+
+    def __init__(self, config, seed):
+        self.rng = random.Random(seed)
+        self.loss = 0.0
+        self.delivered = []
+        super().__init__(config)
+
+    def _send_unicast(self, data, addr):
+        if self.loss and self.rng.random() < self.loss:
+            return
+        super()._send_unicast(data, addr)
+
+    def _deliver_message(self, sender, text):
+        self.delivered.append(text)
+
+
+def _wait(condition, timeout):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.02)
+    return True
+
+
+@pytest.mark.parametrize('loss', [0.0, 0.2])
+def test_loopback_delivery_under_loss(loss, tmp_path):
+    whoisport, port_a, port_b = free_ports(3)
+
+    def config(handle, port):
+        return {'user': {
+            'handle': handle, 'port': port, 'whoisport': whoisport, 'broadcastaddress': '127.255.255.255',
+            'reliablemsg': True, 'history': False, 'peersnapshot': False, 'imagepath': str(tmp_path),
+            'ratelimit': False,
+        }}
+
+    a = _LossyPeer(config('sender', port_a), 1)
+    b = _LossyPeer(config('empfaenger', port_b), 2)
+    try:
+        assert _wait(lambda: a.peers.supports('empfaenger', protocol.RELIABLE_CAPABILITY)
+                     and b.peers.supports('sender', protocol.RELIABLE_CAPABILITY), 10)
+        a.loss = b.loss = loss
+        sent = [str(i) for i in range(100)]
+        for text in sent:
+            a.send_message('empfaenger', text)
+            time.sleep(0.002)
+        _wait(lambda: len(b.delivered) >= len(sent), 30)
+        assert b.delivered == sent
+        assert a.link_quality('empfaenger')['failed'] == 0
+    finally:
+        a.shutdown()
+        b.shutdown()
@@ -1,138 +1,244 @@
+import asyncio
 import threading
+from network.event_loop import AsyncInput
 from network.network_handler import NetworkHandler
+from renderer import Renderer
+from utils import config_loader
+
+CONFIG_WATCH_INTERVAL = 1.0  # Sekunden zwischen zwei Prüfungen der Konfigurationsdatei
 
 class UserInterface:
-    def __init__(self, config):
+    def __init__(self, config, config_file=None):
         self.config = config
         self.running = True
+        self._stopped = threading.Event()
+        # "console" für Menschen, "json" für Skripte (ein JSON-Objekt pro Zeile, keine Eingabeaufforderung)
+        self.output = self.config['user'].get('output', 'console')
+        self._console = None
         
-        print(f"Angemeldet als: {self.config['user']['handle']}")
-        print(f"Mein Port: {self.config['user']['port']}")
+        if self.output != 'json':
+            print(f"Angemeldet als: {self.config['user']['handle']}")
+            print(f"Mein Port: {self.config['user']['port']}")
         
         # Netzwerkkomponenten initialisieren
         self.network = NetworkHandler(self.config)
+
+        # Ausgaben der Netzwerkschicht gebündelt in einem eigenen Thread anzeigen
+        self.renderer = Renderer(self.network.events, self.output, self._current_prompt)
         
-        # Eingabeloop starten
-        self._start_input_thread()
+        # Eingabeloop auf dem Event-Loop des Netzwerks starten
+        self._start_input_task()
+
+        # Änderungen an der Konfigurationsdatei ohne Neustart übernehmen
+        if config_file is not None:
+            self.network.loop.submit(self._watch_config(config_file))
+
+    def _start_input_task(self):
+        self.input_task = self.network.loop.submit(self._input_loop())
+
+    def _current_prompt(self):
+        return self._console.prompt if self._console is not None else None
+
+    def _notify(self, text):
+        self.network.events.notice(text)
 
-    def _start_input_thread(self):
-        self.input_thread = threading.Thread(target=self._input_loop)
-        self.input_thread.daemon = True
-        self.input_thread.start()
+    def wait(self):
+        """Blocks until the user has quit, without busy-waiting."""
+        # Mit Timeout warten, damit Strg+C im Hauptthread auf allen Plattformen ankommt
+        while not self._stopped.wait(0.5):
+            pass
 
-    def _input_loop(self):
+    async def _watch_config(self, path):
+        """Reloads the config file when it changes and applies it to the network layer.
+
+        An unchanged file costs one stat() per configwatch seconds (0 disables watching).
+        Invalid files are reported and the running configuration stays in place.
+        """
+        stamp = config_loader.file_stamp(path)
+        while self.running:
+            interval = self.config['user'].get('configwatch', CONFIG_WATCH_INTERVAL)
+            if not interval:
+                return
+            await asyncio.sleep(interval)
+            current = config_loader.file_stamp(path)
+            if current is None or current == stamp:
+                continue
+            stamp = current
+            try:
+                config = config_loader.read_config(path)
+            except config_loader.ConfigError as e:
+                self._notify(f"Fehler: {e}; die bisherige Konfiguration bleibt aktiv.")
+                continue
+            # Die Ausgabeart steht beim Start fest (z.B. --json)
+            config['user'].pop('output', None)
+            if 'output' in self.config['user']:
+                config['user']['output'] = self.config['user']['output']
+            await self.network.apply_config(config)
+            self.config = self.network.config
+
+    async def _input_loop(self):
+        loop = asyncio.get_running_loop()
+        console = self._console = AsyncInput(loop)
         while self.running:
             try:
                 prompt_group = self.network.active_group if self.network.active_group else "Keine"
-                user_input = input(f"[{prompt_group}] {self.config['user']['handle']}> ").strip()
-                
+                prompt = f"[{prompt_group}] {self.config['user']['handle']}> " if self.output != 'json' else ""
+                user_input = await console.readline(prompt)
+                user_input = user_input.strip()
+
                 if not user_input:
                     continue
-                
-                if user_input.lower() == 'exit':
-                    self._shutdown()
+
+                # Befehle blockieren teilweise (z.B. join_group) und laufen daher außerhalb des Loops
+                if not await loop.run_in_executor(None, self._handle_command, user_input):
                     break
-                
-                elif user_input.lower() == 'who':
-                    self.network.discover_users()
-                
-                elif user_input.lower() == '/help':
-                    self._print_help()
-
-                elif user_input.startswith('/create '):
-                    parts = user_input.split(' ', 1)
-                    if len(parts) == 2 and parts[1]:
-                        self.network.join_group(parts[1]) # join_group kümmert sich um die Erstellung
-                    else:
-                        print("Fehler: /create <Gruppenname>")
-
-                elif user_input.startswith('/join '):
-                    parts = user_input.split(' ', 1)
-                    if len(parts) == 2 and parts[1]:
-                        self.network.join_group(parts[1])
-                    else:
-                        print("Fehler: /join <Gruppenname>")
-
-                elif user_input.startswith('/leave '):
-                    parts = user_input.split(' ', 1)
-                    if len(parts) == 2 and parts[1]:
-                        self.network.leave_group(parts[1])
-                    else:
-                        print("Fehler: /leave <Gruppenname>")
-                
-                elif user_input.startswith('/switch '):
-                    parts = user_input.split(' ', 1)
-                    if len(parts) == 2 and parts[1]:
-                        self.network.switch_active_group(parts[1])
-                    else:
-                        print("Fehler: /switch <Gruppenname>")
-
-                elif user_input.lower() == '/groups':
-                    self.network.list_groups()
-
-                elif user_input.startswith('msg '):
-                    text_part = user_input[4:]
-                    
-                    # Alle bekannten Benutzernamen aus allen Gruppen holen
-                    all_known_handles = {
-                        handle
-                        for group_users in self.network.users_by_group.values()
-                        for handle in group_users.keys()
-                    }
-
-                    # Nach Länge absteigend sortieren, um längere Namen zuerst zu finden (z.B. "User Two" vor "User")
-                    sorted_handles = sorted(list(all_known_handles), key=len, reverse=True)
-
-                    recipient = None
-                    message = ""
-
-                    for handle in sorted_handles:
-                        # Prüfen, ob der Textteil mit einem bekannten Handle und einem Leerzeichen beginnt
-                        if text_part.startswith(handle + ' '):
-                            recipient = handle
-                            # Die Nachricht ist alles nach dem Handle und dem Leerzeichen
-                            message = text_part[len(handle) + 1:].strip()
-                            break
-                    
-                    if recipient and message:
-                        self.network.send_message(recipient, message)
-                    else:
-                        print("\nFehler: msg <Nutzer> <Text>")
-                        print("Mögliche Gründe: Nutzer nicht gefunden, keine Nachricht eingegeben oder der Nutzer ist offline.")
-                        print("Nutze 'who', um online Nutzer zu sehen.")
-                    continue
+                # Antworten erscheinen vor der nächsten Eingabeaufforderung
+                await loop.run_in_executor(None, self.renderer.flush)
 
-                elif user_input.startswith('/img ') or user_input.startswith('/ img '):
-                    parts = user_input.strip().split(' ', 2)
-                    if len(parts) == 3:
-                        self.network.send_image(parts[1], parts[2])
-                    else:
-                        print("Fehler: /img <Nutzer> <Größe_in_Bytes>")
-                
-                else:
-                    # Alles andere wird als Gruppennachricht gesendet
-                    self.network.send_group_message(user_input)
-                        
-            except KeyboardInterrupt:
-                self._shutdown()
+            except (KeyboardInterrupt, EOFError):
+                await loop.run_in_executor(None, self._shutdown)
                 break
             except Exception as e:
-                print(f"Eingabefehler: {e}")
+                self._notify(f"Eingabefehler: {e}")
+
+    def _handle_command(self, user_input):
+        """Executes one console command. Returns False when the program should exit."""
+        try:
+            if user_input.lower() == 'exit':
+                self._shutdown()
+                return False
+            
+            elif user_input.lower() == 'who':
+                self.network.discover_users()
+            
+            elif user_input.lower() == '/help':
+                self._print_help()
+
+            elif user_input.startswith('/create '):
+                parts = user_input.split(' ', 1)
+                if len(parts) == 2 and parts[1]:
+                    self.network.join_group(parts[1]) # join_group kümmert sich um die Erstellung
+                else:
+                    self._notify("Fehler: /create <Gruppenname>")
+
+            elif user_input.startswith('/join '):
+                parts = user_input.split(' ', 1)
+                if len(parts) == 2 and parts[1]:
+                    self.network.join_group(parts[1])
+                else:
+                    self._notify("Fehler: /join <Gruppenname>")
+
+            elif user_input.startswith('/leave '):
+                parts = user_input.split(' ', 1)
+                if len(parts) == 2 and parts[1]:
+                    self.network.leave_group(parts[1])
+                else:
+                    self._notify("Fehler: /leave <Gruppenname>")
+            
+            elif user_input.startswith('/switch '):
+                parts = user_input.split(' ', 1)
+                if len(parts) == 2 and parts[1]:
+                    self.network.switch_active_group(parts[1])
+                else:
+                    self._notify("Fehler: /switch <Gruppenname>")
+
+            elif user_input.lower() == '/groups':
+                self.network.list_groups()
+
+            elif user_input.startswith('msg '):
+                text_part = user_input[4:]
+                
+                # Längsten bekannten Handle am Anfang finden (z.B. "User Two" vor "User")
+                recipient, message = self.network.peers.match_prefix(text_part)
+                message = message.strip()
+
+                if recipient and message:
+                    self.network.send_message(recipient, message)
+                else:
+                    self._notify("Fehler: msg <Nutzer> <Text>\n"
+                                 "Mögliche Gründe: Nutzer nicht gefunden, keine Nachricht eingegeben oder der Nutzer ist offline.\n"
+                                 "Nutze 'who', um online Nutzer zu sehen.")
+
+            elif user_input.startswith('/history '):
+                # /history <Gruppe|Nutzer> [Anzahl] - Namen dürfen Leerzeichen enthalten
+                name = user_input[9:].strip()
+                limit = 20
+                parts = name.rsplit(' ', 1)
+                if len(parts) == 2 and parts[1].isdigit():
+                    name, limit = parts[0], int(parts[1])
+                if name:
+                    self.network.show_history(name, limit)
+                else:
+                    self._notify("Fehler: /history <Gruppe|Nutzer> [Anzahl]")
+
+            elif user_input.startswith('/search '):
+                text = user_input[8:].strip()
+                if text:
+                    self.network.search_history(text)
+                else:
+                    self._notify("Fehler: /search <Text>")
+
+            elif user_input.lower() == '/link' or user_input.startswith('/link '):
+                self.network.show_link_quality(user_input[6:].strip() or None)
+
+            elif user_input.lower() == '/stats':
+                self.network.show_stats()
+
+            elif user_input.startswith('/img ') or user_input.startswith('/ img '):
+                parts = user_input.strip().split(' ', 2)
+                if len(parts) == 3:
+                    self.network.send_image(parts[1], parts[2])
+                else:
+                    self._notify("Fehler: /img <Nutzer> <Größe_in_Bytes>")
+
+            elif user_input.startswith('/send '):
+                # Handles und Pfade dürfen Leerzeichen enthalten
+                recipient, path = self.network.peers.match_prefix(user_input[6:])
+                path = path.strip()
+                if recipient and path:
+                    self.network.send_file(recipient, path)
+                else:
+                    self._notify("Fehler: /send <Nutzer> <Pfad>")
+
+            elif user_input.startswith('/gimg '):
+                size = user_input[6:].strip()
+                if size:
+                    self.network.send_image_to_group(size)
+                else:
+                    self._notify("Fehler: /gimg <Größe_in_Bytes>")
+            
+            else:
+                # Alles andere wird als Gruppennachricht gesendet
+                self.network.send_group_message(user_input)
+
+        except Exception as e:
+            self._notify(f"Eingabefehler: {e}")
+        return True
 
     def _print_help(self):
-        print("\n--- Befehlsübersicht ---")
-        print("msg <nutzer> <text> - Sendet eine private Nachricht.")
-        print("/img <nutzer> <size> - Sendet <size> Bytes an Zufallsdaten an einen Nutzer.")
-        print("who                 - Zeigt Nutzer in der aktiven Gruppe an.")
-        print("/create <gruppe>    - Erstellt eine neue Gruppe und tritt ihr bei.")
-        print("/join <gruppe>      - Tritt einer bestehenden Gruppe bei.")
-        print("/leave <gruppe>     - Verlässt eine bestimmte Gruppe.")
-        print("/switch <gruppe>    - Wechselt die aktive Gruppe zum Senden.")
-        print("/groups             - Listet alle beigetretenen Gruppen auf.")
-        print("exit                - Beendet das Programm.")
-        print("------------------------\n> ", end="", flush=True)
+        self._notify('\n'.join([
+            "--- Befehlsübersicht ---",
+            "msg <nutzer> <text> - Sendet eine private Nachricht.",
+            "/img <nutzer> <size> - Sendet <size> Bytes an Zufallsdaten an einen Nutzer.",
+            "/send <nutzer> <pfad> - Sendet eine Datei von der Platte an einen Nutzer.",
+            "/gimg <size>        - Sendet <size> Bytes parallel an alle Nutzer der aktiven Gruppe.",
+            "who                 - Zeigt Nutzer in der aktiven Gruppe an.",
+            "/create <gruppe>    - Erstellt eine neue Gruppe und tritt ihr bei.",
+            "/join <gruppe>      - Tritt einer bestehenden Gruppe bei.",
+            "/leave <gruppe>     - Verlässt eine bestimmte Gruppe.",
+            "/switch <gruppe>    - Wechselt die aktive Gruppe zum Senden.",
+            "/groups             - Listet alle beigetretenen Gruppen auf.",
+            "/history <gruppe|nutzer> [n] - Zeigt die letzten n Nachrichten.",
+            "/search <text>      - Durchsucht den Nachrichtenverlauf.",
+            "/link [nutzer]      - Zeigt RTT und Verlust zuverlässiger Direktnachrichten.",
+            "/stats              - Zeigt Paketzähler, Latenzen, Warteschlangen und Transfers.",
+            "exit                - Beendet das Programm.",
+            "------------------------",
+        ]))
 
     def _shutdown(self):
-        print("\nBeende Verbindungen...")
+        self._notify("Beende Verbindungen...")
         self.running = False
-        self.network.shutdown()
\ No newline at end of file
+        self.network.shutdown()
+        self.renderer.close()
+        self._stopped.set()
\ No newline at end of file
@@ -1,14 +1,152 @@
-import toml
+import copy
+import os
 from pathlib import Path
 
+try:
+    import tomllib  # Ab Python 3.11 in der Standardbibliothek und schneller importiert
+except ImportError:
+    tomllib = None
+    import toml
+
+_NUMBER = (int, float)
+
+# Erlaubte Schlüssel der [user]-Tabelle: (Typen, Prüfung oder None, Pflichtfeld)
+USER_SCHEMA = {
+    'handle': (str, lambda v: v and not any(c.isspace() for c in v), True),
+    'port': (int, lambda v: 0 < v < 65536, True),
+    'whoisport': (int, lambda v: 0 < v < 65536, True),
+    'autoreply': (str, None, False),
+    'imagepath': (str, None, False),
+    'broadcastaddress': (str, None, False),
+    'output': (str, lambda v: v in ('console', 'json'), False),
+    'history': (bool, None, False),
+    'historypath': (str, None, False),
+    'historysegmentsize': (int, lambda v: v > 0, False),
+    'historysegments': (int, lambda v: v > 0, False),
+    'historymaxage': (int, lambda v: v > 0, False),
+    'binaryprotocol': (bool, None, False),
+    'compression': (str, lambda v: v in ('dict', 'zlib', 'off'), False),
+    'reliablemsg': (bool, None, False),
+    'chunksize': (int, lambda v: 0 < v <= 65000, False),
+    'transferwindow': (int, lambda v: v > 0, False),
+    'maxtransfersize': (int, lambda v: v > 0, False),
+    'maxincomingtransfers': (int, lambda v: v > 0, False),
+    'maxpartialbytes': (int, lambda v: v > 0, False),
+    'rcvbuf': (int, lambda v: v > 0, False),
+    'sndbuf': (int, lambda v: v > 0, False),
+    'recvbatch': (int, lambda v: v > 0, False),
+    'grouptransport': (str, lambda v: v in ('broadcast', 'multicast'), False),
+    'multicastinterface': (str, None, False),
+    'multicastttl': (int, lambda v: 0 <= v < 256, False),
+    'aliveinterval': (_NUMBER, lambda v: v > 0, False),
+    'alivetimeout': (_NUMBER, lambda v: v > 0, False),
+    'liveness': (dict, None, False),
+    'metricsfile': (str, None, False),
+    'metricsformat': (str, lambda v: v in ('prometheus', 'json'), False),
+    'metricsinterval': (_NUMBER, lambda v: v > 0, False),
+    'ratelimit': (bool, None, False),
+    'ratelimits': (dict, lambda v: all(isinstance(x, list) and len(x) == 2 for x in v.values()), False),
+    'replyjitter': (_NUMBER, lambda v: v >= 0, False),
+    'overloadpause': (_NUMBER, lambda v: v >= 0, False),
+    'configwatch': (_NUMBER, lambda v: v >= 0, False),
+    'peersnapshot': (bool, None, False),
+    'statepath': (str, None, False),
+    'snapshotinterval': (_NUMBER, lambda v: v > 0, False),
+    'tcptransfer': (bool, None, False),
+    'dispatchworkers': (int, lambda v: v > 0, False),
+    'dispatchqueue': (int, lambda v: v > 0, False),
+    'dispatchpolicy': (str, lambda v: v in ('oldest', 'newest'), False),
+    'discovery': (str, lambda v: v in ('broadcast', 'gossip'), False),
+    'seeds': (list, lambda v: all(isinstance(x, str) and ':' in x for x in v), False),
+    'gossipinterval': (_NUMBER, lambda v: v > 0, False),
+    'groupcache': (int, lambda v: v >= 0, False),
+    'groupcachegroups': (int, lambda v: v > 0, False),
+}
+
+# {pfad: ((mtime_ns, größe), konfiguration)} - unveränderte Dateien werden nicht neu gelesen
+_cache = {}
+
+
+class ConfigError(Exception):
+    pass
+
+
+def config_path(config_filename="config.toml"):
+    """Resolves a config file name relative to the project directory (absolute paths stay)."""
+    return Path(__file__).parent.parent / config_filename
+
+
+def file_stamp(path):
+    """Returns (mtime_ns, size) of a file, or None if it cannot be read."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def validate_config(config):
+    """Returns a list of problems with the [user] table; empty if it is valid.
+
+    Unknown keys are not errors, so that older versions can read newer files.
+    """
+    user = config.get('user')
+    if not isinstance(user, dict):
+        return ["Tabelle [user] fehlt"]
+    errors = []
+    for key, (types, check, required) in USER_SCHEMA.items():
+        if key not in user:
+            if required:
+                errors.append(f"'{key}' fehlt")
+            continue
+        value = user[key]
+        # bool ist in Python auch ein int; Ports oder Größen als true/false sind Tippfehler
+        if not isinstance(value, types) or (isinstance(value, bool) and types is not bool):
+            errors.append(f"'{key}' hat den falschen Typ ({type(value).__name__})")
+        elif check is not None and not check(value):
+            errors.append(f"'{key}' hat einen ungültigen Wert ({value!r})")
+    return errors
+
+
+def unknown_keys(config):
+    return sorted(set(config.get('user', {})) - set(USER_SCHEMA))
+
+
+def read_config(path):
+    """Parses and validates a config file; raises ConfigError with a readable message.
+
+    The result is cached by modification time and size, so checking an unchanged file
+    costs one stat(). Callers get their own copy and may modify it.
+    """
+    path = str(path)
+    stamp = file_stamp(path)
+    if stamp is None:
+        raise ConfigError(f"Konfigurationsdatei '{path}' nicht gefunden.")
+    cached = _cache.get(path)
+    if cached is None or cached[0] != stamp:
+        try:
+            if tomllib is not None:
+                with open(path, "rb") as config_file:
+                    config = tomllib.load(config_file)
+            else:
+                with open(path, "r") as config_file:
+                    config = toml.load(config_file)
+        except Exception as e:
+            raise ConfigError(f"Konfigurationsdatei '{path}' ist fehlerhaft: {e}")
+        errors = validate_config(config)
+        if errors:
+            raise ConfigError(f"Konfigurationsdatei '{path}' ist ungültig: " + "; ".join(errors))
+        cached = _cache[path] = (stamp, config)
+    return copy.deepcopy(cached[1])
+
+
 def load_config(config_filename="config.toml"):
     try:
-        config_path = Path(__file__).parent.parent / config_filename
-        if not config_path.exists():
-            print(f"Fehler: Konfigurationsdatei '{config_filename}' nicht gefunden.")
-            return None
-        with open(config_path, "r") as config_file:
-            return toml.load(config_file)
-    except Exception as e:
-        print(f"Config error: {e}")
-        return None
\ No newline at end of file
+        config = read_config(config_path(config_filename))
+    except ConfigError as e:
+        print(f"Fehler: {e}")
+        return None
+    unknown = unknown_keys(config)
+    if unknown:
+        print(f"Warnung: unbekannte Schlüssel in [user]: {', '.join(unknown)}")
+    return config